@@ -0,0 +1,205 @@
+# benchmarks/cases.py
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+import geopandas as gpd
+
+from utils.merge_netcdf_utils import merge_netcdf_concat, smart_merge_netcdf, plan_netcdf_merge, execute_merge_plan
+from utils.resample_utils import block_aggregate, temporal_resample, interp_resample
+from utils.split_nc_utils import split_netcdf_by_index, create_zip_from_datasets
+from utils.geospatial_utils import clip_dataset_with_shapefile, subset_to_geometries
+from utils.taylor_utils import compute_taylor_stats, taylor_accumulators
+from utils.skill_map_utils import skill_maps
+from utils import reduction_utils
+from utils.reduction_utils import spatial_mean_table
+from utils.proportional_redistribution_utils import (
+    monthly_mean_series, compute_original_seasonal, apply_proportional_redistribution
+)
+from utils.trend_analysis_utils import (
+    calculate_sens_slopes, compute_sen_summary, analyze_segment, detect_change_points
+)
+from utils.trend_uncertainty_utils import sen_confidence_interval, sen_confidence_grid
+from utils.mann_kendall_utils import mann_kendall_grid
+
+CASES = {}
+
+def benchmark(name: str, setup=None):
+    """
+    Registers a benchmark case.
+
+    `setup(data)` runs once, untimed, and returns the arguments passed to the
+    decorated function; without a setup the function receives the manifest
+    returned by ensure_dataset(). The timed function returns its result so the
+    runner can materialise it and record the output size.
+    """
+    def decorator(fn):
+        CASES[name] = {"name": name, "run": fn, "setup": setup or (lambda data: (data,))}
+        return fn
+    return decorator
+
+def _open_full(data):
+    return (xr.open_dataset(data["full"]),)
+
+def _basin_mean_series(data):
+    """Area-mean basin P series as the DataFrame layout used by the trend page."""
+    basin = gpd.read_file(data["basin"])
+    with xr.open_dataset(data["full"]) as ds:
+        clipped, _ = subset_to_geometries(ds["P"], list(basin.geometry))
+        series = clipped.mean(dim=("lat", "lon")).to_series()
+    df = series.rename("value").reset_index()
+    df["ordinal_time"] = df["time"].map(pd.Timestamp.toordinal)
+    return (df,)
+
+# ── merge_netcdf_utils ─────────────────────────────────────────
+
+@benchmark("merge.concat")
+def merge_concat(data):
+    return merge_netcdf_concat(data["parts"], dim="time")
+
+@benchmark("merge.smart_keep_first")
+def merge_smart_keep_first(data):
+    return smart_merge_netcdf(data["parts"], dim="time", duplicate_policy="keep-first")
+
+@benchmark("merge.smart_average")
+def merge_smart_average(data):
+    return smart_merge_netcdf(data["parts"], dim="time", duplicate_policy="average")
+
+@benchmark("merge.plan")
+def merge_plan(data):
+    return plan_netcdf_merge(data["parts"], dim="time", mode="concat")
+
+@benchmark("merge.plan_execute")
+def merge_plan_execute(data):
+    plan = plan_netcdf_merge(data["parts"], dim="time", mode="concat")
+    return execute_merge_plan(plan, duplicate_policy="keep-first")
+
+# ── resample_utils ─────────────────────────────────────────────
+
+@benchmark("resample.block_mean_4x4", setup=_open_full)
+def resample_block_mean(ds):
+    return block_aggregate(ds, {"lat": 4, "lon": 4}, func="mean", weights="area")
+
+@benchmark("resample.block_median_4x4", setup=_open_full)
+def resample_block_median(ds):
+    return block_aggregate(ds, {"lat": 4, "lon": 4}, func="median")
+
+@benchmark("resample.temporal_yearly", setup=_open_full)
+def resample_temporal_yearly(ds):
+    return temporal_resample(ds, freq="YS", semantics={"P": "flux", "ET": "flux", "Q": "flux", "TWS": "storage"})
+
+@benchmark("resample.interp_half_res", setup=_open_full)
+def resample_interp(ds):
+    lat, lon = ds["lat"].values, ds["lon"].values
+    return interp_resample(ds, {"lat": lat[::2], "lon": lon[::2]}, method="linear")
+
+# ── split_nc_utils ─────────────────────────────────────────────
+
+@benchmark("split.by_index_zip", setup=_open_full)
+def split_by_index_zip(ds):
+    return create_zip_from_datasets(split_netcdf_by_index(ds, dim="time", chunk_size=12))
+
+# ── geospatial_utils ───────────────────────────────────────────
+
+def _open_with_basin(data):
+    return xr.open_dataset(data["full"]), gpd.read_file(data["basin"])
+
+@benchmark("clip.shapefile", setup=_open_with_basin)
+def clip_shapefile(ds, basin):
+    return clip_dataset_with_shapefile(ds, basin)
+
+# ── taylor_utils ───────────────────────────────────────────────
+
+def _obs_model_cube(data):
+    ds = xr.load_dataset(data["full"])
+    obs = ds["P"].values
+    model = obs * np.float32(1.1) + np.random.default_rng(1).normal(0, 5, obs.shape).astype("float32")
+    return obs, model
+
+@benchmark("taylor.stats_full_cube", setup=_obs_model_cube)
+def taylor_stats(obs, model):
+    return compute_taylor_stats(obs, model)
+
+def _obs_models_grouped(data):
+    ds = xr.load_dataset(data["full"])
+    obs = ds["P"]
+    noise = np.random.default_rng(1).normal(0, 5, obs.shape).astype("float32")
+    models = {"wet": obs * np.float32(1.1) + noise, "dry": obs * np.float32(0.8)}
+    return obs, models, gpd.read_file(data["basin"])
+
+@benchmark("taylor.grouped_season_month_region", setup=_obs_models_grouped)
+def taylor_grouped(obs, models, basin):
+    return taylor_accumulators(obs, models, groupings=("all", "season", "month", "region"), regions=basin)
+
+@benchmark("skill.maps_3_models", setup=lambda data: (data["full"],))
+def skill_maps_3_models(path):
+    # ET, Q and TWS stand in for three models of P; only the cost matters here
+    return skill_maps((path, "P"), {v: (path, v) for v in ("ET", "Q", "TWS")})
+
+# ── proportional_redistribution_utils ──────────────────────────
+
+@benchmark("budget.redistribution", setup=_open_full)
+def budget_redistribution(ds):
+    series = [monthly_mean_series(ds[v]) for v in ("P", "ET", "Q", "TWS")]
+    seasonal = compute_original_seasonal(*series)
+    return apply_proportional_redistribution(seasonal)
+
+# ── reduction_utils ────────────────────────────────────────────
+
+def _full_path_with_basin(data):
+    return data["full"], gpd.read_file(data["basin"])
+
+@benchmark("reduce.area_means_4vars", setup=lambda data: (data["full"],))
+def reduce_area_means(path):
+    reduction_utils._series.clear()  # time the read pass, not a cache hit
+    return spatial_mean_table([(path, v) for v in ("P", "ET", "Q", "TWS")])
+
+@benchmark("reduce.basin_means_4vars", setup=_full_path_with_basin)
+def reduce_basin_means(path, basin):
+    reduction_utils._series.clear()
+    return spatial_mean_table([(path, v) for v in ("P", "ET", "Q", "TWS")], geometry=basin)
+
+# ── trend analysis ─────────────────────────────────────────────
+
+@benchmark("trend.sens_slopes_basin", setup=_basin_mean_series)
+def trend_sens_slopes(df):
+    return compute_sen_summary(calculate_sens_slopes(df))
+
+@benchmark("trend.segment_mk_sen", setup=_basin_mean_series)
+def trend_segment(df):
+    result = analyze_segment(df)
+    return result["trend_line"]
+
+@benchmark("trend.change_points", setup=_basin_mean_series)
+def trend_change_points(df):
+    return np.asarray(detect_change_points(df["value"].values))
+
+def _ar1_series(data, n: int = 10000):
+    """A 10,000-step AR(1) series (phi = 0.6) with a linear trend, on a daily axis."""
+    rng = np.random.default_rng(7)
+    noise = np.empty(n)
+    noise[0] = rng.normal()
+    for k in range(1, n):
+        noise[k] = 0.6 * noise[k - 1] + rng.normal()
+    return 0.001 * np.arange(n) + noise, pd.date_range("1990-01-01", periods=n, freq="D")
+
+@benchmark("trend.bootstrap_ci_10k", setup=_ar1_series)
+def trend_bootstrap_ci(values, times):
+    ci = sen_confidence_interval(values, times, method="bootstrap", n_boot=1000)
+    return np.array([ci["slope"], ci["lower"], ci["upper"]])
+
+@benchmark("trend.rank_ci_grid", setup=lambda data: (xr.open_dataset(data["full"])["P"],))
+def trend_rank_ci_grid(da):
+    return sen_confidence_grid(da)
+
+@benchmark("trend.mk_original_grid", setup=lambda data: (xr.open_dataset(data["full"])["P"],))
+def trend_mk_original_grid(da):
+    return mann_kendall_grid(da, method="original")
+
+@benchmark("trend.mk_hamed_rao_grid", setup=lambda data: (xr.open_dataset(data["full"])["P"],))
+def trend_mk_hamed_rao_grid(da):
+    return mann_kendall_grid(da, method="hamed_rao")
+
+@benchmark("trend.mk_tfpw_grid", setup=lambda data: (xr.open_dataset(data["full"])["P"],))
+def trend_mk_tfpw_grid(da):
+    return mann_kendall_grid(da, method="tfpw")
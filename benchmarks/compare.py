@@ -0,0 +1,126 @@
+# benchmarks/compare.py
+"""
+Compares two benchmark result files and flags regressions.
+
+Results can be given as paths or as commit prefixes looked up in
+benchmarks/results. Exits with status 1 when any case regressed.
+
+    python -m benchmarks.compare 3c7ff20 HEAD --preset small
+    python -m benchmarks.compare old.json new.json --threshold 1.2
+"""
+
+import os
+import sys
+import glob
+import json
+import argparse
+import subprocess
+
+from benchmarks.run import REPO_ROOT, RESULTS_DIR
+
+METRICS = {
+    "wall_s": "Wall (s)",
+    "peak_rss_mb": "Peak RSS (MiB)",
+    "output_bytes": "Output (bytes)",
+}
+
+def resolve_result(ref: str, preset: str, results_dir: str = RESULTS_DIR) -> str:
+    """Returns the result file for a path, commit prefix or git revision."""
+    if os.path.isfile(ref):
+        return ref
+    rev = subprocess.run(["git", "rev-parse", ref], capture_output=True, text=True, cwd=REPO_ROOT)
+    prefix = rev.stdout.strip()[:12] if rev.returncode == 0 else ref
+    matches = glob.glob(os.path.join(results_dir, f"{prefix}*-{preset}.json"))
+    if len(matches) != 1:
+        raise FileNotFoundError(f"Expected one '{preset}' result for '{ref}' in {results_dir}, found {len(matches)}.")
+    return matches[0]
+
+def compare_results(old: dict, new: dict, threshold: float = 1.10, min_seconds: float = 0.05) -> list:
+    """
+    Builds one comparison row per case present in either result.
+
+    A case regresses when its wall time or peak RSS grows by more than
+    `threshold` (ratio new/old). Wall times below `min_seconds` in both runs
+    are too noisy to judge and are never flagged. A changed output size is
+    reported as well since it usually means the result itself changed.
+
+    Returns:
+        List of dicts with old/new values, ratios and a 'status' of
+        'ok', 'faster', 'regression', 'new', 'removed' or 'error'
+    """
+    rows = []
+    old_res, new_res = old["results"], new["results"]
+    for name in sorted(set(old_res) | set(new_res)):
+        a, b = old_res.get(name), new_res.get(name)
+        row = {"case": name}
+        if a is None or b is None:
+            row["status"] = "new" if a is None else "removed"
+            rows.append(row)
+            continue
+        if "error" in a or "error" in b:
+            row["status"] = "error"
+            row["note"] = b.get("error") or a.get("error")
+            rows.append(row)
+            continue
+
+        notes, status = [], "ok"
+        for key in METRICS:
+            row[f"old_{key}"], row[f"new_{key}"] = a[key], b[key]
+            row[f"ratio_{key}"] = b[key] / a[key] if a[key] else float("inf") if b[key] else 1.0
+        noisy = max(a["wall_s"], b["wall_s"]) < min_seconds
+        if not noisy and row["ratio_wall_s"] > threshold:
+            status = "regression"
+            notes.append("slower")
+        if row["ratio_peak_rss_mb"] > threshold:
+            status = "regression"
+            notes.append("more memory")
+        if status == "ok" and not noisy and row["ratio_wall_s"] < 1 / threshold:
+            status = "faster"
+        if a["output_bytes"] != b["output_bytes"]:
+            notes.append("output size changed")
+        row["status"] = status
+        row["note"] = ", ".join(notes)
+        rows.append(row)
+    return rows
+
+def format_table(rows: list) -> str:
+    """Renders comparison rows as a fixed-width text table."""
+    header = f"{'case':<32} {'old s':>9} {'new s':>9} {'ratio':>6} {'old MiB':>9} {'new MiB':>9} {'ratio':>6}  status"
+    lines = [header, "-" * len(header)]
+    for r in rows:
+        if "ratio_wall_s" not in r:
+            lines.append(f"{r['case']:<32} {'':>52}  {r['status']} {r.get('note', '')}".rstrip())
+            continue
+        lines.append(
+            f"{r['case']:<32} {r['old_wall_s']:9.3f} {r['new_wall_s']:9.3f} {r['ratio_wall_s']:6.2f} "
+            f"{r['old_peak_rss_mb']:9.1f} {r['new_peak_rss_mb']:9.1f} {r['ratio_peak_rss_mb']:6.2f}  "
+            f"{r['status']}{' (' + r['note'] + ')' if r['note'] else ''}"
+        )
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two WATcycle benchmark results.")
+    parser.add_argument("old", help="Result file, commit prefix or git revision (baseline)")
+    parser.add_argument("new", help="Result file, commit prefix or git revision (candidate)")
+    parser.add_argument("--preset", default="small")
+    parser.add_argument("--threshold", type=float, default=1.10, help="Ratio above which a case regresses")
+    parser.add_argument("--results-dir", default=RESULTS_DIR)
+    parser.add_argument("--json", action="store_true", help="Print rows as JSON instead of a table")
+    args = parser.parse_args(argv)
+
+    paths = [resolve_result(ref, args.preset, args.results_dir) for ref in (args.old, args.new)]
+    old, new = (json.load(open(p)) for p in paths)
+    if old["preset"] != new["preset"]:
+        print(f"warning: comparing presets '{old['preset']}' and '{new['preset']}'", file=sys.stderr)
+
+    rows = compare_results(old, new, threshold=args.threshold)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print(f"old: {old['git']['commit'][:12]} {old['git']['subject']}")
+        print(f"new: {new['git']['commit'][:12]} {new['git']['subject']}{' (dirty)' if new['git']['dirty'] else ''}")
+        print(format_table(rows))
+    return 1 if any(r["status"] == "regression" for r in rows) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+# benchmarks/datasets.py
+
+import os
+import json
+
+import numpy as np
+
+from utils.synthetic_data import generate_synthetic_dataset
+
+# Grid resolution (degrees), record length and number of archive parts per preset.
+# "large" matches a 0.25° GLDAS monthly archive; one variable is ~1 GB as float32.
+PRESETS = {
+    "small":  {"res": 1.0,  "years": 5,  "freq": "MS", "n_files": 5},
+    "medium": {"res": 0.5,  "years": 20, "freq": "MS", "n_files": 20},
+    "large":  {"res": 0.25, "years": 20, "freq": "MS", "n_files": 20},
+}
+
+OVERLAP_STEPS = 3  # time steps shared by consecutive archive parts
+
+def ensure_dataset(preset: str = "small", data_dir: str = None, seed: int = 0) -> dict:
+    """
+    Generates (once) the synthetic archive for a preset and returns its paths.
+
+    The archive is written with utils.synthetic_data and consists of one
+    full-record file, the same record split into `n_files` parts whose
+    neighbours overlap by OVERLAP_STEPS time steps (for merge benchmarks),
+    and a basin outline GeoJSON.
+
+    Args:
+        preset: Key of PRESETS
+        data_dir: Root directory for generated data (default: benchmarks/data)
+        seed: Random seed; the same seed always yields identical files
+
+    Returns:
+        Dict with 'full', 'parts' (list), 'basin', 'truth' (ground-truth JSON)
+        and 'preset' entries
+    """
+    if preset not in PRESETS:
+        raise ValueError(f"Unknown preset '{preset}'; choose from {', '.join(PRESETS)}")
+    spec = PRESETS[preset]
+    data_dir = data_dir or os.path.join(os.path.dirname(__file__), "data")
+    root = os.path.join(data_dir, f"{preset}-s{seed}")
+    manifest_path = os.path.join(root, "manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            return json.load(f)
+
+    os.makedirs(root, exist_ok=True)
+    common = dict(res=spec["res"], periods=spec["years"] * 12, freq=spec["freq"], change_points=1,
+                  complevel=1, seed=seed)
+    truth = generate_synthetic_dataset(os.path.join(root, "full.nc"), **common)
+    parts = generate_synthetic_dataset(os.path.join(root, "parts"), n_files=spec["n_files"],
+                                       overlap_steps=OVERLAP_STEPS, **common)["files"]
+
+    basin = os.path.join(root, "basin.geojson")
+    basin_geometries().to_file(basin, driver="GeoJSON")
+
+    land = truth["land_mask"]
+    manifest = {"preset": preset, "seed": seed, "full": truth["files"][0], "parts": parts, "basin": basin,
+                "truth": truth["truth_path"], "shape": [int(truth["times"].size), *map(int, land.shape)]}
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+def basin_geometries():
+    """Returns a GeoDataFrame with an irregular Amazon-sized basin outline (EPSG:4326)."""
+    import geopandas as gpd
+    from shapely.geometry import Polygon
+
+    theta = np.linspace(0, 2 * np.pi, 180, endpoint=False)
+    radius = 1 + 0.25 * np.sin(3 * theta) + 0.1 * np.cos(7 * theta)
+    ring = np.column_stack([-62 + 13 * radius * np.cos(theta), -6 + 9 * radius * np.sin(theta)])
+    return gpd.GeoDataFrame({"name": ["basin"]}, geometry=[Polygon(ring)], crs="EPSG:4326")
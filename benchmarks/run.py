@@ -0,0 +1,216 @@
+# benchmarks/run.py
+"""
+Runs the benchmark suite and writes one JSON result file per commit.
+
+Every case runs in a fresh Python process so peak RSS is not polluted by
+earlier cases. Usage (from the repository root):
+
+    python -m benchmarks.run --preset small
+    python -m benchmarks.run --preset medium --filter merge --repeat 5
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import resource
+import subprocess
+from fnmatch import fnmatch
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+
+def _peak_rss_mb() -> float:
+    """Peak resident set size of this process in MiB (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def output_bytes(result, scratch_dir: str) -> int:
+    """
+    Materialises a case result and returns its size in bytes.
+
+    Datasets are written to NetCDF (which also computes lazy results, as the
+    app does when a user downloads them); frames, arrays and raw bytes are
+    measured in memory; anything else is measured as JSON.
+    """
+    import numpy as np
+    import pandas as pd
+    import xarray as xr
+
+    if result is None:
+        return 0
+    if isinstance(result, xr.DataArray):
+        result = result.to_dataset(name=result.name or "value")
+    if isinstance(result, xr.Dataset):
+        fd, path = tempfile.mkstemp(suffix=".nc", dir=scratch_dir)
+        os.close(fd)
+        try:
+            result.to_netcdf(path)
+            return os.path.getsize(path)
+        finally:
+            os.remove(path)
+    if isinstance(result, (bytes, bytearray)):
+        return len(result)
+    if isinstance(result, (pd.DataFrame, pd.Series)):
+        return int(result.memory_usage(deep=True).sum()) if isinstance(result, pd.DataFrame) \
+            else int(result.memory_usage(deep=True))
+    if isinstance(result, np.ndarray):
+        return int(result.nbytes)
+    if isinstance(result, dict) and result and all(isinstance(v, (xr.Dataset, xr.DataArray)) for v in result.values()):
+        return sum(output_bytes(v, scratch_dir) for v in result.values())
+    if isinstance(result, (list, tuple)) and result and all(isinstance(v, (xr.Dataset, pd.DataFrame)) for v in result):
+        return sum(output_bytes(v, scratch_dir) for v in result)
+    return len(json.dumps(result, default=str).encode())
+
+def run_worker(name: str, data: dict, repeat: int) -> dict:
+    """Runs one case `repeat` times in this process and returns its measurements."""
+    from benchmarks.cases import CASES
+
+    case = CASES[name]
+    args = case["setup"](data)
+    baseline_rss = _peak_rss_mb()
+    scratch_dir = tempfile.mkdtemp(prefix="watcycle_bench_")
+    walls, cpus, size = [], [], 0
+    try:
+        for _ in range(repeat):
+            t0, c0 = time.perf_counter(), time.process_time()
+            result = case["run"](*args)
+            size = output_bytes(result, scratch_dir)
+            walls.append(time.perf_counter() - t0)
+            cpus.append(time.process_time() - c0)
+            del result
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+    peak = _peak_rss_mb()
+    return {
+        "wall_s": min(walls),
+        "wall_all_s": walls,
+        "cpu_s": min(cpus),
+        "peak_rss_mb": round(peak, 1),
+        "rss_above_setup_mb": round(max(peak - baseline_rss, 0.0), 1),
+        "output_bytes": size,
+    }
+
+def git_info() -> dict:
+    """Returns the current commit hash, subject and whether the tree has uncommitted changes."""
+    def git(*args):
+        out = subprocess.run(["git", *args], capture_output=True, text=True, cwd=REPO_ROOT)
+        return out.stdout.strip() if out.returncode == 0 else ""
+    return {
+        "commit": git("rev-parse", "HEAD") or "unknown",
+        "subject": git("log", "-1", "--format=%s"),
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+    }
+
+def environment_info() -> dict:
+    """Returns the interpreter, machine and key library versions."""
+    import numpy, pandas, xarray, dask, netCDF4
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": numpy.__version__,
+        "pandas": pandas.__version__,
+        "xarray": xarray.__version__,
+        "dask": dask.__version__,
+        "netCDF4": netCDF4.__version__,
+    }
+
+def run_suite(preset: str = "small", pattern: str = "*", repeat: int = 3, data_dir: str = None,
+              results_dir: str = RESULTS_DIR, timeout: float = 3600) -> str:
+    """
+    Runs every case matching `pattern` in its own subprocess and saves the results.
+
+    Args:
+        preset: Dataset preset name (see benchmarks.datasets.PRESETS)
+        pattern: Shell-style filter on case names, e.g. 'merge.*'
+        repeat: Timed repetitions per case; the minimum wall time is reported
+        data_dir: Where generated data lives (default: benchmarks/data)
+        results_dir: Where the JSON result is written
+        timeout: Seconds before a case is killed and recorded as an error
+
+    Returns:
+        Path of the written result file
+    """
+    from benchmarks.cases import CASES
+    from benchmarks.datasets import ensure_dataset
+
+    print(f"Preparing '{preset}' dataset...", flush=True)
+    data = ensure_dataset(preset, data_dir)
+    names = [n for n in CASES if fnmatch(n, pattern) or pattern in n]
+    if not names:
+        raise ValueError(f"No benchmark matches '{pattern}'.")
+
+    results = {}
+    for name in names:
+        cmd = [sys.executable, "-m", "benchmarks.run", "--worker", name, "--preset", preset,
+               "--repeat", str(repeat)]
+        if data_dir:
+            cmd += ["--data-dir", data_dir]
+        try:
+            proc = subprocess.run(cmd, capture_output=True, text=True, cwd=REPO_ROOT, timeout=timeout)
+            lines = [l for l in proc.stdout.splitlines() if l.startswith("{")]
+            if proc.returncode != 0 or not lines:
+                err = proc.stderr.strip().splitlines()
+                results[name] = {"error": err[-1] if err else f"exit code {proc.returncode}"}
+            else:
+                results[name] = json.loads(lines[-1])
+        except subprocess.TimeoutExpired:
+            results[name] = {"error": f"timed out after {timeout:.0f}s"}
+        r = results[name]
+        if "error" in r:
+            print(f"  {name:<32} ERROR  {r['error']}", flush=True)
+        else:
+            print(f"  {name:<32} {r['wall_s']:9.3f} s {r['peak_rss_mb']:9.1f} MiB "
+                  f"{r['output_bytes'] / 1e6:10.2f} MB", flush=True)
+
+    report = {
+        "git": git_info(),
+        "preset": preset,
+        "shape": data["shape"],
+        "repeat": repeat,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": environment_info(),
+        "results": results,
+    }
+    os.makedirs(results_dir, exist_ok=True)
+    out_path = os.path.join(results_dir, f"{report['git']['commit'][:12]}-{preset}.json")
+    with open(out_path, "w") as f:
+        json.dump(report, f, indent=2)
+    return out_path
+
+def main(argv=None):
+    from benchmarks.datasets import PRESETS
+
+    parser = argparse.ArgumentParser(description="Run the WATcycle benchmark suite.")
+    parser.add_argument("--preset", default="small", choices=list(PRESETS))
+    parser.add_argument("--filter", default="*", help="Shell-style pattern or substring of case names")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--data-dir", default=None)
+    parser.add_argument("--results-dir", default=RESULTS_DIR)
+    parser.add_argument("--timeout", type=float, default=3600)
+    parser.add_argument("--list", action="store_true", help="List the benchmark cases and exit")
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.list:
+        from benchmarks.cases import CASES
+        print("\n".join(CASES))
+        return 0
+
+    if args.worker:
+        from benchmarks.datasets import ensure_dataset
+        data = ensure_dataset(args.preset, args.data_dir)
+        print(json.dumps(run_worker(args.worker, data, args.repeat)), flush=True)
+        return 0
+
+    out_path = run_suite(args.preset, args.filter, args.repeat, args.data_dir, args.results_dir, args.timeout)
+    print(f"Results written to {out_path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
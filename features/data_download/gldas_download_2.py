@@ -4,6 +4,8 @@ import requests
 import xarray as xr
 import streamlit as st
 
+from utils.session_store import put_session_object, get_session_object
+
 # ---- Helpers ----
 
 def read_urls_from_uploaded_file(uploaded_file):
@@ -69,7 +71,7 @@ def gldas_download_ui():
 
                 st.success("✅ Merge complete!")
                 # persist in session
-                st.session_state["merged_ds"]   = merged_ds
+                put_session_object("merged_ds", merged_ds)
                 st.session_state["merged_path"] = merged_path
                 st.session_state["tmp_dir"]     = tmp_dir
 
@@ -94,7 +96,7 @@ def gldas_download_ui():
         st.markdown("— or —")
 
         # 2b) Filter UI
-        merged_ds = st.session_state["merged_ds"]
+        merged_ds = get_session_object("merged_ds")
         tmp_dir   = st.session_state["tmp_dir"]
 
         st.markdown("**Filter variables and time range**")
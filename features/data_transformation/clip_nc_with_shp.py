@@ -2,17 +2,18 @@ import os
 import tempfile
 import geopandas as gpd
 import streamlit as st
-import folium
-from streamlit_folium import folium_static
 
 from utils.geospatial_utils import load_netcdf_with_engines, clip_dataset_with_shapefile
 from utils.saving_netcdf import interactive_save_netcdf
+from utils.instrumentation import track
+from utils.geometry_store import get_session_geometry
+from utils.map_preview import shapefile_preview_map
 
 def clip_netcdf_feature():
     st.header("✂️ Clip NetCDF with Shapefile")
 
     # Load shapefile from session
-    shapefile = st.session_state.get("uploaded_shapefile_gdf")
+    shapefile = get_session_geometry()
     if shapefile is None:
         st.warning("⚠️ Please upload a shapefile first using the 'Upload Shapefile' section.")
         return
@@ -21,14 +22,9 @@ def clip_netcdf_feature():
 
     # Preview map and data
     st.subheader("📍 Shapefile Preview")
-    st.dataframe(shapefile.head())
+    st.dataframe(shapefile.source.head())
 
-    m = folium.Map(
-        location=[shapefile.geometry.centroid.y.mean(), shapefile.geometry.centroid.x.mean()],
-        zoom_start=6
-    )
-    folium.GeoJson(shapefile).add_to(m)
-    folium_static(m)
+    shapefile_preview_map(shapefile, key="clip_nc_map")
 
     # Load NetCDF from session or upload
     if "uploaded_nc_file" in st.session_state:
@@ -63,7 +59,8 @@ def clip_netcdf_feature():
                 clipped_ds = clip_dataset_with_shapefile(ds, shapefile)
 
                 output_path = os.path.join(os.getcwd(), f"{netcdf_filename}.nc")
-                clipped_ds.to_netcdf(output_path)
+                with track("to_netcdf"):
+                    clipped_ds.to_netcdf(output_path)
 
                 st.success("✨ Download complete!")
 
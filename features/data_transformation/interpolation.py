@@ -8,7 +8,11 @@ import pandas as pd
 from io import BytesIO
 
 from utils.file_handler import load_dataset
-from utils.interpolation_utils import interpolate_na_along_dim, interpolate_na_all
+from utils.interpolation_utils import (
+    interpolate_na_along_dim, interpolate_na_all, fill_time_gaps, fill_spatial_gaps, TIME_FILL_METHODS,
+    SPATIAL_FILL_METHODS
+)
+from utils.instrumentation import track
 
 def interpolate_netcdf_ui():
     st.title("🔍 Interpolate Missing Values")
@@ -32,21 +36,80 @@ def interpolate_netcdf_ui():
             "Choose interpolation approach:",
             options=[
                 "Fill NaNs along one dimension",
-                "Fill NaNs across all dimensions"
+                "Fill NaNs across all dimensions",
+                "Fill time gaps (gap-limited)",
+                "Fill spatial gaps (lat/lon)"
             ],
             horizontal=True
         )
 
-        # Method selection with help text
-        method = st.selectbox(
-            "Select interpolation method:",
-            options=["linear", "nearest", "spline"],
-            help="Linear: straight line between points\nNearest: uses closest value\nSpline: smooth curve fitting",
-            index=0
-        )
-
         ds_interp = None
 
+        if interp_mode == "Fill time gaps (gap-limited)":
+            if "time" not in ds.dims:
+                st.error("❌ Time dimension not found in the dataset!")
+                return
+            st.info("💡 Fills only short gaps along time, chunk by chunk, and adds a '<variable>_filled' mask")
+            col1, col2 = st.columns(2)
+            with col1:
+                max_gap = st.number_input("Longest gap to fill (time steps)", min_value=1, value=3, step=1)
+            with col2:
+                chunk_size = st.number_input("Time steps per chunk", min_value=10, value=365, step=10)
+
+            time_vars = [v for v in ds.data_vars if "time" in ds[v].dims]
+            with st.expander("Method per variable", expanded=True):
+                methods = {
+                    var: st.selectbox(f"{var}", options=list(TIME_FILL_METHODS), index=0, key=f"fill_{var}",
+                                      help="Climatology: mean value for the same month / day of year")
+                    for var in time_vars
+                }
+
+            if st.button("🔄 Start Interpolation"):
+                with st.spinner("📊 Filling time gaps..."):
+                    ds_interp = fill_time_gaps(ds, methods, max_gap=int(max_gap), chunk_size=int(chunk_size))
+                    st.success("✅ Interpolation complete!")
+
+        elif interp_mode == "Fill spatial gaps (lat/lon)":
+            if "lat" not in ds.dims or "lon" not in ds.dims:
+                st.error("❌ Latitude/longitude dimensions not found in the dataset!")
+                return
+            st.info("💡 Fills NaN cells from nearby valid cells and adds a '<variable>_filled' mask")
+            col1, col2 = st.columns(2)
+            with col1:
+                spatial_method = st.selectbox(
+                    "Select fill method:",
+                    options=list(SPATIAL_FILL_METHODS),
+                    help="idw: inverse distance weighting of the nearest valid cells\n"
+                         "laplace: smooth fill solving Laplace's equation, started from IDW"
+                )
+                k = st.number_input("Neighbours (k)", min_value=1, value=8, step=1)
+                power = st.number_input("IDW power", min_value=0.5, value=2.0, step=0.5)
+            with col2:
+                use_max_distance = st.checkbox("Limit fill distance")
+                max_distance = None
+                if use_max_distance:
+                    max_distance = st.number_input("Maximum distance (km)", min_value=1.0, value=100.0, step=10.0)
+                skip_always_missing = st.checkbox(
+                    "Skip cells missing at every time step", value=True,
+                    help="Leaves e.g. ocean cells of a land-only product untouched"
+                )
+
+            if st.button("🔄 Start Interpolation"):
+                with st.spinner("📊 Filling spatial gaps..."):
+                    ds_interp = fill_spatial_gaps(ds, method=spatial_method, k=int(k), power=float(power),
+                                                  max_distance_km=max_distance,
+                                                  skip_always_missing=skip_always_missing)
+                    st.success("✅ Interpolation complete!")
+
+        else:
+            # Method selection with help text
+            method = st.selectbox(
+                "Select interpolation method:",
+                options=["linear", "nearest", "spline"],
+                help="Linear: straight line between points\nNearest: uses closest value\nSpline: smooth curve fitting",
+                index=0
+            )
+
         if interp_mode == "Fill NaNs along one dimension":
             st.info("💡 This method fills missing values along a single dimension (e.g., time or space)")
             dim = st.selectbox(
@@ -60,7 +123,7 @@ def interpolate_netcdf_ui():
                     ds_interp = interpolate_na_along_dim(ds, dim, method=method)
                     st.success("✅ Interpolation complete!")
 
-        else:  # Fill NaNs across all dimensions
+        elif interp_mode == "Fill NaNs across all dimensions":
             st.info("💡 This method fills missing values using all available dimensions")
 
             if st.button("🔄 Start Interpolation"):
@@ -79,13 +142,19 @@ def interpolate_netcdf_ui():
             # Download section
             st.subheader("💾 Save Results")
             with st.spinner("Preparing download..."):
-                merged_nc = ds_interp.to_netcdf()
-                st.download_button(
-                    label="📥 Download Interpolated NetCDF",
-                    data=merged_nc,
-                    file_name="interpolated_data.nc",
-                    mime="application/x-netcdf"
-                )
+                # Chunked results are computed while streaming to disk
+                with tempfile.NamedTemporaryFile(delete=False, suffix=".nc") as tmp_out:
+                    out_path = tmp_out.name
+                with track("to_netcdf"):
+                    ds_interp.to_netcdf(out_path)
+                with open(out_path, "rb") as f:
+                    st.download_button(
+                        label="📥 Download Interpolated NetCDF",
+                        data=f,
+                        file_name="interpolated_data.nc",
+                        mime="application/x-netcdf"
+                    )
+                os.remove(out_path)
 
     except Exception as e:
         st.error(f"❌ An error occurred: {str(e)}")
@@ -5,7 +5,29 @@ import streamlit as st
 import xarray as xr
 from io import BytesIO
 
-from utils.merge_netcdf_utils import merge_netcdf_concat, merge_netcdf_merge, smart_merge_netcdf
+from utils.merge_netcdf_utils import (
+    smart_merge_netcdf, plan_netcdf_merge, execute_merge_plan
+)
+from utils.instrumentation import track
+
+def _show_merge_plan(plan: dict, names: dict):
+    """Displays the validation result of a header-only merge plan."""
+    for msg in plan["errors"]:
+        st.error(f"❌ {msg}")
+    for msg in plan["warnings"]:
+        st.warning(f"⚠️ {msg}")
+    if plan["gaps"]:
+        st.warning(f"⚠️ {len(plan['gaps'])} gap(s) between files")
+        st.dataframe([{
+            "After": names.get(g["after"], os.path.basename(g["after"])),
+            "Before": names.get(g["before"], os.path.basename(g["before"])),
+            "Missing from": str(g["gap_start"]),
+            "Missing to": str(g["gap_end"]),
+        } for g in plan["gaps"]])
+    if plan["overlaps"]:
+        st.info(f"💡 {len(plan['overlaps'])} overlap(s) between files; duplicates keep the first file's values")
+    if plan["valid"]:
+        st.success(f"✅ {len(plan['files'])} file(s) are compatible")
 
 def merge_netcdf_ui():
     st.title("🔗 Merge NetCDF Files")
@@ -49,9 +71,10 @@ def merge_netcdf_ui():
         )
         duplicate_policy = st.selectbox(
             "How to handle duplicate values:",
-            options=["drop", "average"],
+            options=["keep-first", "keep-last", "average", "priority"],
             index=0,
-            help="Drop: keep first occurrence, Average: calculate mean of duplicates"
+            help="Keep-first/last: keep the first or last occurrence, Average: calculate mean of duplicates, "
+                 "Priority: keep the value from the highest-ranked file"
         )
 
     # File uploader with better instructions
@@ -72,16 +95,33 @@ def merge_netcdf_ui():
 
         st.success(f"✅ Successfully loaded {len(file_paths)} file(s)")
 
+        source_priority = None
+        if merge_method == "Smart Merge" and duplicate_policy == "priority":
+            st.markdown("**Source priority** (1 = preferred when values overlap)")
+            source_priority = [
+                st.number_input(f"Rank for {file.name}", min_value=1, value=i + 1, step=1, key=f"prio_{i}")
+                for i, file in enumerate(uploaded_files)
+            ]
+
+        # Header-only plan: validate before any data is read
+        plan = None
+        if merge_method in ("Concatenate", "Merge"):
+            names = {fp: file.name for fp, file in zip(file_paths, uploaded_files)}
+            with st.spinner("Checking file headers..."):
+                plan = plan_netcdf_merge(file_paths, dim=concat_dim or "time",
+                                         mode="concat" if merge_method == "Concatenate" else "merge")
+            with st.expander("🧭 Merge Plan", expanded=not plan["valid"] or bool(plan["gaps"])):
+                _show_merge_plan(plan, names)
+
         # Process button
-        if st.button("🔄 Start Merging",):
+        if st.button("🔄 Start Merging", disabled=plan is not None and not plan["valid"]):
             try:
                 with st.spinner("Merging your NetCDF files..."):
-                    if merge_method == "Concatenate":
-                        merged_ds = merge_netcdf_concat(file_paths, dim=concat_dim)
-                    elif merge_method == "Merge":
-                        merged_ds = merge_netcdf_merge(file_paths)
+                    if merge_method in ("Concatenate", "Merge"):
+                        merged_ds = execute_merge_plan(plan)
                     elif merge_method == "Smart Merge":
-                        merged_ds = smart_merge_netcdf(file_paths, dim=concat_dim, duplicate_policy=duplicate_policy)
+                        merged_ds = smart_merge_netcdf(file_paths, dim=concat_dim, duplicate_policy=duplicate_policy,
+                                                       source_priority=source_priority)
                     else:
                         st.error("Invalid merge method selected.")
                         return
@@ -96,14 +136,21 @@ def merge_netcdf_ui():
                 # Download section
                 st.subheader("💾 Save Results")
                 with st.spinner("Preparing file for download..."):
-                    merged_nc = merged_ds.to_netcdf()
-                    st.download_button(
-                        label="📥 Download Merged NetCDF",
-                        data=merged_nc,
-                        file_name="merged_dataset.nc",
-                        mime="application/x-netcdf",
-                        help="Save the merged file to your computer"
-                    )
+                    # Stream the (lazy) merged dataset to disk block by block
+                    with tempfile.NamedTemporaryFile(delete=False, suffix=".nc") as tmp_out:
+                        out_path = tmp_out.name
+                    with track("to_netcdf"):
+                        merged_ds.to_netcdf(out_path)
+                    merged_ds.close()
+                    with open(out_path, "rb") as f:
+                        st.download_button(
+                            label="📥 Download Merged NetCDF",
+                            data=f,
+                            file_name="merged_dataset.nc",
+                            mime="application/x-netcdf",
+                            help="Save the merged file to your computer"
+                        )
+                    os.remove(out_path)
             except Exception as e:
                 st.error(f"❌ Error during merging: {str(e)}")
             finally:
@@ -3,6 +3,7 @@ import pandas as pd
 from datetime import datetime
 from utils.file_handler import load_dataset_to_dataframe, load_dataset
 from utils.missing_time_steps_utils import find_missing_time_steps, generate_missing_timesteps_netcdf
+from utils.instrumentation import track
 
 def missing_time_steps_ui():
     st.subheader("📅 Identify & Fill Missing Time Steps in Dataset")
@@ -55,7 +56,8 @@ def missing_time_steps_ui():
                 missing_times = result_df["Missing_Date"].tolist()  # Ensure these are in a datetime-like format
                 filled_ds = generate_missing_timesteps_netcdf(ds, missing_times)
                 filled_filename = "netcdf_with_missing_timesteps.nc"
-                filled_ds.to_netcdf(filled_filename)
+                with track("to_netcdf"):
+                    filled_ds.to_netcdf(filled_filename)
 
             with open(filled_filename, "rb") as f:
                 st.download_button("📦 Download NetCDF File", data=f, file_name=filled_filename, mime="application/x-netcdf")
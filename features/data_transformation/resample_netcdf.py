@@ -1,6 +1,7 @@
 # features/data_transformation/resample_netcdf.py
 import os
 import tempfile
+import warnings
 import streamlit as st
 import xarray as xr
 import numpy as np
@@ -8,20 +9,26 @@ import pandas as pd
 from io import BytesIO
 
 from utils.file_handler import load_dataset
+from utils.catalog_utils import get_file_record
 from utils.resample_utils import (
     interp_resample,
     coarsen_resample,
     # xesmf_regrid,
     groupby_resample,
-    create_zip_from_datasets
+    create_zip_from_datasets,
+    temporal_resample,
+    infer_temporal_semantics,
+    BLOCK_FUNCS
 )
+from utils.instrumentation import track
 
 def resample_netcdf_ui():
     st.title("🏁 Resample NetCDF Resolution")
 
     st.markdown("""
     This tool helps you change the spatial resolution of your NetCDF data.
-    You can make your grid finer (interpolation) or coarser (aggregation).
+    You can make your grid finer (interpolation) or coarser (aggregation),
+    or aggregate the time axis (e.g. daily → monthly → yearly).
     """)
 
     if "uploaded_nc_file" not in st.session_state:
@@ -39,7 +46,7 @@ def resample_netcdf_ui():
         st.subheader("⚙️ Resampling Settings")
         resample_method = st.radio(
             "Select resampling approach:",
-            options=["Interpolation", "Coarsening"],
+            options=["Interpolation", "Coarsening", "Temporal Aggregation"],
             horizontal=True,
             help="Choose how to change your data resolution"
         )
@@ -120,21 +127,90 @@ def resample_netcdf_ui():
 
             factors = {"lat": lat_factor, "lon": lon_factor}
 
-            agg_func = st.selectbox(
-                "Aggregation method:",
-                options=["mean", "sum"],
-                index=0,
-                help="Mean: average values, Sum: total values"
-            )
+            col1, col2 = st.columns(2)
+            with col1:
+                agg_func = st.selectbox(
+                    "Aggregation method:",
+                    options=list(BLOCK_FUNCS),
+                    index=0,
+                    help="Mean: average values, Sum: total values, Min/Max/Median/Std: block statistics"
+                )
+            with col2:
+                weights = st.selectbox(
+                    "Cell weighting:",
+                    options=["none", "coslat", "area"],
+                    format_func=lambda w: {"none": "None", "coslat": "Cosine of latitude",
+                                           "area": "Cell area"}[w],
+                    index=0,
+                    help="Weights cells by their size for mean, sum and std. "
+                         "With cell-area weights, sum gives value × km² totals."
+                )
+
+            col1, col2 = st.columns(2)
+            with col1:
+                min_valid_fraction = st.slider(
+                    "Minimum valid fraction per block:",
+                    min_value=0.0, max_value=1.0, value=0.0, step=0.05,
+                    help="Blocks with a smaller share of non-missing cells become NaN"
+                )
+            with col2:
+                boundary = st.selectbox(
+                    "Incomplete edge blocks:",
+                    options=["trim", "pad"],
+                    index=0,
+                    help="Trim: drop partial blocks at the grid edge, Pad: keep them"
+                )
 
             if st.button("🔄 Start Coarsening",):
                 with st.spinner("Creating coarser resolution grid..."):
                     try:
-                        ds_resampled = coarsen_resample(ds, factors, boundary="trim", func=agg_func)
+                        with warnings.catch_warnings(record=True) as caught:
+                            warnings.simplefilter("always")
+                            ds_resampled = coarsen_resample(ds, factors, boundary=boundary, func=agg_func,
+                                                            weights=weights, min_valid_fraction=min_valid_fraction)
+                        for w in caught:
+                            st.warning(f"⚠️ {w.message}")
                         st.success("✅ Coarsening successful!")
                     except Exception as e:
                         st.error(f"❌ Error during coarsening: {e}")
 
+        elif resample_method == "Temporal Aggregation":
+            st.info("💡 Fluxes are summed over each period, states averaged and storages take the last value")
+            record = get_file_record(st.session_state["uploaded_nc_file"])
+            if "time" not in record["dims"]:
+                st.error("❌ Time dimension not found in the dataset!")
+                return
+
+            freq_options = {"Monthly": "MS", "Seasonal (DJF, MAM, JJA, SON)": "QS-DEC", "Yearly": "YS"}
+            freq_label = st.selectbox("Target time step:", options=list(freq_options.keys()), index=0)
+            min_coverage = st.slider(
+                "Minimum data coverage per period:",
+                min_value=0.0, max_value=1.0, value=0.8, step=0.05,
+                help="Share of a period's time steps that must have data; otherwise the result is NaN"
+            )
+
+            kinds = ["flux", "state", "storage"]
+            time_vars = [v for v, info in record["variables"].items() if "time" in info["dims"]]
+            with st.expander("Variable types", expanded=True):
+                semantics = {
+                    var: st.selectbox(
+                        f"{var}", options=kinds, index=kinds.index(infer_temporal_semantics(ds[var])),
+                        key=f"semantics_{var}",
+                        help="Flux: summed (e.g. precipitation), State: averaged (e.g. temperature), "
+                             "Storage: last value (e.g. TWS)"
+                    )
+                    for var in time_vars
+                }
+
+            if st.button("🔄 Start Aggregation"):
+                with st.spinner("Aggregating time steps..."):
+                    try:
+                        ds_resampled = temporal_resample(ds, freq=freq_options[freq_label], semantics=semantics,
+                                                         min_coverage=min_coverage)
+                        st.success("✅ Temporal aggregation successful!")
+                    except Exception as e:
+                        st.error(f"❌ Error during aggregation: {e}")
+
         # Results and download section
         if ds_resampled is not None:
             st.subheader("📊 Results")
@@ -147,7 +223,7 @@ def resample_netcdf_ui():
                 comparison = pd.DataFrame({
                     "Dimension": list(ds.dims.keys()),
                     "Original Size": [ds.dims[dim] for dim in ds.dims],
-                    "New Size": [ds_resampled.dims[dim] for dim in ds_resampled.dims if dim in ds.dims]
+                    "New Size": [ds_resampled.sizes.get(dim) for dim in ds.dims]
                 })
                 st.table(comparison)
 
@@ -155,15 +231,20 @@ def resample_netcdf_ui():
             st.subheader("💾 Save Results")
             with st.spinner("Preparing file for download..."):
                 try:
-                    # Convert directly to bytes instead of using BytesIO
-                    resampled_nc = ds_resampled.to_netcdf()
-                    st.download_button(
-                        label="📥 Download Resampled NetCDF",
-                        data=resampled_nc,
-                        file_name="resampled_dataset.nc",
-                        mime="application/x-netcdf",
-                        help="Save the resampled file to your computer"
-                    )
+                    # Lazy results are computed chunk by chunk while writing
+                    with tempfile.NamedTemporaryFile(delete=False, suffix=".nc") as tmp_out:
+                        out_path = tmp_out.name
+                    with track("to_netcdf"):
+                        ds_resampled.to_netcdf(out_path)
+                    with open(out_path, "rb") as f:
+                        st.download_button(
+                            label="📥 Download Resampled NetCDF",
+                            data=f,
+                            file_name="resampled_dataset.nc",
+                            mime="application/x-netcdf",
+                            help="Save the resampled file to your computer"
+                        )
+                    os.remove(out_path)
                 except Exception as e:
                     st.error(f"❌ Error preparing download: {e}")
 
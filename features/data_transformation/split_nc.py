@@ -8,6 +8,7 @@ import pandas as pd
 from io import BytesIO
 
 from utils.file_handler import load_dataset
+from utils.catalog_utils import catalog_dims
 from utils.split_nc_utils import split_netcdf_by_index, split_netcdf_by_label, split_netcdf_by_group, create_zip_from_datasets
 
 def split_netcdf_ui():
@@ -49,7 +50,7 @@ def split_netcdf_ui():
 
             dim = st.selectbox(
                 "Select dimension to split on:",
-                options=list(ds.dims.keys()),
+                options=list(catalog_dims(st.session_state["uploaded_nc_file"])),
                 index=0,
                 help="The dimension along which to divide the data"
             )
@@ -0,0 +1,126 @@
+# batch_standardizer.py
+import os
+import glob
+import zipfile
+import tempfile
+import streamlit as st
+from utils.netcdf_standardizer_utils import preview_batch_mappings, batch_standardize
+from utils.catalog_utils import index_file
+
+def batch_standardizer_feature():
+    st.title("🗂️ Batch NetCDF Standardizer")
+    st.markdown("""
+    Standardize many NetCDF files at once. Time, latitude and longitude are detected
+    from each file's header (CF attributes, units and common names), once per product,
+    and files are renamed in place where possible instead of being re-encoded.
+    """)
+
+    # 1️⃣ Input files
+    source = st.radio("Input files", ["Folder on server", "Upload files"], horizontal=True)
+    file_paths = []
+    if source == "Folder on server":
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            folder = st.text_input("Input folder", value="")
+        with col2:
+            pattern = st.text_input("File pattern", value="*.nc")
+        if folder:
+            file_paths = sorted(glob.glob(os.path.join(folder, "**", pattern), recursive=True))
+    else:
+        uploads = st.file_uploader("Select NetCDF files", type=["nc"], accept_multiple_files=True)
+        if uploads:
+            key = tuple((u.name, u.size) for u in uploads)
+            if st.session_state.get("batch_upload_key") != key:
+                upload_dir = tempfile.mkdtemp(prefix="watcycle_batch_in_")
+                for u in uploads:
+                    with open(os.path.join(upload_dir, u.name), "wb") as f:
+                        f.write(u.getbuffer())
+                st.session_state["batch_upload_dir"] = upload_dir
+                st.session_state["batch_upload_key"] = key
+            file_paths = sorted(glob.glob(os.path.join(st.session_state["batch_upload_dir"], "*.nc")))
+
+    if not file_paths:
+        st.info("👆 Choose a folder or upload NetCDF files to begin")
+        return
+    st.success(f"✅ Found {len(file_paths)} file(s)")
+
+    # 2️⃣ Review the inferred mappings (one row per product)
+    st.subheader("Detected Dimension Mapping")
+    with st.spinner("Reading file headers..."):
+        preview = preview_batch_mappings(file_paths)
+    if preview.empty:
+        st.error("❌ None of the files could be read.")
+        return
+    st.caption("Edit the time / lat / lon columns to override a detected mapping. Leave empty if absent.")
+    edited = st.data_editor(
+        preview,
+        disabled=["signature", "example", "files", "variables", "cached"],
+        hide_index=True,
+        use_container_width=True
+    )
+    # Only edited rows override the detected mapping; batch_standardize() caches them
+    overrides = {}
+    for (_, row), (_, detected) in zip(edited.iterrows(), preview.iterrows()):
+        mapping = {k: (row[k] or None) for k in ("time", "lat", "lon")}
+        if mapping != {k: (detected[k] or None) for k in ("time", "lat", "lon")}:
+            overrides[row["signature"]] = mapping
+
+    # 3️⃣ Output settings
+    st.subheader("Global Metadata")
+    global_meta = {
+        "title": st.text_input("Title", ""),
+        "institution": st.text_input("Institution", ""),
+        "source": st.text_input("Source", ""),
+    }
+    default_out = st.session_state.get("batch_out_dir") or tempfile.mkdtemp(prefix="watcycle_batch_out_")
+    st.session_state["batch_out_dir"] = default_out
+    out_dir = st.text_input("Output folder", value=default_out)
+    workers = st.number_input("Worker processes", min_value=1, max_value=os.cpu_count() or 1,
+                              value=os.cpu_count() or 1, step=1)
+
+    input_root = folder if source == "Folder on server" else st.session_state["batch_upload_dir"]
+
+    if st.button("🚀 Standardize All"):
+        progress = st.progress(0.0, text="Standardizing files...")
+        try:
+            report = batch_standardize(
+                file_paths, out_dir, global_meta=global_meta, overrides=overrides, max_workers=int(workers),
+                progress=lambda done, total: progress.progress(done / total, text=f"{done}/{total} files"),
+                input_root=input_root
+            )
+        except Exception as e:
+            st.error(f"❌ Batch standardization failed: {e}")
+            return
+
+        # Register the standardized copies in the data catalog
+        for out_path in report.loc[report["output"] != "", "output"]:
+            try:
+                index_file(out_path, source="derived")
+            except Exception:
+                pass
+
+        # 4️⃣ Report
+        st.subheader("📋 Report")
+        counts = report["status"].value_counts()
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("OK", int(counts.get("ok", 0)))
+        col2.metric("Warnings", int(counts.get("warning", 0)))
+        col3.metric("Errors", int(counts.get("error", 0)))
+        col4.metric("Renamed in place", int((report["method"] == "in-place").sum()))
+        st.dataframe(report, use_container_width=True)
+        st.download_button("📥 Download Report (CSV)", report.to_csv(index=False).encode("utf-8"),
+                           file_name="standardization_report.csv", mime="text/csv")
+
+        if source == "Upload files":
+            outputs = [p for p in report["output"] if p]
+            with tempfile.NamedTemporaryFile(delete=False, suffix=".zip") as tmp_zip:
+                zip_path = tmp_zip.name
+            with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+                for p in outputs:
+                    zf.write(p, os.path.relpath(p, out_dir))
+            with open(zip_path, "rb") as f:
+                st.download_button("💾 Download Standardized Files (ZIP)", f,
+                                   file_name="standardized_files.zip", mime="application/zip")
+            os.remove(zip_path)
+        else:
+            st.success(f"✅ Standardized files written to {out_dir}")
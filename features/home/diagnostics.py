@@ -0,0 +1,97 @@
+# diagnostics.py
+import os
+import tracemalloc
+import pandas as pd
+import streamlit as st
+from utils.instrumentation import (
+    get_records, clear_records, summarize_records, export_json, export_prometheus, enable_memory_tracing, BUFFER_SIZE
+)
+from utils.session_store import governor_stats, governor_entries, enforce_budgets, export_governor_prometheus
+
+def diagnostics_enabled():
+    """The page is listed only with ?diagnostics=1 in the URL or WATCYCLE_DIAGNOSTICS=1."""
+    return st.query_params.get("diagnostics") == "1" or os.environ.get("WATCYCLE_DIAGNOSTICS") == "1"
+
+def diagnostics_ui():
+    st.title("⚙️ Diagnostics")
+    st.markdown(f"""
+    Time, memory and I/O of the instrumented operations in this server process
+    (last {BUFFER_SIZE:,} calls). Page rows cover a whole rerun of that page; the
+    rows below a page are the operations it called.
+    """)
+
+    # 1️⃣ Settings
+    col1, col2 = st.columns(2)
+    with col1:
+        tracing = st.toggle("Trace Python/NumPy allocations", value=tracemalloc.is_tracing(),
+                            help="Adds per-call allocation peaks; slows allocation-heavy code")
+        if tracing != tracemalloc.is_tracing():
+            enable_memory_tracing(tracing)
+    with col2:
+        if st.button("🗑️ Clear Records"):
+            clear_records()
+
+    # 2️⃣ Session memory governor
+    st.subheader("🧠 Session Memory")
+    stats = governor_stats()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("In memory (MB)", f"{stats['resident_bytes'] / 1e6:.0f}",
+                help=f"Budgets: {stats['session_budget_bytes'] / 2**20:.0f} MiB per session, "
+                     f"{stats['global_budget_bytes'] / 2**20:.0f} MiB in total")
+    col2.metric("On disk", stats["spilled_objects"])
+    col3.metric("Spills", stats["spills"], help=f"{stats['spilled_bytes'] / 1e6:.0f} MB in {stats['spill_seconds']:.1f} s")
+    col4.metric("Reloads", stats["reloads"], help=f"{stats['reloaded_bytes'] / 1e6:.0f} MB in {stats['reload_seconds']:.1f} s")
+    entries = governor_entries()
+    if not entries.empty:
+        st.dataframe(entries, hide_index=True, use_container_width=True)
+    if st.button("🧹 Enforce Budgets Now"):
+        freed = enforce_budgets()
+        st.success(f"✅ Freed {freed / 1e6:.0f} MB")
+
+    records = get_records()
+    if not records:
+        st.info("No calls recorded yet. Use another page and come back.")
+        return
+
+    # 3️⃣ Per-page breakdown
+    summary = summarize_records(records)
+    pages = list(summary["page"].unique())
+    page = st.selectbox("Page", pages)
+    page_summary = summary[summary["page"] == page]
+    runs = page_summary[page_summary["category"] == "page"]
+    ops = page_summary[page_summary["category"] != "page"]
+
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Reruns", int(runs["calls"].sum()) if not runs.empty else 0)
+    col2.metric("Mean rerun (s)", f"{runs['wall_mean_s'].iloc[0]:.2f}" if not runs.empty else "—")
+    col3.metric("Peak RSS (MiB)", f"{page_summary['peak_rss_mb'].max():.0f}")
+    col4.metric("Errors", int(page_summary["errors"].sum()))
+
+    if not ops.empty:
+        st.subheader("⏱️ Where the time goes")
+        st.bar_chart(ops.set_index("name")["wall_total_s"], horizontal=True)
+    st.dataframe(
+        page_summary.drop(columns=["page"]).style.format({
+            "wall_total_s": "{:.3f}", "wall_mean_s": "{:.3f}", "wall_p95_s": "{:.3f}", "wall_max_s": "{:.3f}",
+            "cpu_total_s": "{:.3f}", "peak_rss_mb": "{:.0f}", "traced_peak_mb": "{:.1f}",
+            "read_mb": "{:.1f}", "written_mb": "{:.1f}", "share_of_page": "{:.0%}"
+        }, na_rep="—"),
+        hide_index=True,
+        use_container_width=True
+    )
+
+    # 4️⃣ Recent calls
+    with st.expander("🧾 Recent calls"):
+        recent = pd.DataFrame([r for r in records if (r["page"] or "(none)") == page][-200:][::-1])
+        recent["start"] = pd.to_datetime(recent["start"], unit="s")
+        st.dataframe(recent.drop(columns=["page"]), hide_index=True, use_container_width=True)
+
+    # 5️⃣ Export
+    st.subheader("📤 Export")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button("📥 Records (JSON)", export_json(records).encode("utf-8"),
+                           file_name="watcycle_diagnostics.json", mime="application/json")
+    with col2:
+        st.download_button("📥 Metrics (Prometheus)", (export_prometheus() + export_governor_prometheus()).encode("utf-8"),
+                           file_name="watcycle_metrics.prom", mime="text/plain")
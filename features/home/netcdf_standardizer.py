@@ -1,14 +1,27 @@
 # netcdf_standardizer.py
+import os
+import tempfile
 import streamlit as st
 import xarray as xr
-from io import BytesIO
+from utils.file_handler import save_uploaded_file
 from utils.netcdf_standardizer_utils import (
     get_dataset_info,
     standardize_dataset,
     aggregate_extra_dims,
-    slice_extra_dims
+    plan_extra_dim_slices,
+    write_slices_to_zip,
+    unstack_extra_dims
 )
 
+def _download_from_disk(ds: xr.Dataset, label: str, file_name: str):
+    """Writes a (lazy) dataset to a temporary file and offers it for download."""
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".nc") as tmp_out:
+        out_path = tmp_out.name
+    ds.to_netcdf(out_path)
+    with open(out_path, "rb") as f:
+        st.download_button(label, f, file_name=file_name, mime="application/x-netcdf")
+    os.remove(out_path)
+
 def netcdf_standardizer_feature():
     st.title("📊 NetCDF Standardizer")
     st.markdown("Standardize your NetCDF file structure to ensure compatibility with WATcycle toolbox.")
@@ -18,7 +31,12 @@ def netcdf_standardizer_feature():
         st.info("👆 Upload a NetCDF file to begin")
         return
     try:
-        ds = xr.open_dataset(BytesIO(uploaded.read()))
+        # Keep the upload on disk so slices can be read lazily by worker processes
+        if st.session_state.get("standardizer_upload_name") != (uploaded.name, uploaded.size):
+            st.session_state["standardizer_upload_path"] = save_uploaded_file(uploaded, "nc")
+            st.session_state["standardizer_upload_name"] = (uploaded.name, uploaded.size)
+        file_path = st.session_state["standardizer_upload_path"]
+        ds = xr.open_dataset(file_path)
         st.success("✅ File loaded successfully")
     except Exception as e:
         st.error(f"❌ Error loading file: {e}")
@@ -53,12 +71,15 @@ def netcdf_standardizer_feature():
     do_agg = False
     agg_method = None
     export_slices = False
+    unstack = False
     if extra_dims:
         st.subheader("⚙️ Handle Extra Dimensions")
         do_agg = st.checkbox("Aggregate extra dimensions to 3D", help="Compute summary across extra dims")
         if do_agg:
             agg_method = st.selectbox("Aggregation method", ["mean", "min", "max", "median"], index=0)
-        export_slices = st.checkbox("Export each slice separately", help="One file per extra-dim slice")
+        export_slices = st.checkbox("Export each slice separately", help="One file per extra-dim slice, in a ZIP")
+        unstack = st.checkbox("Unstack slices into separate variables",
+                              help="One file; e.g. SoilMoist_depth_0.1, SoilMoist_depth_0.4, ...")
 
     if st.button("Standardize and Save"):
         try:
@@ -66,17 +87,22 @@ def netcdf_standardizer_feature():
             post_dims = set(ds_std.dims) - {"time", "lat", "lon"}
 
             if export_slices and post_dims:
-                slices = slice_extra_dims(ds_std)
-                for fname, slice_ds in slices.items():
-                    data = slice_ds.to_netcdf()
-                    st.download_button(f"Download {fname}", data,
-                                       file_name=fname, mime="application/x-netcdf")
+                n_slices = len(plan_extra_dim_slices(ds_std))
+                progress = st.progress(0.0, text=f"Writing {n_slices} slices...")
+                with tempfile.NamedTemporaryFile(delete=False, suffix=".zip") as tmp_zip:
+                    zip_path = tmp_zip.name
+                write_slices_to_zip(file_path, mapping, global_meta, zip_path,
+                                    progress=lambda done, total: progress.progress(done / total))
+                with open(zip_path, "rb") as f:
+                    st.download_button(f"💾 Download {n_slices} Slices (ZIP)", f,
+                                       file_name="standardized_slices.zip", mime="application/zip")
+                os.remove(zip_path)
+            elif unstack and post_dims:
+                _download_from_disk(unstack_extra_dims(ds_std), "💾 Download Unstacked File", "standardized.nc")
             else:
                 if post_dims and do_agg and agg_method:
                     ds_std = aggregate_extra_dims(ds_std, agg_method)
-                raw = ds_std.to_netcdf()
-                st.download_button("💾 Download Standardized File", raw,
-                                   file_name="standardized.nc", mime="application/x-netcdf")
+                _download_from_disk(ds_std, "💾 Download Standardized File", "standardized.nc")
             st.success("✅ Operation completed successfully!")
         except Exception as e:
             st.error(f"❌ Error during processing: {e}")
@@ -0,0 +1,101 @@
+# features/spatial_plotting/animation_export.py
+
+import os
+import streamlit as st
+import pandas as pd
+import matplotlib.pyplot as plt
+
+from utils.file_handler import load_dataset
+from utils.animation_utils import export_animation
+from utils.geometry_store import get_session_geometry
+
+_FORMATS = {
+    "GIF": ("gif", "image/gif"),
+    "MP4": ("mp4", "video/mp4"),
+    "PNG sequence (ZIP)": ("png", "application/zip"),
+}
+
+def animation_export_ui():
+    st.header("🎞️ Animated Map Export")
+    st.markdown("""
+    Render a time range of a variable as an animation.
+    Colour limits are fixed across all frames and frames are rendered in parallel.
+    """)
+
+    # 1️⃣ Load dataset from session
+    ds = load_dataset()
+    if ds is None:
+        st.warning("Please upload a NetCDF file first.")
+        return
+    if "time" not in ds.dims:
+        st.error("❌ Time dimension not found in the dataset!")
+        return
+
+    # 2️⃣ Variable & time range
+    var = st.selectbox("Select Variable", list(ds.data_vars))
+    times = pd.to_datetime(ds["time"].values).date
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        start_date = st.date_input("Start date", value=times[0], min_value=times[0], max_value=times[-1])
+    with col2:
+        end_date = st.date_input("End date", value=times[-1], min_value=times[0], max_value=times[-1])
+    with col3:
+        step = st.number_input("Use every n-th time step", min_value=1, value=1, step=1)
+
+    if start_date > end_date:
+        st.warning("Start date must be on or before end date.")
+        return
+
+    # 3️⃣ Map settings
+    region = "Global"
+    prepared = get_session_geometry()
+    if prepared is not None:
+        region = st.radio("Extent", ["Global", "Shapefile region"], index=0, horizontal=True)
+
+    proj_name = st.selectbox(
+        "Select Projection",
+        ["PlateCarree", "Robinson", "Mollweide", "Mercator", "Orthographic"],
+        index=0
+    )
+    cmap = st.selectbox("Select Colormap", plt.colormaps(), index=0)
+
+    # 4️⃣ Output settings
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        fmt_label = st.selectbox("Output format", list(_FORMATS.keys()), index=0)
+    with col2:
+        fps = st.number_input("Frames per second", min_value=1, max_value=30, value=4, step=1)
+    with col3:
+        workers = st.number_input("Render processes", min_value=1, max_value=os.cpu_count() or 1,
+                                  value=os.cpu_count() or 1, step=1)
+    dpi = st.slider("Frame resolution (dpi)", min_value=50, max_value=200, value=100, step=10)
+
+    if st.button("🎬 Render Animation"):
+        fmt, mime = _FORMATS[fmt_label]
+        geoms = None
+        if region == "Shapefile region":
+            geoms = prepared.geoms
+        try:
+            with st.spinner("Rendering frames…"):
+                data = export_animation(
+                    st.session_state["uploaded_nc_file"], var, fmt=fmt,
+                    start=str(start_date), end=str(end_date), step=int(step), fps=int(fps),
+                    proj_name=proj_name, cmap=cmap, geoms=geoms,
+                    max_workers=int(workers), dpi=int(dpi)
+                )
+        except Exception as e:
+            st.error(f"❌ Animation export failed: {e}")
+            return
+
+        st.success("✅ Animation ready!")
+        if fmt == "gif":
+            st.image(data)
+        elif fmt == "mp4":
+            st.video(data)
+        extension = "zip" if fmt == "png" else fmt
+        st.download_button(
+            "📥 Download Animation",
+            data=data,
+            file_name=f"animation_{var}.{extension}",
+            mime=mime
+        )
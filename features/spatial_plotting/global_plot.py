@@ -9,14 +9,77 @@ import cartopy.crs as ccrs
 from scipy.interpolate import griddata
 
 from utils.file_handler import load_dataset, get_image_download_button
+from utils.render_cache import dataset_fingerprint, make_render_key, render_figure
 from utils.global_plot_utils import (
     get_time_strings,
     extract_dataarray_at_time,
     extract_dataarray_average,
+    extra_map_dims,
+    select_extra_dims,
     get_projection,
     plot_global_map,
 )
 
+def _build_global_figure(ds, var, mode, sel_date, projection, cmap, smoothing, method, grid_res, selection=None):
+    """Render the global map figure; only called on a render-cache miss."""
+    if mode == "Time Index":
+        da = extract_dataarray_at_time(ds, var, str(sel_date))
+    else:
+        da = extract_dataarray_average(ds, var)
+    da, selected = select_extra_dims(da, selection)
+
+    if mode == "Time Index":
+        title = f"{da.name} ({sel_date})"
+    elif mode == "Average":
+        title = f"{da.name} (Average)"
+    else:
+        title = f"{da.name}"
+    if selected:
+        title += f" – {selected}"
+
+    if smoothing:
+        # convert to DataFrame
+        df = da.to_dataframe().reset_index()[["lat", "lon", da.name]].dropna()
+        # build grid
+        lon_min, lat_min = df["lon"].min(), df["lat"].min()
+        lon_max, lat_max = df["lon"].max(), df["lat"].max()
+        grid_lons = np.linspace(lon_min, lon_max, grid_res)
+        grid_lats = np.linspace(lat_min, lat_max, grid_res)
+        grid_lons, grid_lats = np.meshgrid(grid_lons, grid_lats)
+        # interpolate
+        values = griddata(
+            (df["lon"], df["lat"]),
+            df[da.name],
+            (grid_lons, grid_lats),
+            method=method
+        )
+        # plot via pcolormesh
+        fig = plt.figure(figsize=(12, 6))
+        ax = fig.add_subplot(1, 1, 1, projection=projection)
+        pcm = ax.pcolormesh(
+            grid_lons, grid_lats, values,
+            cmap=cmap, transform=ccrs.PlateCarree()
+        )
+        ax.coastlines()
+        ax.set_global()
+        ax.set_title(title, fontsize=14, weight="bold")
+        fig.colorbar(pcm, ax=ax, orientation="horizontal", pad=0.05, shrink=0.8, label=da.name)
+
+    else:
+        # use xarray built‑in
+        fig = plt.figure(figsize=(12, 6))
+        ax = fig.add_subplot(1, 1, 1, projection=projection)
+        da.plot(
+            ax=ax,
+            transform=ccrs.PlateCarree(),
+            cmap=cmap,
+            cbar_kwargs={"orientation":"horizontal","pad":0.05,"shrink":0.8,"label":da.name}
+        )
+        ax.coastlines()
+        ax.set_global()
+        ax.set_title(title, fontsize=14, weight="bold")
+    return fig
+
 def global_plot_ui():
     st.header("🌐 Global Plot")
 
@@ -27,10 +90,22 @@ def global_plot_ui():
         return
 
     # 2️⃣ Variable selection
-    var = st.selectbox("Select Variable", list(ds.data_vars))
+    mappable = [v for v in ds.data_vars if "lat" in ds[v].dims and "lon" in ds[v].dims]
+    var = st.selectbox("Select Variable", mappable or list(ds.data_vars))
+
+    # Slices of extra dimensions (e.g. the model of skill maps)
+    selection = {}
+    for dim in extra_map_dims(ds[var]):
+        labels = [str(v) for v in ds[dim].values] if dim in ds.coords else list(range(ds.sizes[dim]))
+        choice = st.selectbox(f"Select {dim}", options=list(range(len(labels))), format_func=lambda i: labels[i])
+        selection[dim] = choice
 
     # 3️⃣ Time vs Average mode
-    mode = st.radio("Plot Mode", ["Time Index", "Average"], index=0)
+    if "time" in ds[var].dims:
+        mode = st.radio("Plot Mode", ["Time Index", "Average"], index=0)
+    else:
+        mode = "Map"
+        st.caption("This variable has no time dimension and is mapped as is.")
 
     if mode == "Time Index":
         # build list of actual dates
@@ -45,10 +120,8 @@ def global_plot_ui():
         if sel_date not in list(times):
             st.error("Selected date not found in dataset.")
             return
-        # get DataArray
-        da = extract_dataarray_at_time(ds, var, str(sel_date))
     else:
-        da = extract_dataarray_average(ds, var)
+        sel_date = None
 
     # 4️⃣ Projection & colormap
     proj_name = st.selectbox(
@@ -62,61 +135,30 @@ def global_plot_ui():
 
     # 5️⃣ Smoothing option
     smoothing = st.checkbox("Enable smoothing (this may take time)")
+    method, grid_res = None, None
     if smoothing:
         method = st.selectbox("Interpolation Method", ["linear", "nearest", "cubic"])
         grid_res = st.slider("Grid Resolution", min_value=50, max_value=1000, value=250, step=50)
 
     # 6️⃣ Generate Map
     if st.button("Generate Map"):
+        key = make_render_key(
+            page="global_plot",
+            dataset=dataset_fingerprint(st.session_state["uploaded_nc_file"]),
+            var=var, mode=mode, date=sel_date, projection=proj_name, cmap=cmap,
+            smoothing=smoothing, method=method, grid_res=grid_res, selection=selection
+        )
         if smoothing:
             st.info("Smoothing enabled—this may take a while…")
-            # convert to DataFrame
-            df = da.to_dataframe().reset_index()[["lat", "lon", da.name]].dropna()
-            # build grid
-            lon_min, lat_min = df["lon"].min(), df["lat"].min()
-            lon_max, lat_max = df["lon"].max(), df["lat"].max()
-            grid_lons = np.linspace(lon_min, lon_max, grid_res)
-            grid_lats = np.linspace(lat_min, lat_max, grid_res)
-            grid_lons, grid_lats = np.meshgrid(grid_lons, grid_lats)
-            # interpolate
-            values = griddata(
-                (df["lon"], df["lat"]),
-                df[da.name],
-                (grid_lons, grid_lats),
-                method=method
-            )
-            # plot via pcolormesh
-            fig = plt.figure(figsize=(12, 6))
-            ax = fig.add_subplot(1, 1, 1, projection=projection)
-            pcm = ax.pcolormesh(
-                grid_lons, grid_lats, values,
-                cmap=cmap, transform=ccrs.PlateCarree()
-            )
-            ax.coastlines()
-            ax.set_global()
-            title = f"{da.name} ({sel_date})" if mode == "Time Index" else f"{da.name} (Average)"
-            ax.set_title(title, fontsize=14, weight="bold")
-            fig.colorbar(pcm, ax=ax, orientation="horizontal", pad=0.05, shrink=0.8, label=da.name)
-
-        else:
-            # use xarray built‑in
-            fig = plt.figure(figsize=(12, 6))
-            ax = fig.add_subplot(1, 1, 1, projection=projection)
-            da.plot(
-                ax=ax,
-                transform=ccrs.PlateCarree(),
-                cmap=cmap,
-                cbar_kwargs={"orientation":"horizontal","pad":0.05,"shrink":0.8,"label":da.name}
-            )
-            ax.coastlines()
-            ax.set_global()
-            title = f"{da.name} ({sel_date})" if mode == "Time Index" else f"{da.name} (Average)"
-            ax.set_title(title, fontsize=14, weight="bold")
+        png = render_figure(key, lambda: _build_global_figure(
+            ds, var, mode, sel_date, projection, cmap, smoothing, method, grid_res, selection
+        ))
 
         # render & download
-        st.pyplot(fig)
+        st.image(png, use_container_width=True)
         get_image_download_button(
-            fig,
+            png,
             filename=f"global_{var}_{mode.replace(' ','_')}.png",
-            label="📥 Download Map"
+            label="📥 Download Map",
+            cache_key=key
         )
@@ -0,0 +1,141 @@
+import os
+import glob
+import streamlit as st
+from utils.catalog_utils import query_catalog, catalog_variables
+from utils.geometry_store import get_session_geometry
+from utils.render_cache import make_render_key, render_figure
+from utils.mann_kendall_utils import MK_METHODS
+from utils.batch_trend_utils import (
+    FULL_DOMAIN, parse_period, build_trend_tasks, run_batch_trends, trend_heatmap, file_labels
+)
+
+def batch_trend_analysis_ui():
+    st.title("🗂️ Batch Trend Analysis")
+    st.markdown("""
+    Mann-Kendall and Sen's slope trends of the spatial means of every variable in many
+    files, for several periods and regions at once. Files are reduced in parallel worker
+    processes and the reduced series are cached, so re-running with other periods is fast.
+
+    Headless: `python -m utils.batch_trend_utils <folder> --period 1980-1999 --period 2000-2019`
+    """)
+
+    # 1️⃣ Input files
+    source = st.radio("Input files", ["Data catalog", "Folder on server"], horizontal=True)
+    file_paths = []
+    if source == "Data catalog":
+        catalog = query_catalog()
+        catalog = catalog[catalog["path"].map(os.path.exists)]
+        if catalog.empty:
+            st.info("👆 The catalog is empty; upload files or index a folder in the Data Catalog first")
+            return
+        labels = dict(zip(catalog["path"], catalog["label"]))
+        current = st.session_state.get("uploaded_nc_file")
+        file_paths = st.multiselect("Files", options=list(labels), format_func=labels.get,
+                                    default=[current] if current in labels else [])
+    else:
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            folder = st.text_input("Input folder", value="")
+        with col2:
+            pattern = st.text_input("File pattern", value="*.nc")
+        if folder:
+            file_paths = sorted(glob.glob(os.path.join(folder, "**", pattern), recursive=True))
+
+    if not file_paths:
+        st.info("👆 Choose the files to analyse")
+        return
+    st.success(f"✅ {len(file_paths)} file(s) selected")
+
+    # 2️⃣ Variables, periods and regions
+    st.subheader("📌 Select Data")
+    available = []
+    for fp in file_paths:
+        try:
+            available += [v for v in catalog_variables(fp, required_dims=("time",)) if v not in available]
+        except Exception as e:
+            st.warning(f"⚠️ {os.path.basename(fp)}: {e}")
+    variables = st.multiselect("Variables", options=available, default=available,
+                               help="Files without a selected variable are skipped for it")
+
+    period_text = st.text_area("Periods (one per line)", value="all",
+                               help="'all', whole years like 1980-1999, or dates like 2003-01-01:2015-12-31")
+    try:
+        periods = [parse_period(line) for line in period_text.splitlines() if line.strip()] or [parse_period("all")]
+    except Exception as e:
+        st.error(f"❌ {e}")
+        return
+
+    regions = {}
+    prepared = get_session_geometry()
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.checkbox("Full domain", value=True):
+            regions[FULL_DOMAIN] = None
+    with col2:
+        if prepared is not None:
+            name = st.session_state.get("uploaded_shapefile_name") or "Shapefile"
+            if st.checkbox(f"Uploaded shapefile ({name})", value=False):
+                regions[name] = prepared
+        else:
+            st.caption("Upload a shapefile to also analyse a region")
+    if not regions:
+        st.warning("🚫 Select at least one region")
+        return
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        method = st.selectbox("Test variant", options=list(MK_METHODS), format_func=MK_METHODS.get,
+                              help="The corrected variants account for autocorrelation in the series")
+    with col2:
+        alpha = st.number_input("Significance level (alpha)", min_value=0.0, max_value=1.0, value=0.05, step=0.01)
+    with col3:
+        workers = st.number_input("Worker processes", min_value=1, max_value=os.cpu_count() or 1,
+                                  value=os.cpu_count() or 1, step=1)
+
+    n_tasks = len(build_trend_tasks(file_paths, variables, periods, regions))
+    st.caption(f"{n_tasks} task(s): files × variables × periods × regions")
+
+    if st.button("🚀 Run Batch Analysis", disabled=not variables):
+        progress = st.progress(0.0, text="Reducing files...")
+        try:
+            report = run_batch_trends(
+                file_paths, variables, periods, regions, alpha=alpha, method=method, max_workers=int(workers),
+                progress=lambda done, total: progress.progress(done / total, text=f"{done}/{total} steps")
+            )
+        except Exception as e:
+            st.error(f"❌ Batch trend analysis failed: {e}")
+            return
+        st.session_state["batch_trend_report"] = report
+
+    report = st.session_state.get("batch_trend_report")
+    if report is None:
+        return
+
+    # 3️⃣ Report
+    st.subheader("📋 Report")
+    ok = report[report["status"] == "ok"]
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Tasks", len(report))
+    col2.metric("Significant increasing", int((ok["significant"] & (ok["trend"] == "increasing")).sum()))
+    col3.metric("Significant decreasing", int((ok["significant"] & (ok["trend"] == "decreasing")).sum()))
+    col4.metric("Errors / skipped", int((report["status"] != "ok").sum()))
+    # Files with the same name in different folders are told apart by their parent folders
+    shown = report.assign(file=report["path"].map(file_labels(report["path"])))
+    st.dataframe(shown.drop(columns=["path"]), hide_index=True, use_container_width=True)
+    st.download_button("📥 Download Report (CSV)", report.to_csv(index=False).encode("utf-8"),
+                       file_name="trend_report.csv", mime="text/csv")
+
+    # 4️⃣ Summary plot
+    if ok.empty:
+        return
+    st.subheader("🗺️ Trend Overview")
+    col1, col2 = st.columns(2)
+    with col1:
+        region = st.selectbox("Region", options=list(dict.fromkeys(ok["region"])))
+    with col2:
+        period = st.selectbox("Period", options=list(dict.fromkeys(ok["period"])))
+    key = make_render_key(page="batch_trend_analysis", report=report.to_csv(index=False),
+                          region=region, period=period)
+    png = render_figure(key, lambda: trend_heatmap(report, region, period), dpi=200)
+    st.image(png, use_container_width=True)
+    st.download_button("📥 Download Plot (PNG)", data=png, file_name="trend_overview.png", mime="image/png")
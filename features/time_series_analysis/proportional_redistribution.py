@@ -10,6 +10,8 @@ from utils.proportional_redistribution_utils import (
     compute_original_seasonal,
     apply_proportional_redistribution
 )
+from utils.session_store import put_session_object, get_session_object
+from utils.reduction_utils import spatial_mean_table, wide_table
 
 _COLORS = {
     'average_precip':'#1f77b4','average_et':'#ff7f0e',
@@ -57,25 +59,23 @@ def proportional_redistribution_ui():
         ds_ds = xr.open_dataset(ds_path)
         ds_var= st.selectbox("ΔS variable", list(ds_ds.data_vars), key="ds_var")
 
-    # Extract DataArrays
-    pr_da = xr.open_dataset(p_path)[p_var]
-    et_da = xr.open_dataset(et_path)[et_var]
-    ro_da = xr.open_dataset(r_path)[r_var]
-    ds_da = xr.open_dataset(ds_path)[ds_var]
-
     # Calculate original
     if st.button("Calculate Residual Error"):
-        p_ser  = monthly_mean_series(pr_da)
-        et_ser = monthly_mean_series(et_da)
-        ro_ser = monthly_mean_series(ro_da)
-        ds_ser = monthly_mean_series(ds_da)
+        # Area-weighted spatial means of all four terms, one read pass per file
+        series = wide_table(spatial_mean_table([
+            (p_path, p_var, "P"), (et_path, et_var, "ET"), (r_path, r_var, "R"), (ds_path, ds_var, "dS")
+        ]))
+        p_ser  = monthly_mean_series(series["P"])
+        et_ser = monthly_mean_series(series["ET"])
+        ro_ser = monthly_mean_series(series["R"])
+        ds_ser = monthly_mean_series(series["dS"])
 
         orig_df = compute_original_seasonal(p_ser, et_ser, ro_ser, ds_ser)
-        st.session_state['orig_df'] = orig_df
+        put_session_object('orig_df', orig_df)
 
     # Always display original table & plot if available
     if 'orig_df' in st.session_state:
-        orig_df = st.session_state['orig_df']
+        orig_df = get_session_object('orig_df')
         st.subheader("Original Seasonal Table")
         st.dataframe(orig_df)
 
@@ -100,7 +100,7 @@ def proportional_redistribution_ui():
 
     # Apply redistribution
     if 'orig_df' in st.session_state and st.button("Apply Proportional Redistribution"):
-        orig_df = st.session_state['orig_df']
+        orig_df = get_session_object('orig_df')
         corr_df, factors = apply_proportional_redistribution(orig_df)
 
         st.subheader("Corrected Seasonal Table")
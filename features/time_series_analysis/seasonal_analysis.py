@@ -8,6 +8,74 @@ from io import BytesIO
 
 # Import the seasonal utilities
 from utils.seasonal_utils import prepare_seasonal_df, compute_monthly_stats, compute_monthly_anomalies
+from utils.render_cache import dataset_fingerprint, make_render_key, render_figure
+
+def _build_seasonal_figure(df, monthly_stats, variable, plot_yearly_lines, plot_min_max_range,
+                           plot_std_dev, smooth_line):
+    """Render the seasonal pattern figure; only called on a render-cache miss."""
+    fig, ax = plt.subplots(figsize=(12, 7))
+    plt.style.use('default')
+    ax.set_facecolor('#f0f2f6')
+    fig.patch.set_facecolor('#ffffff')
+
+    # Base Plot with Improved Styling
+    if smooth_line:
+        from scipy.interpolate import make_interp_spline
+        x_smooth = np.linspace(1, 12, 200)
+        y_smooth = make_interp_spline(monthly_stats["month"], monthly_stats["Mean"])(x_smooth)
+        ax.plot(x_smooth, y_smooth, color='#2E86C1', linewidth=2.5, label="Monthly Mean")
+    else:
+        ax.plot(monthly_stats["month"], monthly_stats["Mean"],
+                marker='o', linestyle='-', color='#2E86C1',
+                linewidth=2.5, label="Monthly Mean")
+
+    # Enhanced Range Shading (Min-Max)
+    if plot_min_max_range:
+        ax.fill_between(
+            monthly_stats["month"],
+            monthly_stats["Min"],
+            monthly_stats["Max"],
+            color='#AED6F1', alpha=0.3,
+            label="Min-Max Range"
+        )
+
+    # Standard Deviation Band
+    if plot_std_dev:
+        ax.fill_between(
+            monthly_stats["month"],
+            monthly_stats["Mean"] - monthly_stats["Std"],
+            monthly_stats["Mean"] + monthly_stats["Std"],
+            color='#F5B7B1', alpha=0.3,
+            label="±1 Std Dev"
+        )
+
+    # Yearly Lines with Color Gradient
+    if plot_yearly_lines:
+        years = sorted(df["year"].unique())
+        colors = plt.cm.viridis(np.linspace(0, 1, len(years)))
+        for year, color in zip(years, colors):
+            year_data = df[df["year"] == year].groupby("month")["value"].mean()
+            ax.plot(year_data.index, year_data.values,
+                   color=color, alpha=0.5, linestyle='--',
+                   label=f"Year {year}")
+
+    # Enhanced Plot Styling
+    ax.set_xlabel("Month", fontsize=12, fontweight='bold')
+    ax.set_ylabel(variable, fontsize=12, fontweight='bold')
+    ax.set_title(f"Seasonal Patterns: {variable}",
+                 fontsize=14, fontweight='bold', pad=20)
+
+    ax.set_xticks(range(1, 13))
+    ax.set_xticklabels([
+        'January', 'February', 'March', 'April',
+        'May', 'June', 'July', 'August',
+        'September', 'October', 'November', 'December'
+    ], rotation=45)
+
+    ax.grid(True, linestyle=':', alpha=0.4)
+    ax.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
+    plt.tight_layout()
+    return fig
 
 def seasonal_analysis_ui():
     st.title("🌊 Seasonal Pattern Analysis")
@@ -38,7 +106,7 @@ def seasonal_analysis_ui():
 
     # Data Processing
     try:
-        df = prepare_seasonal_df(ds, variable)
+        df = prepare_seasonal_df(st.session_state.uploaded_nc_file, variable)
     except Exception as e:
         st.error(f"❌ Data preparation error: {str(e)}")
         return
@@ -118,81 +186,25 @@ def seasonal_analysis_ui():
     # Create Enhanced Visualization
     st.subheader("📊 Seasonal Pattern Visualization")
 
-    fig, ax = plt.subplots(figsize=(12, 7))
-    plt.style.use('default')
-    ax.set_facecolor('#f0f2f6')
-    fig.patch.set_facecolor('#ffffff')
-
-    # Base Plot with Improved Styling
-    if smooth_line:
-        from scipy.interpolate import make_interp_spline
-        x_smooth = np.linspace(1, 12, 200)
-        y_smooth = make_interp_spline(monthly_stats["month"], monthly_stats["Mean"])(x_smooth)
-        ax.plot(x_smooth, y_smooth, color='#2E86C1', linewidth=2.5, label="Monthly Mean")
-    else:
-        ax.plot(monthly_stats["month"], monthly_stats["Mean"],
-                marker='o', linestyle='-', color='#2E86C1',
-                linewidth=2.5, label="Monthly Mean")
-
-    # Enhanced Range Shading (Min-Max)
-    if plot_min_max_range:
-        ax.fill_between(
-            monthly_stats["month"],
-            monthly_stats["Min"],
-            monthly_stats["Max"],
-            color='#AED6F1', alpha=0.3,
-            label="Min-Max Range"
-        )
-
-    # Standard Deviation Band
-    if plot_std_dev:
-        ax.fill_between(
-            monthly_stats["month"],
-            monthly_stats["Mean"] - monthly_stats["Std"],
-            monthly_stats["Mean"] + monthly_stats["Std"],
-            color='#F5B7B1', alpha=0.3,
-            label="±1 Std Dev"
-        )
-
-    # Yearly Lines with Color Gradient
-    if plot_yearly_lines:
-        years = sorted(df["year"].unique())
-        colors = plt.cm.viridis(np.linspace(0, 1, len(years)))
-        for year, color in zip(years, colors):
-            year_data = df[df["year"] == year].groupby("month")["value"].mean()
-            ax.plot(year_data.index, year_data.values,
-                   color=color, alpha=0.5, linestyle='--',
-                   label=f"Year {year}")
-
-    # Enhanced Plot Styling
-    ax.set_xlabel("Month", fontsize=12, fontweight='bold')
-    ax.set_ylabel(variable, fontsize=12, fontweight='bold')
-    ax.set_title(f"Seasonal Patterns: {variable}",
-                 fontsize=14, fontweight='bold', pad=20)
-
-    ax.set_xticks(range(1, 13))
-    ax.set_xticklabels([
-        'January', 'February', 'March', 'April',
-        'May', 'June', 'July', 'August',
-        'September', 'October', 'November', 'December'
-    ], rotation=45)
-
-    ax.grid(True, linestyle=':', alpha=0.4)
-    ax.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
-    plt.tight_layout()
+    key = make_render_key(
+        page="seasonal_analysis",
+        dataset=dataset_fingerprint(st.session_state.uploaded_nc_file),
+        variable=variable, yearly=plot_yearly_lines, min_max=plot_min_max_range,
+        std=plot_std_dev, smooth=smooth_line
+    )
+    png = render_figure(key, lambda: _build_seasonal_figure(
+        df, monthly_stats, variable, plot_yearly_lines, plot_min_max_range, plot_std_dev, smooth_line
+    ), dpi=300)
 
     # Display Plot with Download Option
-    st.pyplot(fig)
+    st.image(png, use_container_width=True)
 
     # Enhanced Download Options
     col1, col2 = st.columns(2)
     with col1:
-        buf = BytesIO()
-        fig.savefig(buf, format="png", bbox_inches="tight", dpi=300)
-        buf.seek(0)
         st.download_button(
             "📥 Download Plot (PNG)",
-            data=buf.getvalue(),
+            data=png,
             file_name=f"seasonal_analysis_{variable}.png",
             mime="image/png"
         )
@@ -0,0 +1,144 @@
+import os
+import tempfile
+import pandas as pd
+import xarray as xr
+import streamlit as st
+from utils.catalog_utils import query_catalog, catalog_variables, index_file, remove_from_catalog
+from utils.render_cache import dataset_fingerprint, make_render_key, render_figure
+from utils.global_plot_utils import get_projection, plot_global_map
+from utils.skill_map_utils import SKILL_METRICS, skill_maps, save_skill_maps
+
+def skill_maps_ui():
+    st.title("🎯 Skill Maps")
+    st.markdown("""
+    Pixel-wise skill of one or more models against a reference: Kling-Gupta efficiency and
+    its components, Nash-Sutcliffe efficiency, percent bias, RMSE and Pearson/Spearman
+    correlation per grid cell, over the time steps each model shares with the reference.
+    Models must be on the reference grid (see Resample Resolution); each model runs in its
+    own worker process.
+    """)
+
+    # 1️⃣ Reference and models from the catalog
+    catalog = query_catalog()
+    # Only files with a time axis can be compared (this also leaves out earlier skill maps)
+    catalog = catalog[catalog["path"].map(os.path.exists) & catalog["time_start"].notna()]
+    if catalog.empty:
+        st.info("👆 The catalog is empty; upload files or index a folder in the Data Catalog first")
+        return
+    labels = dict(zip(catalog["path"], catalog["label"]))
+
+    st.subheader("📌 Select Data")
+    col1, col2 = st.columns(2)
+    current = st.session_state.get("uploaded_nc_file")
+    with col1:
+        ref_path = st.selectbox("Reference file", options=list(labels), format_func=labels.get,
+                                index=list(labels).index(current) if current in labels else 0)
+    with col2:
+        ref_vars = catalog_variables(ref_path, required_dims=("time",))
+        if not ref_vars:
+            st.error("❌ The reference file has no variable with a time dimension")
+            return
+        ref_var = st.selectbox("Reference variable", ref_vars)
+
+    model_paths = st.multiselect("Model files", options=[p for p in labels if p != ref_path],
+                                 format_func=labels.get)
+    if not model_paths:
+        st.info("👆 Choose the model files to evaluate")
+        return
+
+    models = {}
+    for path in model_paths:
+        options = catalog_variables(path, required_dims=("time",))
+        if not options:
+            st.warning(f"⚠️ {labels[path]} has no variable with a time dimension; skipped")
+            continue
+        col1, col2 = st.columns(2)
+        with col1:
+            label = st.text_input("Model name", value=os.path.splitext(labels[path])[0], key=f"skill_label_{path}")
+        with col2:
+            var = st.selectbox(f"Variable of {labels[path]}", options,
+                               index=options.index(ref_var) if ref_var in options else 0, key=f"skill_var_{path}")
+        if not label.strip():
+            st.error(f"❌ Enter a model name for {labels[path]}")
+            return
+        if label in models:
+            st.error(f"❌ The model name '{label}' is used twice; model names must be unique")
+            return
+        models[label] = (path, var)
+    if not models:
+        return
+
+    # 2️⃣ Settings
+    col1, col2, col3 = st.columns([2, 1, 1])
+    with col1:
+        metrics = st.multiselect("Metrics", options=list(SKILL_METRICS), default=list(SKILL_METRICS),
+                                 format_func=lambda m: SKILL_METRICS[m][0])
+    with col2:
+        min_count = st.number_input("Minimum valid time steps", min_value=2, value=12, step=1)
+    with col3:
+        workers = st.number_input("Worker processes", min_value=1, max_value=os.cpu_count() or 1,
+                                  value=min(len(models), os.cpu_count() or 1), step=1)
+
+    if st.button("🚀 Compute Skill Maps", disabled=not metrics):
+        try:
+            with st.spinner("Computing skill maps..."):
+                ds = skill_maps((ref_path, ref_var), models, metrics=metrics, min_count=int(min_count),
+                                max_workers=int(workers))
+                with tempfile.NamedTemporaryFile(delete=False, prefix="skill_maps_", suffix=".nc") as tmp:
+                    out_path = tmp.name
+                save_skill_maps(ds, out_path)
+        except Exception as e:
+            st.error(f"❌ {e}")
+            return
+        # Replace the previous result instead of leaving it in the temp folder
+        previous = st.session_state.get("skill_map_file")
+        if previous and previous != st.session_state.get("uploaded_nc_file") and os.path.exists(previous):
+            os.remove(previous)
+            remove_from_catalog(previous)
+        try:
+            index_file(out_path, source="derived", label=f"skill_maps_{ref_var}.nc")
+        except Exception as e:
+            st.warning(f"⚠️ The skill maps could not be added to the data catalog: {e}")
+        st.session_state["skill_map_file"] = out_path
+
+    out_path = st.session_state.get("skill_map_file")
+    if not out_path or not os.path.exists(out_path):
+        return
+
+    # 3️⃣ Results
+    with xr.open_dataset(out_path) as ds:
+        ds = ds.load()
+    names = [m for m in SKILL_METRICS if m in ds.data_vars]
+    st.subheader("📋 Summary")
+    st.caption(f"Reference: {ds.attrs.get('reference', '')}")
+    summary = pd.DataFrame({
+        SKILL_METRICS[m][0]: ds[m].median(dim=[d for d in ds[m].dims if d != "model"]).to_series() for m in names
+    })
+    summary["Valid cells"] = (ds["count"] > 0).sum(dim=[d for d in ds["count"].dims if d != "model"]).to_series()
+    summary["Period"] = [f"{s} → {e}" for s, e in zip(ds["start"].values, ds["end"].values)]
+    st.dataframe(summary, use_container_width=True)
+    st.caption("Spatial medians over all valid cells")
+
+    st.subheader("🗺️ Maps")
+    col1, col2 = st.columns(2)
+    with col1:
+        metric = st.selectbox("Metric", names, format_func=lambda m: SKILL_METRICS[m][0])
+    with col2:
+        model = st.selectbox("Model", list(ds["model"].values))
+    if "lat" in ds[metric].dims and "lon" in ds[metric].dims:
+        _, _, cmap, vmin, vmax = SKILL_METRICS[metric]
+        key = make_render_key(page="skill_maps", dataset=dataset_fingerprint(out_path), metric=metric, model=model)
+        da = ds[metric].sel(model=model).rename(f"{metric} ({model})")
+        png = render_figure(key, lambda: plot_global_map(da, get_projection("PlateCarree"), cmap, vmin, vmax))
+        st.image(png, use_container_width=True)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        with open(out_path, "rb") as f:
+            st.download_button("📥 Download Skill Maps (NetCDF)", f.read(), file_name=f"skill_maps_{ref_var}.nc",
+                               mime="application/x-netcdf")
+    with col2:
+        if st.button("🌍 Open in Global Plot", help="Make the skill maps the current NetCDF file"):
+            st.session_state.uploaded_nc_file = out_path
+            st.session_state.uploaded_nc_file_name = f"skill_maps_{ref_var}.nc"
+            st.success("✅ Current file set; open Spatial Plotting → Global Plot")
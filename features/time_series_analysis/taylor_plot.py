@@ -6,6 +6,9 @@ import matplotlib.pyplot as plt
 from io import BytesIO
 import matplotlib.lines as mlines
 from typing import Dict, List, Optional, Union
+from utils.geometry_store import get_session_geometry
+from utils.render_cache import make_render_key, render_figure
+from utils.taylor_utils import GROUPINGS, taylor_accumulators, grouped_taylor_stats, plot_taylor_small_multiples
 
 # ----------------------------
 # Core Taylor Diagram Functions
@@ -160,7 +163,8 @@ def taylor_plot_ui():
             with xr.open_dataset(BytesIO(obs_file.read())) as ds:
                 obs_ds = ds.load()
             obs_var = st.selectbox("Select reference variable", list(obs_ds.data_vars))
-            obs_values = obs_ds[obs_var].values.flatten()
+            obs_da = obs_ds[obs_var]
+            obs_values = obs_da.values.flatten()
 
             if np.isnan(obs_values).all():
                 st.error("Invalid reference data: All NaN values")
@@ -185,6 +189,7 @@ def taylor_plot_ui():
             return
 
         model_stats = []
+        model_arrays = {}
         for f in model_files:
             try:
                 with xr.open_dataset(BytesIO(f.read())) as ds:
@@ -196,6 +201,7 @@ def taylor_plot_ui():
                 if stats:
                     stats["label"] = f.name.split(".")[0]  # Clean filename
                     model_stats.append(stats)
+                    model_arrays[stats["label"]] = m_ds[m_var]
 
             except Exception as e:
                 st.warning(f"Skipped {f.name}: {str(e)}")
@@ -228,3 +234,50 @@ def taylor_plot_ui():
                               file_name="taylor_diagram.png")
     else:
         st.error("Failed to generate visualization")
+
+    # Grouped diagrams
+    with st.expander("🧩 STEP 4: Grouped Taylor Diagrams", expanded=False):
+        st.markdown("Statistics per season, month or subbasin, accumulated in one pass over the data.")
+        options = ["season", "month"]
+        prepared = get_session_geometry()
+        if prepared is not None:
+            options.append("region")
+        else:
+            st.caption("Upload a shapefile to also group by subbasin")
+        groupings = st.multiselect("Group by", options=options, default=["season"], format_func=GROUPINGS.get)
+        name_column = None
+        if "region" in groupings:
+            columns = [c for c in prepared.gdf.columns if c != prepared.gdf.geometry.name]
+            name_column = st.selectbox("Subbasin name attribute", options=[None] + columns,
+                                       format_func=lambda c: "Feature number" if c is None else c)
+
+        inputs_key = make_render_key(page="taylor_plot", obs=(obs_file.file_id, obs_var),
+                                     models=[(f.file_id, f.name) for f in model_files],
+                                     variables=[str(da.name) for da in model_arrays.values()],
+                                     groupings=groupings, region=None if prepared is None else prepared.key,
+                                     name_column=name_column)
+        if st.button("📊 Compute Grouped Statistics", disabled=not groupings):
+            try:
+                with st.spinner("Accumulating statistics..."):
+                    acc = taylor_accumulators(obs_da, model_arrays, groupings=groupings,
+                                              regions=prepared if "region" in groupings else None,
+                                              name_column=name_column)
+                st.session_state["taylor_accumulators"] = (inputs_key, acc)
+            except Exception as e:
+                st.error(f"❌ {e}")
+
+        stored = st.session_state.get("taylor_accumulators")
+        if stored is None or stored[0] != inputs_key:
+            return
+        grouped = grouped_taylor_stats(stored[1])
+        shown = st.selectbox("Diagram grouping", options=list(dict.fromkeys(grouped["grouping"])),
+                             format_func=GROUPINGS.get)
+        key = make_render_key(page="taylor_plot", inputs=inputs_key, grouping=shown, normalize=normalize)
+        png = render_figure(key, lambda: plot_taylor_small_multiples(grouped, shown, normalize=normalize), dpi=150)
+        st.image(png, use_container_width=True)
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button("📥 Download Grouped Statistics (CSV)", grouped.to_csv(index=False),
+                               file_name="taylor_grouped_statistics.csv")
+        with col2:
+            st.download_button("📥 Download Grouped Diagrams (PNG)", png, file_name=f"taylor_{shown}.png")
@@ -1,67 +1,74 @@
+import os
 import streamlit as st
-import xarray as xr
-import numpy as np
 import pandas as pd
-import pymannkendall as mk
-import ruptures as rpt
 import matplotlib.pyplot as plt
-from io import BytesIO
-from utils.file_handler import load_dataset
+from utils.catalog_utils import get_file_record
+from utils.reduction_utils import spatial_mean_series
+from utils.trend_analysis_utils import (
+    calculate_sens_slopes, compute_sen_summary, with_time_units, generate_trend_line, detect_change_points,
+    analyze_segment
+)
+from utils.trend_uncertainty_utils import default_block_length, sen_confidence_interval
+from utils.mann_kendall_utils import MK_METHODS, mann_kendall_test
+from utils.render_cache import dataset_fingerprint, frame_fingerprint, make_render_key, render_figure
 # ─────────────────────────  Functions ──────────────────────────
 
-def calculate_sens_slopes(df, value_col='value', time_col='ordinal_time'):
-    slopes = []
-    n = len(df)
-    for i in range(n):
-        for j in range(i + 1, n):
-            dt = df[time_col].iloc[j] - df[time_col].iloc[i]
-            if dt != 0:
-                slope = (df[value_col].iloc[j] - df[value_col].iloc[i]) / dt
-                slopes.append(slope)
-    return np.array(slopes)
-
-def compute_sen_summary(slopes):
-    s = np.std(slopes)
-    n = len(slopes)
-    se = s / np.sqrt(n) if n > 0 else np.nan
-    sen_slope = np.median(slopes) if n > 0 else np.nan
-    slope_yearly = sen_slope * 365 if not np.isnan(sen_slope) else np.nan
-    slope_monthly = slope_yearly / 12 if not np.isnan(slope_yearly) else np.nan
-    se_yearly = se * 365 if not np.isnan(se) else np.nan
-    se_monthly = se_yearly / 12 if not np.isnan(se_yearly) else np.nan
-    return {
-        'Sen Slope': sen_slope,
-        'Slope (yearly)': slope_yearly,
-        'Slope (monthly)': slope_monthly,
-        'Uncertainty': se,
-        'Uncertainty (yearly)': se_yearly,
-        'Uncertainty (monthly)': se_monthly
-    }
-
-def generate_trend_line(df, slope, value_col='value', time_col='ordinal_time'):
-    x = df[time_col]
-    y = df[value_col]
-    x_mean = x.mean()
-    y_mean = y.mean()
-    intercept = y_mean - slope * x_mean
-    return slope * x + intercept
-
-def detect_change_points(signal, penalty=6, model="rbf"):
-    algo = rpt.Pelt(model=model).fit(signal)
-    return algo.predict(pen=penalty)    
-
-def analyze_segment(segment_df):
-    if len(segment_df) < 2:
-        return None
-    mk_result = mk.original_test(segment_df['value'])
-    slopes = calculate_sens_slopes(segment_df)
-    sen_summary = compute_sen_summary(slopes)
-    trend_line = generate_trend_line(segment_df, sen_summary['Sen Slope'])
-    return {
-        'mk_result': mk_result,
-        'sen_summary': sen_summary,
-        'trend_line': trend_line
-    }
+def _build_trend_figure(df, variable, global_sen_summary, change_points, enable_cp, plot_std, plot_minmax):
+    """Render the trend figure; only called on a render-cache miss."""
+    df = df.copy()
+    fig, ax = plt.subplots(figsize=(14, 7))
+
+    plt.style.use('default')
+    ax.set_facecolor('#f0f2f6')
+    fig.patch.set_facecolor('#ffffff')
+
+    ax.plot(df['time'], df['value'], label="Time Series", color='#2E86C1', linewidth=1.5, alpha=0.8)
+
+    # plot envelopes
+    if plot_std:
+        df['month'] = df['time'].dt.month  # ensure 'month' column exists
+        month_std = df.groupby('month')['value'].transform('std')
+        ax.fill_between(df['time'], df['value'] - month_std, df['value'] + month_std, alpha=0.2, label='Monthly ±1 std')
+
+    if plot_minmax:
+        # Group by calendar month and compute min/max
+        df['month'] = df['time'].dt.month
+        month_min = df.groupby('month')['value'].transform('min')
+        month_max = df.groupby('month')['value'].transform('max')
+        ax.fill_between(df['time'], month_min, month_max, alpha=0.1, label='Monthly Min-Max')
+
+    # Add overall trend line
+    overall_trend = generate_trend_line(df, global_sen_summary['Sen Slope'])
+    ax.plot(df['time'], overall_trend,
+            label=f"Overall Trend ({global_sen_summary['Slope (monthly)']:.2f})",
+            color='#E67E22', linestyle='--', linewidth=2)
+
+    # Plot segments only if change point detection is enabled
+    if enable_cp and len(change_points) > 1:
+        colors = plt.rcParams['axes.prop_cycle'].by_key()['color']
+        prev_cp = 0
+        for idx, cp in enumerate(change_points):
+            segment_df = df.iloc[prev_cp:cp].reset_index(drop=True)
+            analysis = analyze_segment(segment_df)
+            if analysis:
+                color = colors[idx % len(colors)]
+                label = f"Segment {idx+1}: {analysis['sen_summary']['Slope (monthly)']:.2f}"
+                ax.plot(segment_df['time'], analysis['trend_line'], linestyle='--', linewidth=2, color=color, label=label)
+            prev_cp = cp
+
+        # Plot change points
+        for cp in change_points[:-1]:
+            ax.axvline(df['time'].iloc[cp], color='#34495E', linestyle='--', alpha=0.5,
+                      label='Change Point' if cp == change_points[0] else "")
+
+    ax.set_xlabel("Time", fontsize=12)
+    ax.set_ylabel(variable, fontsize=12)
+    ax.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
+    ax.grid(True, linestyle=':', alpha=0.3)
+
+    plt.title("Time Series Trend Analysis", pad=20, fontsize=14, fontweight='bold')
+    plt.tight_layout()
+    return fig
 
 def run_mk_cp_analysis():
     st.title("📈 Time Series Trend Analysis")
@@ -77,26 +84,24 @@ def run_mk_cp_analysis():
         return
 
     with st.spinner("📊 Processing your data..."):
-        ds = load_dataset()
+        record = get_file_record(st.session_state["uploaded_nc_file"])
 
         # Data Selection
         st.subheader("📌 Select Data")
         variable = st.selectbox(
             "Choose the variable to analyze",
-            options=list(ds.data_vars),
+            options=list(record["variables"]),
             help="Select the variable from your dataset for trend analysis"
         )
 
-        if "time" not in ds.dims:
+        if "time" not in record["dims"]:
             st.error("❌ Time dimension not found in the dataset!")
             return
 
-        # Data Processing
-        time = pd.to_datetime(ds['time'].values)
-        dims_to_average = [dim for dim in ds[variable].dims if dim != "time"]
-        values = ds[variable].mean(dim=dims_to_average).values
+        # Data Processing: area-weighted spatial mean (cached per file and variable)
+        series = spatial_mean_series(st.session_state["uploaded_nc_file"], variable)
 
-        df = pd.DataFrame({'time': time, 'value': values})
+        df = pd.DataFrame({'time': series.index, 'value': series.values})
         df.dropna(inplace=True)
         df['ordinal_time'] = df['time'].apply(lambda x: x.toordinal())
 
@@ -114,8 +119,14 @@ def run_mk_cp_analysis():
             )
 
             with col1:
-                global_mk = mk.original_test(df['value'])
+                mk_method = st.selectbox(
+                    "Test variant", options=list(MK_METHODS), format_func=MK_METHODS.get,
+                    help="Monthly hydrological series are usually autocorrelated, which makes the original "
+                         "test overstate significance; the corrected variants account for it"
+                )
+                global_mk = mann_kendall_test(df['value'], method=mk_method, alpha=alpha)
                 global_mk_dict = {
+                    'Test': MK_METHODS[mk_method],
                     'Trend': global_mk.trend,
                     'p-value': f"{global_mk.p:.4f}",
                     'Significance': "✅ Significant" if global_mk.p < alpha else "❌ Not Significant",
@@ -127,16 +138,42 @@ def run_mk_cp_analysis():
 
             with col2:
                 global_slopes = calculate_sens_slopes(df)
-                global_sen_summary = compute_sen_summary(global_slopes)
+                global_sen_summary = compute_sen_summary(global_slopes, df['value'], alpha=alpha)
+                ci_method = st.selectbox(
+                    "Confidence interval", options=["Rank-based", "Block bootstrap"],
+                    help="Rank-based assumes independent residuals; the block bootstrap resamples blocks "
+                         "of consecutive residuals and stays valid for autocorrelated series"
+                )
+                if ci_method == "Block bootstrap":
+                    c1, c2 = st.columns(2)
+                    n_boot = c1.number_input("Replicates", min_value=100, max_value=10000, value=1000, step=100)
+                    block_length = c2.number_input("Block length (time steps)", min_value=1,
+                                                   max_value=max(1, len(df) // 2),
+                                                   value=min(default_block_length(len(df)), max(1, len(df) // 2)))
+                    ci_key = make_render_key(dataset=dataset_fingerprint(st.session_state["uploaded_nc_file"]),
+                                             variable=variable, alpha=alpha, n_boot=n_boot, block_length=block_length)
+                    if st.session_state.get("trend_ci_key") != ci_key:
+                        st.session_state["trend_ci"] = sen_confidence_interval(
+                            df['value'], df['time'], alpha=alpha, method="bootstrap", n_boot=int(n_boot),
+                            block_length=int(block_length), max_workers=os.cpu_count() or 1
+                        )
+                        st.session_state["trend_ci_key"] = ci_key
+                    ci = st.session_state["trend_ci"]
+                    global_sen_summary.update(with_time_units({
+                        'CI lower': ci['lower'], 'CI upper': ci['upper'], 'Uncertainty': (ci['upper'] - ci['lower']) / 2
+                    }))
                 st.write("**Sen's Slope Estimates:**")
                 for key in ['Slope (monthly)', 'Slope (yearly)']:
                     st.markdown(f"- {key}: **{global_sen_summary[key]:.4f}**")
+                st.markdown(f"- {int((1-alpha)*100)}% CI (yearly): **[{global_sen_summary['CI lower (yearly)']:.4f}, "
+                            f"{global_sen_summary['CI upper (yearly)']:.4f}]**")
 
         # Change Point Analysis
         st.subheader("🔄 Change Point Detection")
         st.markdown("Identify significant shifts in the time series")
 
         enable_cp = st.checkbox("Enable Change Point Detection", value=False)
+        penalty, model = None, None
 
         if enable_cp:
             col1, col2 = st.columns([2, 1])
@@ -168,69 +205,25 @@ def run_mk_cp_analysis():
 
         # Visualization
         st.subheader("📈 Trend Visualization")
-        fig, ax = plt.subplots(figsize=(14, 7))
-
-        plt.style.use('default')
-        ax.set_facecolor('#f0f2f6')
-        fig.patch.set_facecolor('#ffffff')
-
-        ax.plot(df['time'], df['value'], label="Time Series", color='#2E86C1', linewidth=1.5, alpha=0.8)
-
-        # plot envelopes
-        if plot_std:
-            df['month'] = df['time'].dt.month  # ensure 'month' column exists
-            month_std = df.groupby('month')['value'].transform('std')
-            ax.fill_between(df['time'], df['value'] - month_std, df['value'] + month_std, alpha=0.2, label='Monthly ±1 std')
-
-        if plot_minmax:
-            # Group by calendar month and compute min/max
-            df['month'] = df['time'].dt.month
-            month_min = df.groupby('month')['value'].transform('min')
-            month_max = df.groupby('month')['value'].transform('max')
-            ax.fill_between(df['time'], month_min, month_max, alpha=0.1, label='Monthly Min-Max')
-
-        # Add overall trend line
-        overall_trend = generate_trend_line(df, global_sen_summary['Sen Slope'])
-        ax.plot(df['time'], overall_trend,
-                label=f"Overall Trend ({global_sen_summary['Slope (monthly)']:.2f})",
-                color='#E67E22', linestyle='--', linewidth=2)
-
-        # Plot segments only if change point detection is enabled
-        if enable_cp and len(change_points) > 1:
-            colors = plt.rcParams['axes.prop_cycle'].by_key()['color']
-            prev_cp = 0
-            for idx, cp in enumerate(change_points):
-                segment_df = df.iloc[prev_cp:cp].reset_index(drop=True)
-                analysis = analyze_segment(segment_df)
-                if analysis:
-                    color = colors[idx % len(colors)]
-                    label = f"Segment {idx+1}: {analysis['sen_summary']['Slope (monthly)']:.2f}"
-                    ax.plot(segment_df['time'], analysis['trend_line'], linestyle='--', linewidth=2, color=color, label=label)
-                prev_cp = cp
-
-            # Plot change points
-            for cp in change_points[:-1]:
-                ax.axvline(df['time'].iloc[cp], color='#34495E', linestyle='--', alpha=0.5,
-                          label='Change Point' if cp == change_points[0] else "")
-
-        ax.set_xlabel("Time", fontsize=12)
-        ax.set_ylabel(variable, fontsize=12)
-        ax.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
-        ax.grid(True, linestyle=':', alpha=0.3)
-
-        plt.title("Time Series Trend Analysis", pad=20, fontsize=14, fontweight='bold')
-        plt.tight_layout()
-        st.pyplot(fig)
+        key = make_render_key(
+            page="trend_analysis",
+            dataset=dataset_fingerprint(st.session_state["uploaded_nc_file"]),
+            # The plotted series itself, so a change in how it is reduced renders anew
+            series=frame_fingerprint(df),
+            variable=variable, change_points=change_points, penalty=penalty, model=model,
+            plot_std=plot_std, plot_minmax=plot_minmax
+        )
+        png = render_figure(key, lambda: _build_trend_figure(
+            df, variable, global_sen_summary, change_points, enable_cp, plot_std, plot_minmax
+        ), dpi=300)
+        st.image(png, use_container_width=True)
 
         # Download Options
         col1, col2 = st.columns(2)
         with col1:
-            buf = BytesIO()
-            fig.savefig(buf, format="png", bbox_inches="tight", dpi=300)
-            buf.seek(0)
             st.download_button(
                 "📥 Download Plot (PNG)",
-                data=buf.getvalue(),
+                data=png,
                 file_name=f"trend_analysis_{variable}.png",
                 mime="image/png"
             )
@@ -0,0 +1,87 @@
+import os
+import streamlit as st
+from utils.catalog_utils import query_catalog, index_directory, refresh_catalog, get_file_record
+
+def data_catalog():
+    st.title("🗃️ Data Catalog")
+    st.markdown("""
+    Every uploaded, derived or indexed NetCDF file is listed here with its variables,
+    time range and grid. Search the catalog and load a file without uploading it again.
+    """)
+
+    # 1️⃣ Index & refresh
+    with st.expander("➕ Index a folder"):
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            folder = st.text_input("Folder on server", value="")
+        with col2:
+            pattern = st.text_input("File pattern", value="*.nc")
+        if st.button("Index Folder") and folder:
+            with st.spinner("Reading file headers..."):
+                result = index_directory(folder, pattern)
+            st.success(f"✅ {result['indexed']} indexed, {result['unchanged']} unchanged")
+            for fp, err in result["failed"].items():
+                st.warning(f"⚠️ {os.path.basename(fp)}: {err}")
+
+    if st.button("🔄 Refresh Catalog", help="Re-index changed files and drop deleted ones"):
+        with st.spinner("Checking files..."):
+            result = refresh_catalog()
+        st.success(f"✅ {result['reindexed']} re-indexed, {result['removed']} removed, "
+                   f"{result['unchanged']} unchanged")
+
+    # 2️⃣ Search
+    st.subheader("🔎 Search")
+    col1, col2 = st.columns(2)
+    with col1:
+        variable = st.text_input("Variable name (e.g. ET)", value="")
+    with col2:
+        text = st.text_input("Text in file name or description", value="")
+
+    use_period = st.checkbox("Must cover a period")
+    start = end = None
+    if use_period:
+        col1, col2 = st.columns(2)
+        with col1:
+            start = st.date_input("From")
+        with col2:
+            end = st.date_input("To")
+
+    use_bbox = st.checkbox("Must cover a region")
+    bbox = None
+    if use_bbox:
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            min_lon = st.number_input("Min lon", value=-80.0)
+        with col2:
+            min_lat = st.number_input("Min lat", value=-20.0)
+        with col3:
+            max_lon = st.number_input("Max lon", value=-44.0)
+        with col4:
+            max_lat = st.number_input("Max lat", value=10.0)
+        bbox = (min_lon, min_lat, max_lon, max_lat)
+
+    results = query_catalog(variable=variable or None, start=start, end=end, bbox=bbox, text=text or None)
+    st.write(f"**{len(results)} file(s)**")
+    if results.empty:
+        return
+    st.dataframe(
+        results.drop(columns=["content_hash"]),
+        hide_index=True,
+        use_container_width=True
+    )
+
+    # 3️⃣ Load a catalogued file as the active dataset
+    st.subheader("📂 Use a File")
+    labels = {row["path"]: f"{row['label']} ({row['source']})" for _, row in results.iterrows()}
+    choice = st.selectbox("File", options=list(labels), format_func=labels.get)
+    if choice:
+        record = get_file_record(choice)
+        st.caption(f"Variables: {', '.join(record['variables'])} · "
+                   f"{record['time_start'] or '—'} → {record['time_end'] or '—'}")
+        if st.button("✅ Set as Current NetCDF File"):
+            if not os.path.exists(choice):
+                st.error("❌ File no longer exists; refresh the catalog.")
+                return
+            st.session_state.uploaded_nc_file = choice
+            st.session_state.uploaded_nc_file_name = record["label"]
+            st.success(f"✅ Current file: {record['label']}")
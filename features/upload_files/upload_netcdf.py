@@ -1,6 +1,7 @@
 import streamlit as st
 import xarray as xr
 from utils.file_handler import save_uploaded_file
+from utils.catalog_utils import index_file, get_file_record
 
 def upload_netcdf():
     st.title("📊 NetCDF File Viewer")
@@ -16,11 +17,18 @@ def upload_netcdf():
     # File uploader
     uploaded_file = st.file_uploader("Choose a NetCDF file", type=["nc"])
 
-    if uploaded_file:
+    if not uploaded_file:
+        st.session_state.pop("uploaded_nc_file_key", None)
+    elif st.session_state.get("uploaded_nc_file_key") != (uploaded_file.name, uploaded_file.size):
         file_path = save_uploaded_file(uploaded_file, "nc")
         if file_path:
             st.session_state.uploaded_nc_file = file_path
             st.session_state.uploaded_nc_file_name = uploaded_file.name
+            st.session_state.uploaded_nc_file_key = (uploaded_file.name, uploaded_file.size)
+            try:
+                index_file(file_path, source="upload", label=uploaded_file.name)
+            except Exception as e:
+                st.warning(f"⚠️ File could not be added to the data catalog: {e}")
             st.success(f"Uploaded file: {uploaded_file.name}")
             # Remove rerun to maintain state
 
@@ -30,25 +38,35 @@ def upload_netcdf():
         st.success("✅ Current file: " + st.session_state.uploaded_nc_file_name)
 
         try:
-            ds = xr.open_dataset(file_path)
+            # Summary comes from the catalog; the file header is read only once
+            record = get_file_record(file_path)
 
             st.subheader("Dataset Information")
             with st.expander("View Details"):
-                st.write(ds.info())
+                st.write({
+                    "Format": record["format"],
+                    "Time range": f"{record['time_start']} → {record['time_end']} ({record['n_time']} steps)"
+                    if record["time_start"] else "No time axis",
+                    "Calendar": record["calendar"],
+                    "Latitude": f"{record['lat_min']} to {record['lat_max']} (Δ {record['lat_res']})",
+                    "Longitude": f"{record['lon_min']} to {record['lon_max']} (Δ {record['lon_res']})",
+                    "CRS": record["crs"],
+                    "Size (MB)": round(record["size"] / 1e6, 2),
+                })
 
             st.subheader("Dimensions & Coordinates")
             with st.expander("View Dimensions"):
-                st.write(ds.dims)
+                st.write(record["dims"])
 
             st.subheader("Variables")
             with st.expander("View Variables and Dimensions"):
-                variable_list = list(ds.data_vars.keys())
-                for variable in variable_list:
+                variable_list = list(record["variables"])
+                for variable, info in record["variables"].items():
                     st.write(f"**{variable}**")
-                    st.write(f"Dimensions: {ds[variable].dims}")
+                    st.write(f"Dimensions: {info['dims']}")
 
             st.subheader("Metadata (Attributes)")
-            st.write(ds.attrs if ds.attrs else "No attributes found.")
+            st.write(record["attrs"] if record["attrs"] else "No attributes found.")
 
             # DataFrame preview
             st.subheader("🧾 Convert to DataFrame")
@@ -56,6 +74,7 @@ def upload_netcdf():
                 "Select variables to include in DataFrame:", variable_list, default=[]
             )
             if variable_selection:
+                ds = xr.open_dataset(file_path)
                 df = ds[variable_selection].to_dataframe().reset_index()
                 st.write("### Dataframe:")
                 st.dataframe(df)
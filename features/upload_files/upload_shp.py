@@ -3,9 +3,9 @@ import tempfile
 import geopandas as gpd
 import matplotlib.pyplot as plt
 import streamlit as st
-import folium
-from streamlit_folium import folium_static
 from io import BytesIO
+from utils.geometry_store import store_shapefile, set_session_geometry, get_session_geometry, clear_session_geometry, SESSION_KEY
+from utils.map_preview import shapefile_preview_map, level_for_extent
 
 def upload_shp():
     st.title("📍 Shapefile Viewer")
@@ -20,12 +20,10 @@ def upload_shp():
     """)
 
     # Check if a file has already been uploaded
-    if "uploaded_shapefile_gdf" in st.session_state:
+    if SESSION_KEY in st.session_state:
         st.info(f"Current shapefile: {st.session_state.get('uploaded_shapefile_name', 'Unnamed')}")
         if st.button("Clear shapefile"):
-            del st.session_state.uploaded_shapefile_gdf
-            if "uploaded_shapefile_name" in st.session_state:
-                del st.session_state.uploaded_shapefile_name
+            clear_session_geometry()
             st.rerun()
 
     uploaded_files = st.file_uploader(
@@ -47,24 +45,17 @@ def upload_shp():
     # Checkbox for Folium map
     show_interactive_map = st.checkbox("Show interactive map (Folium)", value=False)
 
-    def process_and_display_shapefile(shapefile, file_name=None):
-        """Helper function to process and display shapefile data"""
-        if shapefile.crs is None:
-            st.warning("⚠️ No CRS found in shapefile. Using manually selected CRS.")
-            shapefile.set_crs(crs_options[selected_crs], inplace=True)
-
+    def process_and_display_shapefile(prepared, file_name=None):
+        """Helper function to display a stored shapefile"""
+        shapefile = prepared.source
         st.success(f"✅ CRS: {shapefile.crs}")
 
-        if file_name:
-            st.session_state.uploaded_shapefile_name = file_name
-        st.session_state.uploaded_shapefile_gdf = shapefile
-
         st.subheader("📄 Shapefile Data")
         st.dataframe(shapefile)
 
-        # Plot using matplotlib
+        # Plot using matplotlib, simplified to what the 300 dpi download can show
         fig, ax = plt.subplots(figsize=(8, 6))
-        shapefile.plot(ax=ax, edgecolor='black', facecolor='lightgray')
+        prepared.simplified(level_for_extent(prepared.bounds, 8 * 300)).plot(ax=ax, edgecolor='black', facecolor='lightgray')
         ax.set_title("Shapefile Outline" if file_name else "Area of Interest")
         ax.set_xlabel("Longitude")
         ax.set_ylabel("Latitude")
@@ -83,15 +74,7 @@ def upload_shp():
 
         # Optional interactive map
         if show_interactive_map:
-            m = folium.Map(
-                location=[
-                    shapefile.geometry.centroid.y.mean(),
-                    shapefile.geometry.centroid.x.mean()
-                ],
-                zoom_start=6
-            )
-            folium.GeoJson(shapefile).add_to(m)
-            folium_static(m)
+            shapefile_preview_map(prepared, key="upload_shp_map")
 
     if uploaded_files:
         uploaded_file_names = [file.name for file in uploaded_files]
@@ -113,12 +96,23 @@ def upload_shp():
 
             try:
                 shapefile = gpd.read_file(shp_path)
-                process_and_display_shapefile(shapefile, shp_file.name)
+                if shapefile.crs is None:
+                    st.warning("⚠️ No CRS found in shapefile. Using manually selected CRS.")
+                    shapefile.set_crs(crs_options[selected_crs], inplace=True)
+
+                # Persist once; every page then shares the prepared geometry
+                prepared = store_shapefile(shapefile)
+                set_session_geometry(prepared, shp_file.name)
+                process_and_display_shapefile(prepared, shp_file.name)
             except Exception as e:
                 st.error(f"❌ Error reading shapefile: {e}")
 
     # Show already loaded shapefile if user just navigated here
-    elif "uploaded_shapefile_gdf" in st.session_state:
-        shapefile = st.session_state.uploaded_shapefile_gdf
-        st.success("✅ Active shapefile: " + st.session_state.uploaded_shapefile_name)
-        process_and_display_shapefile(shapefile)
+    elif SESSION_KEY in st.session_state:
+        prepared = get_session_geometry()
+        if prepared is None:
+            st.warning("⚠️ The stored shapefile is no longer available. Please upload it again.")
+            clear_session_geometry()
+            return
+        st.success("✅ Active shapefile: " + st.session_state.get("uploaded_shapefile_name", "Unnamed"))
+        process_and_display_shapefile(prepared)
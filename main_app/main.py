@@ -12,13 +12,14 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 from utils.file_handler import save_uploaded_file, save_uploaded_shapefile, load_dataset_to_dataframe, load_dataset
 from utils.merge_netcdf_utils import merge_netcdf_concat, merge_netcdf_merge, smart_merge_netcdf
 
-from features.home import netcdf_standardizer, description
+from features.home import netcdf_standardizer, batch_standardizer, description, diagnostics
 # from features.data_download import gldas_download
 from features.data_download import gldas_download_2
-from features.upload_files import upload_netcdf, upload_shp
+from features.upload_files import upload_netcdf, upload_shp, data_catalog
 from features.data_transformation import calculator, csv_to_netcdf, clip_nc_with_shp, missing_time_steps, merge_netcdf, split_nc, interpolation, resample_netcdf
-from features.time_series_analysis import trend_analysis, seasonal_analysis, taylor_plot, proportional_redistribution
-from features.spatial_plotting import global_plot, shp_spatial
+from features.time_series_analysis import trend_analysis, batch_trend_analysis, seasonal_analysis, taylor_plot, skill_maps, proportional_redistribution
+from features.spatial_plotting import global_plot, shp_spatial, animation_export
+from utils.instrumentation import run_page
 
 # Sidebar Navigation
 def main():
@@ -28,38 +29,48 @@ def main():
     </div>
     """, unsafe_allow_html=True)
 
-    main_section = st.sidebar.radio("Navigation", [
+    sections = [
         '🏠 Home',
         '⬇️ Data Download',
         '📤 Upload Files',
         '🔄 Data Transformation',
         '📊 Time Series Analysis',
         '🗺️ Spatial Plotting'
-    ])
+    ]
+    # Hidden page: open the app with ?diagnostics=1 or set WATCYCLE_DIAGNOSTICS=1
+    if diagnostics.diagnostics_enabled():
+        sections.append('⚙️ Diagnostics')
+    main_section = st.sidebar.radio("Navigation", sections)
 
     if main_section == '🏠 Home':
         choice = st.sidebar.radio('Choose Feature', [
             '📖 Description',
-            '📊 NetCDF Standardizer'
+            '📊 NetCDF Standardizer',
+            '🗂️ Batch Standardizer'
         ])
 
         if choice == '📖 Description':
-            description.show_description()
+            run_page(choice, description.show_description)
         elif choice == '📊 NetCDF Standardizer':
-            netcdf_standardizer.netcdf_standardizer_feature()
+            run_page(choice, netcdf_standardizer.netcdf_standardizer_feature)
+        elif choice == '🗂️ Batch Standardizer':
+            run_page(choice, batch_standardizer.batch_standardizer_feature)
 
     elif main_section == '⬇️ Data Download':
-        gldas_download_2.gldas_download_ui()
+        run_page(main_section, gldas_download_2.gldas_download_ui)
 
     elif main_section == '📤 Upload Files':
         choice = st.sidebar.radio('Choose Format', [
             '📄 NetCDF File',
-            '🗺️ Shapefile'
+            '🗺️ Shapefile',
+            '🗃️ Data Catalog'
         ])
         if choice == '📄 NetCDF File':
-            upload_netcdf.upload_netcdf()
+            run_page(choice, upload_netcdf.upload_netcdf)
         elif choice == '🗺️ Shapefile':
-            upload_shp.upload_shp()
+            run_page(choice, upload_shp.upload_shp)
+        elif choice == '🗃️ Data Catalog':
+            run_page(choice, data_catalog.data_catalog)
 
     elif main_section == '🔄 Data Transformation':
         choice = st.sidebar.radio('Select Tool', [
@@ -73,47 +84,59 @@ def main():
             '✂️ Split NC file'
         ])
         if choice == '🔢 Calculator':
-            calculator.calculator()
+            run_page(choice, calculator.calculator)
         elif choice == '📝 CSV to NetCDF':
-            csv_to_netcdf.csv_to_netcdf()
+            run_page(choice, csv_to_netcdf.csv_to_netcdf)
         elif choice == '✂️ Clip NC with SHP':
-            clip_nc_with_shp.clip_netcdf_feature()
+            run_page(choice, clip_nc_with_shp.clip_netcdf_feature)
         elif choice == '⏱️ Find Missing Time Steps':
-            missing_time_steps.missing_time_steps_ui()
+            run_page(choice, missing_time_steps.missing_time_steps_ui)
         elif choice == '🔗 Merge NetCDF Files':
-            merge_netcdf.merge_netcdf_ui()
+            run_page(choice, merge_netcdf.merge_netcdf_ui)
         elif choice == '✂️ Split NC file':
-            split_nc.split_netcdf_ui()
+            run_page(choice, split_nc.split_netcdf_ui)
         elif choice == '🔍 Interpolate Missing Values':
-            interpolation.interpolate_netcdf_ui()
+            run_page(choice, interpolation.interpolate_netcdf_ui)
         elif choice == '⚖️ Resample Resolution':
-            resample_netcdf.resample_netcdf_ui()
+            run_page(choice, resample_netcdf.resample_netcdf_ui)
 
     elif main_section == '📊 Time Series Analysis':
         choice = st.sidebar.radio('Select Analysis', [
             '📈 Trend Analysis',
+            '🗂️ Batch Trend Analysis',
             '🔄 Seasonal Analysis',
             '✅ Validation',
+            '🎯 Skill Maps',
             '💧 Water Budget Closure'
         ])
         if choice == '📈 Trend Analysis':
-            trend_analysis.run_mk_cp_analysis()
+            run_page(choice, trend_analysis.run_mk_cp_analysis)
+        elif choice == '🗂️ Batch Trend Analysis':
+            run_page(choice, batch_trend_analysis.batch_trend_analysis_ui)
         elif choice == '🔄 Seasonal Analysis':
-            seasonal_analysis.seasonal_analysis_ui()
+            run_page(choice, seasonal_analysis.seasonal_analysis_ui)
         elif choice == '✅ Validation':
-            taylor_plot.taylor_plot_ui()
+            run_page(choice, taylor_plot.taylor_plot_ui)
+        elif choice == '🎯 Skill Maps':
+            run_page(choice, skill_maps.skill_maps_ui)
         elif choice == '💧 Water Budget Closure':
-            proportional_redistribution.proportional_redistribution_ui()
+            run_page(choice, proportional_redistribution.proportional_redistribution_ui)
 
     elif main_section == '🗺️ Spatial Plotting':
         choice = st.sidebar.radio('Select Plot Type', [
             '🗺️ Regional Plot (SHP)',
-            '🌍 Global Plot'
+            '🌍 Global Plot',
+            '🎞️ Animation Export'
         ])
         if choice == '🗺️ Regional Plot (SHP)':
-            shp_spatial.spatial_plotting_ui()
+            run_page(choice, shp_spatial.spatial_plotting_ui)
         elif choice == '🌍 Global Plot':
-            global_plot.global_plot_ui()
+            run_page(choice, global_plot.global_plot_ui)
+        elif choice == '🎞️ Animation Export':
+            run_page(choice, animation_export.animation_export_ui)
+
+    elif main_section == '⚙️ Diagnostics':
+        diagnostics.diagnostics_ui()
 
 
 if __name__ == "__main__":
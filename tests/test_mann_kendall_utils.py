@@ -0,0 +1,38 @@
+# tests/test_mann_kendall_utils.py
+
+from collections import Counter
+from fractions import Fraction
+
+import numpy as np
+
+from utils.mann_kendall_utils import mann_kendall_test
+
+def _exact_tfpw(x):
+    """S and Var(S) of the trend-free prewhitened series in exact arithmetic."""
+    x = [Fraction(str(v)) for v in x]
+    n = len(x)
+    slopes = sorted((x[j] - x[i]) / (j - i) for i in range(n) for j in range(i + 1, n))
+    m = len(slopes)
+    slope = slopes[m // 2] if m % 2 else (slopes[m // 2 - 1] + slopes[m // 2]) / 2
+    detrended = [x[i] - (i + 1) * slope for i in range(n)]
+    mean = sum(detrended) / n
+    c = [v - mean for v in detrended]
+    r1 = sum(c[i] * c[i + 1] for i in range(n - 1)) / sum(v * v for v in c)
+    white = [detrended[i + 1] - detrended[i] * r1 + (i + 1) * slope for i in range(n - 1)]
+    k = len(white)
+    s = sum((white[j] > white[i]) - (white[j] < white[i]) for i in range(k) for j in range(i + 1, k))
+    ties = Counter(white).values()
+    var_s = (k * (k - 1) * (2 * k + 5) - sum(t * (t - 1) * (2 * t + 5) for t in ties)) / 18
+    return s, float(var_s)
+
+def test_tfpw_counts_ties_of_rounded_series():
+    rng = np.random.default_rng(145)
+    e = np.zeros(24)
+    for i in range(1, 24):
+        e[i] = 0.6 * e[i - 1] + rng.normal()
+    x = np.round(e + 0.02 * np.arange(24), 1)
+
+    result = mann_kendall_test(x, method="tfpw")
+    s, var_s = _exact_tfpw(x)
+    assert result.s == s
+    np.testing.assert_allclose(result.var_s, var_s)
@@ -0,0 +1,53 @@
+# tests/test_merge_netcdf_utils.py
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from utils.merge_netcdf_utils import merge_netcdf_merge, plan_netcdf_merge, smart_merge_netcdf
+
+@pytest.mark.parametrize("policy", ["keep-first", "keep-last", "average"])
+def test_smart_merge_keeps_static_variables(tmp_path, policy):
+    paths = []
+    for i, start in enumerate(["2000-01-01", "2000-04-01"]):
+        time = pd.date_range(start, periods=6, freq="MS")
+        ds = xr.Dataset({"P": (("time", "lat", "lon"), np.full((6, 3, 4), float(i + 1))),
+                         "mask": (("lat", "lon"), np.ones((3, 4)))},
+                        coords={"time": time, "lat": np.arange(3.0), "lon": np.arange(4.0)})
+        paths.append(str(tmp_path / f"part{i}.nc"))
+        ds.to_netcdf(paths[-1])
+
+    merged = smart_merge_netcdf(paths, duplicate_policy=policy)
+    assert merged["mask"].dims == ("lat", "lon")
+    assert merged.sizes["time"] == 9
+    overlap = merged["P"].isel(lat=0, lon=0).values[3:6]
+    expected = {"keep-first": 1.0, "keep-last": 2.0, "average": 1.5}[policy]
+    np.testing.assert_allclose(overlap, expected)
+
+def test_merge_outer_joins_differing_time_axes(tmp_path):
+    paths = []
+    for name, start in [("P", "2000-01-01"), ("ET", "2000-04-01")]:
+        time = pd.date_range(start, periods=6, freq="MS")
+        ds = xr.Dataset({name: (("time", "lat", "lon"), np.ones((6, 3, 4)))},
+                        coords={"time": time, "lat": np.arange(3.0), "lon": np.arange(4.0)})
+        paths.append(str(tmp_path / f"{name}.nc"))
+        ds.to_netcdf(paths[-1])
+
+    plan = plan_netcdf_merge(paths, mode="merge")
+    assert plan["valid"]
+    assert any("'time' axis differs" in w for w in plan["warnings"])
+    merged = merge_netcdf_merge(paths)
+    assert merged.sizes["time"] == 9
+    assert int(merged["P"].isel(lat=0, lon=0).isnull().sum()) == 3
+
+def test_merge_rejects_differing_grids(tmp_path):
+    paths = []
+    for name, lat in [("P", np.arange(3.0)), ("ET", np.arange(3.0) + 0.5)]:
+        ds = xr.Dataset({name: (("lat", "lon"), np.ones((3, 4)))}, coords={"lat": lat, "lon": np.arange(4.0)})
+        paths.append(str(tmp_path / f"{name}.nc"))
+        ds.to_netcdf(paths[-1])
+
+    plan = plan_netcdf_merge(paths, mode="merge")
+    assert not plan["valid"]
+    assert any("'lat' grid differs" in e for e in plan["errors"])
@@ -0,0 +1,43 @@
+# tests/test_netcdf_standardizer_utils.py
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from utils.netcdf_standardizer_utils import batch_standardize, load_mapping_cache
+
+def _write(path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    ds = xr.Dataset({"P": (("t", "Lat", "Lon"), np.ones((2, 3, 4)))},
+                    coords={"t": pd.date_range("2000-01-01", periods=2, freq="MS"),
+                            "Lat": np.arange(3.0), "Lon": np.arange(4.0)})
+    ds.to_netcdf(path)
+    return str(path)
+
+def test_batch_standardize_keeps_relative_paths(tmp_path):
+    files = [_write(tmp_path / "in" / "a" / "P.nc"), _write(tmp_path / "in" / "b" / "P.nc")]
+    cache = str(tmp_path / "cache.json")
+    report = batch_standardize(files, str(tmp_path / "out"), cache_path=cache, max_workers=1)
+
+    assert sorted(report["file"]) == ["a/P.nc", "b/P.nc"]
+    assert (report["status"] == "ok").all()
+    for sub in ("a", "b"):
+        with xr.open_dataset(tmp_path / "out" / sub / "P.nc") as ds:
+            assert {"time", "lat", "lon"} <= set(ds.dims)
+
+def test_batch_standardize_rejects_output_onto_input(tmp_path):
+    files = [_write(tmp_path / "in" / "P.nc")]
+    with pytest.raises(ValueError, match="overwrite the input"):
+        batch_standardize(files, str(tmp_path / "in"), cache_path=str(tmp_path / "cache.json"))
+    with xr.open_dataset(files[0]) as ds:
+        assert "t" in ds.dims
+
+def test_batch_standardize_caches_overrides(tmp_path):
+    files = [_write(tmp_path / "in" / "P.nc")]
+    cache = str(tmp_path / "cache.json")
+    batch_standardize(files, str(tmp_path / "out1"), cache_path=cache, max_workers=1)
+    (signature,) = load_mapping_cache(cache)
+    override = {"time": "t", "lat": "Lat", "lon": None}
+    batch_standardize(files, str(tmp_path / "out2"), overrides={signature: override}, cache_path=cache)
+    assert load_mapping_cache(cache)[signature] == override
@@ -0,0 +1,35 @@
+# tests/test_reduction_utils.py
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+import geopandas as gpd
+from shapely.geometry import box
+
+from utils.reduction_utils import spatial_mean_table
+
+def _write_grid(path) -> str:
+    """1° grid over 0–10°E, 0–4°N: 1 in the west half, 3 in the east half."""
+    lat = np.arange(0.5, 4.0, 1.0)
+    lon = np.arange(0.5, 10.0, 1.0)
+    values = np.broadcast_to(np.where(lon < 5, 1.0, 3.0), (3, lat.size, lon.size))
+    ds = xr.Dataset({"P": (("time", "lat", "lon"), values)},
+                    coords={"time": pd.date_range("2000-01-01", periods=3, freq="MS"), "lat": lat, "lon": lon})
+    ds.to_netcdf(path)
+    return str(path)
+
+def test_region_mean_uses_inside_mask_with_and_without_weights(tmp_path):
+    path = _write_grid(tmp_path / "grid.nc")
+    # The west half plus a sliver in the far east that covers no cell centre:
+    # the bounding-box window is the whole grid, but only west cells are inside
+    region = gpd.GeoDataFrame(geometry=[box(0, 0, 5, 4), box(9.9, 3.9, 9.95, 3.95)], crs="EPSG:4326")
+    for weighted in (True, False):
+        table = spatial_mean_table([(path, "P")], weighted=weighted, geometry=region)
+        np.testing.assert_allclose(table["value"], 1.0, err_msg=f"weighted={weighted}")
+
+def test_region_mean_unweighted_counts_cells_equally(tmp_path):
+    path = _write_grid(tmp_path / "grid.nc")
+    # 5 west cells of 1 and 1 east cell of 3 per row, inside a 6°-wide window
+    region = gpd.GeoDataFrame(geometry=[box(0, 0, 6, 4)], crs="EPSG:4326")
+    table = spatial_mean_table([(path, "P")], weighted=False, geometry=region)
+    np.testing.assert_allclose(table["value"], 8 / 6)
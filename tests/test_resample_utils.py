@@ -0,0 +1,26 @@
+# tests/test_resample_utils.py
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from utils.resample_utils import block_aggregate
+
+def test_block_aggregate_keeps_variables_with_some_block_dims():
+    time = pd.date_range("2000-01-01", periods=3, freq="MS")
+    lat, lon = np.arange(4.0), np.arange(6.0)
+    ds = xr.Dataset({"P": (("time", "lat", "lon"), np.ones((3, 4, 6))),
+                     "zonal": (("time", "lat"), np.arange(12.0).reshape(3, 4)),
+                     "series": ("time", np.arange(3.0)),
+                     "label": (("lat",), np.array(list("abcd")))},
+                    coords={"time": time, "lat": lat, "lon": lon})
+
+    with pytest.warns(UserWarning, match="'label'"):
+        out = block_aggregate(ds, {"lat": 2, "lon": 3}, weights="coslat")
+    assert out["P"].shape == (3, 2, 2)
+    assert out["zonal"].dims == ("time", "lat") and out["zonal"].shape == (3, 2)
+    np.testing.assert_array_equal(out["series"].values, np.arange(3.0))
+    assert "label" not in out
+    w = np.cos(np.deg2rad(lat[:2]))
+    np.testing.assert_allclose(out["zonal"].values[0, 0], np.average([0.0, 1.0], weights=w))
@@ -0,0 +1,277 @@
+# utils/animation_utils.py
+
+import os
+import shutil
+import subprocess
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from utils.geospatial_utils import compute_cell_edges, get_bbox_slices, get_raster_mask, coord_resolution
+from utils.instrumentation import instrument
+
+def get_frame_indices(ds: xr.Dataset, start=None, end=None, step: int = 1) -> list:
+    """
+    Returns the integer time indices that fall inside [start, end].
+
+    Args:
+        ds: Dataset with a 'time' coordinate
+        start: First date to include (anything pandas can parse), or None
+        end: Last date to include, or None
+        step: Keep every `step`-th frame
+
+    Returns:
+        List of integer indices into ds['time']
+    """
+    if "time" not in ds.dims:
+        raise ValueError("Dataset has no 'time' dimension to animate over.")
+    times = pd.to_datetime(ds["time"].values)
+    keep = np.ones(times.size, dtype=bool)
+    if start is not None:
+        keep &= times >= pd.to_datetime(start)
+    if end is not None:
+        keep &= times <= pd.to_datetime(end)
+    return np.flatnonzero(keep)[::max(int(step), 1)].tolist()
+
+def streaming_min_max(da: xr.DataArray, indices: list, chunk_size: int = 24, mask=None) -> tuple:
+    """
+    Computes fixed colour limits for an animation in a single pass.
+
+    Reads `chunk_size` time steps at a time so the full cube is never held
+    in memory, and keeps only a running min/max.
+
+    Args:
+        da: DataArray with a 'time' dimension
+        indices: Time indices that will be rendered
+        chunk_size: Number of time steps read per block
+        mask: Optional boolean (lat, lon) array; cells outside it are ignored
+
+    Returns:
+        (vmin, vmax) as floats
+    """
+    vmin, vmax = np.inf, -np.inf
+    for start in range(0, len(indices), chunk_size):
+        block = da.isel(time=indices[start:start + chunk_size]).values.astype(float)
+        if mask is not None:
+            block = np.where(mask, block, np.nan)
+        if np.all(np.isnan(block)):
+            continue
+        vmin = min(vmin, float(np.nanmin(block)))
+        vmax = max(vmax, float(np.nanmax(block)))
+    if not np.isfinite(vmin) or not np.isfinite(vmax):
+        raise ValueError("Selected frames contain only missing values.")
+    if vmin == vmax:
+        vmax = vmin + 1.0
+    return vmin, vmax
+
+def _region_selection(ds: xr.Dataset, geoms: list) -> tuple:
+    """
+    Returns the lat/lon slices covering the geometries and the inside mask
+    for that window.
+    """
+    import shapely
+
+    lat = ds["lat"].values
+    lon = ds["lon"].values
+    lat_sl, lon_sl = get_bbox_slices(lat, lon, shapely.total_bounds(geoms))
+    mask = get_raster_mask(lat[lat_sl], lon[lon_sl], geoms,
+                           lat_res=coord_resolution(lat), lon_res=coord_resolution(lon))
+    return lat_sl, lon_sl, mask
+
+def _render_frame_batch(job: dict) -> list:
+    """
+    Renders a contiguous batch of frames inside a worker process.
+
+    The figure, projection, coastlines, shapefile overlay and colorbar are
+    built once; each frame only swaps the mesh data and the title text.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import cartopy.crs as ccrs
+    from utils.global_plot_utils import get_projection
+
+    ds = xr.open_dataset(job["file_path"])
+    try:
+        da = ds[job["var"]]
+        mask = None
+        if job["geoms"]:
+            lat_sl, lon_sl, mask = _region_selection(ds, job["geoms"])
+            da = da.isel(lat=lat_sl, lon=lon_sl)
+
+        lon_edges = compute_cell_edges(da["lon"].values)
+        lat_edges = compute_cell_edges(da["lat"].values)
+        times = pd.to_datetime(ds["time"].values)
+
+        fig = plt.figure(figsize=job["figsize"], dpi=job["dpi"])
+        ax = fig.add_subplot(1, 1, 1, projection=get_projection(job["proj_name"]))
+        empty = np.full((da.sizes["lat"], da.sizes["lon"]), np.nan)
+        pcm = ax.pcolormesh(lon_edges, lat_edges, empty, cmap=job["cmap"],
+                            vmin=job["vmin"], vmax=job["vmax"],
+                            transform=ccrs.PlateCarree(), shading="flat")
+        ax.coastlines()
+        if job["geoms"]:
+            ax.add_geometries(job["geoms"], crs=ccrs.PlateCarree(), facecolor="none",
+                              edgecolor="black", linewidth=1.2, zorder=5)
+            minx, maxx = lon_edges.min(), lon_edges.max()
+            miny, maxy = lat_edges.min(), lat_edges.max()
+            ax.set_extent([minx, maxx, miny, maxy], crs=ccrs.PlateCarree())
+        else:
+            ax.set_global()
+        fig.colorbar(pcm, ax=ax, orientation="horizontal", pad=0.05, shrink=0.8, label=job["var"])
+        title = ax.set_title("", fontsize=14, weight="bold")
+
+        written = []
+        for frame_no, t_idx in zip(job["frame_numbers"], job["indices"]):
+            values = da.isel(time=t_idx).values.astype(float)
+            if mask is not None:
+                values = np.where(mask, values, np.nan)
+            pcm.set_array(np.ma.masked_invalid(values))
+            title.set_text(f"{job['var']} ({times[t_idx].date()})")
+            out = os.path.join(job["out_dir"], f"frame_{frame_no:05d}.png")
+            fig.savefig(out, dpi=job["dpi"])
+            written.append(out)
+        plt.close(fig)
+        return written
+    finally:
+        ds.close()
+
+def render_frames(file_path: str, var: str, indices: list, out_dir: str, proj_name: str = "PlateCarree",
+                  cmap: str = "viridis", vmin=None, vmax=None, geoms=None, max_workers=None,
+                  figsize=(12, 6), dpi: int = 100) -> list:
+    """
+    Renders one PNG per time index using a process pool.
+
+    Frames are split into contiguous batches, one per worker, so each worker
+    builds its cartopy axes once and reuses them for every frame it draws.
+
+    Args:
+        file_path: Path to the NetCDF file (each worker opens it itself)
+        var: Variable to render
+        indices: Time indices to render, in output order
+        out_dir: Directory that receives frame_00000.png, frame_00001.png, ...
+        proj_name: Projection name understood by get_projection()
+        cmap: Matplotlib colormap name
+        vmin, vmax: Fixed colour limits; computed with streaming_min_max() if omitted
+        geoms: Optional list of shapely geometries (EPSG:4326) to clip and overlay
+        max_workers: Number of worker processes (default: CPU count)
+        figsize, dpi: Figure size and resolution
+
+    Returns:
+        Sorted list of written frame paths
+    """
+    if not indices:
+        raise ValueError("No frames selected for rendering.")
+    if vmin is None or vmax is None:
+        with xr.open_dataset(file_path) as ds:
+            da = ds[var]
+            mask = None
+            if geoms:
+                lat_sl, lon_sl, mask = _region_selection(ds, list(geoms))
+                da = da.isel(lat=lat_sl, lon=lon_sl)
+            vmin, vmax = streaming_min_max(da, indices, mask=mask)
+
+    max_workers = max(1, min(max_workers or os.cpu_count() or 1, len(indices)))
+    batches = np.array_split(np.arange(len(indices)), max_workers)
+    jobs = [{
+        "file_path": file_path,
+        "var": var,
+        "indices": [indices[i] for i in batch],
+        "frame_numbers": batch.tolist(),
+        "out_dir": out_dir,
+        "proj_name": proj_name,
+        "cmap": cmap,
+        "vmin": vmin,
+        "vmax": vmax,
+        "geoms": list(geoms) if geoms else [],
+        "figsize": figsize,
+        "dpi": dpi,
+    } for batch in batches if batch.size]
+
+    try:
+        if len(jobs) == 1:
+            results = [_render_frame_batch(jobs[0])]
+        else:
+            with ProcessPoolExecutor(max_workers=len(jobs)) as pool:
+                results = list(pool.map(_render_frame_batch, jobs))
+    except Exception as e:
+        raise RuntimeError(f"Error rendering animation frames: {e}")
+    return sorted(p for batch in results for p in batch)
+
+def assemble_gif(frame_paths: list, out_path: str, fps: int = 4) -> str:
+    """Combines rendered PNG frames into a looping GIF."""
+    from PIL import Image
+
+    frames = [Image.open(p).convert("P", palette=Image.ADAPTIVE) for p in frame_paths]
+    frames[0].save(out_path, save_all=True, append_images=frames[1:],
+                   duration=int(1000 / max(fps, 1)), loop=0, optimize=False)
+    return out_path
+
+def assemble_mp4(frame_dir: str, out_path: str, fps: int = 4) -> str:
+    """Encodes frame_%05d.png files into an H.264 MP4 using ffmpeg."""
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise RuntimeError("MP4 export requires ffmpeg on the PATH; choose GIF or PNG sequence instead.")
+    cmd = [ffmpeg, "-y", "-loglevel", "error", "-framerate", str(fps),
+           "-i", os.path.join(frame_dir, "frame_%05d.png"),
+           "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-c:v", "libx264", "-pix_fmt", "yuv420p", out_path]
+    subprocess.run(cmd, check=True)
+    return out_path
+
+def assemble_png_zip(frame_paths: list, out_path: str) -> str:
+    """Packs the rendered PNG sequence into a ZIP archive."""
+    with zipfile.ZipFile(out_path, "w", compression=zipfile.ZIP_STORED) as zf:
+        for p in frame_paths:
+            zf.write(p, os.path.basename(p))
+    return out_path
+
+@instrument()
+def export_animation(file_path: str, var: str, fmt: str = "gif", start=None, end=None, step: int = 1,
+                     fps: int = 4, proj_name: str = "PlateCarree", cmap: str = "viridis",
+                     geoms=None, max_workers=None, dpi: int = 100) -> bytes:
+    """
+    Renders a time range of a variable and returns the encoded animation.
+
+    Args:
+        file_path: Path to the NetCDF file
+        var: Variable to animate
+        fmt: 'gif', 'mp4' or 'png' (ZIP of the PNG sequence)
+        start, end: Optional date range to animate
+        step: Keep every `step`-th time step
+        fps: Frames per second in the output
+        proj_name: Projection name understood by get_projection()
+        cmap: Matplotlib colormap name
+        geoms: Optional shapefile geometries (EPSG:4326) for a regional animation
+        max_workers: Number of render processes
+        dpi: Frame resolution
+
+    Returns:
+        The animation file as bytes
+    """
+    if fmt not in ("gif", "mp4", "png"):
+        raise ValueError("fmt must be one of 'gif', 'mp4' or 'png'")
+
+    with xr.open_dataset(file_path) as ds:
+        indices = get_frame_indices(ds, start, end, step)
+
+    work_dir = tempfile.mkdtemp(prefix="watcycle_anim_")
+    try:
+        frame_dir = os.path.join(work_dir, "frames")
+        os.makedirs(frame_dir)
+        frames = render_frames(file_path, var, indices, frame_dir, proj_name=proj_name, cmap=cmap,
+                               geoms=geoms, max_workers=max_workers, dpi=dpi)
+        out_path = os.path.join(work_dir, f"animation.{'zip' if fmt == 'png' else fmt}")
+        if fmt == "gif":
+            assemble_gif(frames, out_path, fps=fps)
+        elif fmt == "mp4":
+            assemble_mp4(frame_dir, out_path, fps=fps)
+        else:
+            assemble_png_zip(frames, out_path)
+        with open(out_path, "rb") as f:
+            return f.read()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,344 @@
+# utils/batch_trend_utils.py
+
+import os
+import re
+import sys
+import glob
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from utils.catalog_utils import catalog_variables
+from utils.instrumentation import instrument
+from utils.mann_kendall_utils import MK_METHODS, mann_kendall_test
+from utils.reduction_utils import spatial_mean_table
+from utils.trend_analysis_utils import calculate_sens_slopes, compute_sen_summary
+
+FULL_PERIOD = "all"
+FULL_DOMAIN = "Full domain"
+REPORT_COLUMNS = ["region", "period", "file", "variable", "start", "end", "n", "mean", "test", "trend",
+                  "significant", "p", "tau", "z", "slope_yearly", "slope_monthly", "ci_lower_yearly", "ci_upper_yearly",
+                  "status", "message", "path"]
+# Below this many tasks the trend statistics run in-process; a pool costs more than it saves
+_SERIAL_TASKS = 8
+
+def parse_period(text: str) -> tuple:
+    """
+    Parses a period specification into (label, start, end).
+
+    Accepts 'all' (the whole record), 'YYYY-YYYY' (whole years) or
+    'START:END' with any dates pandas understands, e.g. '2003-01-01:2015-12-31'.
+    """
+    text = text.strip()
+    if not text or text.lower() == FULL_PERIOD:
+        return FULL_PERIOD, None, None
+    years = re.fullmatch(r"(\d{4})\s*-\s*(\d{4})", text)
+    if years:
+        start, end = pd.Timestamp(f"{years[1]}-01-01"), pd.Timestamp(f"{years[2]}-12-31 23:59:59")
+    elif ":" in text:
+        start, end = (pd.Timestamp(part.strip()) for part in text.split(":", 1))
+    else:
+        raise ValueError(f"Unrecognised period '{text}'; use 'all', 'YYYY-YYYY' or 'START:END'.")
+    if end < start:
+        raise ValueError(f"Period '{text}' ends before it starts.")
+    return text, start, end
+
+def expand_inputs(inputs, pattern: str = "*.nc") -> list:
+    """Expands files, folders (searched recursively for `pattern`) and glob patterns to a sorted file list."""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths += glob.glob(os.path.join(item, "**", pattern), recursive=True)
+        elif any(c in item for c in "*?["):
+            paths += glob.glob(item, recursive=True)
+        else:
+            paths.append(item)
+    return sorted(dict.fromkeys(os.path.abspath(p) for p in paths))
+
+def build_trend_tasks(paths, variables=None, periods=None, regions=None) -> list:
+    """
+    Lists the (file, variable, period, region) combinations of a batch.
+
+    Variables a file does not have are skipped, so products with different
+    variable sets can be compared in one run. A file whose header cannot be
+    read gets one task per region and period with its 'error' set.
+
+    Args:
+        paths: NetCDF files
+        variables: Variable names; None takes every time-dependent variable of each file
+        periods: (label, start, end) tuples or strings for parse_period(); None is the whole record
+        regions: {label: GeoDataFrame, PreparedGeometry or None}; None is the full domain
+
+    Returns:
+        list of task dicts
+    """
+    periods = [parse_period(p) if isinstance(p, str) else tuple(p) for p in (periods or [FULL_PERIOD])]
+    regions = regions or {FULL_DOMAIN: None}
+    tasks = []
+    for path in paths:
+        try:
+            available = catalog_variables(path, required_dims=("time",))
+            chosen, error = (available if variables is None else [v for v in variables if v in available]), None
+        except Exception as e:
+            chosen, error = [""], f"unreadable file: {e}"
+        for region in regions:
+            for variable in chosen:
+                for label, start, end in periods:
+                    tasks.append({"path": path, "variable": variable, "region": region,
+                                  "period": label, "start": start, "end": end, "error": error})
+    return tasks
+
+def _trend_job(job: dict) -> dict:
+    """Mann-Kendall test and Sen's slope of one series slice."""
+    times, values = job["times"], job["values"]
+    row = {"n": len(values), "start": None, "end": None, "mean": np.nan}
+    if len(values) < 3:
+        return {**row, "status": "skipped", "message": "fewer than 3 valid time steps"}
+    try:
+        row.update(start=times[0], end=times[-1], mean=float(values.mean()))
+        result = mann_kendall_test(values, method=job["method"], alpha=job["alpha"])
+        df = pd.DataFrame({"value": values, "ordinal_time": times.map(pd.Timestamp.toordinal)})
+        sen = compute_sen_summary(calculate_sens_slopes(df), values, alpha=job["alpha"])
+        return {**row, "test": job["method"], "trend": result.trend, "significant": bool(result.h), "p": result.p,
+                "tau": result.Tau, "z": result.z, "slope_yearly": sen["Slope (yearly)"],
+                "slope_monthly": sen["Slope (monthly)"],
+                "ci_lower_yearly": sen["CI lower (yearly)"], "ci_upper_yearly": sen["CI upper (yearly)"],
+                "status": "ok", "message": ""}
+    except Exception as e:
+        return {**row, "status": "error", "message": str(e)}
+
+def _reduce_region(paths_vars: dict, geometry, max_workers: int) -> tuple:
+    """
+    Spatial means of one region as ({(path, variable): Series}, {path: error}).
+
+    All files are reduced in one call (in parallel, from the series cache
+    where possible); if that fails, files are retried one by one so a
+    single unreadable file does not stop the batch.
+    """
+    sources = [(path, variable) for path, variables in paths_vars.items() for variable in variables]
+
+    def collect(keys, table):
+        # Labels are positions in `keys`, so files with the same name in different folders stay apart
+        return {keys[int(label)]: pd.Series(group["value"].values, index=pd.DatetimeIndex(group["time"]))
+                for label, group in table.groupby("label", sort=False)}
+
+    try:
+        table = spatial_mean_table([(p, v, str(i)) for i, (p, v) in enumerate(sources)],
+                                   geometry=geometry, max_workers=max_workers)
+        return collect(sources, table), {}
+    except Exception:
+        series, failed = {}, {}
+        for path, variables in paths_vars.items():
+            keys = [(path, v) for v in variables]
+            try:
+                table = spatial_mean_table([(p, v, str(i)) for i, (p, v) in enumerate(keys)], geometry=geometry)
+                series.update(collect(keys, table))
+            except Exception as e:
+                failed[path] = str(e)
+        return series, failed
+
+@instrument()
+def run_batch_trends(paths, variables=None, periods=None, regions=None, alpha: float = 0.05,
+                     method: str = "original", max_workers: int = None, progress=None) -> pd.DataFrame:
+    """
+    Mann-Kendall and Sen's slope results for every (file, variable, period, region).
+
+    Each file is reduced to area-weighted spatial means once per region,
+    with the files of a region read in parallel worker processes and the
+    series kept in the reduction cache, so repeated runs, extra periods or
+    the single-series trend page reuse them. The trend statistics of the
+    period slices are then fanned out to worker processes.
+
+    Args:
+        paths: NetCDF files
+        variables: Variable names; None takes every time-dependent variable of each file
+        periods: (label, start, end) tuples or strings for parse_period(); None is the whole record
+        regions: {label: GeoDataFrame, PreparedGeometry or None}; None is the full domain
+        alpha: Significance level of the Mann-Kendall test
+        method: Mann-Kendall variant (see mann_kendall_utils.MK_METHODS)
+        max_workers: Worker processes (default: CPU count)
+        progress: Optional callable(done, total)
+
+    Returns:
+        pd.DataFrame: One row per task (REPORT_COLUMNS); failed tasks have status 'error'
+    """
+    try:
+        regions = regions or {FULL_DOMAIN: None}
+        max_workers = max_workers or os.cpu_count() or 1
+        tasks = build_trend_tasks(paths, variables, periods, regions)
+        used_regions = list(dict.fromkeys(t["region"] for t in tasks if t["error"] is None))
+        total, done = len(used_regions) + len(tasks), 0
+
+        # 1️⃣ One spatial-mean pass per region over all files
+        series, failed = {}, {}
+        for region in used_regions:
+            paths_vars = {}
+            for t in tasks:
+                if t["region"] == region and t["error"] is None:
+                    paths_vars.setdefault(t["path"], [])
+                    if t["variable"] not in paths_vars[t["path"]]:
+                        paths_vars[t["path"]].append(t["variable"])
+            reduced, errors = _reduce_region(paths_vars, regions[region], max_workers)
+            series.update({(region,) + key: s for key, s in reduced.items()})
+            failed.update({(region, path): err for path, err in errors.items()})
+            done += 1
+            if progress:
+                progress(done, total)
+
+        # 2️⃣ Trend statistics per period slice
+        rows, jobs = {}, []
+        for i, t in enumerate(tasks):
+            base = {"region": t["region"], "period": t["period"], "file": os.path.basename(t["path"]),
+                    "variable": t["variable"], "path": t["path"]}
+            error = t["error"] or failed.get((t["region"], t["path"]))
+            if error:
+                rows[i] = {**base, "status": "error", "message": error}
+                continue
+            s = series[(t["region"], t["path"], t["variable"])].loc[t["start"]:t["end"]].dropna()
+            rows[i] = base
+            jobs.append({"index": i, "times": s.index, "values": s.to_numpy(dtype=float), "alpha": alpha,
+                         "method": method})
+
+        done += len(tasks) - len(jobs)
+        if len(jobs) < _SERIAL_TASKS or max_workers == 1:
+            for job in jobs:
+                rows[job["index"]].update(_trend_job(job))
+                done += 1
+                if progress:
+                    progress(done, total)
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                futures = {pool.submit(_trend_job, job): job["index"] for job in jobs}
+                for future in as_completed(futures):
+                    rows[futures[future]].update(future.result())
+                    done += 1
+                    if progress:
+                        progress(done, total)
+
+        report = pd.DataFrame([rows[i] for i in range(len(tasks))], columns=REPORT_COLUMNS)
+        return report.astype({"significant": "boolean"})
+    except Exception as e:
+        raise RuntimeError(f"Error running batch trend analysis: {e}")
+
+def file_labels(paths) -> dict:
+    """
+    Short display labels for file paths: the file name, prefixed with as many
+    parent folders as needed to tell apart files with the same name
+    (e.g. 2001/GLDAS.nc and 2002/GLDAS.nc).
+    """
+    paths = list(dict.fromkeys(paths))
+    parts = {p: os.path.normpath(p).split(os.sep) for p in paths}
+    depth = {p: 1 for p in paths}
+    while True:
+        labels = {p: "/".join(parts[p][-depth[p]:]) for p in paths}
+        counts = pd.Series(list(labels.values())).value_counts()
+        clashes = [p for p in paths if counts[labels[p]] > 1 and depth[p] < len(parts[p])]
+        if not clashes:
+            return labels
+        for p in clashes:
+            depth[p] += 1
+
+def trend_heatmap(report: pd.DataFrame, region: str = None, period: str = None):
+    """
+    Kendall's tau of every file × variable of one region and period.
+
+    Tau is unit-free, so variables can share one colour scale; each cell is
+    labelled with the yearly Sen's slope and marked * when significant.
+    Rows are keyed by the full path, so files with the same name in
+    different folders get their own rows.
+
+    Returns:
+        matplotlib Figure
+    """
+    import matplotlib.pyplot as plt
+
+    subset = report[report["status"] == "ok"]
+    if region is not None:
+        subset = subset[subset["region"] == region]
+    if period is not None:
+        subset = subset[subset["period"] == period]
+    files = list(dict.fromkeys(subset["path"]))
+    labels = file_labels(files)
+    variables = list(dict.fromkeys(subset["variable"]))
+    tau = subset.pivot_table(index="path", columns="variable", values="tau", aggfunc="first").reindex(
+        index=files, columns=variables)
+
+    fig, ax = plt.subplots(figsize=(max(6, 1.3 * len(variables) + 3), max(3, 0.45 * len(files) + 1.5)))
+    image = ax.imshow(tau.to_numpy(dtype=float), cmap="RdBu_r", vmin=-1, vmax=1, aspect="auto")
+    for _, row in subset.iterrows():
+        label = f"{row['slope_yearly']:.3g}" + ("*" if row["significant"] else "")
+        ax.text(variables.index(row["variable"]), files.index(row["path"]), label,
+                ha="center", va="center", fontsize=8)
+    ax.set_xticks(range(len(variables)), variables, rotation=45, ha="right")
+    ax.set_yticks(range(len(files)), [labels[f] for f in files])
+    fig.colorbar(image, ax=ax, label="Kendall's tau")
+    title = " · ".join(str(part) for part in (region, period) if part is not None)
+    ax.set_title(f"Trends (Sen's slope per year, * significant){': ' + title if title else ''}", fontsize=11)
+    fig.tight_layout()
+    return fig
+
+def _slug(text: str) -> str:
+    return re.sub(r"[^A-Za-z0-9]+", "_", str(text)).strip("_") or "all"
+
+def main(argv=None) -> int:
+    """Headless entry point: python -m utils.batch_trend_utils --help"""
+    parser = argparse.ArgumentParser(
+        prog="python -m utils.batch_trend_utils",
+        description="Mann-Kendall / Sen's slope trends of the spatial means of many NetCDF files."
+    )
+    parser.add_argument("inputs", nargs="+", help="NetCDF files, folders or glob patterns")
+    parser.add_argument("--variables", nargs="+", help="Variables to analyse (default: all with a time dimension)")
+    parser.add_argument("--period", action="append", dest="periods",
+                        help="'all', 'YYYY-YYYY' or 'START:END'; repeat for several periods (default: all)")
+    parser.add_argument("--shapefile", action="append", dest="shapefiles",
+                        help="Region to average over; repeat for several regions (default: full domain)")
+    parser.add_argument("--full-domain", action="store_true", help="Also analyse the full domain with --shapefile")
+    parser.add_argument("--alpha", type=float, default=0.05, help="Significance level (default: 0.05)")
+    parser.add_argument("--method", choices=list(MK_METHODS), default="original",
+                        help="Mann-Kendall variant; hamed_rao, yue_wang and tfpw correct for autocorrelation")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("--pattern", default="*.nc", help="File pattern inside folders (default: *.nc)")
+    parser.add_argument("--out", default="batch_trends", help="Output folder for the report and plots")
+    args = parser.parse_args(argv)
+
+    paths = expand_inputs(args.inputs, args.pattern)
+    if not paths:
+        parser.error("no NetCDF files found")
+    regions = {}
+    if args.shapefiles:
+        import geopandas as gpd
+        from utils.geometry_store import prepare_geometry
+        if args.full_domain:
+            regions[FULL_DOMAIN] = None
+        for shp in args.shapefiles:
+            regions[os.path.splitext(os.path.basename(shp))[0]] = prepare_geometry(gpd.read_file(shp))
+
+    def report_progress(done, total):
+        print(f"\r{done}/{total}", end="", file=sys.stderr, flush=True)
+
+    report = run_batch_trends(paths, args.variables, args.periods, regions or None, alpha=args.alpha,
+                              method=args.method, max_workers=args.workers, progress=report_progress)
+    print(file=sys.stderr)
+
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    os.makedirs(args.out, exist_ok=True)
+    report.to_csv(os.path.join(args.out, "trend_report.csv"), index=False)
+    ok = report[report["status"] == "ok"]
+    for (region, period), _ in ok.groupby(["region", "period"], sort=False):
+        fig = trend_heatmap(report, region, period)
+        fig.savefig(os.path.join(args.out, f"trend_heatmap_{_slug(region)}_{_slug(period)}.png"), dpi=150)
+        plt.close(fig)
+
+    counts = report["status"].value_counts()
+    print(f"{len(report)} tasks: {counts.get('ok', 0)} ok, {counts.get('skipped', 0)} skipped, "
+          f"{counts.get('error', 0)} errors; {int(ok['significant'].sum())} significant trends. "
+          f"Results in {os.path.abspath(args.out)}")
+    return 0 if not counts.get("error", 0) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
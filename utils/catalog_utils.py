@@ -0,0 +1,326 @@
+# utils/catalog_utils.py
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import tempfile
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+from utils.instrumentation import instrument
+
+CATALOG_PATH = os.environ.get("WATCYCLE_CATALOG_DB",
+                              os.path.join(tempfile.gettempdir(), "watcycle_catalog.sqlite"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    name TEXT,
+    label TEXT,
+    source TEXT,
+    size INTEGER,
+    mtime_ns INTEGER,
+    content_hash TEXT,
+    format TEXT,
+    dims TEXT,
+    time_start TEXT,
+    time_end TEXT,
+    n_time INTEGER,
+    calendar TEXT,
+    lat_min REAL, lat_max REAL, lon_min REAL, lon_max REAL,
+    lat_res REAL, lon_res REAL,
+    crs TEXT,
+    attrs TEXT,
+    indexed_at REAL
+);
+CREATE TABLE IF NOT EXISTS variables (
+    path TEXT REFERENCES files(path) ON DELETE CASCADE,
+    name TEXT,
+    dims TEXT,
+    shape TEXT,
+    dtype TEXT,
+    units TEXT,
+    long_name TEXT,
+    PRIMARY KEY (path, name)
+);
+CREATE INDEX IF NOT EXISTS idx_variables_name ON variables(name);
+CREATE INDEX IF NOT EXISTS idx_files_time ON files(time_start, time_end);
+"""
+
+_LAT_NAMES = ("lat", "latitude", "y")
+_LON_NAMES = ("lon", "longitude", "x")
+
+def _connect(db_path: str = None) -> sqlite3.Connection:
+    """Opens the catalog database, creating the schema on first use."""
+    conn = sqlite3.connect(db_path or CATALOG_PATH, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.executescript(_SCHEMA)
+    return conn
+
+def file_content_hash(file_path: str, block_size: int = 1 << 20) -> str:
+    """BLAKE2b hash of the file contents, read in 1 MiB blocks."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _axis_summary(values: np.ndarray) -> tuple:
+    """(min, max, resolution) of a 1D coordinate."""
+    values = np.asarray(values, dtype=float)
+    if values.size == 0:
+        return None, None, None
+    res = float(np.median(np.abs(np.diff(values)))) if values.size > 1 else None
+    return float(np.nanmin(values)), float(np.nanmax(values)), res
+
+def extract_file_metadata(file_path: str) -> dict:
+    """
+    Reads catalog metadata from a NetCDF header and its 1D coordinates.
+
+    Data variables are never read; only time/lat/lon coordinate values are.
+
+    Returns:
+        dict with the 'files' columns plus a 'variables' list
+    """
+    import netCDF4
+
+    meta = {"format": None, "dims": {}, "time_start": None, "time_end": None, "n_time": None,
+            "calendar": None, "lat_min": None, "lat_max": None, "lon_min": None, "lon_max": None,
+            "lat_res": None, "lon_res": None, "crs": None, "attrs": {}, "variables": []}
+    with netCDF4.Dataset(file_path) as nc:
+        nc.set_auto_mask(False)
+        meta["format"] = nc.data_model
+        meta["dims"] = {name: len(dim) for name, dim in nc.dimensions.items()}
+        meta["attrs"] = {k: str(nc.getncattr(k)) for k in nc.ncattrs()}
+
+        for name, var in nc.variables.items():
+            attrs = {k: var.getncattr(k) for k in var.ncattrs()}
+            is_coord = var.dimensions == (name,)
+            if is_coord and name.lower() in ("time", "t") and " since " in str(attrs.get("units", "")):
+                calendar = str(attrs.get("calendar", "standard"))
+                times = xr.coding.times.decode_cf_datetime(var[:], attrs["units"], calendar)
+                if len(times):
+                    meta["time_start"] = str(pd.Timestamp(str(min(times))).date())
+                    meta["time_end"] = str(pd.Timestamp(str(max(times))).date())
+                meta["n_time"] = len(times)
+                meta["calendar"] = calendar
+            elif is_coord and name.lower() in _LAT_NAMES:
+                meta["lat_min"], meta["lat_max"], meta["lat_res"] = _axis_summary(var[:])
+            elif is_coord and name.lower() in _LON_NAMES:
+                meta["lon_min"], meta["lon_max"], meta["lon_res"] = _axis_summary(var[:])
+            if "grid_mapping" in attrs and attrs["grid_mapping"] in nc.variables:
+                gm = nc.variables[attrs["grid_mapping"]]
+                meta["crs"] = str(getattr(gm, "crs_wkt", None) or getattr(gm, "spatial_ref", None)
+                                  or getattr(gm, "epsg_code", None) or getattr(gm, "grid_mapping_name", ""))
+            if not is_coord:
+                meta["variables"].append({
+                    "name": name,
+                    "dims": ",".join(var.dimensions),
+                    "shape": "x".join(str(n) for n in var.shape),
+                    "dtype": str(var.dtype),
+                    "units": str(attrs.get("units", "")),
+                    "long_name": str(attrs.get("long_name", "")),
+                })
+    if meta["crs"] is None and meta["lat_min"] is not None:
+        meta["crs"] = "EPSG:4326"
+    return meta
+
+@instrument()
+def index_file(file_path: str, source: str = "upload", label: str = None, db_path: str = None,
+               force: bool = False) -> bool:
+    """
+    Adds or updates one file in the catalog.
+
+    The file is skipped when its size and modification time are unchanged,
+    so repeated calls are cheap.
+
+    Args:
+        file_path: NetCDF file to index
+        source: Where the file came from ('upload', 'derived', 'folder', ...)
+        label: Display name (default: the file name)
+        db_path: Catalog database (default: CATALOG_PATH)
+        force: Re-index even if the file looks unchanged
+
+    Returns:
+        True if the file was (re)indexed, False if it was up to date
+    """
+    path = os.path.abspath(file_path)
+    stat = os.stat(path)
+    conn = _connect(db_path)
+    try:
+        row = conn.execute("SELECT size, mtime_ns FROM files WHERE path = ?", (path,)).fetchone()
+        if row and not force and row == (stat.st_size, stat.st_mtime_ns):
+            if label:
+                conn.execute("UPDATE files SET label = ? WHERE path = ?", (label, path))
+                conn.commit()
+            return False
+
+        meta = extract_file_metadata(path)
+        variables = meta.pop("variables")
+        record = {
+            "path": path, "name": os.path.basename(path), "label": label or os.path.basename(path),
+            "source": source, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+            "content_hash": file_content_hash(path), "indexed_at": time.time(),
+            **meta, "dims": json.dumps(meta["dims"]), "attrs": json.dumps(meta["attrs"]),
+        }
+        with conn:
+            conn.execute("DELETE FROM variables WHERE path = ?", (path,))
+            conn.execute(f"INSERT OR REPLACE INTO files ({', '.join(record)}) "
+                         f"VALUES ({', '.join('?' * len(record))})", tuple(record.values()))
+            conn.executemany(
+                "INSERT INTO variables (path, name, dims, shape, dtype, units, long_name) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(path, v["name"], v["dims"], v["shape"], v["dtype"], v["units"], v["long_name"]) for v in variables]
+            )
+        return True
+    finally:
+        conn.close()
+
+def index_directory(folder: str, pattern: str = "*.nc", source: str = "folder", db_path: str = None) -> dict:
+    """
+    Indexes every matching file below `folder` (recursively).
+
+    Returns:
+        {"indexed": n, "unchanged": n, "failed": {path: error}}
+    """
+    import glob
+
+    result = {"indexed": 0, "unchanged": 0, "failed": {}}
+    for fp in sorted(glob.glob(os.path.join(folder, "**", pattern), recursive=True)):
+        try:
+            if index_file(fp, source=source, db_path=db_path):
+                result["indexed"] += 1
+            else:
+                result["unchanged"] += 1
+        except Exception as e:
+            result["failed"][fp] = str(e)
+    return result
+
+def refresh_catalog(db_path: str = None) -> dict:
+    """
+    Re-indexes changed files and removes deleted ones.
+
+    Only files whose size or modification time changed are re-read.
+
+    Returns:
+        {"reindexed": n, "removed": n, "unchanged": n}
+    """
+    conn = _connect(db_path)
+    try:
+        rows = conn.execute("SELECT path, source, label FROM files").fetchall()
+    finally:
+        conn.close()
+
+    result = {"reindexed": 0, "removed": 0, "unchanged": 0}
+    for path, source, label in rows:
+        if not os.path.exists(path):
+            remove_from_catalog(path, db_path=db_path)
+            result["removed"] += 1
+        elif index_file(path, source=source, label=label, db_path=db_path):
+            result["reindexed"] += 1
+        else:
+            result["unchanged"] += 1
+    return result
+
+def remove_from_catalog(file_path: str, db_path: str = None) -> None:
+    """Deletes a file and its variables from the catalog."""
+    conn = _connect(db_path)
+    try:
+        with conn:
+            conn.execute("DELETE FROM files WHERE path = ?", (os.path.abspath(file_path),))
+    finally:
+        conn.close()
+
+@instrument()
+def query_catalog(variable: str = None, start=None, end=None, bbox: tuple = None, text: str = None,
+                  bbox_mode: str = "contains", db_path: str = None) -> pd.DataFrame:
+    """
+    Searches the catalog.
+
+    Example: all files with ET covering 2003–2015 over an Amazon bbox:
+        query_catalog("ET", "2003-01-01", "2015-12-31", bbox=(-80, -20, -44, 10))
+
+    Args:
+        variable: Variable name that must be present (case-insensitive)
+        start, end: Period the file's time axis must cover
+        bbox: (min_lon, min_lat, max_lon, max_lat)
+        text: Substring to match in the file name, label or variable long names
+        bbox_mode: 'contains' (file grid covers the bbox) or 'intersects'
+
+    Returns:
+        pd.DataFrame with one row per matching file
+    """
+    clauses, params = [], []
+    if variable:
+        clauses.append("EXISTS (SELECT 1 FROM variables v WHERE v.path = f.path AND lower(v.name) = lower(?))")
+        params.append(variable)
+    if start:
+        clauses.append("f.time_start <= ?")
+        params.append(str(pd.Timestamp(start).date()))
+    if end:
+        clauses.append("f.time_end >= ?")
+        params.append(str(pd.Timestamp(end).date()))
+    if bbox:
+        min_lon, min_lat, max_lon, max_lat = bbox
+        if bbox_mode == "contains":
+            clauses.append("f.lon_min <= ? AND f.lon_max >= ? AND f.lat_min <= ? AND f.lat_max >= ?")
+            params += [min_lon, max_lon, min_lat, max_lat]
+        else:
+            clauses.append("f.lon_min <= ? AND f.lon_max >= ? AND f.lat_min <= ? AND f.lat_max >= ?")
+            params += [max_lon, min_lon, max_lat, min_lat]
+    if text:
+        like = f"%{text.lower()}%"
+        clauses.append("(lower(f.name) LIKE ? OR lower(f.label) LIKE ? OR EXISTS (SELECT 1 FROM variables v "
+                       "WHERE v.path = f.path AND (lower(v.name) LIKE ? OR lower(v.long_name) LIKE ?)))")
+        params += [like] * 4
+
+    sql = ("SELECT f.label, f.path, f.source, f.time_start, f.time_end, f.n_time, f.calendar, "
+           "f.lat_min, f.lat_max, f.lon_min, f.lon_max, f.lat_res, f.lon_res, f.crs, f.size, f.content_hash, "
+           "(SELECT group_concat(v.name, ', ') FROM variables v WHERE v.path = f.path) AS variables "
+           "FROM files f")
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY f.indexed_at DESC"
+
+    conn = _connect(db_path)
+    try:
+        return pd.read_sql_query(sql, conn, params=params)
+    finally:
+        conn.close()
+
+def get_file_record(file_path: str, db_path: str = None) -> dict:
+    """
+    Returns the catalog entry of a file, indexing it first if needed.
+
+    Returns:
+        dict with the 'files' columns, 'dims' as a dict and a 'variables'
+        dict {name: {"dims": tuple, "shape", "dtype", "units", "long_name"}}
+    """
+    path = os.path.abspath(file_path)
+    index_file(path, db_path=db_path)
+    conn = _connect(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        record = dict(conn.execute("SELECT * FROM files WHERE path = ?", (path,)).fetchone())
+        record["dims"] = json.loads(record["dims"])
+        record["attrs"] = json.loads(record["attrs"])
+        record["variables"] = {
+            row["name"]: {"dims": tuple(row["dims"].split(",")) if row["dims"] else (), "shape": row["shape"],
+                          "dtype": row["dtype"], "units": row["units"], "long_name": row["long_name"]}
+            for row in conn.execute("SELECT * FROM variables WHERE path = ? ORDER BY rowid", (path,))
+        }
+        return record
+    finally:
+        conn.close()
+
+def catalog_variables(file_path: str, required_dims: tuple = (), db_path: str = None) -> list:
+    """Variable names of a file (optionally only those having all `required_dims`), from the catalog."""
+    variables = get_file_record(file_path, db_path=db_path)["variables"]
+    return [name for name, info in variables.items() if set(required_dims) <= set(info["dims"])]
+
+def catalog_dims(file_path: str, db_path: str = None) -> dict:
+    """{dimension: size} of a file, from the catalog."""
+    return get_file_record(file_path, db_path=db_path)["dims"]
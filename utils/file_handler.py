@@ -13,13 +13,22 @@ def save_uploaded_file(uploaded_file, file_extension):
 
 # SHP File handler
 def save_uploaded_shapefile(uploaded_files):
-    """Saves shapefile components to temporary files."""
+    """
+    Saves shapefile components to one temporary directory.
+
+    All components share the stem of the .shp file, so readers find the
+    .shx/.dbf/.prj next to it.
+    """
     saved_files = []
     try:
+        tmp_dir = tempfile.mkdtemp(prefix="watcycle_shp_")
+        shp_names = [f.name for f in uploaded_files if f.name.lower().endswith(".shp")]
+        stem = os.path.splitext(os.path.basename(shp_names[0]))[0] if shp_names else "shapefile"
         for uploaded_file in uploaded_files:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=f".{uploaded_file.name.split('.')[-1]}") as tmp:
-                tmp.write(uploaded_file.getbuffer())
-                saved_files.append(tmp.name)
+            path = os.path.join(tmp_dir, f"{stem}.{uploaded_file.name.split('.')[-1].lower()}")
+            with open(path, "wb") as f:
+                f.write(uploaded_file.getbuffer())
+            saved_files.append(path)
         return saved_files
     except Exception as e:
         return None
@@ -31,7 +40,9 @@ import pandas as pd
 import xarray as xr
 import pandas as pd
 import streamlit as st
+from utils.instrumentation import instrument
 
+@instrument()
 def load_dataset():
     """
     Safely load the NetCDF dataset stored in session_state.
@@ -47,6 +58,7 @@ def load_dataset():
         st.error(f"Error opening NetCDF file: {e}")
         return None
 
+@instrument()
 def load_dataset_to_dataframe():
     """
     Safely load the NetCDF as a flattened pandas DataFrame.
@@ -67,10 +79,28 @@ def load_dataset_to_dataframe():
 from io import BytesIO
 import base64
 
-def get_image_download_button(fig, filename="plot.png", label="📥 Download Plot"):
-    buf = BytesIO()
-    fig.savefig(buf, format="png", bbox_inches="tight")
-    buf.seek(0)
-    b64 = base64.b64encode(buf.read()).decode()
-    href = f'<a href="data:image/png;base64,{b64}" download="{filename}">{label}</a>'
+_B64_CACHE = {}
+
+def get_image_download_button(fig, filename="plot.png", label="📥 Download Plot", cache_key=None):
+    """
+    Render an HTML download link for a figure.
+
+    `fig` may be a matplotlib Figure or already-encoded image bytes (e.g. from
+    utils.render_cache). With `cache_key`, the base64 payload is reused across reruns.
+    """
+    b64 = _B64_CACHE.get(cache_key) if cache_key else None
+    if b64 is None:
+        if isinstance(fig, (bytes, bytearray)):
+            data = bytes(fig)
+        else:
+            buf = BytesIO()
+            fig.savefig(buf, format=filename.rsplit(".", 1)[-1], bbox_inches="tight")
+            data = buf.getvalue()
+        b64 = base64.b64encode(data).decode()
+        if cache_key:
+            if len(_B64_CACHE) >= 16:
+                _B64_CACHE.pop(next(iter(_B64_CACHE)))
+            _B64_CACHE[cache_key] = b64
+    mime = "image/svg+xml" if filename.endswith(".svg") else "image/png"
+    href = f'<a href="data:{mime};base64,{b64}" download="{filename}">{label}</a>'
     return st.markdown(href, unsafe_allow_html=True)
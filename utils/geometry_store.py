@@ -0,0 +1,234 @@
+# utils/geometry_store.py
+
+import os
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from functools import cached_property
+
+import numpy as np
+import shapely
+import geopandas as gpd
+import streamlit as st
+
+from utils.instrumentation import instrument, track
+from utils.render_cache import geometry_fingerprint
+
+STORE_DIR = os.environ.get("WATCYCLE_GEOMETRY_STORE_DIR",
+                           os.path.join(tempfile.gettempdir(), "watcycle_geometry_store"))
+CACHE_SIZE = int(os.environ.get("WATCYCLE_GEOMETRY_CACHE", "16"))
+# Simplification tolerances in degrees (~100 m, ~500 m, ~2 km, ~10 km at the equator)
+SIMPLIFY_TOLERANCES = (0.001, 0.005, 0.02, 0.1)
+SESSION_KEY = "uploaded_geometry_key"
+
+# Bumped whenever the stored layout or the simplification method changes
+_FORMAT_VERSION = 2
+_LEVEL_PREFIX = "_simplified_"
+_lock = threading.Lock()
+_cache = OrderedDict()
+
+class PreparedGeometry:
+    """
+    A shapefile together with the derived objects every page needs.
+
+    Built once per distinct shapefile and shared by all sessions of the
+    process, so treat it as read-only. Everything except the source frame
+    is computed on first use and then kept:
+
+        source      the GeoDataFrame as uploaded (original CRS)
+        gdf         the same in EPSG:4326, used for masking and plotting
+        union       dissolved geometry, prepared for fast point-in-polygon
+        bounds      (minx, miny, maxx, maxy) in EPSG:4326
+        tree        STRtree over the EPSG:4326 geometries
+        is_coverage whether the polygons tile without overlaps (shared edges)
+    """
+
+    def __init__(self, source: gpd.GeoDataFrame, key: str = None, levels: dict = None):
+        self.source = source
+        self.key = key or store_key(source)
+        self._levels = dict(levels or {})
+        self._projected = {}
+
+    @cached_property
+    def gdf(self) -> gpd.GeoDataFrame:
+        if self.source.crs is None:
+            return self.source.set_crs("EPSG:4326")
+        if self.source.crs.to_epsg() == 4326:
+            return self.source
+        return self.source.to_crs("EPSG:4326")
+
+    @cached_property
+    def geoms(self) -> list:
+        return list(self.gdf.geometry)
+
+    @cached_property
+    def union(self):
+        geoms = self.gdf.geometry.values
+        if not shapely.is_valid(geoms).all():
+            geoms = shapely.make_valid(geoms)
+        # Coverage union only merges shared edges, far faster than a general union
+        union = shapely.coverage_union_all(geoms) if self.is_coverage else shapely.union_all(geoms)
+        shapely.prepare(union)
+        return union
+
+    @cached_property
+    def bounds(self) -> tuple:
+        return tuple(float(v) for v in self.gdf.total_bounds)
+
+    @cached_property
+    def centroid(self) -> tuple:
+        """(lat, lon) of the dissolved geometry, e.g. to centre a map."""
+        point = self.union.centroid
+        return point.y, point.x
+
+    @cached_property
+    def tree(self) -> shapely.STRtree:
+        return shapely.STRtree(self.gdf.geometry.values)
+
+    @cached_property
+    def is_coverage(self) -> bool:
+        geoms = self.gdf.geometry.values
+        polygonal = shapely.get_type_id(geoms)
+        if not np.isin(polygonal, (3, 6)).all():  # Polygon, MultiPolygon
+            return False
+        return bool(shapely.is_valid(geoms).all() and shapely.coverage_is_valid(geoms))
+
+    def query(self, geometry, predicate: str = "intersects"):
+        """Returns the row positions of the features that satisfy `predicate` with `geometry`."""
+        return self.tree.query(geometry, predicate=predicate)
+
+    def contains_xy(self, x, y):
+        """Boolean array: which lon/lat points fall inside the dissolved geometry."""
+        return shapely.contains_xy(self.union, x, y)
+
+    def to_crs(self, crs) -> gpd.GeoDataFrame:
+        """Returns the shapefile reprojected to `crs`; each CRS is reprojected once."""
+        name = str(crs)
+        if name not in self._projected:
+            self._projected[name] = self.gdf.to_crs(crs)
+        return self._projected[name]
+
+    def simplified(self, level: int) -> gpd.GeoDataFrame:
+        """
+        Returns the EPSG:4326 shapefile simplified to SIMPLIFY_TOLERANCES[level - 1].
+
+        Level 0 is the full-resolution geometry. Levels are precomputed when
+        a shapefile is stored and kept in its GeoParquet file. Polygons that
+        tile a region (e.g. sub-basins) are simplified as one coverage, so
+        shared borders stay shared and no gaps or slivers open between them;
+        anything else is simplified per feature with topology preserved.
+        """
+        if level <= 0:
+            return self.gdf
+        level = min(level, len(SIMPLIFY_TOLERANCES))
+        if level not in self._levels:
+            tolerance = SIMPLIFY_TOLERANCES[level - 1]
+            geoms = self.gdf.geometry
+            if self.is_coverage:
+                simplified = shapely.coverage_simplify(geoms.values, tolerance)
+            else:
+                simplified = shapely.simplify(geoms.values, tolerance, preserve_topology=True)
+            self._levels[level] = gpd.GeoSeries(simplified, index=geoms.index, crs="EPSG:4326")
+        return self.gdf.assign(**{self.gdf.geometry.name: self._levels[level].values})
+
+def store_key(gdf) -> str:
+    """Returns a content hash of a GeoDataFrame's geometries, CRS and attributes."""
+    h = hashlib.sha1(geometry_fingerprint(gdf).encode())
+    h.update(gdf.drop(columns=gdf.geometry.name).to_csv().encode())
+    return h.hexdigest()
+
+def _store_path(key: str) -> str:
+    return os.path.join(STORE_DIR, f"{key}-v{_FORMAT_VERSION}.parquet")
+
+def _remember(prepared: PreparedGeometry) -> PreparedGeometry:
+    with _lock:
+        _cache[prepared.key] = prepared
+        _cache.move_to_end(prepared.key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return prepared
+
+def _cached(key: str):
+    with _lock:
+        prepared = _cache.get(key)
+        if prepared is not None:
+            _cache.move_to_end(key)
+        return prepared
+
+@instrument()
+def store_shapefile(gdf: gpd.GeoDataFrame) -> PreparedGeometry:
+    """
+    Persists a shapefile as GeoParquet and returns its prepared geometry.
+
+    The file is keyed by content, so uploading the same shapefile again
+    reuses the stored copy. The STRtree, union and simplification levels
+    are built here once, not on every page that uses the shapefile.
+
+    Args:
+        gdf: GeoDataFrame with a CRS (EPSG:4326 is assumed when missing)
+
+    Returns:
+        PreparedGeometry
+    """
+    try:
+        key = store_key(gdf)
+        prepared = _cached(key)
+        if prepared is not None:
+            return prepared
+
+        prepared = PreparedGeometry(gdf, key)
+        for level in range(1, len(SIMPLIFY_TOLERANCES) + 1):
+            prepared.simplified(level)
+        # Build the spatial index and dissolved geometry up front
+        _ = prepared.tree, prepared.union
+
+        path = _store_path(key)
+        if not os.path.exists(path):
+            os.makedirs(STORE_DIR, exist_ok=True)
+            frame = gdf.copy()
+            for level, geoms in prepared._levels.items():
+                frame[f"{_LEVEL_PREFIX}{level}"] = gpd.GeoSeries(geoms.values, index=frame.index, crs="EPSG:4326")
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with track("geometry_store.write", key=key):
+                frame.to_parquet(tmp_path)
+            os.replace(tmp_path, path)
+        return _remember(prepared)
+    except Exception as e:
+        raise RuntimeError(f"Error storing shapefile: {e}")
+
+@instrument()
+def load_prepared_geometry(key: str):
+    """Returns the stored shapefile with this key, or None if it is not in the store."""
+    prepared = _cached(key)
+    if prepared is not None:
+        return prepared
+    path = _store_path(key)
+    if not os.path.exists(path):
+        return None
+    frame = gpd.read_parquet(path)
+    level_cols = [c for c in frame.columns if c.startswith(_LEVEL_PREFIX)]
+    levels = {int(c[len(_LEVEL_PREFIX):]): frame[c] for c in level_cols}
+    return _remember(PreparedGeometry(frame.drop(columns=level_cols), key, levels))
+
+def prepare_geometry(obj) -> PreparedGeometry:
+    """Returns `obj` if it is already prepared, otherwise prepares a GeoDataFrame in memory."""
+    if isinstance(obj, PreparedGeometry):
+        return obj
+    return _cached(store_key(obj)) or _remember(PreparedGeometry(obj))
+
+def set_session_geometry(prepared: PreparedGeometry, name: str = None) -> None:
+    """Makes `prepared` the active shapefile of this session (only its key is kept in session state)."""
+    st.session_state[SESSION_KEY] = prepared.key
+    if name:
+        st.session_state.uploaded_shapefile_name = name
+
+def get_session_geometry():
+    """Returns the active shapefile of this session as a PreparedGeometry, or None."""
+    key = st.session_state.get(SESSION_KEY)
+    return load_prepared_geometry(key) if key else None
+
+def clear_session_geometry() -> None:
+    """Forgets the active shapefile of this session; the stored copy stays for other sessions."""
+    st.session_state.pop(SESSION_KEY, None)
+    st.session_state.pop("uploaded_shapefile_name", None)
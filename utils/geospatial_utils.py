@@ -1,29 +1,237 @@
 # utils/geospatial_utils.py
 
 import os
+import hashlib
+from collections import OrderedDict
+import numpy as np
 import xarray as xr
 from affine import Affine
 from rasterio.features import geometry_mask
 import geopandas as gpd
+import shapely
 import streamlit as st
+from utils.instrumentation import instrument
+from utils.geometry_store import PreparedGeometry, prepare_geometry
+
+CLIP_CHUNK_MB = int(os.environ.get("WATCYCLE_CLIP_CHUNK_MB", "64"))
+
+def grid_transform(lat, lon, lat_res=None, lon_res=None):
+    """
+    Affine transform from (row, col) to lon/lat for a regular grid.
+
+    Uses the first cell centre and the signed spacing, so ascending and
+    descending coordinates map rows the right way round.
+    """
+    lat_res = coord_resolution(lat) if lat_res is None else lat_res
+    lon_res = coord_resolution(lon) if lon_res is None else lon_res
+    return Affine.translation(lon[0] - lon_res / 2, lat[0] - lat_res / 2) * Affine.scale(lon_res, lat_res)
 
 def calculate_transform(ds):
-    lon = ds['lon'].values
-    lat = ds['lat'].values
-    lon_res = (lon[1] - lon[0])
-    lat_res = (lat[1] - lat[0])
-    transform = Affine.translation(lon[0] - lon_res / 2, lat[0] - lat_res / 2) * Affine.scale(lon_res, lat_res)
-    return transform
-
-def clip_dataset_with_shapefile(ds, shapefile):
-    transform = calculate_transform(ds)
-    geoms = shapefile.geometry.values
-    mask = geometry_mask([geom for geom in geoms],
-                         transform=transform,
-                         invert=True,
-                         out_shape=(ds.sizes['lat'], ds.sizes['lon']))
-    mask_da = xr.DataArray(mask, dims=("lat", "lon"), coords={"lat": ds["lat"], "lon": ds["lon"]})
-    clipped_ds = ds.where(mask_da, drop=True)
+    return grid_transform(ds['lat'].values, ds['lon'].values)
+
+def compute_cell_edges(centers):
+    """Compute cell edges from 1D monotonic center coordinates (either direction)."""
+    centers = np.asarray(centers, dtype=float)
+    if centers.size == 1:
+        d = 1.0
+        return np.array([centers[0] - d / 2.0, centers[0] + d / 2.0])
+    diffs = np.diff(centers)
+    edges = np.empty(centers.size + 1, dtype=float)
+    edges[1:-1] = (centers[:-1] + centers[1:]) / 2.0
+    edges[0] = centers[0] - diffs[0] / 2.0
+    edges[-1] = centers[-1] + diffs[-1] / 2.0
+    return edges
+
+def compute_cell_areas(lat, lon):
+    """
+    Area of each cell of a regular lat/lon grid on a spherical Earth, in km².
+
+    Returns:
+        (n_lat, n_lon) array
+    """
+    radius = 6371.0
+    lat_edges = np.deg2rad(np.clip(compute_cell_edges(lat), -90.0, 90.0))
+    lon_edges = np.deg2rad(compute_cell_edges(lon))
+    band = np.abs(np.diff(np.sin(lat_edges)))
+    width = np.abs(np.diff(lon_edges))
+    return radius ** 2 * np.outer(band, width)
+
+_MASK_CACHE = OrderedDict()
+_MASK_CACHE_SIZE = 32
+
+def coord_resolution(values):
+    """Signed spacing of a 1D coordinate (1.0 for single-cell axes)."""
+    values = np.asarray(values, dtype=float)
+    return float(values[1] - values[0]) if values.size > 1 else 1.0
+
+def get_bbox_slices(lat, lon, bounds):
+    """
+    Returns index slices (lat_slice, lon_slice) covering a lon/lat bounding box.
+
+    Works on index positions, so ascending and descending coordinates are both
+    handled. If the box is smaller than one cell, the nearest cell is used.
+    """
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    minx, miny, maxx, maxy = bounds
+
+    def _span(values, lo, hi):
+        idx = np.flatnonzero((values >= lo) & (values <= hi))
+        if idx.size == 0:
+            nearest = int(np.argmin(np.abs(values - (lo + hi) / 2.0)))
+            return slice(nearest, nearest + 1)
+        return slice(int(idx[0]), int(idx[-1]) + 1)
+
+    return _span(lat, miny, maxy), _span(lon, minx, maxx)
+
+def get_raster_mask(lat, lon, geoms, lat_res=None, lon_res=None, geoms_key=None):
+    """
+    Rasterizes geometries onto a lat/lon grid (True = cell centre inside).
+
+    Masks are cached per (grid, geometry) pair so reruns with the same inputs
+    skip the rasterization. Pass `lat_res`/`lon_res` when the grid is a window
+    of a larger grid that may be a single cell wide, and `geoms_key` (e.g. a
+    PreparedGeometry key) to skip hashing the geometries.
+    """
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    lat_res = coord_resolution(lat) if lat_res is None else lat_res
+    lon_res = coord_resolution(lon) if lon_res is None else lon_res
+
+    h = hashlib.sha1()
+    h.update(lat.tobytes())
+    h.update(lon.tobytes())
+    h.update(np.array([lat_res, lon_res]).tobytes())
+    if geoms_key is not None:
+        h.update(geoms_key.encode())
+    else:
+        for geom in geoms:
+            h.update(geom.wkb)
+    key = h.hexdigest()
+    if key in _MASK_CACHE:
+        _MASK_CACHE.move_to_end(key)
+        return _MASK_CACHE[key]
+
+    transform = grid_transform(lat, lon, lat_res, lon_res)
+    shape = (lat.size, lon.size)
+    mask = geometry_mask(list(geoms), transform=transform, invert=True, out_shape=shape)
+    if not mask.any():
+        # Polygon smaller than a cell: fall back to any cell it touches
+        mask = geometry_mask(list(geoms), transform=transform, invert=True, out_shape=shape, all_touched=True)
+    mask.setflags(write=False)
+
+    _MASK_CACHE[key] = mask
+    if len(_MASK_CACHE) > _MASK_CACHE_SIZE:
+        _MASK_CACHE.popitem(last=False)
+    return mask
+
+def bbox_window(obj, bounds):
+    """
+    Lazily indexes the part of a Dataset/DataArray covering a lon/lat box.
+
+    `bounds` is (minx, miny, maxx, maxy) in -180..180 longitude. On grids
+    stored in 0–360 longitude the box is mapped onto the grid, and a box
+    crossing the grid's 0°/360° seam is read as two hyperslabs and joined.
+    The window's longitudes are returned in -180..180 either way.
+    """
+    lat = obj["lat"].values
+    lon = obj["lon"].values
+    lat_sl, lon_sl = get_bbox_slices(lat, lon, bounds)
+    if lon.max() <= 180:
+        return obj.isel(lat=lat_sl, lon=lon_sl)
+
+    minx, miny, maxx, maxy = bounds
+    if minx >= 0 or maxx < 0:
+        _, lon_sl = get_bbox_slices(lat, lon, (minx % 360, miny, maxx % 360, maxy))
+        window = obj.isel(lat=lat_sl, lon=lon_sl)
+    else:
+        _, west = get_bbox_slices(lat, lon, (minx % 360, miny, 360.0, maxy))
+        _, east = get_bbox_slices(lat, lon, (0.0, miny, maxx, maxy))
+        window = xr.concat([obj.isel(lat=lat_sl, lon=west), obj.isel(lat=lat_sl, lon=east)], dim="lon",
+                           data_vars="minimal", coords="minimal", compat="override", join="override")
+    return window.assign_coords(lon=(window["lon"] + 180) % 360 - 180)
+
+@instrument()
+def subset_to_geometries(obj, geoms):
+    """
+    Slices a Dataset/DataArray to the geometries' bounding box by index and
+    sets cells outside the geometries to NaN.
+
+    Only the bounding-box hyperslab is read from disk (see bbox_window).
+    `geoms` is a list of shapely geometries or a PreparedGeometry (whose
+    cached bounds and key are then reused).
+
+    Returns:
+        (masked_obj, mask) where mask is the boolean (lat, lon) window mask
+    """
+    if isinstance(geoms, PreparedGeometry):
+        bounds, geoms_key, geoms = geoms.bounds, geoms.key, geoms.geoms
+    else:
+        geoms = list(geoms)
+        bounds, geoms_key = shapely.total_bounds(geoms), None
+
+    lat = obj["lat"].values
+    lon = obj["lon"].values
+    window = bbox_window(obj, bounds)
+    mask = get_raster_mask(window["lat"].values, window["lon"].values, geoms,
+                           lat_res=coord_resolution(lat), lon_res=coord_resolution(lon), geoms_key=geoms_key)
+    mask_da = xr.DataArray(mask, dims=("lat", "lon"), coords={"lat": window["lat"], "lon": window["lon"]})
+    return window.where(mask_da), mask
+
+def _time_chunk(ds, chunk_mb: int) -> int:
+    """
+    Time steps per chunk so that one chunk of all gridded variables is about
+    chunk_mb, rounded to whole on-disk chunks so none is read twice.
+    """
+    timed = [v for v in ds.data_vars.values() if "time" in v.dims]
+    step_bytes = sum(v.dtype.itemsize * v.size // v.sizes["time"] for v in timed)
+    steps = max(1, int(chunk_mb * 1024 * 1024 // max(step_bytes, 1)))
+    disk = [v.encoding["chunksizes"][v.dims.index("time")] for v in timed if v.encoding.get("chunksizes")]
+    if disk:
+        steps = max(disk[0], steps // disk[0] * disk[0])
+    return steps
+
+@instrument()
+def clip_dataset_with_shapefile(ds, shapefile, chunk_mb: int = CLIP_CHUNK_MB):
+    """
+    Clips a dataset to a shapefile's geometries.
+
+    Only the geometries' bounding-box hyperslab is indexed, so clipping a
+    small basin out of a global archive reads just the basin's cells.
+    Descending latitudes and 0–360 longitudes are handled (see bbox_window).
+    The cached raster mask is applied lazily per time chunk, so writing the
+    result with to_netcdf() streams chunk by chunk instead of loading it.
+
+    Args:
+        ds: Dataset with 'lat' and 'lon' dimensions
+        shapefile: GeoDataFrame or PreparedGeometry
+        chunk_mb: Target size of one time chunk when ds is not already chunked
+
+    Returns:
+        Dataset trimmed to the rows and columns touching the geometries, with
+        gridded variables set to NaN outside them
+    """
+    prepared = prepare_geometry(shapefile)
+    window = bbox_window(ds, prepared.bounds)
+    mask = get_raster_mask(window["lat"].values, window["lon"].values, prepared.geoms,
+                           lat_res=coord_resolution(ds["lat"].values), lon_res=coord_resolution(ds["lon"].values),
+                           geoms_key=prepared.key)
+
+    # Same extent as where(..., drop=True): drop rows/columns without any inside cell
+    rows, cols = np.flatnonzero(mask.any(axis=1)), np.flatnonzero(mask.any(axis=0))
+    if rows.size == 0:
+        raise ValueError("The shapefile does not overlap the dataset grid.")
+    window = window.isel(lat=slice(rows[0], rows[-1] + 1), lon=slice(cols[0], cols[-1] + 1))
+    mask = mask[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+
+    if "time" in window.dims and not window.chunks:
+        window = window.chunk({"time": _time_chunk(window, chunk_mb)})
+    mask_da = xr.DataArray(mask, dims=("lat", "lon"), coords={"lat": window["lat"], "lon": window["lon"]})
+
+    clipped_ds = window.copy()
+    for name, var in window.data_vars.items():
+        if "lat" in var.dims and "lon" in var.dims:
+            clipped_ds[name] = var.where(mask_da)
     return clipped_ds
 
 def load_netcdf_with_engines(file_path):
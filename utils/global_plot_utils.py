@@ -2,6 +2,7 @@ import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import cartopy.crs as ccrs
+from utils.instrumentation import instrument
 
 def get_time_strings(ds):
     """
@@ -21,11 +22,31 @@ def extract_dataarray_at_time(ds, var_name, time_str):
 
 def extract_dataarray_average(ds, var_name):
     """
-    Compute the time-mean of var_name.
+    Compute the time-mean of var_name (variables without time are returned as is).
     Returns an xarray.DataArray.
     """
+    if "time" not in ds[var_name].dims:
+        return ds[var_name]
     return ds[var_name].mean(dim="time")
 
+def extra_map_dims(da):
+    """
+    Dimensions other than time/lat/lon (e.g. 'model' of skill maps),
+    along which one slice has to be chosen before mapping.
+    """
+    return [d for d in da.dims if d not in ("time", "lat", "lon")]
+
+def select_extra_dims(da, selection):
+    """
+    Select one index along each extra dimension, e.g. {"model": 0}.
+    Returns the DataArray and a label like "model=m1" for titles.
+    """
+    if not selection:
+        return da, ""
+    da = da.isel(selection)
+    label = ", ".join(f"{d}={da[d].values.item() if d in da.coords else i}" for d, i in selection.items())
+    return da, label
+
 def get_projection(proj_name):
     """
     Map a string name to a Cartopy CRS object.
@@ -39,6 +60,7 @@ def get_projection(proj_name):
     }
     return mapping.get(proj_name, ccrs.PlateCarree())
 
+@instrument()
 def plot_global_map(da, projection, cmap, vmin=None, vmax=None):
     """
     Plot a DataArray on a global map with coastlines.
@@ -0,0 +1,280 @@
+# utils/instrumentation.py
+
+import os
+import sys
+import json
+import time
+import threading
+import functools
+import contextvars
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+
+import pandas as pd
+
+BUFFER_SIZE = int(os.environ.get("WATCYCLE_DIAG_BUFFER", "5000"))
+ENABLED = os.environ.get("WATCYCLE_INSTRUMENTATION", "1") != "0"
+WALL_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float("inf"))
+
+# Streamlit control flow, not failures
+_CONTROL_FLOW = ("StopException", "RerunException")
+
+_records = deque(maxlen=BUFFER_SIZE)
+_totals = {}
+_lock = threading.Lock()
+_page = contextvars.ContextVar("watcycle_page", default=None)
+_stack = contextvars.ContextVar("watcycle_span_stack", default=())
+
+def set_current_page(page: str) -> None:
+    """Tags every record made by the current script run with `page`."""
+    _page.set(page)
+
+def enable_memory_tracing(enabled: bool = True) -> None:
+    """
+    Switches tracemalloc on or off.
+
+    While tracing, outermost spans also report the Python/NumPy allocation
+    peak of the call. Tracing slows allocation-heavy code, so it is off
+    unless WATCYCLE_TRACE_MEMORY=1 or it is switched on from Diagnostics.
+    """
+    if enabled and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    elif not enabled and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+def _io_counters() -> tuple:
+    """Returns (bytes read, bytes written) by this process, or (None, None) without /proc."""
+    try:
+        with open("/proc/self/io") as f:
+            fields = dict(line.split(":") for line in f.read().splitlines() if ":" in line)
+        return int(fields["rchar"]), int(fields["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+def _rss_mb() -> tuple:
+    """Returns (current RSS, peak RSS) of this process in MiB; None where the OS does not expose it."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak = peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:  # Windows
+        peak = None
+    try:
+        with open("/proc/self/statm") as f:
+            current = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        current = None
+    return current, peak
+
+def _add_to_totals(rec: dict) -> None:
+    """Updates the cumulative counters behind the Prometheus export."""
+    key = (rec["page"] or "", rec["name"])
+    t = _totals.get(key)
+    if t is None:
+        t = _totals[key] = {"count": 0, "errors": 0, "wall": 0.0, "cpu": 0.0, "read": 0, "written": 0,
+                            "peak_rss_mb": 0.0, "buckets": [0] * len(WALL_BUCKETS)}
+    t["count"] += 1
+    t["errors"] += rec["status"] == "error"
+    t["wall"] += rec["wall_s"]
+    t["cpu"] += rec["cpu_s"]
+    t["read"] += rec["read_bytes"] or 0
+    t["written"] += rec["write_bytes"] or 0
+    t["peak_rss_mb"] = max(t["peak_rss_mb"], rec["peak_rss_mb"] or 0.0)
+    for i, bound in enumerate(WALL_BUCKETS):
+        if rec["wall_s"] <= bound:
+            t["buckets"][i] += 1
+
+@contextmanager
+def track(name: str, category: str = "op", **labels):
+    """
+    Records wall time, CPU time, memory and I/O of the enclosed block.
+
+    Records go to a ring buffer of the last BUFFER_SIZE calls, tagged with the
+    current page and the enclosing span (so nested calls can be told apart).
+    CPU time and I/O bytes are process-wide, so they include worker threads
+    and any concurrent session.
+
+    Args:
+        name: Operation name, e.g. 'file_handler.load_dataset'
+        category: 'page' for a whole page run, 'op' for a function call
+        **labels: Extra JSON-serialisable details stored with the record
+
+    Example:
+        with track("to_netcdf", path=out_path):
+            ds.to_netcdf(out_path)
+    """
+    if not ENABLED:
+        yield
+        return
+
+    parents = _stack.get()
+    token = _stack.set(parents + (name,))
+    outermost = not parents
+    tracing = tracemalloc.is_tracing()
+    if tracing and outermost:
+        tracemalloc.reset_peak()
+    traced_start = tracemalloc.get_traced_memory()[0] if tracing else 0
+    read0, write0 = _io_counters()
+    rss0, _ = _rss_mb()
+    wall0, cpu0 = time.perf_counter(), time.process_time()
+    status, error = "ok", None
+    try:
+        yield
+    except BaseException as e:
+        if type(e).__name__ in _CONTROL_FLOW:
+            status = "stopped"
+        else:
+            status, error = "error", f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        wall = time.perf_counter() - wall0
+        cpu = time.process_time() - cpu0
+        read1, write1 = _io_counters()
+        rss1, peak = _rss_mb()
+        traced_peak = None
+        if tracing and tracemalloc.is_tracing():
+            traced_peak = max(tracemalloc.get_traced_memory()[1] - traced_start, 0) / (1024 * 1024)
+        _stack.reset(token)
+        rec = {
+            "name": name,
+            "category": category,
+            "page": _page.get(),
+            "parent": parents[-1] if parents else None,
+            "depth": len(parents),
+            "start": time.time() - wall,
+            "wall_s": wall,
+            "cpu_s": cpu,
+            "rss_delta_mb": None if rss0 is None or rss1 is None else rss1 - rss0,
+            "peak_rss_mb": peak,
+            "traced_peak_mb": traced_peak,
+            "read_bytes": None if read0 is None else read1 - read0,
+            "write_bytes": None if write0 is None else write1 - write0,
+            "status": status,
+            "error": error,
+        }
+        if labels:
+            rec["labels"] = labels
+        with _lock:
+            _records.append(rec)
+            _add_to_totals(rec)
+
+def instrument(name: str = None, category: str = "op"):
+    """
+    Decorator that wraps every call of a function in track().
+
+    The record name defaults to '<module>.<function>' with the package prefix
+    dropped, e.g. 'merge_netcdf_utils.smart_merge_netcdf'.
+    """
+    def decorator(fn):
+        label = name or f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__name__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with track(label, category=category):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def run_page(page: str, page_fn, *args, **kwargs):
+    """Sets the current page and runs its entry point as a tracked 'page' span."""
+    set_current_page(page)
+    with track(page, category="page"):
+        return page_fn(*args, **kwargs)
+
+def get_records(page: str = None) -> list:
+    """Returns a copy of the buffered records, optionally for one page only."""
+    with _lock:
+        records = list(_records)
+    if page is not None:
+        records = [r for r in records if r["page"] == page]
+    return records
+
+def clear_records() -> None:
+    """Empties the ring buffer. Cumulative Prometheus counters are kept."""
+    with _lock:
+        _records.clear()
+
+def summarize_records(records: list) -> pd.DataFrame:
+    """
+    Aggregates records per page and operation.
+
+    Returns:
+        DataFrame with calls, total/mean/p95/max wall time, CPU time, peak
+        memory, bytes read/written, error count and each operation's share
+        of its page's wall time
+    """
+    columns = ["page", "name", "category", "calls", "wall_total_s", "wall_mean_s", "wall_p95_s", "wall_max_s",
+               "cpu_total_s", "peak_rss_mb", "traced_peak_mb", "read_mb", "written_mb", "errors", "share_of_page"]
+    if not records:
+        return pd.DataFrame(columns=columns)
+    df = pd.DataFrame(records)
+    df["page"] = df["page"].fillna("(none)")
+    grouped = df.groupby(["page", "name", "category"], sort=False)
+    summary = grouped.agg(
+        calls=("wall_s", "size"),
+        wall_total_s=("wall_s", "sum"),
+        wall_mean_s=("wall_s", "mean"),
+        wall_p95_s=("wall_s", lambda s: s.quantile(0.95)),
+        wall_max_s=("wall_s", "max"),
+        cpu_total_s=("cpu_s", "sum"),
+        peak_rss_mb=("peak_rss_mb", "max"),
+        traced_peak_mb=("traced_peak_mb", "max"),
+        read_mb=("read_bytes", lambda s: s.fillna(0).sum() / 1e6),
+        written_mb=("write_bytes", lambda s: s.fillna(0).sum() / 1e6),
+        errors=("status", lambda s: int((s == "error").sum())),
+    ).reset_index()
+    page_time = df[df["category"] == "page"].groupby("page")["wall_s"].sum()
+    summary["share_of_page"] = summary["wall_total_s"] / summary["page"].map(page_time)
+    return summary[columns].sort_values(["page", "wall_total_s"], ascending=[True, False], ignore_index=True)
+
+def export_json(records: list = None) -> str:
+    """Serialises records (default: the whole buffer) as a JSON array."""
+    return json.dumps(get_records() if records is None else records, indent=2, default=str)
+
+def _prom_labels(page: str, name: str) -> str:
+    def esc(v):
+        return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return f'page="{esc(page)}",operation="{esc(name)}"'
+
+def export_prometheus() -> str:
+    """
+    Renders cumulative per-operation metrics in the Prometheus text format.
+
+    Counters accumulate since process start and are not affected by the ring
+    buffer dropping old records, so they are safe to scrape.
+    """
+    with _lock:
+        totals = {k: {**v, "buckets": list(v["buckets"])} for k, v in _totals.items()}
+
+    lines = [
+        "# HELP watcycle_operation_duration_seconds Wall time of instrumented operations.",
+        "# TYPE watcycle_operation_duration_seconds histogram",
+    ]
+    for (page, name), t in totals.items():
+        labels = _prom_labels(page, name)
+        for bound, n in zip(WALL_BUCKETS, t["buckets"]):  # counts are already cumulative (<= bound)
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f'watcycle_operation_duration_seconds_bucket{{{labels},le="{le}"}} {n}')
+        lines.append(f"watcycle_operation_duration_seconds_sum{{{labels}}} {t['wall']:.6f}")
+        lines.append(f"watcycle_operation_duration_seconds_count{{{labels}}} {t['count']}")
+
+    simple = [
+        ("watcycle_operation_cpu_seconds_total", "counter", "CPU time of instrumented operations.", "cpu", "{:.6f}"),
+        ("watcycle_operation_read_bytes_total", "counter", "Bytes read during instrumented operations.", "read", "{}"),
+        ("watcycle_operation_written_bytes_total", "counter", "Bytes written during instrumented operations.",
+         "written", "{}"),
+        ("watcycle_operation_errors_total", "counter", "Instrumented operations that raised.", "errors", "{}"),
+        ("watcycle_operation_peak_rss_bytes", "gauge", "Process peak RSS observed after the operation.",
+         "peak_rss_mb", None),
+    ]
+    for metric, kind, help_text, key, fmt in simple:
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {kind}")
+        for (page, name), t in totals.items():
+            value = int(t[key] * 1024 * 1024) if fmt is None else fmt.format(t[key])
+            lines.append(f"{metric}{{{_prom_labels(page, name)}}} {value}")
+    return "\n".join(lines) + "\n"
+
+if os.environ.get("WATCYCLE_TRACE_MEMORY") == "1":
+    enable_memory_tracing(True)
@@ -1,7 +1,17 @@
 import xarray as xr
 import numpy as np
 import pandas as pd
+import dask.array as dsa
+import hashlib
+import threading
+from collections import OrderedDict
+from utils.instrumentation import instrument
 
+TIME_FILL_METHODS = ("linear", "nearest", "spline", "climatology")
+SPATIAL_FILL_METHODS = ("idw", "laplace")
+EARTH_RADIUS_KM = 6371.0
+
+@instrument()
 def interpolate_na_along_dim(ds: xr.Dataset, dim: str, method: str = "linear") -> xr.Dataset:
     """
     Fills missing values (NaNs) along a specified dimension.
@@ -21,6 +31,7 @@ def interpolate_na_along_dim(ds: xr.Dataset, dim: str, method: str = "linear") -
     except Exception as e:
         raise RuntimeError(f"Interpolation failed: {e}")
 
+@instrument()
 def interpolate_na_all(ds: xr.Dataset, method: str = "linear") -> xr.Dataset:
     """
     Fills missing values (NaNs) using all available dimensions.
@@ -36,3 +47,359 @@ def interpolate_na_all(ds: xr.Dataset, method: str = "linear") -> xr.Dataset:
         return ds.interpolate_na(method=method)
     except Exception as e:
         raise RuntimeError(f"Multi-dimensional interpolation failed: {e}")
+
+def _time_as_numbers(ds: xr.Dataset, dim: str) -> np.ndarray:
+    """Returns the coordinate of `dim` as float64 numbers for distance weighting."""
+    index = ds.indexes[dim]
+    values = np.asarray(index)
+    if np.issubdtype(values.dtype, np.datetime64):
+        return values.astype("datetime64[ns]").astype(np.int64).astype(np.float64)
+    if hasattr(index, "asi8"):  # CFTimeIndex
+        return np.asarray(index.asi8, dtype=np.float64)
+    return values.astype(np.float64)
+
+def _gap_neighbours(missing: np.ndarray) -> tuple:
+    """
+    Returns, for every cell along axis 0, the index of the previous and next
+    valid cell (-1 / len if there is none).
+    """
+    n = missing.shape[0]
+    idx = np.arange(n).reshape((n,) + (1,) * (missing.ndim - 1))
+    prev = np.maximum.accumulate(np.where(missing, -1, idx), axis=0)
+    nxt = np.flip(np.minimum.accumulate(np.flip(np.where(missing, n, idx), axis=0), axis=0), axis=0)
+    return prev, nxt
+
+def _fill_time_block(block: np.ndarray, t: np.ndarray, clim: np.ndarray = None, method: str = "linear",
+                     max_gap: int = None) -> np.ndarray:
+    """
+    Fills NaN runs along axis 0 of one time block (including its halo).
+
+    Only interior runs of at most `max_gap` steps are filled; runs touching
+    either end of the block are left alone. With a halo of `max_gap` steps a
+    run touching the end of the block is longer than `max_gap` anyway, so the
+    result in the block core matches a fill over the whole series.
+    """
+    values = block.astype(np.float64, copy=True)
+    missing = np.isnan(values)
+    if not missing.any():
+        return values
+
+    n = values.shape[0]
+    prev, nxt = _gap_neighbours(missing)
+    eligible = missing & (prev >= 0) & (nxt < n)
+    if max_gap is not None:
+        eligible &= (nxt - prev - 1) <= max_gap
+    if not eligible.any():
+        return values
+
+    t = np.broadcast_to(t.reshape((n,) + (1,) * (values.ndim - 1)), values.shape)
+    if method == "climatology":
+        values[eligible] = np.broadcast_to(clim, values.shape)[eligible]
+        return values
+
+    p = np.clip(prev, 0, n - 1)
+    q = np.clip(nxt, 0, n - 1)
+    t0 = np.take_along_axis(t, p, axis=0)
+    t1 = np.take_along_axis(t, q, axis=0)
+    v0 = np.take_along_axis(values, p, axis=0)
+    v1 = np.take_along_axis(values, q, axis=0)
+
+    if method == "nearest":
+        fill = np.where((t - t0) <= (t1 - t), v0, v1)
+    else:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            fill = v0 + (v1 - v0) * (t - t0) / (t1 - t0)
+    values[eligible] = fill[eligible]
+
+    if method == "spline":
+        from scipy.interpolate import CubicSpline
+
+        flat = values.reshape(n, -1)
+        flat_missing = missing.reshape(n, -1)
+        flat_eligible = eligible.reshape(n, -1)
+        t_axis = t.reshape(n, -1)[:, 0]
+        for col in np.flatnonzero(flat_eligible.any(axis=0)):
+            valid = ~flat_missing[:, col]
+            if valid.sum() < 4:
+                continue  # keep the linear fill for very short records
+            rows = flat_eligible[:, col]
+            spline = CubicSpline(t_axis[valid], flat[valid, col])
+            flat[rows, col] = spline(t_axis[rows])
+        values = flat.reshape(values.shape)
+    return values
+
+def _climatology_like(da: xr.DataArray, dim: str) -> xr.DataArray:
+    """
+    Returns the mean seasonal cycle of `da` broadcast back onto its time axis.
+
+    Sub-monthly data use a day-of-year climatology, coarser data a monthly one.
+    """
+    times = da[dim]
+    if not hasattr(times, "dt"):
+        raise ValueError("Climatology fill requires a datetime time coordinate")
+    step = np.median(np.diff(_time_as_numbers(da.to_dataset(name="_v"), dim))) if times.size > 1 else 0
+    key = "dayofyear" if step and step < 28 * 86400e9 else "month"
+    groups = getattr(times.dt, key)
+    clim = da.groupby(groups).mean(dim)
+    return clim.sel({key: groups}).drop_vars(key, errors="ignore")
+
+@instrument()
+def fill_time_gaps(ds: xr.Dataset, methods="linear", max_gap: int = None, dim: str = "time",
+                   chunk_size: int = 365, add_fill_mask: bool = True) -> xr.Dataset:
+    """
+    Fills gaps along the time dimension on time-chunked (dask) data.
+
+    Each time chunk is processed together with a halo of `max_gap` steps
+    from its neighbours, so the fill is exact across chunk boundaries while
+    only a few chunks are held in memory at a time. The result is lazy;
+    computing or writing it processes chunks in parallel.
+
+    Args:
+        ds: Input dataset with missing values
+        methods: One method for all variables, or a dict {variable: method}.
+                 Methods: "linear", "nearest", "spline" (local cubic spline
+                 within the chunk and its halo) or "climatology" (mean
+                 seasonal cycle value for that date)
+        max_gap: Longest run of consecutive missing steps to fill; longer gaps
+                 stay NaN. None fills every interior gap but needs the whole
+                 time axis in one chunk.
+        dim: Dimension to fill along
+        chunk_size: Time steps per chunk
+        add_fill_mask: If True, adds an int8 "<var>_filled" variable that is 1
+                       where a value was filled
+
+    Returns:
+        Lazily filled dataset
+    """
+    if dim not in ds.dims:
+        raise ValueError(f"Dimension '{dim}' not found in dataset")
+    if max_gap is not None and max_gap < 1:
+        raise ValueError("max_gap must be at least 1")
+
+    if isinstance(methods, str):
+        methods = {var: methods for var in ds.data_vars if dim in ds[var].dims}
+    for var, method in methods.items():
+        if method not in TIME_FILL_METHODS:
+            raise ValueError(f"Unknown method '{method}' for '{var}'; choose from {', '.join(TIME_FILL_METHODS)}")
+
+    n = ds.sizes[dim]
+    halo = n if max_gap is None else max_gap + (4 if "spline" in methods.values() else 0)
+    chunk = n if max_gap is None else min(n, max(int(chunk_size), halo))
+    t_num = _time_as_numbers(ds, dim)
+
+    try:
+        out = ds.copy()
+        for var, method in methods.items():
+            da = ds[var].chunk({dim: chunk})
+            da = da.transpose(dim, *[d for d in da.dims if d != dim])
+            axis_chunks = da.chunks[0]
+            shape1 = (1,) * (da.ndim - 1)
+            t_arr = dsa.from_array(t_num.reshape((n,) + shape1), chunks=(axis_chunks,) + shape1)
+            args = [da.data, t_arr]
+            if method == "climatology":
+                clim = _climatology_like(ds[var], dim).transpose(*da.dims).chunk(dict(zip(da.dims, da.chunks)))
+                args.append(clim.data)
+
+            depth = {0: halo if len(axis_chunks) > 1 else 0}
+            filled = dsa.map_overlap(
+                lambda block, t, clim=None, _m=method: _fill_time_block(block, t.ravel(), clim, _m, max_gap),
+                *args, depth=[depth] + [{0: depth[0]}] * (len(args) - 1), boundary="none",
+                dtype=np.float64, align_arrays=False
+            )
+            filled = xr.DataArray(filled, dims=da.dims, coords=da.coords, attrs=da.attrs)
+            filled = filled.transpose(*ds[var].dims)
+            out[var] = filled
+            if add_fill_mask:
+                mask = (ds[var].isnull() & filled.notnull()).astype(np.int8)
+                mask.attrs = {"long_name": f"1 where {var} was gap-filled ({method})"}
+                out[f"{var}_filled"] = mask
+        return out
+    except Exception as e:
+        raise RuntimeError(f"Temporal gap filling failed: {e}")
+
+def _unit_vectors(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """Returns (n_lat * n_lon, 3) unit vectors for a regular lat/lon grid."""
+    lat2d, lon2d = np.meshgrid(np.deg2rad(lat), np.deg2rad(lon), indexing="ij")
+    cos_lat = np.cos(lat2d)
+    return np.column_stack([(cos_lat * np.cos(lon2d)).ravel(),
+                            (cos_lat * np.sin(lon2d)).ravel(),
+                            np.sin(lat2d).ravel()])
+
+def _idw_plan(missing: np.ndarray, fillable: np.ndarray, xyz: np.ndarray, k: int, power: float,
+              max_distance_km: float = None) -> tuple:
+    """
+    Builds the neighbour structure for one NaN pattern.
+
+    A KD-tree is built on the valid cells and queried once for all fillable
+    NaN cells; the result can be applied to every time step sharing the pattern.
+
+    Returns:
+        (targets, sources, weights): flat indices of cells to fill, (M, k) flat
+        indices of their neighbours and (M, k) normalised weights
+    """
+    from scipy.spatial import cKDTree
+
+    valid_idx = np.flatnonzero(~missing)
+    targets = np.flatnonzero(missing & fillable)
+    if valid_idx.size == 0 or targets.size == 0:
+        return np.empty(0, dtype=int), np.empty((0, 1), dtype=int), np.empty((0, 1))
+
+    k = min(k, valid_idx.size)
+    chord, nbr = cKDTree(xyz[valid_idx]).query(xyz[targets], k=k)
+    chord, nbr = chord.reshape(targets.size, k), nbr.reshape(targets.size, k)
+    dist = 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0, 1))
+    weights = 1.0 / np.maximum(dist, 1e-6) ** power
+    if max_distance_km is not None:
+        weights[dist > max_distance_km] = 0.0
+    total = weights.sum(axis=1)
+    keep = total > 0
+    return targets[keep], valid_idx[nbr[keep]], weights[keep] / total[keep, None]
+
+def _grid_neighbours(n_lat: int, n_lon: int, periodic_lon: bool) -> np.ndarray:
+    """
+    Returns (n_lat * n_lon, 4) flat indices of each cell's N/S/W/E neighbours.
+
+    Neighbours beyond the grid edge point back at the cell itself; with
+    `periodic_lon` the western and eastern edges wrap around.
+    """
+    rows, cols = np.meshgrid(np.arange(n_lat), np.arange(n_lon), indexing="ij")
+    if periodic_lon:
+        west, east = (cols - 1) % n_lon, (cols + 1) % n_lon
+    else:
+        west, east = np.maximum(cols - 1, 0), np.minimum(cols + 1, n_lon - 1)
+    north, south = np.maximum(rows - 1, 0), np.minimum(rows + 1, n_lat - 1)
+    flat = lambda r, c: (r * n_lon + c).ravel()
+    return np.column_stack([flat(north, cols), flat(south, cols), flat(rows, west), flat(rows, east)])
+
+def _laplace_fill(values: np.ndarray, targets: np.ndarray, neighbours: np.ndarray, max_iter: int,
+                  tol: float) -> np.ndarray:
+    """
+    Relaxes the target cells towards the mean of their four neighbours.
+
+    Jacobi iterations run on the target cells of the whole (time, cell) batch
+    at once; all other cells are fixed boundary values and NaN neighbours are
+    ignored.
+    """
+    nbr = neighbours[targets]
+    scale = np.nanmax(np.abs(values)) or 1.0
+    for _ in range(max_iter):
+        around = values[:, nbr]
+        counts = np.sum(~np.isnan(around), axis=2)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            relaxed = np.where(counts > 0, np.nansum(around, axis=2) / counts, values[:, targets])
+        change = np.nanmax(np.abs(relaxed - values[:, targets]))
+        values[:, targets] = relaxed
+        if not change > tol * scale:
+            break
+    return values
+
+def _fill_spatial_block(block: np.ndarray, fillable: np.ndarray, xyz: np.ndarray, plans: OrderedDict,
+                        lock: threading.Lock, method: str, k: int, power: float, max_distance_km: float,
+                        neighbours: np.ndarray, max_iter: int, tol: float) -> np.ndarray:
+    """
+    Fills one (..., lat, lon) block of time steps.
+
+    Rows are grouped by NaN pattern; neighbour plans are shared between
+    blocks through `plans`, guarded by `lock` as blocks may run in threads.
+    """
+    shape = block.shape
+    stack = block.reshape(-1, shape[-2] * shape[-1]).astype(np.float64)
+    missing = np.isnan(stack)
+    groups = OrderedDict()
+    for i, row in enumerate(missing):
+        groups.setdefault(hashlib.sha1(np.packbits(row).tobytes()).digest(), []).append(i)
+
+    for key, rows in groups.items():
+        rows = np.asarray(rows)
+        if not missing[rows[0]].any():
+            continue
+        with lock:
+            plan = plans.get(key)
+        if plan is None:
+            plan = _idw_plan(missing[rows[0]], fillable, xyz, k, power, max_distance_km)
+            with lock:
+                plans[key] = plan
+                if len(plans) > 64:
+                    plans.popitem(last=False)
+        targets, sources, weights = plan
+        if targets.size == 0:
+            continue
+        values = stack[rows]
+        values[:, targets] = np.einsum("tmk,mk->tm", values[:, sources], weights)
+        if method == "laplace":
+            values = _laplace_fill(values, targets, neighbours, max_iter, tol)
+        stack[rows] = values
+    return stack.reshape(shape)
+
+@instrument()
+def fill_spatial_gaps(ds: xr.Dataset, method: str = "idw", variables: list = None, k: int = 8, power: float = 2.0,
+                      max_distance_km: float = None, skip_always_missing: bool = False, max_iter: int = 500,
+                      tol: float = 1e-4, batch_size: int = 366, add_fill_mask: bool = True) -> xr.Dataset:
+    """
+    Fills NaN cells of lat/lon grids from the surrounding valid cells.
+
+    Time steps are grouped by their NaN pattern. For each pattern a KD-tree
+    of the valid cells (on the sphere) is queried once and the neighbours and
+    weights are reused for every time step in the group. Variables are
+    chunked into batches of time steps; the result is lazy and computing or
+    writing it fills one batch per task.
+
+    Args:
+        ds: Input dataset with 'lat' and 'lon' dimensions
+        method: "idw" (inverse distance weighting of the k nearest valid cells)
+                or "laplace" (smooth fill solving Laplace's equation, started from IDW)
+        variables: Variables to fill (default: all with lat and lon)
+        k: Number of neighbours used by IDW
+        power: IDW distance exponent
+        max_distance_km: Cells farther than this from any valid cell stay NaN
+        skip_always_missing: Leave cells that are NaN at every time step
+                             (e.g. ocean in a land-only product) untouched
+        max_iter: Maximum Laplace iterations
+        tol: Laplace stopping tolerance relative to the field magnitude
+        batch_size: Time steps loaded into memory at once
+        add_fill_mask: If True, adds an int8 "<var>_filled" variable that is 1
+                       where a value was filled
+
+    Returns:
+        Lazily filled dataset
+    """
+    if method not in SPATIAL_FILL_METHODS:
+        raise ValueError(f"Unknown method '{method}'; choose from {', '.join(SPATIAL_FILL_METHODS)}")
+    if "lat" not in ds.dims or "lon" not in ds.dims:
+        raise ValueError("Dataset must have 'lat' and 'lon' dimensions")
+
+    lat, lon = ds["lat"].values, ds["lon"].values
+    xyz = _unit_vectors(lat, lon)
+    lon_res = abs(float(np.median(np.diff(lon)))) if lon.size > 1 else 0.0
+    periodic_lon = lon.size > 1 and abs(float(lon.max() - lon.min()) + lon_res - 360.0) < 1e-6 * 360
+    neighbours = _grid_neighbours(lat.size, lon.size, periodic_lon) if method == "laplace" else None
+    variables = variables or [v for v in ds.data_vars if {"lat", "lon"} <= set(ds[v].dims)]
+
+    try:
+        out = ds.copy()
+        for var in variables:
+            other = [d for d in ds[var].dims if d not in ("lat", "lon")]
+            # Batches of `batch_size` steps along the leading dimension, whole grids per chunk
+            chunks = {d: (int(batch_size) if i == 0 else -1) for i, d in enumerate(other)}
+            da = ds[var].transpose(*other, "lat", "lon").chunk({**chunks, "lat": -1, "lon": -1})
+
+            fillable = np.ones(lat.size * lon.size, dtype=bool)
+            if skip_always_missing:
+                # Reduced chunk by chunk, so only one batch is held at a time
+                always = da.isnull().all(dim=other) if other else da.isnull()
+                fillable = ~always.values.ravel()
+
+            filled = dsa.map_blocks(
+                _fill_spatial_block, da.data, dtype=np.float64, fillable=fillable, xyz=xyz, plans=OrderedDict(),
+                lock=threading.Lock(), method=method, k=k, power=power, max_distance_km=max_distance_km,
+                neighbours=neighbours, max_iter=max_iter, tol=tol
+            )
+            result = xr.DataArray(filled, dims=da.dims, coords=da.coords, attrs=da.attrs)
+            out[var] = result.transpose(*ds[var].dims)
+            if add_fill_mask:
+                mask = (ds[var].isnull() & out[var].notnull()).astype(np.int8)
+                mask.attrs = {"long_name": f"1 where {var} was spatially filled ({method})"}
+                out[f"{var}_filled"] = mask
+        return out
+    except Exception as e:
+        raise RuntimeError(f"Spatial gap filling failed: {e}")
@@ -0,0 +1,246 @@
+# utils/mann_kendall_utils.py
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+from scipy.fft import next_fast_len, rfft, irfft
+from scipy.stats import norm, rankdata
+
+from utils.instrumentation import instrument
+from utils.trend_uncertainty_utils import (
+    RANK_PAIRS, mk_variance, index_pairs, row_batches, pair_slopes, row_medians
+)
+
+MK_METHODS = {
+    "original": "Original (Mann-Kendall)",
+    "hamed_rao": "Hamed-Rao variance correction",
+    "yue_wang": "Yue-Wang variance correction",
+    "tfpw": "Trend-free prewhitening",
+}
+RESULT_COLUMNS = ["trend", "h", "p", "z", "Tau", "s", "var_s", "slope", "intercept"]
+# Same fields as pymannkendall's results, so either can be used by the pages
+MKResult = namedtuple("MKResult", RESULT_COLUMNS)
+_SERIES_PER_JOB = 4096
+
+def acf_fft(x, nlags: int) -> np.ndarray:
+    """
+    Autocorrelation of many series at once via FFT.
+
+    Same estimator as pymannkendall (mean removed, autocovariances divided
+    by n), but O(n log n) per series instead of O(n²). Constant series get
+    zero autocorrelation beyond lag 0.
+
+    Args:
+        x: (n,) series or (series, n) array without NaNs
+        nlags: Highest lag returned
+
+    Returns:
+        (nlags + 1,) or (series, nlags + 1) array, 1 at lag 0
+    """
+    y = np.atleast_2d(np.asarray(x, dtype=float))
+    n = y.shape[1]
+    y = y - y.mean(axis=1, keepdims=True)
+    nfft = next_fast_len(2 * n - 1, real=True)
+    f = rfft(y, nfft, axis=1)
+    acov = irfft(f * np.conj(f), nfft, axis=1)[:, :nlags + 1] / n
+    with np.errstate(invalid="ignore", divide="ignore"):
+        acf = np.where(acov[:, :1] > 0, acov / acov[:, :1], 0.0)
+    acf[:, 0] = 1.0
+    return acf[0] if np.ndim(x) == 1 else acf
+
+def mk_score(x) -> np.ndarray:
+    """Mann-Kendall S of the rows of `x`, summed one lag at a time over all rows."""
+    y = np.atleast_2d(np.asarray(x, dtype=float))
+    s = np.zeros(len(y))
+    for lag in range(1, y.shape[1]):
+        s += np.sign(y[:, lag:] - y[:, :-lag]).sum(axis=1)
+    return s
+
+def _merge_near_ties(y: np.ndarray, rtol: float = 1e-9) -> np.ndarray:
+    """
+    Sets values of each row that differ by less than `rtol` × the row's
+    magnitude to the same value, so ties lost to rounding error count as ties.
+    """
+    order = np.argsort(y, axis=1, kind="stable")
+    ordered = np.take_along_axis(y, order, axis=1)
+    tol = rtol * np.abs(y).max(axis=1, keepdims=True)
+    new_group = np.ones(y.shape, dtype=bool)
+    new_group[:, 1:] = np.diff(ordered, axis=1) > tol
+    # Each value takes the first (smallest) value of its run of near-equal values
+    first = np.maximum.accumulate(np.where(new_group, np.arange(y.shape[1]), 0), axis=1)
+    merged = np.empty_like(y)
+    np.put_along_axis(merged, order, np.take_along_axis(ordered, first, axis=1), axis=1)
+    return merged
+
+def _score_and_slope(y: np.ndarray, max_pairs: int) -> tuple:
+    """
+    Mann-Kendall S and Sen's slope per time step of the rows of `y`.
+
+    With all pairs in memory both come from the same pairwise differences;
+    longer series get S lag by lag and the slope from a seeded pair subset.
+    """
+    n = y.shape[1]
+    i, j, dt, total = index_pairs(np.arange(n, dtype=float), max_pairs, np.random.default_rng(0))
+    exact = len(dt) == n * (n - 1) // 2
+    s, slope = np.empty(len(y)), np.empty(len(y))
+    for rows in row_batches(len(y), len(dt)):
+        d = pair_slopes(y[rows], i, j, dt)
+        if exact:
+            s[rows] = np.sign(d).sum(axis=1)
+        slope[rows] = row_medians(d)
+    if not exact:
+        s = mk_score(y)
+    return s, slope
+
+def _z_score(s, var_s) -> np.ndarray:
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(s > 0, (s - 1) / np.sqrt(var_s), np.where(s < 0, (s + 1) / np.sqrt(var_s), 0.0))
+
+def _mk_job(job: dict) -> dict:
+    """All statistics of one chunk of equally long, NaN-free series."""
+    y, method, alpha, lag = job["values"], job["method"], job["alpha"], job["lag"]
+    n = y.shape[1]
+    s, slope = _score_and_slope(y, job["max_pairs"])
+    var_s = mk_variance(y)
+    tau = s / (0.5 * n * (n - 1))
+    intercept = np.median(y, axis=1) - (n - 1) / 2 * slope
+
+    if method in ("hamed_rao", "yue_wang", "tfpw"):
+        detrended = y - np.arange(1, n + 1) * slope[:, None]
+    if method == "hamed_rao":
+        lags = n if lag is None else lag + 1
+        acf = acf_fft(rankdata(detrended, axis=1), lags - 1)[:, 1:]
+        i = np.arange(1, lags)
+        bound = norm.ppf(1 - alpha / 2) / np.sqrt(n)
+        significant = (acf > bound) | (acf < -bound)
+        weights = (n - i) * (n - i - 1) * (n - i - 2)
+        var_s = var_s * (1 + 2 / (n * (n - 1) * (n - 2)) * (np.where(significant, acf, 0.0) * weights).sum(axis=1))
+    elif method == "yue_wang":
+        lags = n if lag is None else lag + 1
+        acf = acf_fft(detrended, lags - 1)[:, 1:]
+        i = np.arange(1, lags)
+        var_s = var_s * (1 + 2 * ((1 - i / n) * acf).sum(axis=1))
+    elif method == "tfpw":
+        r1 = acf_fft(detrended, 1)[:, 1:]
+        white = detrended[:, 1:] - detrended[:, :-1] * r1 + np.arange(1, n) * slope[:, None]
+        # Tied (e.g. rounded) data give ties in `white` only up to rounding error
+        white = _merge_near_ties(white)
+        s = mk_score(white)
+        var_s = mk_variance(white)
+        tau = s / (0.5 * (n - 1) * (n - 2))
+    elif method != "original":
+        raise ValueError(f"Unknown method '{method}'; use one of {', '.join(MK_METHODS)}.")
+
+    z = _z_score(s, var_s)
+    p = 2 * (1 - norm.cdf(np.abs(z)))
+    h = np.abs(z) > norm.ppf(1 - alpha / 2)
+    return {"h": h, "p": p, "z": z, "Tau": tau, "s": s, "var_s": var_s, "slope": slope, "intercept": intercept}
+
+def _trend_labels(h, z) -> np.ndarray:
+    return np.where(h & (z > 0), "increasing", np.where(h & (z < 0), "decreasing", "no trend"))
+
+def _run_chunks(y: np.ndarray, method: str, alpha: float, lag, max_pairs: int, max_workers: int) -> dict:
+    jobs = [{"values": y[k:k + _SERIES_PER_JOB], "method": method, "alpha": alpha, "lag": lag,
+             "max_pairs": max_pairs} for k in range(0, len(y), _SERIES_PER_JOB)]
+    if max_workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(jobs))) as pool:
+            results = list(pool.map(_mk_job, jobs))
+    else:
+        results = [_mk_job(job) for job in jobs]
+    return {key: np.concatenate([r[key] for r in results]) for key in results[0]}
+
+@instrument()
+def mann_kendall_batch(values, method: str = "original", alpha: float = 0.05, lag: int = None,
+                       max_pairs: int = RANK_PAIRS, max_workers: int = 1) -> pd.DataFrame:
+    """
+    Mann-Kendall test of many series of equal length at once.
+
+    Besides the original test, the autocorrelation-corrected variants of
+    pymannkendall are available and give the same results:
+    'hamed_rao' and 'yue_wang' inflate Var(S) with the autocorrelation of the
+    (ranked) Sen-detrended series, 'tfpw' tests the trend-free prewhitened
+    series. Values of the prewhitened series within rounding error of each
+    other count as ties, so rounded data keep their ties (pymannkendall
+    compares them exactly and may differ there). Autocorrelations come from one FFT per chunk of series, and S
+    and Sen's slope share the pairwise differences, so the variants cost
+    about as much as the original test.
+
+    Args:
+        values: (series, n) array without NaNs (rows with NaNs give NaN results)
+        method: One of MK_METHODS
+        alpha: Significance level
+        lag: Number of autocorrelation lags for 'hamed_rao' / 'yue_wang' (default: all)
+        max_pairs: Pairs above which Sen's slope uses a random subset (S stays exact)
+        max_workers: Worker processes for many series
+
+    Returns:
+        pd.DataFrame with one row per series and RESULT_COLUMNS; slope is per time step
+    """
+    try:
+        if method not in MK_METHODS:
+            raise ValueError(f"Unknown method '{method}'; use one of {', '.join(MK_METHODS)}.")
+        y = np.atleast_2d(np.asarray(values, dtype=float))
+        valid = np.isfinite(y).all(axis=1)
+        out = pd.DataFrame(np.nan, index=range(len(y)), columns=RESULT_COLUMNS).astype(
+            {"trend": object, "h": object})
+        if valid.any() and y.shape[1] >= 3:
+            stats = _run_chunks(y[valid], method, alpha, lag, max_pairs, max_workers)
+            stats["trend"] = _trend_labels(stats["h"], stats["z"])
+            for key in RESULT_COLUMNS:
+                out.loc[valid, key] = stats[key]
+        return out
+    except Exception as e:
+        raise RuntimeError(f"Error in batched Mann-Kendall test: {e}")
+
+def mann_kendall_test(values, method: str = "original", alpha: float = 0.05, lag: int = None) -> MKResult:
+    """
+    Mann-Kendall test of one series; NaNs are dropped as in pymannkendall.
+
+    Returns:
+        MKResult with the fields of pymannkendall's result
+    """
+    values = np.asarray(values, dtype=float)
+    values = values[np.isfinite(values)]
+    row = mann_kendall_batch(values[None, :], method=method, alpha=alpha, lag=lag).iloc[0]
+    return MKResult(**{**row.to_dict(), "h": bool(row["h"]) if pd.notna(row["h"]) else False})
+
+@instrument()
+def mann_kendall_grid(da: xr.DataArray, method: str = "original", alpha: float = 0.05, lag: int = None,
+                      max_workers: int = 1) -> xr.Dataset:
+    """
+    Per-cell Mann-Kendall test of a gridded variable.
+
+    Cells with any missing time step are left NaN.
+
+    Args:
+        da: DataArray with a time dimension (e.g. time, lat, lon)
+        method, alpha, lag, max_workers: See mann_kendall_batch
+
+    Returns:
+        xr.Dataset with p, z, tau, slope (per time step) and trend
+        (+1 increasing, -1 decreasing, 0 none) over the non-time dimensions
+    """
+    try:
+        if "time" not in da.dims:
+            raise ValueError(f"Variable '{da.name}' has no time dimension.")
+        other = [d for d in da.dims if d != "time"]
+        da = da.transpose("time", *other)
+        y = np.asarray(da.values, dtype=float).reshape(da.sizes["time"], -1).T
+        table = mann_kendall_batch(y, method=method, alpha=alpha, lag=lag, max_workers=max_workers)
+        shape = [da.sizes[d] for d in other]
+        trend = table["trend"].map({"increasing": 1.0, "decreasing": -1.0, "no trend": 0.0}).to_numpy(dtype=float)
+        attrs = {"method": MK_METHODS[method], "alpha": alpha}
+        data = {
+            "p": table["p"].to_numpy(dtype=float),
+            "z": table["z"].to_numpy(dtype=float),
+            "tau": table["Tau"].to_numpy(dtype=float),
+            "slope": table["slope"].to_numpy(dtype=float),
+            "trend": trend,
+        }
+        return xr.Dataset({name: (other, values.reshape(shape), attrs) for name, values in data.items()},
+                          coords={d: da[d] for d in other if d in da.coords})
+    except Exception as e:
+        raise RuntimeError(f"Error in gridded Mann-Kendall test: {e}")
@@ -0,0 +1,156 @@
+# utils/map_preview.py
+
+import os
+import json
+import math
+
+import numpy as np
+import shapely
+from shapely.geometry import mapping
+import streamlit as st
+
+from utils.geometry_store import SIMPLIFY_TOLERANCES
+from utils.instrumentation import instrument
+
+PREVIEW_MAX_BYTES = int(os.environ.get("WATCYCLE_PREVIEW_MAX_KB", "512")) * 1024
+# Simplify up to this many screen pixels; errors below one pixel are invisible
+PIXEL_TOLERANCE = 1.0
+MIN_ZOOM, MAX_ZOOM = 1, 18
+
+def pixel_degrees(zoom: float, lat: float = 0.0) -> float:
+    """Size of one Web Mercator screen pixel in degrees at `zoom` and latitude `lat`."""
+    return 360.0 / (256 * 2 ** zoom) * max(math.cos(math.radians(lat)), 0.01)
+
+def level_for_resolution(pixel_deg: float) -> int:
+    """Coarsest simplification level whose tolerance is still below PIXEL_TOLERANCE pixels."""
+    level = 0
+    for i, tolerance in enumerate(SIMPLIFY_TOLERANCES, start=1):
+        if tolerance <= pixel_deg * PIXEL_TOLERANCE:
+            level = i
+    return level
+
+def level_for_zoom(zoom: float, lat: float = 0.0) -> int:
+    """Simplification level to draw on a web map at `zoom`."""
+    return level_for_resolution(pixel_degrees(zoom, lat))
+
+def level_for_extent(bounds, width_px: int) -> int:
+    """Simplification level for a static figure showing `bounds` across `width_px` pixels."""
+    minx, _, maxx, _ = bounds
+    return level_for_resolution(max(maxx - minx, 1e-6) / width_px)
+
+def precision_for_zoom(zoom: float, lat: float = 0.0) -> int:
+    """Decimal places that keep GeoJSON coordinates within a quarter pixel at `zoom`."""
+    return int(np.clip(math.ceil(-math.log10(pixel_degrees(zoom, lat) / 4)), 1, 7))
+
+def fit_zoom(bounds, width_px: int = 700, height_px: int = 500) -> int:
+    """Web map zoom at which `bounds` just fits a map of the given size."""
+    minx, miny, maxx, maxy = bounds
+    zoom_x = math.log2(width_px * 360.0 / (256 * max(maxx - minx, 1e-6)))
+    zoom_y = math.log2(height_px * 180.0 / (256 * max(maxy - miny, 1e-6)))
+    return int(np.clip(math.floor(min(zoom_x, zoom_y)), MIN_ZOOM, MAX_ZOOM))
+
+def _round_coords(geoms, digits: int):
+    """Snaps geometries to a 10^-digits grid (dropping collapsed parts) and rounds the coordinates."""
+    geoms = shapely.set_precision(geoms, 10.0 ** -digits)
+    geoms = shapely.transform(geoms, lambda c: np.round(c, digits))
+    return geoms[~shapely.is_empty(geoms)]
+
+def _feature_collection(geoms) -> str:
+    features = [{"type": "Feature", "properties": {}, "geometry": mapping(g)} for g in geoms]
+    return json.dumps({"type": "FeatureCollection", "features": features})
+
+@instrument()
+def preview_geojson(prepared, zoom: float, bounds=None, max_bytes: int = PREVIEW_MAX_BYTES) -> tuple:
+    """
+    Builds a GeoJSON preview of a shapefile for a web map.
+
+    The simplification level and coordinate precision follow the zoom, and
+    with `bounds` only features intersecting the viewport are sent. If the
+    payload is still larger than `max_bytes`, coarser levels are tried, then
+    the dissolved outline at growing tolerances and finally the bounding box,
+    so the result never exceeds the cap whatever the source complexity.
+    Attributes are not included.
+
+    Args:
+        prepared: PreparedGeometry
+        zoom: Web map zoom level
+        bounds: Optional viewport (minx, miny, maxx, maxy) in EPSG:4326
+        max_bytes: Size cap of the serialised GeoJSON
+
+    Returns:
+        (geojson string, info dict with level, tolerance, digits, features and bytes)
+    """
+    try:
+        lat = (prepared.bounds[1] + prepared.bounds[3]) / 2
+        digits = precision_for_zoom(zoom, lat)
+        level = level_for_zoom(zoom, lat)
+        if bounds is None:
+            rows = np.arange(len(prepared.gdf))
+        else:
+            rows = np.sort(prepared.query(shapely.box(*bounds)))
+
+        def result(payload, level, tolerance, n):
+            return payload, {"level": level, "tolerance": tolerance, "digits": digits,
+                             "features": n, "bytes": len(payload)}
+
+        for lvl in range(level, len(SIMPLIFY_TOLERANCES) + 1):
+            geoms = _round_coords(prepared.simplified(lvl).geometry.to_numpy()[rows], digits)
+            payload = _feature_collection(geoms)
+            if len(payload) <= max_bytes:
+                return result(payload, lvl, SIMPLIFY_TOLERANCES[lvl - 1] if lvl else 0.0, len(geoms))
+
+        # Too many features even at the coarsest level: draw the outline only
+        minx, miny, maxx, maxy = prepared.bounds
+        tolerance = SIMPLIFY_TOLERANCES[-1]
+        while tolerance < max(maxx - minx, maxy - miny):
+            outline = shapely.simplify(prepared.union, tolerance, preserve_topology=True)
+            payload = _feature_collection(_round_coords(np.array([outline]), digits))
+            if len(payload) <= max_bytes:
+                return result(payload, "outline", tolerance, 1)
+            tolerance *= 2
+        payload = _feature_collection([shapely.box(*np.round(prepared.bounds, digits))])
+        return result(payload, "bbox", tolerance, 1)
+    except Exception as e:
+        raise RuntimeError(f"Error building map preview: {e}")
+
+def _leaflet_bounds(bounds):
+    """Converts Leaflet's {'_southWest': {...}, '_northEast': {...}} to (minx, miny, maxx, maxy)."""
+    try:
+        sw, ne = bounds["_southWest"], bounds["_northEast"]
+        return sw["lng"], sw["lat"], ne["lng"], ne["lat"]
+    except (KeyError, TypeError):
+        return None
+
+def _pad(bounds, fraction: float = 0.5):
+    minx, miny, maxx, maxy = bounds
+    dx, dy = (maxx - minx) * fraction, (maxy - miny) * fraction
+    return minx - dx, miny - dy, maxx + dx, maxy + dy
+
+@st.fragment
+def shapefile_preview_map(prepared, key: str, height: int = 500):
+    """
+    Interactive folium preview of a prepared shapefile.
+
+    Only this fragment reruns when the user zooms or pans; the shapefile
+    layer is then rebuilt for the new zoom and viewport while the map keeps
+    its view.
+    """
+    import folium
+    from streamlit_folium import st_folium
+
+    view = st.session_state.get(key) or {}
+    zoom = view.get("zoom") or fit_zoom(prepared.bounds)
+    viewport = _leaflet_bounds(view.get("bounds"))
+    payload, info = preview_geojson(prepared, zoom, _pad(viewport) if viewport else None)
+
+    minx, miny, maxx, maxy = prepared.bounds
+    m = folium.Map(location=list(prepared.centroid), zoom_start=fit_zoom(prepared.bounds))
+    m.fit_bounds([[miny, minx], [maxy, maxx]])
+    layer = folium.FeatureGroup(name="Shapefile")
+    folium.GeoJson(json.loads(payload)).add_to(layer)
+    st_folium(m, key=key, height=height, use_container_width=True, feature_group_to_add=layer,
+              returned_objects=["zoom", "bounds"])
+
+    detail = {0: "full resolution", "outline": "dissolved outline", "bbox": "bounding box only"}.get(
+        info["level"], f"simplified to {info['tolerance']:g}°")
+    st.caption(f"Preview: {info['features']} features, {detail}, {info['bytes'] / 1024:.0f} kB")
@@ -1,14 +1,21 @@
 # utils/merge_netcdf_utils.py
 
+import os
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
 import xarray as xr
 import numpy as np
+from utils.instrumentation import instrument
 
-def load_dataset(file_path: str) -> xr.Dataset:
+def load_dataset(file_path: str, chunks=None) -> xr.Dataset:
     """
     Loads a NetCDF file as an xarray Dataset.
 
     Args:
         file_path (str): Path to the NetCDF file
+        chunks: Optional dask chunking passed to xr.open_dataset ({} keeps
+            the on-disk chunks and makes every variable lazy)
 
     Returns:
         xr.Dataset: Loaded dataset
@@ -17,11 +24,12 @@ def load_dataset(file_path: str) -> xr.Dataset:
         RuntimeError: If file cannot be loaded
     """
     try:
-        ds = xr.open_dataset(file_path)
+        ds = xr.open_dataset(file_path, chunks=chunks)
         return ds
     except Exception as e:
         raise RuntimeError(f"Error loading {file_path}: {e}")
 
+@instrument()
 def merge_netcdf_concat(file_paths: list, dim: str = 'time') -> xr.Dataset:
     """
     Concatenates multiple NetCDF files along the specified dimension.
@@ -37,15 +45,18 @@ def merge_netcdf_concat(file_paths: list, dim: str = 'time') -> xr.Dataset:
         xr.Dataset: The concatenated dataset
 
     Raises:
+        ValueError: If the files are incompatible (see plan_netcdf_merge)
         RuntimeError: If concatenation fails
     """
+    plan = plan_netcdf_merge(file_paths, dim=dim, mode='concat')
     try:
-        datasets = [load_dataset(fp) for fp in file_paths]
-        merged_ds = xr.concat(datasets, dim=dim)
-        return merged_ds
+        return execute_merge_plan(plan)
+    except ValueError:
+        raise
     except Exception as e:
         raise RuntimeError(f"Error concatenating datasets along '{dim}': {e}")
 
+@instrument()
 def merge_netcdf_merge(file_paths: list) -> xr.Dataset:
     """
     Merges multiple NetCDF files by combining their variables.
@@ -61,28 +72,180 @@ def merge_netcdf_merge(file_paths: list) -> xr.Dataset:
         xr.Dataset: The merged dataset with combined variables
 
     Raises:
+        ValueError: If the files are incompatible (see plan_netcdf_merge)
         RuntimeError: If merging fails
     """
+    plan = plan_netcdf_merge(file_paths, mode='merge')
     try:
-        datasets = [load_dataset(fp) for fp in file_paths]
-        merged_ds = xr.merge(datasets)
-        return merged_ds
+        return execute_merge_plan(plan)
+    except ValueError:
+        raise
     except Exception as e:
         raise RuntimeError(f"Error merging datasets: {e}")
 
-def smart_merge_netcdf(file_paths: list, dim: str = 'time', duplicate_policy: str = 'drop') -> xr.Dataset:
+DUPLICATE_POLICIES = ("keep-first", "keep-last", "average", "priority")
+
+def read_coordinate_axis(file_path: str, dim: str = 'time') -> np.ndarray:
+    """
+    Reads only the coordinate values of `dim` from a NetCDF file.
+
+    Args:
+        file_path (str): Path to the NetCDF file
+        dim (str): Coordinate to read
+
+    Returns:
+        np.ndarray: The coordinate values in file order
+
+    Raises:
+        RuntimeError: If the file or coordinate cannot be read
+    """
+    try:
+        with xr.open_dataset(file_path) as ds:
+            return ds[dim].values
+    except Exception as e:
+        raise RuntimeError(f"Error reading '{dim}' from {file_path}: {e}")
+
+def _contiguous_runs(files: np.ndarray, positions: np.ndarray) -> list:
+    """Groups (file, position) pairs into runs of consecutive positions in one file."""
+    if files.size == 0:
+        return []
+    breaks = np.flatnonzero((np.diff(files) != 0) | (np.diff(positions) != 1)) + 1
+    starts = np.r_[0, breaks]
+    stops = np.r_[breaks, files.size]
+    return [{"kind": "copy", "file": int(files[a]), "start": int(positions[a]), "stop": int(positions[b - 1]) + 1}
+            for a, b in zip(starts, stops)]
+
+def plan_overlap_merge(axes: list, policy: str = 'keep-first', source_priority: list = None) -> dict:
+    """
+    Computes how to merge files from their coordinate axes alone.
+
+    Every output label is resolved to a source: labels present in one file are
+    copied as contiguous blocks, and only labels present more than once are
+    resolved by the policy.
+
+    Args:
+        axes (list): Coordinate arrays, one per file, in file order
+        policy (str): How to handle duplicate labels:
+            - 'keep-first': Keep the first occurrence (file order)
+            - 'keep-last': Keep the last occurrence
+            - 'average': Mean of all occurrences
+            - 'priority': Keep the occurrence from the highest-priority file
+        source_priority (list): For 'priority', one rank per file (lower wins)
+
+    Returns:
+        dict: Plan with the sorted unique 'labels', the ordered 'segments'
+        ('copy' blocks and 'combine' windows) and the 'n_overlap' label count
+
+    Raises:
+        ValueError: If the policy or priorities are invalid
+    """
+    if policy == 'drop':
+        policy = 'keep-first'
+    if policy not in DUPLICATE_POLICIES:
+        raise ValueError(f"duplicate_policy must be one of {', '.join(DUPLICATE_POLICIES)}")
+
+    labels = np.concatenate(axes)
+    files = np.concatenate([np.full(len(a), i) for i, a in enumerate(axes)])
+    positions = np.concatenate([np.arange(len(a)) for a in axes])
+
+    if policy == 'keep-last':
+        rank, secondary = -files, -positions
+    elif policy == 'priority':
+        if source_priority is None or len(source_priority) != len(axes):
+            raise ValueError("source_priority must give one rank per file")
+        rank, secondary = np.asarray(source_priority)[files], positions
+    else:
+        rank, secondary = files, positions
+
+    # Sort by label, then by preference, so each label's winner comes first
+    order = np.lexsort((secondary, rank, labels))
+    sorted_labels = labels[order]
+    first = np.r_[True, sorted_labels[1:] != sorted_labels[:-1]]
+    group_id = np.cumsum(first) - 1
+    counts = np.bincount(group_id)
+    unique_labels = sorted_labels[first]
+    winners = order[first]
+
+    if policy != 'average':
+        segments = _contiguous_runs(files[winners], positions[winners])
+    else:
+        segments = []
+        overlapped = counts > 1
+        boundaries = np.flatnonzero(np.diff(overlapped.astype(int)) != 0) + 1
+        for a, b in zip(np.r_[0, boundaries], np.r_[boundaries, unique_labels.size]):
+            if not overlapped[a]:
+                segments.extend(_contiguous_runs(files[winners[a:b]], positions[winners[a:b]]))
+                continue
+            in_window = (group_id >= a) & (group_id < b)
+            members = []
+            for f in np.unique(files[order[in_window]]):
+                pos = np.sort(positions[order[in_window]][files[order[in_window]] == f])
+                members.append((int(f), pos))
+            segments.append({"kind": "combine", "members": members})
+
+    return {
+        "labels": unique_labels,
+        "segments": segments,
+        "n_overlap": int(np.count_nonzero(counts > 1)),
+    }
+
+def execute_overlap_plan(file_paths: list, plan: dict, dim: str = 'time') -> xr.Dataset:
+    """
+    Builds the merged dataset described by plan_overlap_merge().
+
+    Files are opened lazily (dask-backed), 'copy' segments stay lazy slices of
+    their source file, and only 'combine' windows are read and averaged in
+    memory. Writing the result with to_netcdf() streams block by block.
+
+    Args:
+        file_paths (list): NetCDF file paths, in the order used for planning
+        plan (dict): Output of plan_overlap_merge()
+        dim (str): The merge dimension
+
+    Returns:
+        xr.Dataset: Lazily merged dataset sorted along `dim`
+    """
+    datasets = [load_dataset(fp, chunks={}) for fp in file_paths]
+    # Variables without `dim` (e.g. a static land mask) are taken once from the first file
+    static = datasets[0][[v for v in datasets[0].data_vars if dim not in datasets[0][v].dims]]
+    along = [ds[[v for v in ds.data_vars if dim in ds[v].dims]] for ds in datasets]
+    pieces = []
+    for seg in plan["segments"]:
+        if seg["kind"] == "copy":
+            pieces.append(along[seg["file"]].isel({dim: slice(seg["start"], seg["stop"])}))
+        else:
+            window = xr.concat(
+                [along[f].isel({dim: pos}) for f, pos in seg["members"]],
+                dim=dim, data_vars="minimal", coords="minimal", compat="override"
+            ).load()
+            pieces.append(window.groupby(dim).mean(keep_attrs=True))
+    if len(pieces) == 1:
+        merged = pieces[0]
+    else:
+        merged = xr.concat(pieces, dim=dim, data_vars="minimal", coords="minimal", compat="override")
+    if not static.data_vars:
+        return merged
+    return xr.merge([merged, static], compat="override", combine_attrs="override")
+
+@instrument()
+def smart_merge_netcdf(file_paths: list, dim: str = 'time', duplicate_policy: str = 'keep-first',
+                       source_priority: list = None) -> xr.Dataset:
     """
     Intelligently merges NetCDF files with handling for overlapping values.
 
-    This advanced merge function handles cases where datasets have
-    overlapping coordinates (e.g., overlapping time periods).
+    Only each file's `dim` coordinate is read up front to plan the merge;
+    non-overlapping blocks are passed through lazily and only the overlapping
+    windows are combined, so cost scales with the overlap, not the archive.
 
     Args:
         file_paths (list): List of NetCDF file paths
         dim (str): The dimension along which to merge (default 'time')
         duplicate_policy (str): How to handle duplicates:
-            - 'drop': Keep only the first occurrence
+            - 'keep-first' (or 'drop'): Keep only the first occurrence
+            - 'keep-last': Keep only the last occurrence
             - 'average': Calculate mean of all duplicate values
+            - 'priority': Keep the value from the file ranked best in source_priority
+        source_priority (list): For 'priority', one rank per file (lower wins)
 
     Returns:
         xr.Dataset: The merged dataset with handled duplicates
@@ -92,24 +255,216 @@ def smart_merge_netcdf(file_paths: list, dim: str = 'time', duplicate_policy: st
         ValueError: If an invalid duplicate policy is provided
     """
     try:
-        datasets = [load_dataset(fp) for fp in file_paths]
-        merged_ds = xr.concat(datasets, dim=dim)
-
-        # Get the coordinate values along the merge dimension
-        coord_values = merged_ds[dim].values
-        unique_vals, indices, counts = np.unique(coord_values, return_index=True, return_counts=True)
-
-        # Handle duplicates according to policy
-        if duplicate_policy == 'drop':
-            # Select only the first occurrence for duplicate times
-            if np.any(counts > 1):
-                merged_ds = merged_ds.sel({dim: unique_vals})
-            return merged_ds
-        elif duplicate_policy == 'average':
-            # Group by the coordinate and take the mean (averaging duplicates)
-            merged_ds = merged_ds.groupby(dim).mean()
-            return merged_ds
-        else:
-            raise ValueError("duplicate_policy must be either 'drop' or 'average'")
+        axes = [read_coordinate_axis(fp, dim) for fp in file_paths]
+        plan = plan_overlap_merge(axes, policy=duplicate_policy, source_priority=source_priority)
+        return execute_overlap_plan(file_paths, plan, dim=dim)
+    except ValueError:
+        raise
     except Exception as e:
         raise RuntimeError(f"Error in smart merging along '{dim}': {e}")
+
+def read_file_header(file_path: str, dim: str = 'time') -> dict:
+    """
+    Reads the metadata needed to plan a merge without touching data variables.
+
+    Uses netCDF4 directly (no CF decoding of the whole file); only 1D
+    coordinate variables are read, and `dim` is decoded to datetimes when it
+    carries CF time units.
+
+    Args:
+        file_path (str): Path to the NetCDF file
+        dim (str): The merge dimension
+
+    Returns:
+        dict: 'path', 'variables' (name -> dims/dtype/shape), 1D 'coords'
+        values, the 'calendar' and 'units' of `dim`, or an 'error' message
+    """
+    import netCDF4
+
+    header = {"path": file_path, "variables": {}, "coords": {}, "calendar": None, "units": None, "error": None}
+    try:
+        with netCDF4.Dataset(file_path) as nc:
+            nc.set_auto_mask(False)
+            for name, var in nc.variables.items():
+                if var.dimensions == (name,):
+                    header["coords"][name] = var[:]
+                else:
+                    header["variables"][name] = {"dims": var.dimensions, "dtype": str(var.dtype), "shape": var.shape}
+            if dim in nc.variables:
+                time_var = nc.variables[dim]
+                header["units"] = getattr(time_var, "units", None)
+                header["calendar"] = getattr(time_var, "calendar", "standard" if header["units"] else None)
+                if header["units"] and " since " in header["units"]:
+                    header["coords"][dim] = xr.coding.times.decode_cf_datetime(
+                        header["coords"][dim], header["units"], header["calendar"])
+    except Exception as e:
+        header["error"] = str(e)
+    return header
+
+def read_file_headers(file_paths: list, dim: str = 'time', max_workers: int = None) -> list:
+    """
+    Reads headers for many files, in parallel worker processes for large sets.
+
+    HDF5 is not thread-safe, so parallel header reads use processes; small
+    sets are read in-process to avoid the start-up cost.
+
+    Args:
+        file_paths (list): NetCDF file paths
+        dim (str): The merge dimension
+        max_workers (int): Worker processes (default: CPU count)
+
+    Returns:
+        list: One read_file_header() dict per path, in input order
+    """
+    reader = partial(read_file_header, dim=dim)
+    max_workers = max_workers or os.cpu_count() or 1
+    if len(file_paths) < 64 or max_workers == 1:
+        return [reader(fp) for fp in file_paths]
+    chunksize = max(1, len(file_paths) // (max_workers * 4))
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(reader, file_paths, chunksize=chunksize))
+
+def _as_step(values: np.ndarray):
+    """Median spacing of a sorted 1D coordinate, or None if it has one value."""
+    if values.size < 2:
+        return None
+    return np.median(np.diff(values))
+
+@instrument()
+def plan_netcdf_merge(file_paths: list, dim: str = 'time', mode: str = 'concat', max_workers: int = None) -> dict:
+    """
+    Validates and orders a set of files for merging from their headers alone.
+
+    Headers and coordinate arrays are read in parallel (see read_file_headers).
+    The plan checks that grids, calendars, variables and dtypes are compatible,
+    sorts files along `dim` and reports gaps and overlaps between consecutive files.
+
+    Args:
+        file_paths (list): NetCDF file paths
+        dim (str): The concatenation dimension; for mode='merge' the axis that
+            may differ between files (outer-joined) instead of failing the grid check
+        mode (str): 'concat' to stack along `dim`, 'merge' to combine variables
+        max_workers (int): Processes used to read headers (default: CPU count)
+
+    Returns:
+        dict: Plan with 'mode', 'dim', sorted 'files', 'headers', 'errors',
+        'warnings', 'gaps', 'overlaps' and 'valid'
+
+    Raises:
+        ValueError: If no files are given or the mode is unknown
+    """
+    if not file_paths:
+        raise ValueError("No files given to merge.")
+    if mode not in ('concat', 'merge'):
+        raise ValueError("mode must be either 'concat' or 'merge'")
+
+    headers = read_file_headers(file_paths, dim=dim, max_workers=max_workers)
+
+    errors, warnings, gaps, overlaps = [], [], [], []
+    for h in headers:
+        if h["error"]:
+            errors.append(f"{os.path.basename(h['path'])}: cannot be read ({h['error']})")
+    headers = [h for h in headers if not h["error"]]
+
+    if mode == 'concat':
+        missing = [os.path.basename(h["path"]) for h in headers if dim not in h["coords"]]
+        if missing:
+            errors.append(f"Coordinate '{dim}' missing in: {', '.join(missing)}")
+        headers = [h for h in headers if dim in h["coords"]]
+        headers.sort(key=lambda h: h["coords"][dim].min() if h["coords"][dim].size else 0)
+
+    if headers:
+        ref = headers[0]
+        ref_name = os.path.basename(ref["path"])
+        for h in headers[1:]:
+            name = os.path.basename(h["path"])
+            # Grid: every shared 1D coordinate except the merge dimension must match
+            for coord, values in ref["coords"].items():
+                if mode == 'concat' and coord == dim:
+                    continue
+                other = h["coords"].get(coord)
+                if other is None or (other.shape == values.shape and np.array_equal(other, values)):
+                    continue
+                if coord == dim:
+                    # Variables merged from files with different time axes are outer-joined
+                    warnings.append(f"{name}: '{coord}' axis differs from {ref_name}; "
+                                    f"steps missing in one file will be filled with NaN")
+                else:
+                    errors.append(f"{name}: '{coord}' grid differs from {ref_name}")
+            if h["calendar"] != ref["calendar"]:
+                errors.append(f"{name}: calendar '{h['calendar']}' differs from '{ref['calendar']}' in {ref_name}")
+            if mode == 'concat':
+                if set(h["variables"]) != set(ref["variables"]):
+                    diff = sorted(set(h["variables"]) ^ set(ref["variables"]))
+                    warnings.append(f"{name}: variables differ from {ref_name} ({', '.join(diff)})")
+                for var, meta in h["variables"].items():
+                    ref_meta = ref["variables"].get(var)
+                    if ref_meta and meta["dtype"] != ref_meta["dtype"]:
+                        warnings.append(f"{name}: '{var}' is {meta['dtype']} but {ref_meta['dtype']} in {ref_name}")
+            else:
+                shared = set(h["variables"]) & set(ref["variables"])
+                if shared:
+                    warnings.append(f"{name}: variables also in {ref_name} will be combined ({', '.join(sorted(shared))})")
+
+        if mode == 'concat':
+            steps = [_as_step(h["coords"][dim]) for h in headers]
+            steps = [st for st in steps if st is not None]
+            if not steps and len(headers) > 1:
+                # Single-step granules: use the spacing between file starts
+                starts = np.array([h["coords"][dim].min() for h in headers])
+                steps = [_as_step(starts)]
+            step = np.median(np.array(steps)) if steps else None
+            for prev, cur in zip(headers[:-1], headers[1:]):
+                prev_end = prev["coords"][dim].max()
+                cur_start = cur["coords"][dim].min()
+                if cur_start <= prev_end:
+                    n = int(np.count_nonzero(cur["coords"][dim] <= prev_end))
+                    overlaps.append({"first": prev["path"], "second": cur["path"], "n_overlapping": n})
+                elif step is not None and (cur_start - prev_end) > 1.5 * step:
+                    gaps.append({"after": prev["path"], "before": cur["path"], "gap_start": prev_end, "gap_end": cur_start})
+
+    return {
+        "mode": mode,
+        "dim": dim,
+        "files": [h["path"] for h in headers],
+        "headers": headers,
+        "errors": errors,
+        "warnings": warnings,
+        "gaps": gaps,
+        "overlaps": overlaps,
+        "valid": not errors and bool(headers),
+    }
+
+@instrument()
+def execute_merge_plan(plan: dict, duplicate_policy: str = 'keep-first') -> xr.Dataset:
+    """
+    Runs a plan from plan_netcdf_merge() lazily.
+
+    Files are opened dask-backed in the planned order. Opening with
+    chunks={} only reads metadata, so it is done serially (HDF5 is not
+    thread-safe). Overlapping files in 'concat' mode are resolved with the
+    smart-merge engine so duplicate labels never reach xr.concat.
+
+    Args:
+        plan (dict): Output of plan_netcdf_merge()
+        duplicate_policy (str): Policy for overlaps (see plan_overlap_merge)
+
+    Returns:
+        xr.Dataset: Lazily merged dataset
+
+    Raises:
+        ValueError: If the plan is not valid
+    """
+    if not plan["valid"]:
+        raise ValueError("Files cannot be merged:\n- " + "\n- ".join(plan["errors"] or ["no readable files"]))
+
+    files, dim = plan["files"], plan["dim"]
+    if plan["mode"] == 'concat' and plan["overlaps"]:
+        axes = [h["coords"][dim] for h in plan["headers"]]
+        overlap_plan = plan_overlap_merge(axes, policy=duplicate_policy)
+        return execute_overlap_plan(files, overlap_plan, dim=dim)
+
+    datasets = [load_dataset(fp, chunks={}) for fp in files]
+    if plan["mode"] == 'concat':
+        return xr.concat(datasets, dim=dim, data_vars="minimal", coords="minimal", compat="override")
+    return xr.merge(datasets, join="outer")
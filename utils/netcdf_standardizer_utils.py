@@ -1,5 +1,20 @@
 # netcdf_standardizer_utils.py
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+from itertools import product
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import json
+import time
+import hashlib
+
+import numpy as np
+import pandas as pd
 import xarray as xr
+from utils.instrumentation import instrument
 
 def get_dataset_info(ds: xr.Dataset) -> dict:
     return {
@@ -32,38 +47,430 @@ def aggregate_extra_dims(ds: xr.Dataset, method: str) -> xr.Dataset:
         raise ValueError(f"Invalid aggregation method: {method}")
     return getattr(ds, method)(dim=extra)
 
-def slice_extra_dims(ds: xr.Dataset) -> dict:
+def _extra_dims(ds: xr.Dataset) -> list:
+    """Dimensions other than time/lat/lon, ignoring *_bnds dimensions."""
     allowed = {"time", "lat", "lon"}
-    slices = {}
+    return [d for d in ds.dims if d not in allowed and not d.endswith('_bnds')]
+
+def _dim_labels(ds: xr.Dataset, dim: str) -> list:
+    """Filename-safe label for every index of `dim` (its coordinate value, or the index)."""
+    if dim not in ds.coords:
+        return [str(i) for i in range(ds.sizes[dim])]
+    labels = []
+    for i, value in enumerate(ds[dim].values):
+        if np.issubdtype(np.asarray(value).dtype, np.datetime64):
+            labels.append(np.datetime_as_string(value, unit='D').replace('-', ''))
+        else:
+            text = str(value.item() if hasattr(value, 'item') else value).strip()
+            labels.append(re.sub(r'[^A-Za-z0-9.+-]+', '_', text) or str(i))
+    return labels
 
-    # Get all dimensions that are not time/lat/lon and not bounds dimensions
-    extra_dims = [d for d in ds.dims if d not in allowed and not d.endswith('_bnds')]
+def plan_extra_dim_slices(ds: xr.Dataset) -> list:
+    """
+    Lists every extra-dimension slice without touching the data.
 
+    Returns:
+        List of {"filename": str, "selection": {dim: index}}, one per
+        combination of extra-dimension indices
+    """
+    extra_dims = _extra_dims(ds)
     if not extra_dims:
-        return slices
-
-    # Create one file per combination of extra dimensions
-    from itertools import product
-    indices = [range(ds.dims[dim]) for dim in extra_dims]
-
-    for idx_combination in product(*indices):
-        selection = {dim: idx for dim, idx in zip(extra_dims, idx_combination)}
-        slice_ds = ds.isel(selection)
-
-        # Create filename with dimension values
-        filename_parts = []
-        for dim, idx in zip(extra_dims, idx_combination):
-            try:
-                value = slice_ds[dim].values.item()
-                if hasattr(value, 'strftime'):  # Handle datetime
-                    value_str = value.strftime('%Y%m%d')
-                else:
-                    value_str = str(value).replace(' ', '_')
-            except:
-                value_str = str(idx)
-            filename_parts.append(f"{dim}_{value_str}")
-
-        filename = "_".join(filename_parts) + "_standardized.nc"
-        slices[filename] = slice_ds
-
-    return slices
+        return []
+    labels = {dim: _dim_labels(ds, dim) for dim in extra_dims}
+    plan = []
+    for idx_combination in product(*[range(ds.sizes[dim]) for dim in extra_dims]):
+        parts = [f"{dim}_{labels[dim][idx]}" for dim, idx in zip(extra_dims, idx_combination)]
+        plan.append({
+            "filename": "_".join(parts) + "_standardized.nc",
+            "selection": dict(zip(extra_dims, idx_combination)),
+        })
+    return plan
+
+def slice_extra_dims(ds: xr.Dataset) -> dict:
+    """
+    Returns {filename: slice} for every combination of extra-dimension indices.
+
+    Slices are lazy ds.isel() views; nothing is loaded until they are written.
+    """
+    return {job["filename"]: ds.isel(job["selection"]) for job in plan_extra_dim_slices(ds)}
+
+def _write_slice(job: dict) -> tuple:
+    """Opens the source file, standardizes it and writes one slice (worker process)."""
+    with xr.open_dataset(job["file_path"]) as ds:
+        ds_std = standardize_dataset(ds, job["mapping"], job["global_meta"])
+        ds_std.isel(job["selection"]).to_netcdf(job["out_path"])
+    return job["filename"], job["out_path"]
+
+@instrument()
+def write_slices_to_zip(file_path: str, mapping: dict, global_meta: dict, zip_path: str,
+                        max_workers: int = None, progress=None) -> int:
+    """
+    Writes every extra-dimension slice of a file into a ZIP archive on disk.
+
+    Slices are encoded in parallel worker processes, each reading its own
+    hyperslab from `file_path`. Finished files are appended to the archive
+    as they complete and then deleted, so neither the slices nor the archive
+    are ever held in memory.
+
+    Args:
+        file_path: Source NetCDF file
+        mapping: Dimension mapping passed to standardize_dataset()
+        global_meta: Global attributes passed to standardize_dataset()
+        zip_path: Output ZIP path
+        max_workers: Worker processes (default: CPU count)
+        progress: Optional callable(done, total)
+
+    Returns:
+        Number of slices written
+    """
+    with xr.open_dataset(file_path) as ds:
+        plan = plan_extra_dim_slices(standardize_dataset(ds, mapping, global_meta))
+    if not plan:
+        raise ValueError("Dataset has no extra dimensions to slice")
+
+    work_dir = tempfile.mkdtemp(prefix="watcycle_slices_")
+    jobs = [dict(job, file_path=file_path, mapping=mapping, global_meta=global_meta,
+                 out_path=os.path.join(work_dir, f"slice_{i:06d}.nc")) for i, job in enumerate(plan)]
+    try:
+        with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_STORED, allowZip64=True) as zf, \
+                ProcessPoolExecutor(max_workers=max_workers or os.cpu_count() or 1) as pool:
+            futures = [pool.submit(_write_slice, job) for job in jobs]
+            for done, future in enumerate(as_completed(futures), start=1):
+                filename, out_path = future.result()
+                zf.write(out_path, filename)
+                os.remove(out_path)
+                if progress:
+                    progress(done, len(jobs))
+        return len(jobs)
+    except Exception as e:
+        raise RuntimeError(f"Error writing slices: {e}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def unstack_extra_dims(ds: xr.Dataset) -> xr.Dataset:
+    """
+    Turns every extra-dimension slice of a variable into its own variable.
+
+    A variable "SoilMoist" with a "depth" dimension becomes "SoilMoist_depth_0.1",
+    "SoilMoist_depth_0.4", ... in a single time/lat/lon dataset. Each new
+    variable is an integer isel() of the original, i.e. a view on the same
+    (lazily loaded) data rather than a copy.
+    """
+    extra_dims = _extra_dims(ds)
+    if not extra_dims:
+        return ds
+    labels = {dim: _dim_labels(ds, dim) for dim in extra_dims}
+    out = {}
+    for var, da in ds.data_vars.items():
+        dims = [d for d in extra_dims if d in da.dims]
+        if not dims:
+            out[var] = da
+            continue
+        for idx_combination in product(*[range(ds.sizes[d]) for d in dims]):
+            selection = dict(zip(dims, idx_combination))
+            name = "_".join([var] + [f"{d}_{labels[d][i]}" for d, i in selection.items()])
+            piece = da.isel(selection).drop_vars(dims, errors="ignore")
+            piece.attrs = dict(da.attrs, **{f"source_{d}": str(ds[d].values[i]) if d in ds.coords else i
+                                            for d, i in selection.items()})
+            out[name] = piece
+    return xr.Dataset(out, attrs=ds.attrs).drop_dims([d for d in extra_dims if d in ds.dims], errors="ignore")
+
+MAPPING_CACHE_PATH = os.environ.get("WATCYCLE_MAPPING_CACHE",
+                                    os.path.join(tempfile.gettempdir(), "watcycle_mapping_cache.json"))
+
+_NAME_HINTS = {
+    "time": ("time", "t", "times", "date", "valid_time", "time_counter"),
+    "lat": ("lat", "latitude", "y", "nav_lat", "lats", "rlat", "latitude_0"),
+    "lon": ("lon", "longitude", "x", "nav_lon", "lons", "long", "rlon", "longitude_0"),
+}
+_UNIT_HINTS = {
+    "lat": ("degrees_north", "degree_north", "degree_n", "degrees_n", "degreen", "degreesn"),
+    "lon": ("degrees_east", "degree_east", "degree_e", "degrees_e", "degreee", "degreese"),
+}
+_AXIS_HINTS = {"time": "T", "lat": "Y", "lon": "X"}
+_STANDARD_ATTRS = {
+    "lat": {"standard_name": "latitude", "units": "degrees_north", "axis": "Y"},
+    "lon": {"standard_name": "longitude", "units": "degrees_east", "axis": "X"},
+    "time": {"standard_name": "time", "axis": "T"},
+}
+
+def inspect_header(file_path: str) -> dict:
+    """
+    Reads dimensions, variable dims and attributes from a NetCDF header.
+
+    No data values are read.
+
+    Returns:
+        {"path", "dims": {name: size}, "variables": {name: {"dims": [...], "attrs": {...}}}}
+    """
+    import netCDF4
+
+    with netCDF4.Dataset(file_path) as nc:
+        return {
+            "path": file_path,
+            "dims": {name: len(dim) for name, dim in nc.dimensions.items()},
+            "variables": {
+                name: {"dims": list(var.dimensions),
+                       "attrs": {k: str(var.getncattr(k)) for k in var.ncattrs()}}
+                for name, var in nc.variables.items()
+            },
+        }
+
+def product_signature(header: dict) -> str:
+    """
+    Hash of the variable names, their dimension names and units.
+
+    Files of the same product share a signature even when their sizes or
+    time reference dates differ (e.g. monthly granules), so a mapping
+    inferred once can be reused.
+    """
+    parts = sorted((name, tuple(info["dims"]), info["attrs"].get("units", "").split(" since ")[0])
+                   for name, info in header["variables"].items())
+    return hashlib.sha1(json.dumps(parts).encode()).hexdigest()[:16]
+
+def _score_candidate(target: str, name: str, info: dict) -> int:
+    """Scores how likely a variable is the `target` coordinate."""
+    attrs = {k.lower(): v for k, v in info["attrs"].items()}
+    units = attrs.get("units", "").lower().replace(" ", "")
+    score = 0
+    if attrs.get("standard_name", "").lower() == {"lat": "latitude", "lon": "longitude"}.get(target, target):
+        score += 8
+    if attrs.get("axis", "").upper() == _AXIS_HINTS[target]:
+        score += 4
+    if target == "time" and " since " in f" {attrs.get('units', '').lower()} ":
+        score += 6
+    if target in _UNIT_HINTS and units in _UNIT_HINTS[target]:
+        score += 6
+    if name.lower() in _NAME_HINTS[target]:
+        score += 3
+    if len(info["dims"]) == 1 and info["dims"][0] == name:
+        score += 2  # CF coordinate variable
+    return score
+
+def infer_dimension_mapping(header: dict) -> dict:
+    """
+    Guesses which variables hold time, latitude and longitude.
+
+    Uses CF standard_name and axis attributes, units ("degrees_north",
+    "days since ...") and common names (latitude/Lat/y, ...). Dimensions
+    without a coordinate variable are matched by name only.
+
+    Returns:
+        {"time": name or None, "lat": name or None, "lon": name or None}
+    """
+    mapping = {}
+    taken = set()
+    for target in ("time", "lat", "lon"):
+        scores = {name: _score_candidate(target, name, info)
+                  for name, info in header["variables"].items()
+                  if len(info["dims"]) == 1 and name not in taken}
+        for dim in header["dims"]:
+            if dim not in header["variables"] and dim not in taken and dim.lower() in _NAME_HINTS[target]:
+                scores[dim] = 3
+        best = max(scores.items(), key=lambda kv: kv[1], default=(None, 0))
+        mapping[target] = best[0] if best[1] >= 3 else None
+        if mapping[target]:
+            taken.add(mapping[target])
+    return mapping
+
+def load_mapping_cache(cache_path: str = None) -> dict:
+    """Loads {signature: mapping} from the JSON mapping cache."""
+    try:
+        with open(cache_path or MAPPING_CACHE_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_mapping_cache(cache: dict, cache_path: str = None) -> None:
+    """Writes the mapping cache atomically."""
+    path = cache_path or MAPPING_CACHE_PATH
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".part")
+    with os.fdopen(fd, "w") as f:
+        json.dump(cache, f, indent=1)
+    os.replace(tmp_path, path)
+
+def _rewrite_standardized(src_path: str, dst_path: str, mapping: dict, global_meta: dict) -> None:
+    """Rewrites a file with renamed coordinates, keeping raw (undecoded) values and encodings."""
+    with xr.open_dataset(src_path, decode_cf=False) as ds:
+        renames = {src: target for target, src in mapping.items()
+                   if src and src != target and (src in ds.variables or src in ds.dims)}
+        ds = ds.rename(renames)
+        for target, attrs in _STANDARD_ATTRS.items():
+            if mapping.get(target) and target in ds.variables:
+                ds[target].attrs = {**attrs, **ds[target].attrs}
+        ds.attrs.update({k: v for k, v in global_meta.items() if v})
+        ds.to_netcdf(dst_path)
+
+def standardize_file_inplace(src_path: str, dst_path: str, mapping: dict, global_meta: dict = None) -> str:
+    """
+    Writes a standardized copy of a file, editing only metadata where possible.
+
+    The file is copied byte for byte and dimensions/variables are renamed in
+    place with netCDF4, so data are never decoded or re-encoded. Renaming
+    coordinate variables inside NetCDF-4/HDF5 files is unreliable in netCDF-C
+    (the dimension scale loses its data), so those files, and any copy whose
+    coordinates do not read back unchanged, are rewritten with xarray using
+    the raw stored values instead.
+
+    Returns:
+        "in-place" or "rewritten"
+    """
+    import netCDF4
+
+    global_meta = global_meta or {}
+    renames = {src: target for target, src in mapping.items() if src and src != target}
+    with netCDF4.Dataset(src_path) as nc:
+        classic = nc.data_model.startswith("NETCDF3")
+        renames_dims = any(src in nc.dimensions for src in renames)
+        clash = any(target in nc.variables or target in nc.dimensions for target in renames.values())
+        before = {src: np.ma.filled(nc[src][:].astype(float), np.nan)
+                  for src in renames if src in nc.variables and nc[src].ndim == 1}
+
+    if clash or (renames_dims and not classic):
+        _rewrite_standardized(src_path, dst_path, mapping, global_meta)
+        return "rewritten"
+
+    shutil.copyfile(src_path, dst_path)
+    try:
+        with netCDF4.Dataset(dst_path, "a") as nc:
+            for src, target in renames.items():
+                if src in nc.dimensions:
+                    nc.renameDimension(src, target)
+                if src in nc.variables:
+                    nc.renameVariable(src, target)
+            for target, attrs in _STANDARD_ATTRS.items():
+                if mapping.get(target) and target in nc.variables:
+                    var = nc[target]
+                    for key, value in attrs.items():
+                        if key not in var.ncattrs():
+                            var.setncattr(key, value)
+            for key, value in global_meta.items():
+                if value:
+                    nc.setncattr(key, value)
+        with netCDF4.Dataset(dst_path) as nc:
+            for src, values in before.items():
+                after = np.ma.filled(nc[renames[src]][:].astype(float), np.nan)
+                if not np.array_equal(values, after, equal_nan=True):
+                    raise ValueError(f"coordinate '{src}' changed while renaming")
+        return "in-place"
+    except Exception:
+        _rewrite_standardized(src_path, dst_path, mapping, global_meta)
+        return "rewritten"
+
+def _standardize_job(job: dict) -> dict:
+    """Runs one file of a batch (worker process) and returns its report row."""
+    start = time.perf_counter()
+    row = {"file": job["name"], "signature": job["signature"],
+           "mapping": ", ".join(f"{k}←{v}" for k, v in job["mapping"].items() if v and v != k) or "unchanged"}
+    missing = [k for k, v in job["mapping"].items() if not v]
+    try:
+        row["method"] = standardize_file_inplace(job["src"], job["dst"], job["mapping"], job["global_meta"])
+        row["status"] = "warning" if missing else "ok"
+        row["message"] = f"no {', '.join(missing)} found" if missing else ""
+        row["output"] = job["dst"]
+    except Exception as e:
+        row.update(method="", status="error", message=str(e), output="")
+    row["seconds"] = round(time.perf_counter() - start, 3)
+    return row
+
+@instrument()
+def batch_standardize(file_paths: list, out_dir: str, global_meta: dict = None, overrides: dict = None,
+                      max_workers: int = None, cache_path: str = None, progress=None,
+                      input_root: str = None) -> pd.DataFrame:
+    """
+    Standardizes many files, inferring the time/lat/lon mapping from headers.
+
+    Headers are grouped by product_signature(); the mapping is inferred once
+    per signature (or taken from the mapping cache / `overrides`) and the
+    files are then rewritten in parallel worker processes with
+    standardize_file_inplace(). Copies keep their path relative to
+    `input_root`, so files of the same name in different subfolders do not
+    overwrite each other.
+
+    Args:
+        file_paths: NetCDF files to standardize
+        out_dir: Directory for the standardized copies (same relative paths)
+        global_meta: Global attributes to set on every file
+        overrides: {signature: mapping} taking precedence over inference;
+                   saved to the mapping cache
+        max_workers: Worker processes (default: CPU count)
+        cache_path: Mapping cache file (default: MAPPING_CACHE_PATH)
+        progress: Optional callable(done, total)
+        input_root: Folder the relative output paths start from
+                    (default: the common folder of all files)
+
+    Returns:
+        pd.DataFrame: One report row per file (status, method, mapping, time)
+
+    Raises:
+        ValueError: If a copy would overwrite its own source file
+    """
+    cache = load_mapping_cache(cache_path)
+    overrides = overrides or {}
+    if input_root is None and file_paths:
+        input_root = os.path.commonpath([os.path.dirname(os.path.abspath(fp)) for fp in file_paths])
+
+    jobs, rows = [], []
+    for fp in file_paths:
+        name = os.path.relpath(os.path.abspath(fp), input_root)
+        dst = os.path.join(out_dir, name)
+        if os.path.exists(dst) and os.path.samefile(fp, dst):
+            raise ValueError(f"The output folder would overwrite the input file {name}; choose another folder.")
+        try:
+            header = inspect_header(fp)
+        except Exception as e:
+            rows.append({"file": name, "signature": "", "mapping": "", "method": "",
+                         "status": "error", "message": f"unreadable header: {e}", "output": "", "seconds": 0.0})
+            continue
+        sig = product_signature(header)
+        if sig in overrides:
+            cache[sig] = overrides[sig]
+        elif sig not in cache:
+            cache[sig] = infer_dimension_mapping(header)
+        jobs.append({"src": fp, "dst": dst, "name": name, "signature": sig,
+                     "mapping": cache[sig], "global_meta": global_meta or {}})
+    save_mapping_cache(cache, cache_path)
+    os.makedirs(out_dir, exist_ok=True)
+    for job in jobs:
+        os.makedirs(os.path.dirname(job["dst"]) or ".", exist_ok=True)
+
+    if jobs:
+        total = len(jobs)
+        if len(jobs) < 8 or max_workers == 1:
+            for done, job in enumerate(jobs, start=1):
+                rows.append(_standardize_job(job))
+                if progress:
+                    progress(done, total)
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count() or 1) as pool:
+                futures = [pool.submit(_standardize_job, job) for job in jobs]
+                for done, future in enumerate(as_completed(futures), start=1):
+                    rows.append(future.result())
+                    if progress:
+                        progress(done, total)
+
+    columns = ["file", "status", "method", "mapping", "message", "signature", "output", "seconds"]
+    return pd.DataFrame(rows, columns=columns).sort_values("file", ignore_index=True)
+
+def preview_batch_mappings(file_paths: list, cache_path: str = None) -> pd.DataFrame:
+    """
+    Returns one row per product signature with its inferred (or cached) mapping.
+
+    Useful to review and override mappings before running batch_standardize().
+    """
+    cache = load_mapping_cache(cache_path)
+    groups = {}
+    for fp in file_paths:
+        try:
+            header = inspect_header(fp)
+        except Exception:
+            continue
+        sig = product_signature(header)
+        if sig not in groups:
+            mapping = cache.get(sig) or infer_dimension_mapping(header)
+            groups[sig] = {"signature": sig, "example": os.path.basename(fp), "files": 0,
+                           "variables": ", ".join(v for v in header["variables"] if v not in mapping.values()),
+                           **{k: mapping.get(k) or "" for k in ("time", "lat", "lon")},
+                           "cached": sig in cache}
+        groups[sig]["files"] += 1
+    return pd.DataFrame(list(groups.values()))
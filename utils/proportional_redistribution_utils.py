@@ -1,18 +1,23 @@
 import numpy as np
 import pandas as pd
+from utils.reduction_utils import spatial_mean
 
-def monthly_mean_series(da):
+def monthly_mean_series(series):
     """
-    Compute monthly means (1–12) from a DataArray with a 'time' coordinate.
+    Compute monthly means (1–12) of a spatial-mean time series.
+
+    Accepts a time-indexed pandas Series (e.g. a column of
+    reduction_utils.wide_table) or a DataArray with a 'time' coordinate,
+    which is first reduced to its area-weighted spatial mean.
     Returns a pandas Series indexed by month.
     """
-    df = da.to_dataframe().reset_index()
-    if 'time' not in df:
-        raise ValueError("DataArray must have a 'time' coordinate.")
-    df['month'] = df['time'].dt.month
-    ser = df.groupby('month')[da.name].mean()
+    if not isinstance(series, pd.Series):
+        if 'time' not in series.dims:
+            raise ValueError("DataArray must have a 'time' coordinate.")
+        series = spatial_mean(series)
+    ser = series.groupby(series.index.month).mean()
     ser.index.name = 'month'
-    ser.name = da.name
+    ser.name = series.name
     return ser
 
 def compute_original_seasonal(p_ser, et_ser, ro_ser, ds_ser):
@@ -0,0 +1,214 @@
+# utils/reduction_utils.py
+
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from utils.geospatial_utils import compute_cell_areas, coord_resolution, bbox_window, get_raster_mask
+from utils.geometry_store import prepare_geometry
+from utils.instrumentation import instrument
+from utils.render_cache import dataset_fingerprint
+
+REDUCTION_CHUNK_MB = int(os.environ.get("WATCYCLE_REDUCTION_CHUNK_MB", "128"))
+SERIES_CACHE_SIZE = int(os.environ.get("WATCYCLE_SERIES_CACHE", "256"))
+TABLE_COLUMNS = ["time", "label", "variable", "file", "value"]
+
+_lock = threading.Lock()
+_weights = OrderedDict()
+_series = OrderedDict()
+_WEIGHT_CACHE_SIZE = 16
+
+def cell_area_weights(lat, lon) -> np.ndarray:
+    """
+    Returns read-only (lat, lon) cell areas in km², computed once per grid.
+    """
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    key = hashlib.sha1(lat.tobytes() + b"|" + lon.tobytes()).hexdigest()
+    with _lock:
+        if key in _weights:
+            _weights.move_to_end(key)
+            return _weights[key]
+    weights = compute_cell_areas(lat, lon)
+    weights.setflags(write=False)
+    with _lock:
+        _weights[key] = weights
+        if len(_weights) > _WEIGHT_CACHE_SIZE:
+            _weights.popitem(last=False)
+    return weights
+
+def _block_means(values: np.ndarray, weights) -> np.ndarray:
+    """
+    Means over all axes but the first of a (time, ..., lat, lon) block.
+
+    Cells are weighted by `weights` (lat, lon) when given; NaNs are skipped
+    and steps without valid cells give NaN. Extra dimensions between time
+    and lat/lon are averaged without weights.
+    """
+    n = values.shape[0]
+    valid = np.isfinite(values)
+    if weights is None:
+        flat, ok = np.where(valid, values, 0.0).reshape(n, -1), valid.reshape(n, -1)
+        num, den = flat.sum(axis=1), ok.sum(axis=1)
+    else:
+        cells = weights.size
+        flat = np.where(valid, values, 0.0).reshape(-1, cells)
+        ok = valid.reshape(-1, cells).astype(weights.dtype)
+        w = weights.ravel()
+        num = (flat @ w).reshape(n, -1).sum(axis=1)
+        den = (ok @ w).reshape(n, -1).sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(den > 0, num / den, np.nan)
+
+def _layout(da: xr.DataArray, weighted: bool) -> tuple:
+    """Returns (transposed DataArray, whether lat/lon weighting applies)."""
+    if "time" not in da.dims:
+        raise ValueError(f"Variable '{da.name}' has no time dimension.")
+    spatial = "lat" in da.dims and "lon" in da.dims
+    if spatial:
+        da = da.transpose("time", ..., "lat", "lon")
+    else:
+        da = da.transpose("time", ...)
+    return da, weighted and spatial
+
+def spatial_mean(da: xr.DataArray, weighted: bool = True) -> pd.Series:
+    """
+    Spatial mean of an in-memory or lazily opened DataArray as a time-indexed Series.
+
+    With `weighted`, lat/lon cells are weighted by their area; NaN cells
+    are skipped.
+    """
+    da, use_weights = _layout(da, weighted)
+    weights = cell_area_weights(da["lat"].values, da["lon"].values) if use_weights else None
+    values = _block_means(np.asarray(da.values, dtype=np.float64), weights)
+    return pd.Series(values, index=pd.DatetimeIndex(da["time"].values, name="time"), name=da.name)
+
+def _region_weights(ds: xr.Dataset, geometry, weighted: bool = True) -> tuple:
+    """
+    Returns (window of ds covering the geometry, area weights × inside mask);
+    without `weighted` the weights are just the inside mask as 0/1.
+    """
+    prepared = prepare_geometry(geometry)
+    window = bbox_window(ds, prepared.bounds)
+    mask = get_raster_mask(window["lat"].values, window["lon"].values, prepared.geoms,
+                           lat_res=coord_resolution(ds["lat"].values), lon_res=coord_resolution(ds["lon"].values),
+                           geoms_key=prepared.key)
+    if not weighted:
+        return window, mask.astype(np.float64)
+    return window, cell_area_weights(window["lat"].values, window["lon"].values) * mask
+
+def _reduce_file(job: dict) -> dict:
+    """
+    Reads the requested variables of one file in a single pass over time
+    chunks and returns {variable: (times, means)}.
+    """
+    with xr.open_dataset(job["path"]) as ds:
+        ds = ds[job["variables"]]
+        weights = None
+        region = job["geometry"] is not None
+        if region:
+            # Unweighted region means still need the inside mask, so weights are always used
+            ds, weights = _region_weights(ds, job["geometry"], job["weighted"])
+
+        layouts, step_bytes = {}, 0
+        for name in job["variables"]:
+            da, use_weights = _layout(ds[name], job["weighted"] or region)
+            if use_weights and weights is None:
+                weights = cell_area_weights(ds["lat"].values, ds["lon"].values)
+            layouts[name] = (da, weights if use_weights else None)
+            step_bytes += da.dtype.itemsize * da.size // max(da.sizes["time"], 1)
+
+        n_time = ds.sizes["time"]
+        step = max(1, int(job["chunk_mb"] * 1024 * 1024 // max(step_bytes, 1)))
+        out = {name: np.empty(n_time) for name in job["variables"]}
+        for start in range(0, n_time, step):
+            sl = slice(start, min(start + step, n_time))
+            for name, (da, w) in layouts.items():
+                block = np.asarray(da.isel(time=sl).values, dtype=np.float64)
+                out[name][sl] = _block_means(block, w)
+        times = ds["time"].values
+    return {name: (times, values) for name, values in out.items()}
+
+@instrument()
+def spatial_mean_table(sources, weighted: bool = True, geometry=None, chunk_mb: int = REDUCTION_CHUNK_MB,
+                       max_workers: int = 1) -> pd.DataFrame:
+    """
+    Area-weighted spatial means of many variables from one or more files.
+
+    Each file is opened once and read in a single pass over time chunks,
+    reducing every requested variable of that file per chunk. Series are
+    cached per (file contents, variable, weighting, region), so pages that
+    ask for the same series again, or for a subset of an earlier request,
+    read nothing.
+
+    Args:
+        sources: Iterable of (path, variable) or (path, variable, label)
+            tuples; the label defaults to the variable name
+        weighted: Weight lat/lon cells by their area (km²)
+        geometry: Optional GeoDataFrame or PreparedGeometry; only its
+            bounding-box hyperslab is read and cells outside are ignored
+        chunk_mb: Approximate memory of one time chunk across the variables of a file
+        max_workers: Processes for reading several files at once
+
+    Returns:
+        Tidy DataFrame with columns time, label, variable, file and value
+    """
+    try:
+        sources = [tuple(s) + (s[1],) if len(s) == 2 else tuple(s) for s in sources]
+        prepared = None if geometry is None else prepare_geometry(geometry)
+        region = None if prepared is None else prepared.key
+        keys = {}
+        for path, variable, _ in sources:
+            keys[(path, variable)] = (dataset_fingerprint(path), variable, weighted, region)
+
+        with _lock:
+            missing = {}
+            for (path, variable), key in keys.items():
+                if key not in _series:
+                    missing.setdefault(path, []).append(variable)
+
+        parallel = len(missing) > 1 and max_workers > 1
+        # Worker processes get the plain EPSG:4326 frame; the STRtree does not pickle
+        region_arg = prepared.gdf if parallel and prepared is not None else prepared
+        jobs = [{"path": path, "variables": variables, "weighted": weighted, "geometry": region_arg,
+                 "chunk_mb": chunk_mb} for path, variables in missing.items()]
+        if parallel:
+            with ProcessPoolExecutor(max_workers=min(max_workers, len(jobs))) as pool:
+                results = list(pool.map(_reduce_file, jobs))
+        else:
+            results = [_reduce_file(job) for job in jobs]
+
+        with _lock:
+            for job, result in zip(jobs, results):
+                for variable, (times, values) in result.items():
+                    _series[keys[(job["path"], variable)]] = pd.Series(
+                        values, index=pd.DatetimeIndex(times, name="time"), name=variable)
+            frames = []
+            for path, variable, label in sources:
+                key = keys[(path, variable)]
+                _series.move_to_end(key)
+                series = _series[key]
+                frames.append(pd.DataFrame({"time": series.index, "label": label, "variable": variable,
+                                            "file": os.path.basename(path), "value": series.values}))
+            while len(_series) > SERIES_CACHE_SIZE:
+                _series.popitem(last=False)
+        if not frames:
+            return pd.DataFrame(columns=TABLE_COLUMNS)
+        return pd.concat(frames, ignore_index=True)[TABLE_COLUMNS]
+    except Exception as e:
+        raise RuntimeError(f"Error computing spatial means: {e}")
+
+def spatial_mean_series(path: str, variable: str, **kwargs) -> pd.Series:
+    """Time-indexed spatial mean of one variable (see spatial_mean_table for options)."""
+    table = spatial_mean_table([(path, variable)], **kwargs)
+    return pd.Series(table["value"].values, index=pd.DatetimeIndex(table["time"], name="time"), name=variable)
+
+def wide_table(table: pd.DataFrame) -> pd.DataFrame:
+    """Pivots a tidy spatial-mean table to one column per label, indexed by time."""
+    return table.pivot(index="time", columns="label", values="value")[list(dict.fromkeys(table["label"]))]
@@ -0,0 +1,127 @@
+# utils/render_cache.py
+
+import os
+import io
+import json
+import hashlib
+import tempfile
+from utils.instrumentation import instrument
+
+CACHE_DIR = os.environ.get("WATCYCLE_RENDER_CACHE_DIR",
+                           os.path.join(tempfile.gettempdir(), "watcycle_render_cache"))
+MAX_CACHE_BYTES = int(os.environ.get("WATCYCLE_RENDER_CACHE_MB", "512")) * 1024 * 1024
+
+def dataset_fingerprint(file_path: str) -> str:
+    """
+    Returns a cheap identity hash for a file on disk.
+
+    Uses the absolute path, size and modification time, so a re-uploaded or
+    edited file gets a new fingerprint without reading its contents.
+    """
+    st_ = os.stat(file_path)
+    raw = f"{os.path.abspath(file_path)}|{st_.st_size}|{st_.st_mtime_ns}"
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+def geometry_fingerprint(gdf) -> str:
+    """Returns a hash of a GeoDataFrame's geometries and CRS."""
+    h = hashlib.sha1(str(gdf.crs).encode())
+    for geom in gdf.geometry:
+        h.update(geom.wkb)
+    return h.hexdigest()
+
+def frame_fingerprint(df) -> str:
+    """Returns a hash of a DataFrame's index and values."""
+    import pandas as pd
+
+    return hashlib.sha1(pd.util.hash_pandas_object(df, index=True).values.tobytes()).hexdigest()
+
+def make_render_key(**parts) -> str:
+    """
+    Builds a cache key from the inputs that determine a figure.
+
+    Typical parts: dataset fingerprint, variable, time selection, projection,
+    colormap and smoothing parameters. Values only need a stable str().
+    """
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def _entry_path(key: str, fmt: str) -> str:
+    return os.path.join(CACHE_DIR, f"{key}.{fmt}")
+
+def get_cached_render(key: str, fmt: str = "png"):
+    """
+    Returns the cached encoded figure for `key`, or None on a miss.
+
+    A hit refreshes the entry's timestamp so eviction is least-recently-used.
+    """
+    path = _entry_path(key, fmt)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        os.utime(path, None)
+        return data
+    except OSError:
+        return None
+
+def store_render(key: str, data: bytes, fmt: str = "png") -> None:
+    """Writes encoded figure bytes to the cache and enforces the size budget."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = _entry_path(key, fmt)
+    fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix=".part")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    evict_renders()
+
+def evict_renders(max_bytes: int = None) -> int:
+    """
+    Deletes least-recently-used entries until the cache fits in `max_bytes`.
+
+    Returns:
+        Number of bytes freed
+    """
+    max_bytes = MAX_CACHE_BYTES if max_bytes is None else max_bytes
+    try:
+        entries = [e for e in os.scandir(CACHE_DIR) if e.is_file() and not e.name.endswith(".part")]
+    except FileNotFoundError:
+        return 0
+    stats = [(e.stat().st_mtime, e.stat().st_size, e.path) for e in entries]
+    total = sum(size for _, size, _ in stats)
+    freed = 0
+    for _, size, path in sorted(stats):
+        if total - freed <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            freed += size
+        except OSError:
+            pass
+    return freed
+
+@instrument()
+def render_figure(key: str, build_fig, fmt: str = "png", dpi: int = 200) -> bytes:
+    """
+    Returns the encoded figure for `key`, rendering it only on a cache miss.
+
+    Args:
+        key: Cache key from make_render_key()
+        build_fig: Zero-argument callable returning a matplotlib Figure
+        fmt: 'png' or 'svg'
+        dpi: Resolution used when encoding a PNG
+
+    Returns:
+        Encoded image bytes
+    """
+    data = get_cached_render(key, fmt)
+    if data is not None:
+        return data
+
+    import matplotlib.pyplot as plt
+
+    fig = build_fig()
+    buf = io.BytesIO()
+    fig.savefig(buf, format=fmt, dpi=dpi, bbox_inches="tight")
+    plt.close(fig)
+    data = buf.getvalue()
+    store_render(key, data, fmt)
+    return data
@@ -1,10 +1,28 @@
 # utils/resample_utils.py
 
+import os
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
 import xarray as xr
 import numpy as np
 # import xesmf as xe  # make sure xESMF is installed: pip install xesmf
 import pandas as pd
 
+from utils.geospatial_utils import compute_cell_areas
+from utils.instrumentation import instrument
+
+BLOCK_FUNCS = ("mean", "sum", "min", "max", "median", "std")
+BLOCK_WEIGHTS = ("none", "coslat", "area")
+TEMPORAL_SEMANTICS = {
+    "flux": "sum",       # accumulated over the period (precipitation, ET, runoff)
+    "state": "mean",     # averaged over the period (temperature, soil moisture)
+    "storage": "point",  # last value in the period (TWS, snow water equivalent)
+}
+_FLUX_HINTS = ("precip", "rain", "evap", "transpir", "runoff", "discharge", "flux", "recharge", "drainage")
+_STORAGE_HINTS = ("storage", "tws", "swe", "snow_water", "water_equivalent", "groundwater", "reservoir")
+
+@instrument()
 def interp_resample(ds: xr.Dataset, new_coords: dict, method: str = "linear") -> xr.Dataset:
     """
     Interpolates the dataset to new coordinate arrays using xarray's interp().
@@ -24,32 +42,235 @@ def interp_resample(ds: xr.Dataset, new_coords: dict, method: str = "linear") ->
     except Exception as e:
         raise RuntimeError(f"Error in interp_resample: {e}")
 
-def coarsen_resample(ds: xr.Dataset, factors: dict, boundary: str = "trim", func: str = "mean") -> xr.Dataset:
+def _to_blocks(arr: np.ndarray, factors: list, boundary: str, fill=np.nan) -> np.ndarray:
+    """
+    Splits each of the trailing len(factors) axes of `arr` into (blocks, factor).
+
+    (..., n1*f1, n2*f2) becomes the view (..., n1, f1, n2, f2) without copying
+    (except when padding), so reductions over the factor axes aggregate blocks.
+    """
+    k = len(factors)
+    lead = arr.shape[:arr.ndim - k]
+    pads, sizes = [], []
+    for n, f in zip(arr.shape[arr.ndim - k:], factors):
+        if boundary == "exact" and n % f:
+            raise ValueError(f"Dimension of size {n} is not divisible by factor {f}")
+        nb = -(-n // f) if boundary == "pad" else n // f
+        sizes.append(nb)
+        pads.append(nb * f - n)
+
+    if boundary == "pad" and any(pads):
+        arr = np.pad(arr, [(0, 0)] * len(lead) + [(0, p) for p in pads], constant_values=fill)
+    else:
+        arr = arr[(Ellipsis,) + tuple(slice(0, nb * f) for nb, f in zip(sizes, factors))]
+    return arr.reshape(lead + tuple(x for nb, f in zip(sizes, factors) for x in (nb, f)))
+
+def _block_sum(x: np.ndarray, axes: tuple, dtype=None, ufunc=np.add) -> np.ndarray:
+    """Reduces the factor axes, outermost first (streams over contiguous rows)."""
+    for i, ax in enumerate(sorted(axes)):
+        x = ufunc.reduce(x, axis=ax - i, **({"dtype": dtype} if dtype else {}))
+    return x
+
+def _reduce_blocks(blocks: np.ndarray, weights: np.ndarray, func: str, w_total: np.ndarray,
+                   min_valid_fraction: float) -> np.ndarray:
     """
-    Resamples the dataset by aggregating over blocks using xarray's coarsen().
+    Reduces the factor axes of a _to_blocks() view with NaN-aware statistics.
+
+    Blocks whose valid share of (weighted) cells is below `min_valid_fraction`
+    become NaN. `w_total` is the total weight of the real cells in each block.
+    """
+    k = w_total.ndim
+    axes = tuple(blocks.ndim - 2 * k + 2 * i + 1 for i in range(k))
+    valid = ~np.isnan(blocks)
+    weighted = weights is not None
+    w_valid = (_block_sum(np.where(valid, weights, 0.0), axes) if weighted
+               else _block_sum(valid, axes, dtype=np.float64))
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if func in ("mean", "sum", "std"):
+            x = np.where(valid, blocks, 0.0)
+            if weighted:
+                x *= weights
+            result = _block_sum(x, axes)
+            if func != "sum":
+                result /= w_valid
+            if func == "std":
+                x = np.where(valid, blocks - np.expand_dims(result, axes), 0.0)
+                x **= 2
+                if weighted:
+                    x *= weights
+                result = np.sqrt(_block_sum(x, axes) / w_valid)
+        elif func == "min":
+            result = _block_sum(blocks, axes, ufunc=np.fmin)
+        elif func == "max":
+            result = _block_sum(blocks, axes, ufunc=np.fmax)
+        else:  # median: gather each block's cells on the last axis; sorting puts NaNs last
+            lead = blocks.ndim - 2 * k
+            order = list(range(lead)) + [lead + 2 * i for i in range(k)] + list(axes)
+            cells = np.sort(blocks.transpose(order).reshape(blocks.shape[:lead] + w_total.shape + (-1,)), axis=-1)
+            count = np.count_nonzero(~np.isnan(cells), axis=-1)
+            lo = np.take_along_axis(cells, np.maximum((count - 1) // 2, 0)[..., None], axis=-1)[..., 0]
+            hi = np.take_along_axis(cells, np.maximum(count // 2, 0)[..., None], axis=-1)[..., 0]
+            result = (lo + hi) / 2.0
+        fraction = w_valid / w_total
+    return np.where((w_valid > 0) & (fraction >= min_valid_fraction), result, np.nan)
+
+def _block_weights(ds: xr.Dataset, dims: list, weights) -> np.ndarray:
+    """Returns cell weights over `dims`, or None for unweighted aggregation."""
+    shape = tuple(ds.sizes[d] for d in dims)
+    if weights is None or (isinstance(weights, str) and weights == "none"):
+        return None
+    if isinstance(weights, str) and weights == "coslat":
+        if "lat" not in dims:
+            return None
+        w = np.cos(np.deg2rad(ds["lat"].values))
+        return np.broadcast_to(w.reshape([-1 if d == "lat" else 1 for d in dims]), shape).astype(float)
+    if isinstance(weights, str) and weights == "area":
+        if not {"lat", "lon"} <= set(dims):
+            raise ValueError("Area weights need both 'lat' and 'lon' in the coarsening factors")
+        area = xr.DataArray(compute_cell_areas(ds["lat"].values, ds["lon"].values), dims=("lat", "lon"))
+    elif isinstance(weights, str):
+        if weights not in ds:
+            raise ValueError(f"Weight variable '{weights}' not found in dataset")
+        area = ds[weights]
+    else:
+        area = weights
+    if not set(area.dims) <= set(dims):
+        raise ValueError("Cell-area weights may only use the coarsened dimensions")
+    return np.broadcast_to(area.transpose(*[d for d in dims if d in area.dims]).values
+                           .reshape([area.sizes[d] if d in area.dims else 1 for d in dims]), shape).astype(float)
+
+@instrument()
+def block_aggregate(ds: xr.Dataset, factors: dict, func: str = "mean", weights="none",
+                    min_valid_fraction: float = 0.0, boundary: str = "trim", time_chunk: int = None,
+                    max_workers: int = None) -> xr.Dataset:
+    """
+    Aggregates the dataset over blocks of `factors` cells.
+
+    Each dimension in `factors` is split into (blocks, factor) axes of a
+    reshaped view, so every statistic is one vectorised, NaN-aware reduction
+    over the factor axes. Data are read and reduced `time_chunk` time steps
+    at a time; chunks are reduced in parallel threads. Variables with only
+    some of the dimensions are aggregated over those (with the weights
+    averaged over the others), variables with none are passed through, and
+    non-numeric variables on the grid are dropped with a warning.
 
     Parameters:
       ds: xarray.Dataset to be coarsened.
-      factors: Dictionary specifying the factor for each dimension.
-               Example: {"lat": 4, "lon": 4} to average every 4 grid cells in lat and lon.
-      boundary: How to handle boundaries; options include "trim" (default) or "pad".
-      func: Aggregation function to apply; default is "mean". Other options: "sum", etc.
+      factors: Block size per dimension, e.g. {"lat": 10, "lon": 10}.
+      func: One of "mean", "sum", "min", "max", "median", "std".
+      weights: "none", "coslat" (cosine of latitude), "area" (spherical cell
+               area) or the name of / a DataArray with explicit cell areas.
+               Used by mean, sum and std and by the valid-fraction test;
+               a weighted sum integrates value × area.
+      min_valid_fraction: Minimum (weighted) share of valid cells per block, 0–1.
+      boundary: "trim" drops incomplete edge blocks, "pad" keeps them, "exact"
+                raises if a dimension is not divisible by its factor.
+      time_chunk: Time steps per chunk when "time" is not coarsened
+                  (default: about 8 million values per chunk).
+      max_workers: Threads reducing chunks (default: CPU count).
 
     Returns:
-      ds_coarse: The coarsened dataset.
+      ds_coarse: The coarsened dataset. Coordinates are the block means.
     """
+    if func not in BLOCK_FUNCS:
+        raise ValueError(f"Unsupported aggregation '{func}'; choose from {', '.join(BLOCK_FUNCS)}")
+    if boundary not in ("trim", "pad", "exact"):
+        raise ValueError("boundary must be 'trim', 'pad' or 'exact'")
+    factors = {d: int(f) for d, f in factors.items() if int(f) > 1}
+    for d in factors:
+        if d not in ds.dims:
+            raise ValueError(f"Dimension '{d}' not found in dataset")
+    if not factors:
+        return ds.copy()
+
+    dims = list(factors)
+    grid_shape = tuple(ds.sizes[d] for d in dims)
+    cell_weights = _block_weights(ds, dims, weights)
+    layouts = {}
+
+    def layout(var_dims):
+        """Factors, weight blocks and total block weights over a subset of the dims."""
+        if var_dims not in layouts:
+            f_list = [factors[d] for d in var_dims]
+            shape = tuple(ds.sizes[d] for d in var_dims)
+            block_axes = tuple(2 * i + 1 for i in range(len(var_dims)))
+            w_cells = cell_weights
+            if w_cells is not None and len(var_dims) < len(dims):
+                w_cells = w_cells.mean(axis=tuple(i for i, d in enumerate(dims) if d not in var_dims))
+            present = _to_blocks(np.ones(shape), f_list, boundary, fill=0.0)
+            w_blocks = None if w_cells is None else _to_blocks(w_cells, f_list, boundary, fill=0.0)
+            w_total = (present if w_blocks is None else w_blocks).sum(axis=block_axes)
+            layouts[var_dims] = (f_list, w_blocks, w_total)
+        return layouts[var_dims]
+
+    if time_chunk is None:
+        time_chunk = max(1, int(8e6 // max(1, np.prod(grid_shape))))
+
+    coords = {}
+    for d in dims:
+        if d in ds.coords:
+            values = ds[d].values
+            is_time = np.issubdtype(values.dtype, np.datetime64)
+            numeric = values.astype("datetime64[ns]").astype(np.int64) if is_time else values
+            centre = np.nanmean(_to_blocks(numeric.astype(float), [factors[d]], boundary), axis=-1)
+            coords[d] = centre.astype(np.int64).astype("datetime64[ns]") if is_time else centre
+
+    def reduce(values, var_dims):
+        f_list, w_blocks, w_total = layout(var_dims)
+        return _reduce_blocks(_to_blocks(values.astype(np.float64, copy=False), f_list, boundary),
+                              w_blocks, func, w_total, min_valid_fraction)
+
     try:
-        coarsened = ds.coarsen(**factors, boundary=boundary)
-        if func == "mean":
-            ds_coarse = coarsened.mean()
-        elif func == "sum":
-            ds_coarse = coarsened.sum()
-        else:
-            # You can add more aggregation methods as needed
-            ds_coarse = coarsened.mean()
+        out_vars = {}
+        for var, da in ds.data_vars.items():
+            var_dims = tuple(d for d in dims if d in da.dims)
+            if not var_dims:
+                out_vars[var] = da
+                continue
+            if not (np.issubdtype(da.dtype, np.number) or np.issubdtype(da.dtype, np.bool_)):
+                warnings.warn(f"'{var}' ({da.dtype}) cannot be aggregated and was dropped")
+                continue
+            lead = [d for d in da.dims if d not in var_dims]
+            da = da.transpose(*lead, *var_dims)
+
+            if lead and lead[0] == "time" and da.sizes["time"] > time_chunk:
+                starts = range(0, da.sizes["time"], time_chunk)
+                with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count() or 1) as pool:
+                    parts = list(pool.map(
+                        lambda i: reduce(da.isel(time=slice(i, i + time_chunk)).values, var_dims), starts))
+                result = np.concatenate(parts, axis=0)
+            else:
+                result = reduce(da.values, var_dims)
+
+            result = xr.DataArray(result, dims=lead + list(var_dims),
+                                  coords={d: ds[d] for d in lead if d in ds.coords}, attrs=da.attrs)
+            out_vars[var] = result.transpose(*ds[var].dims)
+
+        ds_coarse = xr.Dataset(out_vars, attrs=ds.attrs).assign_coords(coords)
         return ds_coarse
     except Exception as e:
-        raise RuntimeError(f"Error in coarsen_resample: {e}")
+        raise RuntimeError(f"Error in block_aggregate: {e}")
+
+def coarsen_resample(ds: xr.Dataset, factors: dict, boundary: str = "trim", func: str = "mean",
+                     weights="none", min_valid_fraction: float = 0.0) -> xr.Dataset:
+    """
+    Resamples the dataset by aggregating over blocks of grid cells.
+
+    Parameters:
+      ds: xarray.Dataset to be coarsened.
+      factors: Dictionary specifying the factor for each dimension.
+               Example: {"lat": 4, "lon": 4} to average every 4 grid cells in lat and lon.
+      boundary: How to handle boundaries; options include "trim" (default), "pad" or "exact".
+      func: Aggregation function: "mean" (default), "sum", "min", "max", "median" or "std".
+      weights: "none", "coslat", "area" or a cell-area variable (see block_aggregate).
+      min_valid_fraction: Minimum share of valid cells for a block to get a value.
+
+    Returns:
+      ds_coarse: The coarsened dataset.
+    """
+    return block_aggregate(ds, factors, func=func, weights=weights,
+                           min_valid_fraction=min_valid_fraction, boundary=boundary)
 
 # def xesmf_regrid(ds: xr.Dataset, target_grid: dict, method: str = "bilinear") -> xr.Dataset:
 #     """
@@ -76,6 +297,166 @@ def coarsen_resample(ds: xr.Dataset, factors: dict, boundary: str = "trim", func
 #     except Exception as e:
 #         raise RuntimeError(f"Error in xesmf_regrid: {e}")
 
+def infer_temporal_semantics(da: xr.DataArray) -> str:
+    """
+    Guesses whether a variable is a "flux", "state" or "storage" quantity
+    from its name, standard_name, long_name and cell_methods.
+    """
+    text = " ".join(str(x) for x in (da.name, da.attrs.get("standard_name", ""),
+                                     da.attrs.get("long_name", ""))).lower()
+    if "time: sum" in str(da.attrs.get("cell_methods", "")) or any(h in text for h in _FLUX_HINTS):
+        return "flux"
+    if any(h in text for h in _STORAGE_HINTS):
+        return "storage"
+    if str(da.name).upper() in ("P", "ET", "PET", "Q", "R"):
+        return "flux"
+    return "state"
+
+def _temporal_bins(times: pd.DatetimeIndex, freq: str) -> tuple:
+    """
+    Computes output periods and their positions on the input time axis.
+
+    Returns:
+        (labels, starts, counts, expected): period start labels, index of the
+        first input step in each period, number of input steps per period and
+        the number of steps a complete period would have
+    """
+    positions = pd.Series(np.arange(times.size), index=times)
+    grouped = positions.resample(freq, label="left", closed="left")
+    first = grouped.min()
+    counts = grouped.count().to_numpy()
+    labels = pd.DatetimeIndex(first.index)
+    ends = labels + pd.tseries.frequencies.to_offset(freq)
+
+    steps = np.diff(times.values).astype("timedelta64[ns]").astype(np.int64)
+    native = float(np.median(steps)) if steps.size else 1.0
+    expected = np.maximum(1, np.rint((ends - labels).values.astype("timedelta64[ns]").astype(np.int64) / native))
+    starts = np.nan_to_num(first.to_numpy(dtype=float), nan=-1).astype(np.int64)
+    return labels, starts, counts, expected.astype(np.int64)
+
+def _reduce_periods(values: np.ndarray, starts: np.ndarray, counts: np.ndarray, expected: np.ndarray,
+                    semantics: str, min_coverage: float) -> np.ndarray:
+    """
+    Reduces consecutive runs of axis 0 into periods with np.*.reduceat.
+
+    `starts` are relative to `values`; empty periods (count 0) become NaN.
+    """
+    out = np.full((starts.size,) + values.shape[1:], np.nan)
+    full = counts > 0
+    if not full.any():
+        return out
+    idx = starts[full]
+    valid = ~np.isnan(values)
+    n_valid = np.add.reduceat(valid, idx, axis=0, dtype=np.float64)
+    shape = (-1,) + (1,) * (values.ndim - 1)
+    exp = expected[full].reshape(shape).astype(np.float64)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if semantics == "point":
+            steps = np.arange(values.shape[0]).reshape(shape)
+            last = np.maximum.reduceat(np.where(valid, steps, -1), idx, axis=0)
+            result = np.take_along_axis(values, np.maximum(last, 0), axis=0)
+        else:
+            total = np.add.reduceat(np.where(valid, values, 0.0), idx, axis=0)
+            mean = total / n_valid
+            # Partial periods are scaled up from the observed mean
+            result = mean * exp if semantics == "sum" else mean
+    coverage = n_valid / exp
+    out[full] = np.where((n_valid > 0) & (coverage >= min_coverage), result, np.nan)
+    return out
+
+@instrument()
+def temporal_resample(ds: xr.Dataset, freq: str = "MS", semantics: dict = None, min_coverage: float = 0.0,
+                      dim: str = "time", chunk_steps: int = 366) -> xr.Dataset:
+    """
+    Aggregates a dataset to a coarser time step using per-variable semantics.
+
+    Fluxes are accumulated over each period, states are averaged and storages
+    take the last valid value. Period boundaries are computed once and every
+    period is reduced with np.*.reduceat; the input is read in chunks of whole
+    periods, so the result is a lazy dask-backed dataset that is computed
+    chunk by chunk when written with to_netcdf().
+
+    Parameters:
+      ds: xarray.Dataset with a datetime time coordinate.
+      freq: Pandas frequency of the output, e.g. "MS" (monthly), "QS-DEC"
+            (seasonal), "YS" (yearly).
+      semantics: {variable: "flux" | "state" | "storage"}; variables not
+                 listed are inferred with infer_temporal_semantics().
+      min_coverage: Minimum fraction (0–1) of a period's expected time steps
+                    that must hold valid data; otherwise the result is NaN.
+                    Flux sums of partial periods are scaled to the full period.
+      dim: Time dimension name.
+      chunk_steps: Approximate number of input steps read per chunk.
+
+    Returns:
+      ds_resampled: Lazily aggregated dataset labelled with period starts.
+    """
+    import dask
+    import dask.array as dsa
+
+    if dim not in ds.dims:
+        raise ValueError(f"Dimension '{dim}' not found in dataset")
+    semantics = dict(semantics or {})
+    for var, kind in semantics.items():
+        if kind not in TEMPORAL_SEMANTICS:
+            raise ValueError(f"Unknown semantics '{kind}' for '{var}'; use flux, state or storage")
+
+    try:
+        if not ds.indexes[dim].is_monotonic_increasing:
+            ds = ds.sortby(dim)
+        times = pd.DatetimeIndex(ds.indexes[dim])
+        labels, starts, counts, expected = _temporal_bins(times, freq)
+
+        # Group whole periods into chunks of roughly chunk_steps input steps
+        groups, current, size = [], [], 0
+        for b, c in enumerate(counts):
+            if current and size + c > chunk_steps:
+                groups.append(current)
+                current, size = [], 0
+            current.append(b)
+            size += c
+        if current:
+            groups.append(current)
+
+        out = xr.Dataset(attrs=ds.attrs)
+        for var, da in ds.data_vars.items():
+            if dim not in da.dims:
+                out[var] = da
+                continue
+            kind = semantics.get(var) or infer_temporal_semantics(da)
+            reduction = TEMPORAL_SEMANTICS[kind]
+            da = da.transpose(dim, *[d for d in da.dims if d != dim])
+            rest = da.shape[1:]
+
+            pieces = []
+            for group in groups:
+                g = np.asarray(group)
+                filled = g[counts[g] > 0]
+                if filled.size:
+                    lo = starts[filled[0]]
+                    hi = starts[filled[-1]] + counts[filled[-1]]
+                    local = np.where(counts[g] > 0, starts[g] - lo, 0)
+                    task = dask.delayed(_reduce_periods)(
+                        dask.delayed(lambda a, b, _da=da: _da.isel({dim: slice(a, b)}).values.astype(np.float64))(lo, hi),
+                        local, counts[g], expected[g], reduction, min_coverage
+                    )
+                    pieces.append(dsa.from_delayed(task, shape=(g.size,) + rest, dtype=np.float64))
+                else:
+                    pieces.append(dsa.full((g.size,) + rest, np.nan))
+
+            result = xr.DataArray(dsa.concatenate(pieces, axis=0), dims=da.dims,
+                                  coords={d: da[d] for d in da.dims[1:] if d in da.coords},
+                                  attrs=dict(da.attrs))
+            result.attrs["cell_methods"] = f"{dim}: {reduction}"
+            out[var] = result.transpose(*ds[var].dims)
+
+        out = out.assign_coords({dim: labels.values})
+        out[dim].attrs = {"long_name": f"start of {freq} period"}
+        return out
+    except Exception as e:
+        raise RuntimeError(f"Error in temporal_resample: {e}")
+
 def groupby_resample(ds: xr.Dataset, dim: str = "time", group_freq: str = "YS") -> dict:
     """
     Splits the dataset by grouping a coordinate based on a frequency.
@@ -102,6 +483,7 @@ def groupby_resample(ds: xr.Dataset, dim: str = "time", group_freq: str = "YS")
     except Exception as e:
         raise RuntimeError(f"Error in groupby_resample: {e}")
 
+@instrument()
 def create_zip_from_datasets(datasets: list, base_filename: str = "split_", suffix: str = ".nc") -> bytes:
     """
     Saves each dataset in the list to a temporary NetCDF file, compresses them into a ZIP archive, and returns the ZIP archive as bytes.
@@ -1,6 +1,7 @@
 import streamlit as st
 import xarray as xr
 import pandas as pd
+from utils.instrumentation import track
 
 def interactive_save_netcdf(df: pd.DataFrame, default_filename="output.nc"):
     st.subheader("💾 Save as NetCDF")
@@ -77,7 +78,8 @@ def interactive_save_netcdf(df: pd.DataFrame, default_filename="output.nc"):
 
             # Save to disk
             save_path = f"./{default_filename}"
-            ds.to_netcdf(save_path)
+            with track("to_netcdf"):
+                ds.to_netcdf(save_path)
 
             with open(save_path, "rb") as f:
                 st.success("✅ NetCDF file saved successfully!")
@@ -1,30 +1,31 @@
 import xarray as xr
 import pandas as pd
 import numpy as np
+from utils.reduction_utils import spatial_mean, spatial_mean_series
 
-def prepare_seasonal_df(ds: xr.Dataset, variable: str) -> pd.DataFrame:
+def prepare_seasonal_df(ds, variable: str) -> pd.DataFrame:
     """
     Prepares time series data for seasonal analysis.
 
     Parameters:
-        ds (xr.Dataset): Input dataset with time dimension
+        ds (xr.Dataset or str): Input dataset with time dimension, or the
+            path of a NetCDF file (its series is then read once and cached)
         variable (str): Variable name to analyze
 
     Returns:
         pd.DataFrame: Processed data with time, value, month, and year columns
     """
     try:
-        # Process time dimension
-        time = pd.to_datetime(ds["time"].values)
-
-        # Average over spatial dimensions
-        dims_to_average = [dim for dim in ds[variable].dims if dim != "time"]
-        values = ds[variable].mean(dim=dims_to_average).values
+        # Area-weighted average over spatial dimensions
+        if isinstance(ds, str):
+            series = spatial_mean_series(ds, variable)
+        else:
+            series = spatial_mean(ds[variable])
 
         # Create and process DataFrame
         df = pd.DataFrame({
-            "time": time,
-            "value": values
+            "time": series.index,
+            "value": series.values
         }).dropna()
 
         # Extract temporal components
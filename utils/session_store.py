@@ -0,0 +1,275 @@
+# utils/session_store.py
+
+import os
+import sys
+import time
+import shutil
+import pickle
+import tempfile
+import threading
+import weakref
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+import streamlit as st
+
+from utils.instrumentation import track
+
+SPILL_DIR = os.environ.get("WATCYCLE_SPILL_DIR", os.path.join(tempfile.gettempdir(), "watcycle_spill"))
+SESSION_BUDGET_BYTES = int(os.environ.get("WATCYCLE_SESSION_BUDGET_MB", "512")) * 1024 * 1024
+GLOBAL_BUDGET_BYTES = int(os.environ.get("WATCYCLE_GLOBAL_BUDGET_MB", "4096")) * 1024 * 1024
+
+_lock = threading.RLock()
+_slots = weakref.WeakSet()
+_stats = {"spills": 0, "reloads": 0, "spilled_bytes": 0, "reloaded_bytes": 0, "spill_seconds": 0.0,
+          "reload_seconds": 0.0, "spill_errors": 0}
+
+def estimate_nbytes(obj) -> int:
+    """
+    Approximates the memory an object pins in RAM.
+
+    Only in-memory data counts: lazily opened or dask-backed dataset
+    variables cost (almost) nothing until they are loaded.
+    """
+    if isinstance(obj, xr.DataArray):
+        obj = obj.to_dataset(name=obj.name or "value")
+    if isinstance(obj, xr.Dataset):
+        return int(sum(v.nbytes for v in obj.variables.values() if v._in_memory))
+    if isinstance(obj, pd.DataFrame) and hasattr(obj, "geometry"):
+        import shapely
+        n_coords = int(shapely.get_num_coordinates(obj.geometry.values).sum())
+        return int(obj.drop(columns=obj.geometry.name).memory_usage(deep=True).sum()) + n_coords * 16
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        usage = obj.memory_usage(deep=True)
+        return int(usage.sum() if isinstance(obj, pd.DataFrame) else usage)
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes)
+    if isinstance(obj, (bytes, bytearray)):
+        return len(obj)
+    return sys.getsizeof(obj)
+
+def _session_id() -> str:
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else "default"
+
+def _remove_file(path: str) -> None:
+    if path and os.path.exists(path):
+        shutil.rmtree(path, ignore_errors=True) if os.path.isdir(path) else os.remove(path)
+
+def _write_spill(obj, base: str) -> str:
+    """Writes obj in its natural format (NetCDF, (Geo)Parquet, .npy or pickle) and returns the path."""
+    if isinstance(obj, (xr.Dataset, xr.DataArray)):
+        path = base + ".nc"
+        obj.to_netcdf(path)
+    elif isinstance(obj, pd.DataFrame):
+        path = base + ".parquet"
+        obj.to_parquet(path)  # GeoDataFrames are written as GeoParquet
+    elif isinstance(obj, np.ndarray) and obj.dtype != object:
+        path = base + ".npy"
+        np.save(path, obj)
+    else:
+        path = base + ".pkl"
+        with open(path, "wb") as f:
+            pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return path
+
+class _Slot:
+    """
+    Holds one session object, either in memory or spilled to disk.
+
+    The slot itself is stored in st.session_state, so it (and its spill
+    file) disappears with the session.
+    """
+
+    def __init__(self, key: str, session_id: str, obj):
+        self.key = key
+        self.session_id = session_id
+        self.value = obj
+        self.kind = type(obj).__name__
+        self.nbytes = estimate_nbytes(obj)
+        self.path = None
+        self.last_access = time.monotonic()
+        self.lock = threading.Lock()
+        self._finalizer = None
+
+    @property
+    def resident(self) -> bool:
+        return self.value is not None
+
+    def spill(self) -> int:
+        """Writes the value to disk and drops it from memory. Returns the bytes freed."""
+        with self.lock:
+            if self.value is None or self.nbytes == 0:
+                return 0
+            obj, freed = self.value, self.nbytes
+            os.makedirs(SPILL_DIR, exist_ok=True)
+            base = os.path.join(SPILL_DIR, f"{self.session_id}_{self.key}_{id(self):x}")
+            t0 = time.perf_counter()
+            with track("session_store.spill", key=self.key, nbytes=freed):
+                try:
+                    path = _write_spill(obj, base)
+                except Exception:
+                    # Unusual dtypes or attributes: fall back to pickle
+                    path = base + ".pkl"
+                    with open(path, "wb") as f:
+                        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+            self.path = path
+            self.value = None
+            self._finalizer = weakref.finalize(self, _remove_file, path)
+            _stats["spills"] += 1
+            _stats["spilled_bytes"] += freed
+            _stats["spill_seconds"] += time.perf_counter() - t0
+            return freed
+
+    def load(self):
+        """Returns the value, reading it back from disk if it was spilled."""
+        with self.lock:
+            self.last_access = time.monotonic()
+            if self.value is not None:
+                return self.value
+            t0 = time.perf_counter()
+            with track("session_store.reload", key=self.key, nbytes=self.nbytes):
+                if self.path.endswith(".nc"):
+                    # Opened lazily: values are read from the spill file on demand
+                    value = xr.open_dataset(self.path)
+                    if self.kind == "DataArray":
+                        value = value[list(value.data_vars)[0]]
+                elif self.path.endswith(".parquet"):
+                    if self.kind == "GeoDataFrame":
+                        import geopandas as gpd
+                        value = gpd.read_parquet(self.path)
+                    else:
+                        value = pd.read_parquet(self.path)
+                elif self.path.endswith(".npy"):
+                    value = np.load(self.path)
+                else:
+                    with open(self.path, "rb") as f:
+                        value = pickle.load(f)
+            self.value = value
+            self.nbytes = estimate_nbytes(value)
+            _stats["reloads"] += 1
+            _stats["reloaded_bytes"] += self.nbytes
+            _stats["reload_seconds"] += time.perf_counter() - t0
+            return value
+
+def _live_slots() -> list:
+    with _lock:
+        return [s for s in list(_slots) if s.resident]
+
+def enforce_budgets(protect=None) -> int:
+    """
+    Spills least-recently-used objects until every session and the whole
+    process fit their budgets.
+
+    Args:
+        protect: A slot that must stay in memory (the one just accessed)
+
+    Returns:
+        Number of bytes freed
+    """
+    freed = 0
+    with _lock:
+        resident = sorted((s for s in _live_slots() if s is not protect), key=lambda s: s.last_access)
+        per_session = {}
+        for s in _live_slots():
+            per_session[s.session_id] = per_session.get(s.session_id, 0) + s.nbytes
+        total = sum(per_session.values())
+
+        for s in resident:
+            over_session = per_session[s.session_id] > SESSION_BUDGET_BYTES
+            if not over_session and total <= GLOBAL_BUDGET_BYTES:
+                continue
+            try:
+                n = s.spill()
+            except Exception:
+                _stats["spill_errors"] += 1
+                continue
+            per_session[s.session_id] -= n
+            total -= n
+            freed += n
+    return freed
+
+def put_session_object(key: str, obj) -> None:
+    """
+    Stores a large object in st.session_state under the memory governor.
+
+    Use get_session_object() to read it back; `key in st.session_state`
+    keeps working as before.
+    """
+    old = st.session_state.get(key)
+    if isinstance(old, _Slot):
+        if old.value is obj:  # same object stored again on a rerun
+            old.last_access = time.monotonic()
+            old.nbytes = estimate_nbytes(obj)
+            enforce_budgets(protect=old)
+            return
+        if old._finalizer is not None:
+            old._finalizer()
+    slot = _Slot(key, _session_id(), obj)
+    with _lock:
+        _slots.add(slot)
+    st.session_state[key] = slot
+    enforce_budgets(protect=slot)
+
+def get_session_object(key: str, default=None):
+    """Returns a governed session object, rehydrating it from disk if it was spilled."""
+    slot = st.session_state.get(key)
+    if slot is None:
+        return default
+    if not isinstance(slot, _Slot):
+        return slot
+    value = slot.load()
+    enforce_budgets(protect=slot)
+    return value
+
+def drop_session_object(key: str) -> None:
+    """Removes a governed object from the session and deletes its spill file."""
+    slot = st.session_state.pop(key, None)
+    if isinstance(slot, _Slot) and slot._finalizer is not None:
+        slot._finalizer()
+
+def governor_stats() -> dict:
+    """Returns spill/reload counters and current resident and spilled bytes."""
+    with _lock:
+        slots = list(_slots)
+        stats = dict(_stats)
+    stats["resident_bytes"] = sum(s.nbytes for s in slots if s.resident)
+    stats["spilled_objects"] = sum(not s.resident for s in slots)
+    stats["sessions"] = len({s.session_id for s in slots})
+    stats["session_budget_bytes"] = SESSION_BUDGET_BYTES
+    stats["global_budget_bytes"] = GLOBAL_BUDGET_BYTES
+    return stats
+
+def governor_entries() -> pd.DataFrame:
+    """One row per governed object across all sessions."""
+    with _lock:
+        slots = list(_slots)
+    now = time.monotonic()
+    return pd.DataFrame([{
+        "session": s.session_id[:8],
+        "key": s.key,
+        "type": s.kind,
+        "size_mb": s.nbytes / 1e6,
+        "state": "memory" if s.resident else "disk",
+        "idle_s": now - s.last_access,
+    } for s in slots], columns=["session", "key", "type", "size_mb", "state", "idle_s"])
+
+def export_governor_prometheus() -> str:
+    """Renders the governor counters and gauges in the Prometheus text format."""
+    stats = governor_stats()
+    metrics = [
+        ("watcycle_session_spills_total", "counter", "Objects spilled to disk.", stats["spills"]),
+        ("watcycle_session_reloads_total", "counter", "Spilled objects read back.", stats["reloads"]),
+        ("watcycle_session_spilled_bytes_total", "counter", "Bytes spilled to disk.", stats["spilled_bytes"]),
+        ("watcycle_session_reloaded_bytes_total", "counter", "Bytes read back from disk.", stats["reloaded_bytes"]),
+        ("watcycle_session_spill_errors_total", "counter", "Spills that failed.", stats["spill_errors"]),
+        ("watcycle_session_resident_bytes", "gauge", "Governed bytes held in memory.", stats["resident_bytes"]),
+        ("watcycle_session_spilled_objects", "gauge", "Governed objects currently on disk.", stats["spilled_objects"]),
+    ]
+    lines = []
+    for name, kind, help_text, value in metrics:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {value}"]
+    return "\n".join(lines) + "\n"
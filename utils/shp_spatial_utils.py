@@ -1,7 +1,12 @@
 import numpy as np
 import pandas as pd
 from scipy.interpolate import griddata
-from shapely.geometry import Point
+
+from utils.geospatial_utils import compute_cell_edges, subset_to_geometries
+from utils.geometry_store import prepare_geometry
+from utils.instrumentation import instrument
+
+_EDGE_CACHE = {}
 
 def get_time_strings(ds):
     """
@@ -31,14 +36,49 @@ def extract_df_average(ds, var_name):
     df = da.to_dataframe().reset_index()[["lat","lon", var_name]].dropna()
     return df
 
+def extract_region_dataarray(ds, var_name, geoms, time_str=None):
+    """
+    Read only the shapefile's bounding-box hyperslab of var_name and mask
+    cells outside the geometries.
+
+    With time_str, selects that date; otherwise returns the time-mean of the
+    hyperslab. Returns an xarray.DataArray on the native (lat, lon) grid.
+    """
+    da, _ = subset_to_geometries(ds[var_name], geoms)
+    if time_str is None:
+        return da.mean(dim="time")
+    idx = get_time_strings(ds).index(time_str)
+    return da.isel(time=idx)
+
+def region_to_dataframe(da):
+    """
+    Flatten a masked regional DataArray into ['lat','lon', name], dropping NaNs.
+    """
+    return da.to_dataframe().reset_index()[["lat", "lon", da.name]].dropna()
+
+def get_grid_edges(da):
+    """
+    Return (lon_edges, lat_edges) for a DataArray's native grid, computed
+    once per distinct grid.
+    """
+    key = (da["lon"].values.tobytes(), da["lat"].values.tobytes())
+    if _EDGE_CACHE.get("key") != key:
+        _EDGE_CACHE["key"] = key
+        _EDGE_CACHE["edges"] = (compute_cell_edges(da["lon"].values), compute_cell_edges(da["lat"].values))
+    return _EDGE_CACHE["edges"]
+
+@instrument()
 def interpolate_grid_data(df, shapefile, grid_resolution, method):
     """
     Given a DataFrame with ['lat','lon',value], interpolate onto a regular grid
     within the shapefile bounds, mask outside the polygon, and return
     (grid_lons, grid_lats, grid_values).
+
+    `shapefile` may be a GeoDataFrame or a PreparedGeometry.
     """
+    prepared = prepare_geometry(shapefile)
     # bounding box
-    minx, miny, maxx, maxy = shapefile.total_bounds
+    minx, miny, maxx, maxy = prepared.bounds
     # create regular grid
     grid_lons = np.linspace(minx, maxx, grid_resolution)
     grid_lats = np.linspace(miny, maxy, grid_resolution)
@@ -52,10 +92,8 @@ def interpolate_grid_data(df, shapefile, grid_resolution, method):
         method=method,
     )
 
-    # mask outside shapefile
-    union = shapefile.unary_union
-    pts = np.vstack([grid_lons.ravel(), grid_lats.ravel()]).T
-    mask = np.array([union.contains(Point(x, y)) for x, y in pts]).reshape(grid_lons.shape)
+    # mask outside shapefile (prepared union, built once per shapefile)
+    mask = prepared.contains_xy(grid_lons, grid_lats)
     values[~mask] = np.nan
 
     return grid_lons, grid_lats, values
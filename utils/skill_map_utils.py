@@ -0,0 +1,233 @@
+# utils/skill_map_utils.py
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import xarray as xr
+from scipy.stats import rankdata
+
+from utils.instrumentation import instrument
+
+SKILL_CHUNK_MB = int(os.environ.get("WATCYCLE_SKILL_CHUNK_MB", "128"))
+# name: (long name, units, colormap, vmin, vmax); units None = units of the reference
+SKILL_METRICS = {
+    "kge": ("Kling-Gupta efficiency", "1", "RdYlBu", -1.0, 1.0),
+    "kge_alpha": ("KGE variability ratio (std model / std reference)", "1", "RdBu_r", 0.0, 2.0),
+    "kge_beta": ("KGE bias ratio (mean model / mean reference)", "1", "RdBu_r", 0.0, 2.0),
+    "nse": ("Nash-Sutcliffe efficiency", "1", "RdYlBu", -1.0, 1.0),
+    "pbias": ("Percent bias", "%", "BrBG", -100.0, 100.0),
+    "rmse": ("Root mean square error", None, "viridis", None, None),
+    "pearson": ("Pearson correlation (KGE r component)", "1", "RdBu_r", -1.0, 1.0),
+    "spearman": ("Spearman rank correlation", "1", "RdBu_r", -1.0, 1.0),
+}
+# Float64 arrays of the chunk's size alive at once while the metrics are computed
+_WORK_ARRAYS = 12
+
+def skill_metrics(obs, sim, metrics=None, min_count: int = 3) -> dict:
+    """
+    Skill metrics of many series at once, vectorized along time.
+
+    Only time steps where both series are valid count. KGE follows Gupta et
+    al. (2009) with population standard deviations; pbias is positive when
+    the model is too high.
+
+    Args:
+        obs: (time, cells) reference values
+        sim: (time, cells) model values
+        metrics: Keys of SKILL_METRICS (default: all)
+        min_count: Cells with fewer valid pairs are NaN
+
+    Returns:
+        {metric: (cells,) array} plus 'count', the valid pairs per cell
+    """
+    metrics = list(SKILL_METRICS) if metrics is None else list(metrics)
+    obs = np.asarray(obs, dtype=np.float64)
+    sim = np.asarray(sim, dtype=np.float64)
+    valid = np.isfinite(obs) & np.isfinite(sim)
+    n = valid.sum(axis=0)
+    enough = n >= max(min_count, 2)
+    if not enough.all():
+        # Skip masked cells (e.g. oceans) entirely
+        active = np.flatnonzero(enough)
+        out = {name: np.full(n.shape, np.nan) for name in metrics}
+        if active.size:
+            part = skill_metrics(obs[:, active], sim[:, active], metrics, min_count)
+            for name in metrics:
+                out[name][active] = part[name]
+        out["count"] = n
+        return out
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        o = np.where(valid, obs, 0.0)
+        s = np.where(valid, sim, 0.0)
+        sum_o, sum_s = o.sum(axis=0), s.sum(axis=0)
+        mean_o, mean_s = sum_o / n, sum_s / n
+        do = np.where(valid, obs - mean_o, 0.0)
+        ds = np.where(valid, sim - mean_s, 0.0)
+        var_o, var_s = (do * do).sum(axis=0), (ds * ds).sum(axis=0)
+        r = (do * ds).sum(axis=0) / np.sqrt(var_o * var_s)
+        del o, s, do, ds
+        err = np.where(valid, sim - obs, 0.0)
+        sse = (err * err).sum(axis=0)
+
+        out = {"count": n}
+        alpha = np.sqrt(var_s / var_o)
+        beta = mean_s / mean_o
+        if "kge" in metrics:
+            out["kge"] = 1 - np.sqrt((r - 1) ** 2 + (alpha - 1) ** 2 + (beta - 1) ** 2)
+        if "kge_alpha" in metrics:
+            out["kge_alpha"] = alpha
+        if "kge_beta" in metrics:
+            out["kge_beta"] = beta
+        if "nse" in metrics:
+            out["nse"] = 1 - sse / var_o
+        if "pbias" in metrics:
+            out["pbias"] = 100 * err.sum(axis=0) / sum_o
+        if "rmse" in metrics:
+            out["rmse"] = np.sqrt(sse / n)
+        if "pearson" in metrics:
+            out["pearson"] = r
+        if "spearman" in metrics:
+            ro = rankdata(np.where(valid, obs, np.nan), axis=0, nan_policy="omit")
+            rs = rankdata(np.where(valid, sim, np.nan), axis=0, nan_policy="omit")
+            # Average ranks of n values always have mean (n + 1) / 2
+            ro = np.where(valid, ro - (n + 1) / 2, 0.0)
+            rs = np.where(valid, rs - (n + 1) / 2, 0.0)
+            out["spearman"] = (ro * rs).sum(axis=0) / np.sqrt((ro * ro).sum(axis=0) * (rs * rs).sum(axis=0))
+
+    for name in metrics:
+        out[name] = np.where(enough & np.isfinite(out[name]), out[name], np.nan)
+    return out
+
+def _open_aligned(job: dict) -> tuple:
+    """Opens reference and model lazily and aligns them on their shared coordinates."""
+    ref_path, ref_var = job["reference"]
+    model_path, model_var = job["model"]
+    ref_ds = xr.open_dataset(ref_path)
+    model_ds = xr.open_dataset(model_path)
+    ref, model = ref_ds[ref_var], model_ds[model_var]
+    if "time" not in ref.dims or "time" not in model.dims:
+        raise ValueError("Reference and model need a time dimension.")
+    if set(ref.dims) != set(model.dims):
+        raise ValueError(f"Dimensions {model.dims} of '{job['label']}' differ from the reference {ref.dims}.")
+    ref = ref.transpose("time", ...)
+    model = model.transpose(*ref.dims)
+    aligned_ref, aligned_model = xr.align(ref, model, join="inner")
+    spatial = ref.dims[1:]
+    if any(aligned_ref.sizes[d] != ref.sizes[d] for d in spatial):
+        raise ValueError(f"The grid of '{job['label']}' differs from the reference; regrid it first.")
+    if aligned_ref.sizes["time"] == 0:
+        raise ValueError(f"'{job['label']}' shares no time steps with the reference.")
+    return (ref_ds, model_ds), aligned_ref, aligned_model
+
+def _skill_job(job: dict) -> dict:
+    """All metric maps of one model, read in chunks along the first spatial dimension."""
+    datasets, ref, model = _open_aligned(job)
+    try:
+        n_time = ref.sizes["time"]
+        spatial = ref.dims[1:]
+        shape = tuple(ref.sizes[d] for d in spatial)
+        if not spatial:
+            shape, rows = (), 1
+        else:
+            row_cells = int(np.prod(shape[1:], dtype=np.int64))
+            budget = job["chunk_mb"] * 1024 * 1024 // (8 * _WORK_ARRAYS)
+            rows = max(1, int(budget // max(n_time * row_cells, 1)))
+        out = {name: np.full(shape, np.nan) for name in job["metrics"]}
+        out["count"] = np.zeros(shape, dtype=np.int64)
+
+        n_rows = shape[0] if spatial else 1
+        for start in range(0, n_rows, rows):
+            sl = slice(start, min(start + rows, n_rows))
+            index = {spatial[0]: sl} if spatial else {}
+            obs = np.asarray(ref.isel(index).values, dtype=np.float64)
+            sim = np.asarray(model.isel(index).values, dtype=np.float64)
+            block_shape = obs.shape[1:]
+            result = skill_metrics(obs.reshape(n_time, -1), sim.reshape(n_time, -1),
+                                   metrics=job["metrics"], min_count=job["min_count"])
+            for name, values in result.items():
+                if spatial:
+                    out[name][sl] = values.reshape(block_shape)
+                else:
+                    out[name] = values.reshape(())
+        times = ref["time"].values
+        return {"maps": out, "start": times[0], "end": times[-1], "n_time": n_time}
+    finally:
+        for ds in datasets:
+            ds.close()
+
+@instrument()
+def skill_maps(reference: tuple, models: dict, metrics=None, min_count: int = 3,
+               chunk_mb: int = SKILL_CHUNK_MB, max_workers: int = 1) -> xr.Dataset:
+    """
+    Pixel-wise skill of N models against a reference.
+
+    Each model is a separate job: reference and model are opened lazily,
+    aligned on the time steps they share, and read in chunks along the first
+    spatial dimension, with every metric computed at once along time. Jobs
+    run in parallel worker processes when `max_workers` > 1. The models must
+    be on the reference grid.
+
+    Args:
+        reference: (path, variable) of the reference
+        models: {label: (path, variable)}
+        metrics: Keys of SKILL_METRICS (default: all)
+        min_count: Minimum valid time steps per cell
+        chunk_mb: Approximate working memory of one spatial chunk
+        max_workers: Processes for several models at once
+
+    Returns:
+        xr.Dataset with one (model, <spatial dims>) variable per metric plus
+        'count', the number of valid pairs per cell
+    """
+    try:
+        metrics = list(SKILL_METRICS) if metrics is None else list(metrics)
+        unknown = [m for m in metrics if m not in SKILL_METRICS]
+        if unknown:
+            raise ValueError(f"Unknown metric(s) {', '.join(unknown)}; use {', '.join(SKILL_METRICS)}.")
+        if not models:
+            raise ValueError("No models given.")
+        labels = list(models)
+        jobs = [{"reference": tuple(reference), "model": tuple(models[label]), "label": label, "metrics": metrics,
+                 "min_count": min_count, "chunk_mb": chunk_mb} for label in labels]
+        if max_workers > 1 and len(jobs) > 1:
+            with ProcessPoolExecutor(max_workers=min(max_workers, len(jobs))) as pool:
+                results = list(pool.map(_skill_job, jobs))
+        else:
+            results = [_skill_job(job) for job in jobs]
+
+        ref_path, ref_var = reference
+        with xr.open_dataset(ref_path) as ref_ds:
+            ref = ref_ds[ref_var].transpose("time", ...)
+            spatial = ref.dims[1:]
+            coords = {d: ref[d].values for d in spatial if d in ref.coords}
+            units = ref.attrs.get("units", "")
+
+        data_vars = {}
+        for name in metrics + ["count"]:
+            if name == "count":
+                attrs = {"long_name": "Number of valid time steps", "units": "1"}
+            else:
+                long_name, metric_units, *_ = SKILL_METRICS[name]
+                attrs = {"long_name": long_name, "units": units if metric_units is None else metric_units}
+            values = np.stack([r["maps"][name] for r in results])
+            data_vars[name] = (("model",) + spatial, values, attrs)
+        ds = xr.Dataset(data_vars, coords={"model": labels, **coords})
+        ds["start"] = ("model", np.array([str(r["start"])[:10] for r in results]))
+        ds["end"] = ("model", np.array([str(r["end"])[:10] for r in results]))
+        ds.attrs.update({"title": f"Skill of models against {os.path.basename(ref_path)}:{ref_var}",
+                         "reference": f"{ref_path}:{ref_var}",
+                         "models": ", ".join(f"{label}={path}:{var}" for label, (path, var) in models.items())})
+        return ds
+    except Exception as e:
+        raise RuntimeError(f"Error computing skill maps: {e}")
+
+def save_skill_maps(ds: xr.Dataset, path: str) -> str:
+    """Writes skill maps to a compressed NetCDF file and returns its path."""
+    try:
+        encoding = {name: {"zlib": True, "complevel": 4} for name in ds.data_vars if ds[name].dtype.kind == "f"}
+        ds.to_netcdf(path, encoding=encoding)
+        return path
+    except Exception as e:
+        raise RuntimeError(f"Error saving skill maps: {e}")
@@ -5,6 +5,7 @@ import zipfile
 from io import BytesIO
 import numpy as np
 import pandas as pd
+from utils.instrumentation import instrument
 
 def load_dataset(file_path: str) -> xr.Dataset:
     """
@@ -147,6 +148,7 @@ def split_netcdf_by_group(ds: xr.Dataset, dim: str = 'time', group_freq: str = '
     except Exception as e:
         raise RuntimeError(f"Error in group-based splitting along '{dim}': {e}")
 
+@instrument()
 def create_zip_from_datasets(datasets: list, base_filename: str = "split_", suffix: str = ".nc") -> bytes:
     """
     Packages multiple datasets into a ZIP archive for download.
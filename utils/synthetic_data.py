@@ -0,0 +1,319 @@
+# utils/synthetic_data.py
+
+import os
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+SYNTHETIC_VARIABLES = {
+    "P":   {"long_name": "Precipitation", "standard_name": "precipitation_amount",
+            "units": "mm", "cell_methods": "time: sum"},
+    "ET":  {"long_name": "Evapotranspiration", "standard_name": "water_evapotranspiration_amount",
+            "units": "mm", "cell_methods": "time: sum"},
+    "Q":   {"long_name": "Total runoff", "standard_name": "runoff_amount",
+            "units": "mm", "cell_methods": "time: sum"},
+    "TWS": {"long_name": "Terrestrial water storage anomaly", "units": "mm", "cell_methods": "time: point"},
+    "dS":  {"long_name": "Change in terrestrial water storage over the time step", "units": "mm",
+            "cell_methods": "time: sum"},
+}
+DEFAULT_VARIABLES = ("P", "ET", "Q", "TWS")
+
+RUNOFF_RATIO = 0.25        # Q = RUNOFF_RATIO * P
+ET_NOISE_SIGMA = 0.15      # lognormal, mean 1
+TWS_NOISE = 0.03           # uniform ± fraction of the local climatology
+
+def synthetic_grid(res: float) -> tuple:
+    """Returns cell-centre latitudes (south to north) and longitudes of a global grid."""
+    lat = np.arange(-90 + res / 2, 90, res)
+    lon = np.arange(-180 + res / 2, 180, res)
+    return lat, lon
+
+def synthetic_land_mask(lat: np.ndarray, lon: np.ndarray, land_fraction: float = 0.3, seed: int = 0) -> np.ndarray:
+    """
+    Returns a boolean (lat, lon) land mask covering about `land_fraction` of the cells.
+
+    Continents are the high values of a few random low-order waves, so the
+    mask is smooth and the same at every resolution for a given seed.
+    """
+    rng = np.random.default_rng(seed)
+    la, lo = np.deg2rad(lat)[:, None], np.deg2rad(lon)[None, :]
+    field = np.zeros((lat.size, lon.size))
+    for k in range(1, 5):
+        a, b, p1, p2 = rng.normal(size=4)
+        field += (a * np.sin(k * lo + p1) * np.cos(la) + b * np.sin(k * la + p2)) / k
+    return field > np.quantile(field, 1 - land_fraction)
+
+def _step_days(times: pd.DatetimeIndex, freq: str) -> np.ndarray:
+    """Length of each time step in days (the period that starts at each timestamp)."""
+    ends = times + pd.tseries.frequencies.to_offset(freq)
+    return ((ends - times) / pd.Timedelta(days=1)).values
+
+def _climatology(lat: np.ndarray) -> np.ndarray:
+    """Mean monthly ET-scale (mm per 30.44 days) as a function of latitude."""
+    return 40 + 120 * np.exp(-(lat / 25) ** 2)
+
+def _cp_factor(times: pd.DatetimeIndex, change_points: list) -> np.ndarray:
+    """Multiplicative ET level per time step after applying every change point."""
+    factor = np.ones(times.size)
+    for cp in change_points:
+        factor[times >= pd.Timestamp(cp["time"])] *= 1 + cp["shift"]
+    return factor
+
+def _time_terms(times: pd.DatetimeIndex, t0: pd.Timestamp) -> tuple:
+    """Seasonal phase (radians) and elapsed years of each timestamp."""
+    years = ((times - t0) / pd.Timedelta(days=365.25)).values
+    phase = 2 * np.pi * (times.dayofyear.values - 1) / 365.25
+    return phase, years
+
+def _fields(times: pd.DatetimeIndex, index: np.ndarray, lat: np.ndarray, land: np.ndarray, spec: dict,
+            noise: bool = True) -> dict:
+    """
+    Builds the requested variables for `times` at global step positions `index`.
+
+    The water budget closes exactly: ΔS is the difference of consecutive TWS
+    values and P = (ET + ΔS + imbalance) / (1 - runoff ratio), with Q the
+    runoff fraction of P. Noise is seeded by step position, so any step has
+    the same values in every file or chunk that contains it.
+    """
+    t0 = pd.Timestamp(spec["start"])
+    freq = spec["freq"]
+    prev = times - pd.tseries.frequencies.to_offset(freq)
+    clim = _climatology(lat)[None, :, None]
+    hemi = np.sign(lat)[None, :, None]
+    scale = (_step_days(times, freq) / 30.44)[:, None, None]
+
+    def tws_at(ts, idx):
+        phase, years = _time_terms(ts, t0)
+        value = (spec["tws_amplitude"] * clim * hemi * np.sin(phase[:, None, None] - 1.2)
+                 + spec["trends"]["TWS"] * years[:, None, None])
+        if noise:
+            jitter = np.stack([np.random.default_rng((spec["seed"], 1, int(i) + 1))
+                               .uniform(-TWS_NOISE, TWS_NOISE, size=land.shape) for i in idx])
+            value = value + jitter * clim * (_step_days(ts, freq) / 30.44)[:, None, None]
+        return value
+
+    tws = tws_at(times, index)
+    ds = tws - tws_at(prev, index - 1)
+
+    phase, years = _time_terms(times, t0)
+    et = (0.55 * clim * (1 + 0.3 * hemi * np.sin(phase[:, None, None] - 0.5)) * scale
+          * (1 + spec["trends"]["ET"] * years[:, None, None])
+          * _cp_factor(times, spec["change_points"])[:, None, None])
+    if noise:
+        sigma = ET_NOISE_SIGMA
+        et = et * np.stack([np.random.default_rng((spec["seed"], 2, int(i) + 1))
+                            .lognormal(-sigma ** 2 / 2, sigma, size=land.shape) for i in index])
+    p = (et + ds + spec["imbalance"] * scale) / (1 - RUNOFF_RATIO)
+    q = RUNOFF_RATIO * p
+
+    values = {"P": p, "ET": et, "Q": q, "TWS": tws, "dS": ds}
+    ocean = ~land[None, :, :]
+    return {name: np.where(ocean, np.nan, np.broadcast_to(values[name], (times.size,) + land.shape))
+            .astype("float32") for name in spec["variables"]}
+
+def _write_netcdf_file(job: dict) -> str:
+    """Writes one NetCDF-4 file `chunk_steps` time steps at a time."""
+    import netCDF4
+
+    spec, lat, lon, land = job["spec"], job["lat"], job["lon"], job["land"]
+    times = pd.DatetimeIndex(job["times"])
+    index = np.asarray(job["index"])
+    t0 = pd.Timestamp(spec["start"])
+    with netCDF4.Dataset(job["path"], "w", format="NETCDF4") as nc:
+        nc.createDimension("time", None)
+        nc.createDimension("lat", lat.size)
+        nc.createDimension("lon", lon.size)
+        tv = nc.createVariable("time", "f8", ("time",))
+        tv.units = f"hours since {t0:%Y-%m-%d %H:%M:%S}"
+        tv.calendar = "standard"
+        tv.axis = "T"
+        latv = nc.createVariable("lat", "f8", ("lat",))
+        latv[:] = lat
+        latv.units, latv.axis = "degrees_north", "Y"
+        lonv = nc.createVariable("lon", "f8", ("lon",))
+        lonv[:] = lon
+        lonv.units, lonv.axis = "degrees_east", "X"
+        for name in spec["variables"]:
+            v = nc.createVariable(name, "f4", ("time", "lat", "lon"), zlib=spec["complevel"] > 0,
+                                  complevel=max(spec["complevel"], 1), chunksizes=(1, lat.size, lon.size),
+                                  fill_value=np.float32(np.nan))
+            v.setncatts(SYNTHETIC_VARIABLES[name])
+        nc.title = "WATcycle synthetic hydrological dataset"
+        nc.source = f"utils.synthetic_data (seed={spec['seed']})"
+
+        step = spec["chunk_steps"]
+        for start in range(0, times.size, step):
+            block = times[start:start + step]
+            tv[start:start + block.size] = ((block - t0) / pd.Timedelta(hours=1)).values
+            for name, values in _fields(block, index[start:start + step], lat, land, spec).items():
+                nc[name][start:start + block.size] = values
+    return job["path"]
+
+def _write_zarr_store(job: dict) -> str:
+    """Writes one Zarr store, appending `chunk_steps` time steps at a time."""
+    import xarray as xr
+
+    try:
+        import zarr  # noqa: F401
+    except ImportError:
+        raise RuntimeError("Zarr output requires the 'zarr' package; install it or use fmt='netcdf'.")
+
+    spec, lat, lon, land = job["spec"], job["lat"], job["lon"], job["land"]
+    times = pd.DatetimeIndex(job["times"])
+    index = np.asarray(job["index"])
+    step = spec["chunk_steps"]
+    for start in range(0, times.size, step):
+        block = times[start:start + step]
+        fields = _fields(block, index[start:start + step], lat, land, spec)
+        ds = xr.Dataset({name: (("time", "lat", "lon"), values, SYNTHETIC_VARIABLES[name])
+                         for name, values in fields.items()},
+                        coords={"time": block, "lat": lat, "lon": lon})
+        if start == 0:
+            ds.attrs["title"] = "WATcycle synthetic hydrological dataset"
+            ds.to_zarr(job["path"], mode="w", encoding={n: {"chunks": (1, lat.size, lon.size)} for n in fields})
+        else:
+            ds.to_zarr(job["path"], append_dim="time")
+    return job["path"]
+
+def expected_area_means(times: pd.DatetimeIndex, lat: np.ndarray, land: np.ndarray, spec: dict) -> pd.DataFrame:
+    """
+    Noise-free, area-weighted land means of every variable at `times`.
+
+    Noise has zero mean (ET, TWS) or enters linearly (P, Q, ΔS), so these are
+    the expected basin-wide series the analysis tools should recover.
+    """
+    weights = np.cos(np.deg2rad(lat)) * land.sum(axis=1)
+    one_row = land.any(axis=1)[:, None]
+    index = np.arange(times.size)
+    fields = _fields(times, index, lat, one_row, {**spec, "variables": list(SYNTHETIC_VARIABLES)}, noise=False)
+    return pd.DataFrame({name: np.nansum(values[:, :, 0] * weights, axis=1) / weights.sum()
+                         for name, values in fields.items()}, index=times)
+
+def generate_synthetic_dataset(out_path: str, res: float = 1.0, start: str = "2000-01-01", periods: int = 120,
+                               freq: str = "MS", variables=DEFAULT_VARIABLES, land_fraction: float = 0.3,
+                               trends: dict = None, tws_amplitude: float = 0.3, change_points=0,
+                               change_point_shift: float = 0.2, missing_steps: int = 0, imbalance: float = 0.0,
+                               n_files: int = 1, overlap_steps: int = 0, fmt: str = "netcdf",
+                               chunk_steps: int = 12, complevel: int = 0, seed: int = 0,
+                               max_workers: int = None) -> dict:
+    """
+    Writes a synthetic P/ET/Q/TWS cube and returns its ground truth.
+
+    Fields have a latitude-dependent climatology, a seasonal cycle with
+    opposite phase in each hemisphere, linear trends, optional step changes
+    in the ET level (which carry through to P and Q), an ocean NaN mask and
+    noise. The water budget P - ET - Q - ΔS equals `imbalance` everywhere.
+    Data are generated and written `chunk_steps` steps at a time, and files
+    are written in parallel, so fixtures of many GB can be created with
+    bounded memory.
+
+    Args:
+        out_path: Output file (n_files=1) or directory (n_files > 1)
+        res: Grid resolution in degrees
+        start, periods, freq: Time axis (pandas date_range arguments)
+        variables: Any of 'P', 'ET', 'Q', 'TWS' and 'dS'
+        land_fraction: Share of cells that are land; the rest are NaN
+        trends: Per-variable trends; 'ET' is relative per year (0.01 = +1 %/yr),
+                'TWS' is mm per year. Defaults to {'ET': 0.01, 'TWS': -1.5}
+        tws_amplitude: Seasonal TWS amplitude as a fraction of the local climatology
+        change_points: Number of random ET level shifts, or a list of dates
+        change_point_shift: Relative size of each shift (sign alternates)
+        missing_steps: Number of time steps dropped at random from the output
+        imbalance: Budget residual P - ET - Q - ΔS in mm per 30.44 days
+        n_files: Split the record into this many files along time
+        overlap_steps: Steps shared by consecutive files (for merge testing)
+        fmt: 'netcdf' or 'zarr'
+        chunk_steps: Time steps generated and written per block
+        complevel: zlib level for NetCDF output (0 = uncompressed, fastest)
+        seed: Random seed; the same arguments always give identical data
+        max_workers: Processes used when writing several files
+
+    Returns:
+        Ground truth dict with 'files', 'times', 'missing_times',
+        'change_points', 'trends', 'imbalance', 'land_mask' (array) and
+        'expected' (DataFrame of noise-free land-mean series). A JSON copy
+        without the mask is written next to the output as *.truth.json.
+    """
+    unknown = set(variables) - set(SYNTHETIC_VARIABLES)
+    if unknown:
+        raise ValueError(f"Unknown variables: {', '.join(sorted(unknown))}")
+    if fmt not in ("netcdf", "zarr"):
+        raise ValueError("fmt must be 'netcdf' or 'zarr'")
+    if n_files < 1 or overlap_steps < 0:
+        raise ValueError("n_files must be >= 1 and overlap_steps >= 0")
+
+    rng = np.random.default_rng(seed)
+    times = pd.date_range(start, periods=periods, freq=freq)
+    lat, lon = synthetic_grid(res)
+    land = synthetic_land_mask(lat, lon, land_fraction, seed)
+
+    if isinstance(change_points, int):
+        candidates = np.arange(int(periods * 0.15), int(periods * 0.85))
+        picks = np.sort(rng.choice(candidates, size=min(change_points, candidates.size), replace=False)) \
+            if change_points and candidates.size else []
+        change_points = [times[i] for i in picks]
+    cps = [{"time": pd.Timestamp(t).isoformat(), "shift": change_point_shift * (1 if i % 2 == 0 else -1)}
+           for i, t in enumerate(change_points)]
+
+    spec = {
+        "start": times[0].isoformat(), "freq": freq, "seed": seed, "variables": list(variables),
+        "trends": {"ET": 0.01, "TWS": -1.5, **(trends or {})}, "tws_amplitude": tws_amplitude,
+        "change_points": cps, "imbalance": imbalance, "chunk_steps": chunk_steps, "complevel": complevel,
+    }
+
+    keep = np.ones(periods, dtype=bool)
+    if missing_steps:
+        keep[rng.choice(np.arange(1, periods - 1), size=min(missing_steps, periods - 2), replace=False)] = False
+    index = np.flatnonzero(keep)
+
+    suffix = ".zarr" if fmt == "zarr" else ".nc"
+    if n_files == 1:
+        paths = [out_path]
+        spans = [(0, index.size)]
+    else:
+        os.makedirs(out_path, exist_ok=True)
+        bounds = np.linspace(0, index.size, n_files + 1).astype(int)
+        spans = [(a, min(b + overlap_steps, index.size)) for a, b in zip(bounds[:-1], bounds[1:])]
+        paths = [os.path.join(out_path, f"part_{i:03d}{suffix}") for i in range(n_files)]
+
+    jobs = [{"path": p, "times": times[index[a:b]].values, "index": index[a:b], "spec": spec,
+             "lat": lat, "lon": lon, "land": land} for p, (a, b) in zip(paths, spans)]
+    writer = _write_zarr_store if fmt == "zarr" else _write_netcdf_file
+    try:
+        workers = max(1, min(max_workers or os.cpu_count() or 1, len(jobs)))
+        if workers == 1:
+            files = [writer(job) for job in jobs]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                files = list(pool.map(writer, jobs))
+    except RuntimeError:
+        raise
+    except Exception as e:
+        raise RuntimeError(f"Error generating synthetic dataset: {e}")
+
+    expected = expected_area_means(times, lat, land, spec)
+    truth = {
+        "files": files,
+        "times": times,
+        "missing_times": times[~keep],
+        "change_points": cps,
+        "trends": spec["trends"],
+        "imbalance": imbalance,
+        "runoff_ratio": RUNOFF_RATIO,
+        "land_mask": land,
+        "expected": expected,
+    }
+    truth_path = f"{out_path.rstrip(os.sep)}.truth.json"
+    with open(truth_path, "w") as f:
+        json.dump({
+            **{k: v for k, v in truth.items() if k not in ("times", "missing_times", "land_mask", "expected")},
+            "spec": spec,
+            "grid": {"res": res, "n_lat": int(lat.size), "n_lon": int(lon.size)},
+            "missing_times": [t.isoformat() for t in truth["missing_times"]],
+            "expected": {"time": [t.isoformat() for t in expected.index],
+                         **{c: expected[c].round(6).tolist() for c in expected}},
+        }, f, indent=2)
+    truth["truth_path"] = truth_path
+    return truth
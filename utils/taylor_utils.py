@@ -1,8 +1,28 @@
+import os
+import calendar
 import numpy as np
+import pandas as pd
+import xarray as xr
 import matplotlib.pyplot as plt
 import matplotlib.lines as mlines
+from rasterio.features import rasterize
 from typing import Dict, List, Optional, Union
 
+from utils.geospatial_utils import grid_transform
+from utils.geometry_store import prepare_geometry
+from utils.instrumentation import instrument
+
+TAYLOR_CHUNK_MB = int(os.environ.get("WATCYCLE_TAYLOR_CHUNK_MB", "128"))
+GROUPINGS = {
+    "all": "All data",
+    "season": "Season",
+    "month": "Month",
+    "region": "Subbasin",
+}
+SEASONS = ["DJF", "MAM", "JJA", "SON"]
+ACCUMULATOR_COLUMNS = ["grouping", "group", "model", "n", "mean_obs", "mean_model",
+                       "m2_obs", "m2_model", "c_obs_model"]
+
 def compute_taylor_stats(obs: np.ndarray, model: np.ndarray) -> Optional[Dict[str, Union[str, float]]]:
     try:
         obs = np.asarray(obs).flatten()
@@ -165,3 +185,254 @@ def plot_taylor_diagram(stats_list, normalize=False, show_legend=True):
     except Exception as e:
         print(f"Error in plot_taylor_diagram: {str(e)}")
         return None
+
+# ----------------------------
+# Grouped Taylor statistics
+# ----------------------------
+
+def region_labels(lat, lon, regions, name_column: str = None) -> tuple:
+    """
+    Rasterizes the features of a shapefile onto a lat/lon grid.
+
+    Returns:
+        ((lat, lon) int array of feature positions, -1 outside all features,
+         list of feature names)
+    """
+    prepared = prepare_geometry(regions)
+    gdf = prepared.gdf
+    if name_column:
+        names = [str(v) for v in gdf[name_column]]
+    else:
+        names = [f"Region {i + 1}" for i in range(len(gdf))]
+    labels = rasterize(((geom, i) for i, geom in enumerate(gdf.geometry) if geom is not None and not geom.is_empty),
+                       out_shape=(len(lat), len(lon)), transform=grid_transform(lat, lon),
+                       fill=-1, dtype="int32")
+    return labels, names
+
+def _group_codes(da: xr.DataArray, grouping: str, regions=None, name_column: str = None) -> tuple:
+    """
+    Group code of every time step or every cell of `da` for one grouping.
+
+    Returns:
+        (axis the codes run along: 'time', 'cell' or None for one group,
+         int codes, group labels)
+    """
+    if grouping == "all":
+        return None, None, [GROUPINGS["all"]]
+    if grouping in ("season", "month"):
+        if "time" not in da.dims:
+            raise ValueError(f"Grouping by {grouping} needs a time dimension.")
+        months = da["time"].dt.month.values
+        if grouping == "season":
+            return "time", (months % 12) // 3, SEASONS
+        return "time", months - 1, list(calendar.month_abbr[1:])
+    if grouping == "region":
+        if regions is None:
+            raise ValueError("Grouping by region needs a shapefile.")
+        if "lat" not in da.dims or "lon" not in da.dims:
+            raise ValueError("Grouping by region needs lat/lon dimensions.")
+        labels, names = region_labels(da["lat"].values, da["lon"].values, regions, name_column)
+        return "cell", labels.ravel(), names
+    raise ValueError(f"Unknown grouping '{grouping}'; use one of {', '.join(GROUPINGS)}.")
+
+def _chunk_moments(codes: np.ndarray, obs: np.ndarray, model: np.ndarray, n_groups: int) -> np.ndarray:
+    """
+    (n_groups, 6) array of count, means and centred (co)moment sums of the
+    valid obs/model pairs of one chunk: n, mean_obs, mean_model, m2_obs,
+    m2_model, c_obs_model.
+    """
+    n = np.bincount(codes, minlength=n_groups).astype(float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_o = np.where(n > 0, np.bincount(codes, obs, n_groups) / n, 0.0)
+        mean_m = np.where(n > 0, np.bincount(codes, model, n_groups) / n, 0.0)
+    do = obs - mean_o[codes]
+    dm = model - mean_m[codes]
+    return np.column_stack([n, mean_o, mean_m, np.bincount(codes, do * do, n_groups),
+                            np.bincount(codes, dm * dm, n_groups), np.bincount(codes, do * dm, n_groups)])
+
+def _merge_moments(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Combines two moment arrays of _chunk_moments (pairwise update of Chan et al.)."""
+    na, nb = a[:, 0], b[:, 0]
+    n = na + nb
+    with np.errstate(invalid="ignore", divide="ignore"):
+        frac = np.where(n > 0, nb / n, 0.0)
+    d_o = b[:, 1] - a[:, 1]
+    d_m = b[:, 2] - a[:, 2]
+    cross = na * frac
+    return np.column_stack([
+        n,
+        a[:, 1] + d_o * frac,
+        a[:, 2] + d_m * frac,
+        a[:, 3] + b[:, 3] + d_o * d_o * cross,
+        a[:, 4] + b[:, 4] + d_m * d_m * cross,
+        a[:, 5] + b[:, 5] + d_o * d_m * cross,
+    ])
+
+@instrument()
+def taylor_accumulators(reference: xr.DataArray, models: Dict[str, xr.DataArray], groupings=("all",),
+                        regions=None, name_column: str = None, chunk_mb: int = TAYLOR_CHUNK_MB) -> pd.DataFrame:
+    """
+    Taylor-diagram accumulators per (group, model) in one pass over the data.
+
+    Reference and models are aligned on their shared coordinates (inner
+    join) and read in time chunks; every chunk of the reference is read once
+    for all models, and every grouping is accumulated from the same chunk,
+    so adding groupings costs arithmetic but no extra I/O. Each group keeps
+    its count, means and centred moment sums, merged chunk by chunk, which
+    is all the diagram needs and can be stored and re-plotted without
+    touching the data again.
+
+    Args:
+        reference: Reference DataArray (in memory or lazily opened)
+        models: {label: DataArray} with the reference's dimensions
+        groupings: Keys of GROUPINGS; 'season' and 'month' group time steps,
+            'region' groups cells by the features of `regions`
+        regions: GeoDataFrame or PreparedGeometry with one feature per subbasin
+        name_column: Attribute naming the features (default 'Region 1', ...)
+        chunk_mb: Approximate memory of one time chunk of all arrays
+
+    Returns:
+        pd.DataFrame with ACCUMULATOR_COLUMNS, one row per grouping, group and model
+    """
+    try:
+        if not models:
+            raise ValueError("No model datasets given.")
+        labels = list(models)
+        dims = reference.dims
+        arrays = [reference] + [models[label].transpose(*dims) for label in labels]
+        arrays = xr.align(*arrays, join="inner")
+        if arrays[0].size == 0:
+            raise ValueError("Reference and models share no coordinates.")
+        reference, arrays = arrays[0], arrays[1:]
+        if "time" in dims:
+            reference = reference.transpose("time", ...)
+            arrays = [a.transpose("time", ...) for a in arrays]
+
+        groups = {g: _group_codes(reference, g, regions, name_column) for g in dict.fromkeys(groupings)}
+        totals = {(g, label): np.zeros((len(names), 6)) for g, (_, _, names) in groups.items() for label in labels}
+
+        n_time = reference.sizes["time"] if "time" in dims else 1
+        cells = reference.size // n_time
+        step_bytes = 8 * cells * (1 + len(labels))
+        step = max(1, int(chunk_mb * 1024 * 1024 // max(step_bytes, 1)))
+        for start in range(0, n_time, step):
+            sl = slice(start, min(start + step, n_time))
+            obs = reference.isel(time=sl) if "time" in dims else reference
+            obs = np.asarray(obs.values, dtype=np.float64).reshape(-1, cells)
+            chunk_codes = {}
+            for g, (axis, codes, _) in groups.items():
+                if axis == "time":
+                    chunk_codes[g] = np.broadcast_to(codes[sl][:, None], obs.shape).ravel()
+                elif axis == "cell":
+                    chunk_codes[g] = np.broadcast_to(codes, obs.shape).ravel()
+                else:
+                    chunk_codes[g] = np.zeros(obs.size, dtype=np.intp)
+            obs = obs.ravel()
+            obs_valid = np.isfinite(obs)
+            for label, da in zip(labels, arrays):
+                model = da.isel(time=sl) if "time" in dims else da
+                model = np.asarray(model.values, dtype=np.float64).ravel()
+                valid = obs_valid & np.isfinite(model)
+                for g, codes in chunk_codes.items():
+                    keep = valid & (codes >= 0)
+                    moments = _chunk_moments(codes[keep], obs[keep], model[keep], len(groups[g][2]))
+                    totals[(g, label)] = _merge_moments(totals[(g, label)], moments)
+
+        rows = []
+        for (g, label), moments in totals.items():
+            for name, values in zip(groups[g][2], moments):
+                rows.append([g, name, label, *values])
+        out = pd.DataFrame(rows, columns=ACCUMULATOR_COLUMNS)
+        return out.astype({"n": int})
+    except Exception as e:
+        raise RuntimeError(f"Error accumulating Taylor statistics: {e}")
+
+def grouped_taylor_stats(accumulators: pd.DataFrame) -> pd.DataFrame:
+    """
+    Taylor statistics from stored accumulators (see taylor_accumulators).
+
+    Standard deviations use ddof=1 and the centred RMSE satisfies
+    crmse² = std_obs'² + std_model'² - 2 std_obs' std_model' R with the
+    population deviations, as in the diagram. Groups with fewer than two
+    pairs or a constant series give NaN.
+
+    Returns:
+        pd.DataFrame with grouping, group, model, n, std_obs, std_model,
+        correlation, crmse and bias (mean model - mean reference)
+    """
+    acc = accumulators
+    n = acc["n"].to_numpy(dtype=float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ok = n >= 2
+        m2o, m2m, c = (acc[k].to_numpy(dtype=float) for k in ("m2_obs", "m2_model", "c_obs_model"))
+        corr = np.where(ok, c / np.sqrt(m2o * m2m), np.nan)
+        out = acc[["grouping", "group", "model", "n"]].copy()
+        out["std_obs"] = np.where(ok, np.sqrt(m2o / (n - 1)), np.nan)
+        out["std_model"] = np.where(ok, np.sqrt(m2m / (n - 1)), np.nan)
+        out["correlation"] = np.clip(corr, -1.0, 1.0)
+        out["crmse"] = np.where(ok, np.sqrt(np.maximum(m2o + m2m - 2 * c, 0.0) / n), np.nan)
+        out["bias"] = np.where(n > 0, acc["mean_model"] - acc["mean_obs"], np.nan)
+    out.loc[(out["std_obs"] == 0) | (out["std_model"] == 0), ["correlation", "crmse"]] = np.nan
+    return out
+
+def plot_taylor_small_multiples(stats: pd.DataFrame, grouping: str, normalize: bool = True, ncols: int = 4):
+    """
+    One small Taylor diagram per group of a grouping, from grouped_taylor_stats.
+
+    Models keep the same colour in every panel; with `normalize` each panel
+    is scaled by its own reference standard deviation, so all panels share
+    the radial axis.
+
+    Returns:
+        matplotlib Figure
+    """
+    try:
+        stats = stats[(stats["grouping"] == grouping) & stats["correlation"].notna()]
+        if stats.empty:
+            raise ValueError(f"No valid statistics for grouping '{grouping}'.")
+        groups = list(dict.fromkeys(stats["group"]))
+        models = list(dict.fromkeys(stats["model"]))
+        colors = plt.cm.tab20.colors
+        ncols = min(ncols, len(groups))
+        nrows = int(np.ceil(len(groups) / ncols))
+
+        height = 3.4 * nrows + 0.8
+        fig, axes = plt.subplots(nrows, ncols, figsize=(max(3.6 * ncols, 6.0), height),
+                                 subplot_kw={"projection": "polar"}, squeeze=False)
+        corr_ticks = np.linspace(0, 1, 5)
+        for ax, group in zip(axes.flat, groups):
+            rows = stats[stats["group"] == group]
+            std_obs = float(rows["std_obs"].iloc[0])
+            scale = std_obs if normalize else 1.0
+            ref = std_obs / scale
+            max_std = max([ref] + list(rows["std_model"] / scale)) * 1.15
+
+            ax.set_theta_zero_location("N")
+            ax.set_theta_direction(-1)
+            ax.set_thetalim(0, np.pi / 2)
+            ax.set_ylim(0, max_std)
+            ax.set_thetagrids(np.degrees(np.arccos(corr_ticks)), labels=[f"{t:.1f}" for t in corr_ticks],
+                              fontsize=7, color="#333333")
+            ax.tick_params(axis="y", labelsize=7)
+            ax.plot(np.linspace(0, np.pi / 2, 100), [ref] * 100, "--", color="#444444", linewidth=1, alpha=0.8)
+            ax.plot(0, ref, "o", markersize=8, markerfacecolor="white", markeredgecolor="#444444",
+                    markeredgewidth=1.5, zorder=3)
+            for _, row in rows.iterrows():
+                ax.plot(np.arccos(row["correlation"]), row["std_model"] / scale, "o",
+                        color=colors[models.index(row["model"]) % len(colors)],
+                        markersize=7, markeredgecolor="white", markeredgewidth=1)
+            ax.set_title(f"{group} (n={int(rows['n'].max()):,})", fontsize=10, fontweight="bold", pad=12)
+        for ax in axes.flat[len(groups):]:
+            ax.set_visible(False)
+
+        handles = [mlines.Line2D([], [], color=colors[i % len(colors)], marker="o", linestyle="None",
+                                 markersize=8, label=m) for i, m in enumerate(models)]
+        handles.append(mlines.Line2D([], [], color="#444444", marker="o", markerfacecolor="white",
+                                     linestyle="None", markersize=8, label="Reference"))
+        fig.legend(handles=handles, loc="lower center", ncol=min(len(handles), 6), frameon=False, fontsize=9)
+        suffix = " (normalized)" if normalize else ""
+        fig.suptitle(f"Taylor Diagrams by {GROUPINGS.get(grouping, grouping)}{suffix}", fontsize=13, fontweight="bold")
+        fig.tight_layout(rect=(0, 0.5 / height, 1, 1 - 0.4 / height))
+        return fig
+    except Exception as e:
+        raise RuntimeError(f"Error plotting grouped Taylor diagrams: {e}")
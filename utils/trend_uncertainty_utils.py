@@ -0,0 +1,346 @@
+# utils/trend_uncertainty_utils.py
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import xarray as xr
+from scipy.stats import norm
+
+from utils.instrumentation import instrument
+
+# Pairwise slopes beyond these counts are estimated from a seeded random subset of pairs
+RANK_PAIRS = int(os.environ.get("WATCYCLE_SEN_RANK_PAIRS", "2000000"))
+BOOTSTRAP_PAIRS = int(os.environ.get("WATCYCLE_SEN_BOOTSTRAP_PAIRS", "200000"))
+# Elements of one (rows × pairs) slope block, ~64 MB of float64
+_BATCH_ELEMENTS = 8_000_000
+# Work units are fixed slices of series × replicates; each gets its own child seed,
+# so results depend on the seed only, not on the number of worker processes
+_SERIES_PER_JOB = 64
+_REPLICATES_PER_JOB = 250
+
+def default_block_length(n: int) -> int:
+    """Block length of the moving-block bootstrap, n^(1/3) (Hall et al., 1995)."""
+    return max(1, int(round(n ** (1 / 3))))
+
+def mk_variance(values) -> np.ndarray:
+    """
+    Variance of the Mann-Kendall S statistic, corrected for tied values.
+
+    Args:
+        values: (n,) series or (series, n) array without NaNs
+
+    Returns:
+        Scalar for one series, else an array with one variance per series
+    """
+    y = np.atleast_2d(np.asarray(values, dtype=float))
+    s, n = y.shape
+    ordered = np.sort(y, axis=1)
+    new_group = np.ones((s, n), dtype=bool)
+    new_group[:, 1:] = ordered[:, 1:] != ordered[:, :-1]
+    group = np.cumsum(new_group, axis=1) - 1 + (np.arange(s) * n)[:, None]
+    t = np.bincount(group.ravel(), minlength=s * n).reshape(s, n).astype(float)
+    var = (n * (n - 1) * (2 * n + 5) - (t * (t - 1) * (2 * t + 5)).sum(axis=1)) / 18
+    return var[0] if np.ndim(values) == 1 else var
+
+def index_pairs(times: np.ndarray, max_pairs: int, rng) -> tuple:
+    """
+    Index pairs (i < j) with distinct times: all of them, or `max_pairs`
+    drawn uniformly at random when there are more.
+
+    Returns:
+        (i, j, dt, total) where total is the number of pairs in the full set
+    """
+    n = len(times)
+    total = n * (n - 1) // 2
+    if total <= max_pairs:
+        i, j = np.triu_indices(n, k=1)
+    else:
+        a, b = rng.integers(0, n, max_pairs), rng.integers(0, n, max_pairs)
+        keep = a != b
+        i, j = np.minimum(a, b)[keep], np.maximum(a, b)[keep]
+    dt = times[j] - times[i]
+    keep = dt != 0
+    if total <= max_pairs:
+        total = int(keep.sum())
+    return i[keep], j[keep], dt[keep], total
+
+def row_batches(n_rows: int, n_pairs: int):
+    """Row slices such that one (rows × pairs) block stays within _BATCH_ELEMENTS."""
+    step = max(1, _BATCH_ELEMENTS // max(n_pairs, 1))
+    for start in range(0, n_rows, step):
+        yield slice(start, min(start + step, n_rows))
+
+def pair_slopes(y: np.ndarray, i, j, dt) -> np.ndarray:
+    """(rows, pairs) slopes of the rows of `y` for the given index pairs."""
+    d = np.take(y, j, axis=1)
+    d -= np.take(y, i, axis=1)
+    d /= dt
+    return d
+
+def row_medians(d: np.ndarray) -> np.ndarray:
+    """Medians of the rows of `d`, partially sorting it in place (one selection per row)."""
+    h = d.shape[1] // 2
+    d.partition(h, axis=1)
+    if d.shape[1] % 2:
+        return d[:, h].copy()
+    return (d[:, :h].max(axis=1) + d[:, h]) / 2
+
+def _rank_ranks(var_s, n_total: int, n_pairs: int, alpha: float) -> tuple:
+    """
+    0-based positions of the rank-based CI limits among `n_pairs` sorted slopes.
+
+    With N pairwise slopes and C = z(1 - alpha/2) * sqrt(Var S), the limits
+    are the M1-th and (M2 + 1)-th smallest slopes, M1 = (N - C) / 2 and
+    M2 = (N + C) / 2 (Gilbert, 1987). For a random subset of the pairs the
+    ranks are scaled to the subset size.
+    """
+    c = np.minimum(norm.ppf(1 - alpha / 2) * np.sqrt(np.asarray(var_s, dtype=float)), n_total)
+    scale = n_pairs / max(n_total, 1)
+    lo = np.clip(np.round((n_total - c) / 2 * scale).astype(int) - 1, 0, n_pairs - 1)
+    hi = np.clip(np.round((n_total + c) / 2 * scale).astype(int), 0, n_pairs - 1)
+    return lo, hi
+
+def rank_confidence_interval(slopes: np.ndarray, var_s: float, alpha: float = 0.05, n_total: int = None) -> tuple:
+    """
+    Rank-based confidence interval of Sen's slope from its pairwise slopes.
+
+    Args:
+        slopes: All pairwise slopes, or a random subset of them
+        var_s: Variance of the Mann-Kendall S statistic (see mk_variance)
+        alpha: Significance level
+        n_total: Number of pairs in the full set when `slopes` is a subset
+
+    Returns:
+        (lower, upper)
+    """
+    slopes = np.asarray(slopes, dtype=float)
+    if len(slopes) == 0 or not np.isfinite(var_s):
+        return np.nan, np.nan
+    lo, hi = _rank_ranks(var_s, n_total or len(slopes), len(slopes), alpha)
+    part = np.partition(slopes, [int(lo), int(hi)])
+    return float(part[lo]), float(part[hi])
+
+def _rank_job(job: dict) -> np.ndarray:
+    """Sen's slope and rank-based limits of a chunk of series, as a (series, 3) array."""
+    y, i, j, dt = job["values"], job["i"], job["j"], job["dt"]
+    var_s = mk_variance(y)
+    out = np.empty((len(y), 3))
+    for rows in row_batches(len(y), len(dt)):
+        d = np.sort(pair_slopes(y[rows], i, j, dt), axis=1)
+        lo, hi = _rank_ranks(var_s[rows], job["n_total"], len(dt), job["alpha"])
+        r = np.arange(d.shape[0])
+        out[rows, 0] = np.median(d, axis=1)
+        out[rows, 1] = d[r, lo]
+        out[rows, 2] = d[r, hi]
+    return out
+
+def _bootstrap_job(job: dict) -> np.ndarray:
+    """
+    Sen's slopes of moving-block bootstrap replicates of detrended series.
+
+    Returns:
+        (series, replicates) array of slope deviations from the original slope
+    """
+    resid, i, j, dt = job["resid"], job["i"], job["j"], job["dt"]
+    rng = np.random.default_rng(job["seed"])
+    s, n = resid.shape
+    n_boot, length = job["n_boot"], job["block_length"]
+    n_blocks = -(-n // length)
+    offsets = np.arange(length)
+    out = np.empty(s * n_boot)
+    for rows in row_batches(s * n_boot, max(len(dt), n)):
+        r = np.arange(rows.start, rows.stop)
+        starts = rng.integers(0, n, (len(r), n_blocks))
+        # Circular blocks: every position is equally likely to be drawn
+        idx = ((starts[:, :, None] + offsets) % n).reshape(len(r), -1)[:, :n]
+        y = resid[(r // n_boot)[:, None], idx]
+        out[rows] = row_medians(pair_slopes(y, i, j, dt))
+    return out.reshape(s, n_boot)
+
+def _run_jobs(fn, jobs: list, max_workers: int) -> list:
+    if max_workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(jobs))) as pool:
+            return list(pool.map(fn, jobs))
+    return [fn(job) for job in jobs]
+
+def _as_days(times) -> np.ndarray:
+    """Numeric time axis in days; datetimes become ordinal days as on the trend page."""
+    times = np.asarray(times)
+    if np.issubdtype(times.dtype, np.datetime64):
+        return (times.astype("datetime64[ns]").astype(np.int64) / 86400e9).astype(float)
+    return times.astype(float)
+
+def _prepare(values, times, max_pairs: int, seed) -> tuple:
+    y = np.atleast_2d(np.asarray(values, dtype=float))
+    t = _as_days(times)
+    if y.shape[1] != len(t):
+        raise ValueError(f"{y.shape[1]} values but {len(t)} time steps.")
+    i, j, dt, total = index_pairs(t, max_pairs, np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(0,))))
+    return y, t, i, j, dt, total
+
+def sen_slope_with_rank_ci(values, times, alpha: float = 0.05, max_pairs: int = RANK_PAIRS, seed: int = 0,
+                           max_workers: int = 1) -> np.ndarray:
+    """
+    Sen's slope and its rank-based confidence limits for one or many series.
+
+    Pairwise slopes are formed for all series at once in memory-bounded
+    blocks. Long series (more than `max_pairs` pairs) use a seeded random
+    subset of the pairs, which keeps a 10,000-step series under a second.
+
+    Args:
+        values: (n,) series or (series, n) array on a common time axis, without NaNs
+        times: (n,) datetimes or numbers (slopes are per day for datetimes)
+        alpha: Significance level
+        max_pairs: Pairs above which a random subset is used
+        seed: Seed of the pair subset
+        max_workers: Worker processes for many series
+
+    Returns:
+        (3,) or (series, 3) array of slope, lower and upper limit
+    """
+    y, _, i, j, dt, total = _prepare(values, times, max_pairs, seed)
+    jobs = [{"values": y[k:k + _SERIES_PER_JOB], "i": i, "j": j, "dt": dt, "n_total": total, "alpha": alpha}
+            for k in range(0, len(y), _SERIES_PER_JOB)]
+    out = np.concatenate(_run_jobs(_rank_job, jobs, max_workers))
+    return out[0] if np.ndim(values) == 1 else out
+
+def block_bootstrap_slopes(values, times, n_boot: int = 1000, block_length: int = None, seed: int = 0,
+                           max_pairs: int = BOOTSTRAP_PAIRS, max_workers: int = 1) -> tuple:
+    """
+    Moving-block bootstrap distribution of Sen's slope.
+
+    Each series is detrended with its Sen's slope; the residuals are
+    resampled in circular blocks (keeping the autocorrelation within a
+    block) and the slope is re-estimated on trend + resampled residuals.
+    Replicates are vectorised in batches and split into fixed work units
+    that run in worker processes, each with a child seed of `seed`, so the
+    result is reproducible whatever `max_workers` is.
+
+    Args:
+        values: (n,) series or (series, n) array on a common time axis, without NaNs
+        times: (n,) datetimes or numbers (slopes are per day for datetimes)
+        n_boot: Number of bootstrap replicates
+        block_length: Block length in time steps (default: default_block_length(n))
+        seed: Random seed
+        max_pairs: Pairs per replicate above which a random subset is used
+        max_workers: Worker processes
+
+    Returns:
+        (slope, replicates): Sen's slope ((series,) or scalar) and the
+        replicate slopes ((series, n_boot) or (n_boot,))
+    """
+    y, t, i, j, dt, total = _prepare(values, times, max_pairs, seed)
+    length = int(block_length or default_block_length(y.shape[1]))
+    slope = np.concatenate([row_medians(pair_slopes(y[rows], i, j, dt))
+                            for rows in row_batches(len(y), len(dt))] or [np.empty(0)])
+    resid = y - slope[:, None] * t
+
+    chunks = [(k, r) for k in range(0, len(y), _SERIES_PER_JOB) for r in range(0, n_boot, _REPLICATES_PER_JOB)]
+    seeds = [np.random.SeedSequence(seed, spawn_key=(c + 1,)) for c in range(len(chunks))]
+    jobs = [{"resid": resid[k:k + _SERIES_PER_JOB], "i": i, "j": j, "dt": dt, "block_length": length,
+             "n_boot": min(_REPLICATES_PER_JOB, n_boot - r), "seed": seeds[c]} for c, (k, r) in enumerate(chunks)]
+    results = _run_jobs(_bootstrap_job, jobs, max_workers)
+
+    replicates = np.empty((len(y), n_boot))
+    for (k, r), result in zip(chunks, results):
+        replicates[k:k + result.shape[0], r:r + result.shape[1]] = result
+    replicates += slope[:, None]
+    if np.ndim(values) == 1:
+        return float(slope[0]), replicates[0]
+    return slope, replicates
+
+@instrument()
+def sen_confidence_interval(values, times, alpha: float = 0.05, method: str = "rank", n_boot: int = 1000,
+                            block_length: int = None, seed: int = 0, max_workers: int = 1) -> dict:
+    """
+    Sen's slope of one series with a confidence interval.
+
+    'rank' gives the distribution-free interval from the ranks of the
+    pairwise slopes, which assumes independent residuals. 'bootstrap' uses
+    the moving-block bootstrap percentiles, which stay valid for
+    autocorrelated (e.g. monthly hydrological) series. NaNs are dropped.
+
+    Args:
+        values: (n,) series
+        times: (n,) datetimes or numbers (slopes are per day for datetimes)
+        alpha: Significance level (0.05 for a 95% interval)
+        method: 'rank' or 'bootstrap'
+        n_boot, block_length, seed, max_workers: See block_bootstrap_slopes
+
+    Returns:
+        dict with slope, lower, upper, method, n and block_length
+    """
+    try:
+        values = np.asarray(values, dtype=float)
+        ok = np.isfinite(values)
+        values, times = values[ok], np.asarray(times)[ok]
+        result = {"slope": np.nan, "lower": np.nan, "upper": np.nan, "method": method, "n": len(values),
+                  "block_length": None}
+        if len(values) < 3:
+            return result
+        slope, lower, upper = sen_slope_with_rank_ci(values, times, alpha=alpha, seed=seed)
+        if method == "bootstrap":
+            length = block_length or default_block_length(len(values))
+            _, replicates = block_bootstrap_slopes(values, times, n_boot=n_boot, block_length=length, seed=seed,
+                                                   max_workers=max_workers)
+            lower, upper = np.quantile(replicates, [alpha / 2, 1 - alpha / 2])
+            result["block_length"] = length
+        elif method != "rank":
+            raise ValueError(f"Unknown method '{method}'; use 'rank' or 'bootstrap'.")
+        result.update(slope=float(slope), lower=float(lower), upper=float(upper))
+        return result
+    except Exception as e:
+        raise RuntimeError(f"Error computing Sen's slope confidence interval: {e}")
+
+@instrument()
+def sen_confidence_grid(da: xr.DataArray, alpha: float = 0.05, method: str = "rank", n_boot: int = 200,
+                        block_length: int = None, seed: int = 0, max_workers: int = 1) -> xr.Dataset:
+    """
+    Per-cell Sen's slope and confidence interval of a gridded variable.
+
+    All cells share the time axis, so the pairs are built once and the
+    cells are processed in vectorised chunks spread over worker processes.
+    Cells with any missing time step are left NaN. Slopes are per year
+    for a datetime axis.
+
+    Args:
+        da: DataArray with a time dimension (e.g. time, lat, lon)
+        alpha: Significance level
+        method: 'rank' (fast) or 'bootstrap' (n_boot replicates per cell)
+        n_boot, block_length, seed, max_workers: See block_bootstrap_slopes
+
+    Returns:
+        xr.Dataset with sen_slope, ci_lower and ci_upper over the non-time dimensions
+    """
+    try:
+        if "time" not in da.dims:
+            raise ValueError(f"Variable '{da.name}' has no time dimension.")
+        other = [d for d in da.dims if d != "time"]
+        da = da.transpose("time", *other)
+        y = np.asarray(da.values, dtype=float).reshape(da.sizes["time"], -1).T
+        valid = np.isfinite(y).all(axis=1)
+        out = np.full((len(y), 3), np.nan)
+        if valid.any():
+            out[valid] = sen_slope_with_rank_ci(y[valid], da["time"].values, alpha=alpha, seed=seed,
+                                                max_workers=max_workers)
+            if method == "bootstrap":
+                _, replicates = block_bootstrap_slopes(y[valid], da["time"].values, n_boot=n_boot,
+                                                       block_length=block_length, seed=seed, max_workers=max_workers)
+                out[valid, 1:] = np.quantile(replicates, [alpha / 2, 1 - alpha / 2], axis=1).T
+            elif method != "rank":
+                raise ValueError(f"Unknown method '{method}'; use 'rank' or 'bootstrap'.")
+
+        shape = [da.sizes[d] for d in other]
+        coords = {d: da[d] for d in other if d in da.coords}
+        dated = np.issubdtype(da["time"].dtype, np.datetime64)
+        factor = 365.0 if dated else 1.0
+        units = f"{da.attrs.get('units', '')} per {'year' if dated else 'time unit'}".strip()
+        attrs = {"units": units, "method": method, "alpha": alpha}
+        return xr.Dataset(
+            {name: (other, out[:, k].reshape(shape) * factor, attrs)
+             for k, name in enumerate(("sen_slope", "ci_lower", "ci_upper"))},
+            coords=coords
+        )
+    except Exception as e:
+        raise RuntimeError(f"Error computing gridded Sen's slope confidence intervals: {e}")